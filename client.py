@@ -4,9 +4,14 @@
 # You just DO WHAT THE FUCK YOU WANT TO.
 # https://github.com/sirkris/WTFPL/blob/master/WTFPL.md
 
-from hydrus import hydrus_client
+import multiprocessing
 
 if __name__ == '__main__':
     
+    # file import process pool workers come through here in frozen builds, so catch them before the client parses its arguments
+    multiprocessing.freeze_support()
+    
+    from hydrus import hydrus_client
+    
     hydrus_client.boot()
     
@@ -1,5 +1,7 @@
+import numpy
 import threading
 
+from hydrus.core import HydrusBitmaps
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
@@ -27,6 +29,8 @@ basic_permission_to_str_lookup[ CLIENT_API_PERMISSION_MANAGE_COOKIES ] = 'manage
 
 SEARCH_RESULTS_CACHE_TIMEOUT = 4 * 3600
 
+MAX_SEARCH_CURSORS = 8
+
 SESSION_EXPIRY = 86400
 
 api_request_dialog_open = False
@@ -231,6 +235,9 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
         self._last_search_results = None
         self._search_results_timeout = 0
         
+        # cursor_key -> ( ordered hash_ids array, timeout ). a snapshot of a search that a client can page through
+        self._search_cursors = {}
+        
         self._lock = threading.Lock()
         
     
@@ -331,6 +338,25 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def CreateSearchCursor( self, hash_ids ):
+        
+        with self._lock:
+            
+            if len( self._search_cursors ) >= MAX_SEARCH_CURSORS:
+                
+                oldest_cursor_key = min( self._search_cursors.keys(), key = lambda k: self._search_cursors[ k ][1] )
+                
+                del self._search_cursors[ oldest_cursor_key ]
+                
+            
+            cursor_key = HydrusData.GenerateKey()
+            
+            self._search_cursors[ cursor_key ] = ( numpy.fromiter( hash_ids, dtype = numpy.int64, count = len( hash_ids ) ), HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT )
+            
+            return cursor_key
+            
+        
+    
     def GenerateNewAccessKey( self ):
         
         with self._lock:
@@ -380,6 +406,23 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def GetSearchCursorPage( self, cursor_key, offset, limit ):
+        
+        with self._lock:
+            
+            if cursor_key not in self._search_cursors:
+                
+                raise HydrusExceptions.NotFoundException( 'It looks like that search cursor is no longer available--please run the search again!' )
+                
+            
+            ( hash_ids, timeout ) = self._search_cursors[ cursor_key ]
+            
+            self._search_cursors[ cursor_key ] = ( hash_ids, HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT )
+            
+            return ( hash_ids[ offset : offset + limit ].tolist(), len( hash_ids ) )
+            
+        
+    
     def GetSearchTagFilter( self ):
         
         with self._lock:
@@ -405,6 +448,8 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
                 self._last_search_results = None
                 
             
+            self._search_cursors = { cursor_key : ( hash_ids, timeout ) for ( cursor_key, ( hash_ids, timeout ) ) in self._search_cursors.items() if not HydrusData.TimeHasPassed( timeout ) }
+            
         
     
     def SetLastSearchResults( self, hash_ids ):
@@ -416,7 +461,7 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
                 return
                 
             
-            self._last_search_results = set( hash_ids )
+            self._last_search_results = HydrusBitmaps.IntegerBitmap( hash_ids )
             
             self._search_results_timeout = HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT
             
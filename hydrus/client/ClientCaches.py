@@ -17,19 +17,243 @@ from hydrus.client import ClientImageHandling
 from hydrus.client import ClientParsing
 from hydrus.client import ClientRendering
 
+CACHE_EVICTION_LRU = 0
+CACHE_EVICTION_2Q = 1
+
+class DataCacheLRUPolicy( object ):
+    
+    # plain least recently used
+    
+    def __init__( self, cache_size ):
+        
+        self._keys_to_last_access_times = collections.OrderedDict()
+        
+    
+    def Add( self, key, memory_footprint ):
+        
+        self._keys_to_last_access_times[ key ] = HydrusData.GetNow()
+        
+    
+    def Clear( self ):
+        
+        self._keys_to_last_access_times = collections.OrderedDict()
+        
+    
+    def Delete( self, key ):
+        
+        if key in self._keys_to_last_access_times:
+            
+            del self._keys_to_last_access_times[ key ]
+            
+        
+    
+    def GetEvictionKey( self ):
+        
+        return next( iter( self._keys_to_last_access_times.keys() ) )
+        
+    
+    def GetTimedOutKeys( self, timeout ):
+        
+        timed_out_keys = []
+        
+        for ( key, last_access_time ) in self._keys_to_last_access_times.items():
+            
+            if HydrusData.TimeHasPassed( last_access_time + timeout ):
+                
+                timed_out_keys.append( key )
+                
+            else:
+                
+                break
+                
+            
+        
+        return timed_out_keys
+        
+    
+    def NotifyEvicted( self, key ):
+        
+        self.Delete( key )
+        
+    
+    def Touch( self, key, memory_footprint ):
+        
+        self._keys_to_last_access_times[ key ] = HydrusData.GetNow()
+        
+        self._keys_to_last_access_times.move_to_end( key )
+        
+    
+class DataCache2QPolicy( object ):
+    
+    # scan resistant, after Johnson and Shasha's 2Q
+    # new keys go into a small fifo 'in' queue. a hit there does not promote, so a big one-off scroll just churns through that queue
+    # keys evicted from the 'in' queue are remembered in a 'ghost' queue. if one is added again soon, it is clearly in use, so it goes straight to the main lru queue
+    
+    IN_QUEUE_PROPORTION = 0.25
+    MIN_GHOST_SIZE = 256
+    GHOST_MULTIPLIER = 2
+    
+    def __init__( self, cache_size ):
+        
+        self._in_queue_max_size = int( cache_size * self.IN_QUEUE_PROPORTION )
+        
+        self._in_keys_to_last_access_times = collections.OrderedDict()
+        self._in_keys_to_memory_footprints = {}
+        self._in_memory_footprint = 0
+        
+        self._main_keys_to_last_access_times = collections.OrderedDict()
+        
+        self._ghost_keys = collections.OrderedDict()
+        
+    
+    def _ForgetGhosts( self ):
+        
+        # ghosts are just keys, so we can afford to remember a good number of them. more ghosts means we notice reuse over longer scans
+        max_ghosts = max( self.MIN_GHOST_SIZE, ( len( self._in_keys_to_last_access_times ) + len( self._main_keys_to_last_access_times ) ) * self.GHOST_MULTIPLIER )
+        
+        while len( self._ghost_keys ) > max_ghosts:
+            
+            self._ghost_keys.popitem( last = False )
+            
+        
+    
+    def Add( self, key, memory_footprint ):
+        
+        if key in self._ghost_keys:
+            
+            del self._ghost_keys[ key ]
+            
+            self._main_keys_to_last_access_times[ key ] = HydrusData.GetNow()
+            
+        else:
+            
+            self._in_keys_to_last_access_times[ key ] = HydrusData.GetNow()
+            self._in_keys_to_memory_footprints[ key ] = memory_footprint
+            self._in_memory_footprint += memory_footprint
+            
+        
+    
+    def Clear( self ):
+        
+        self._in_keys_to_last_access_times = collections.OrderedDict()
+        self._in_keys_to_memory_footprints = {}
+        self._in_memory_footprint = 0
+        
+        self._main_keys_to_last_access_times = collections.OrderedDict()
+        
+        self._ghost_keys = collections.OrderedDict()
+        
+    
+    def Delete( self, key ):
+        
+        if key in self._in_keys_to_last_access_times:
+            
+            del self._in_keys_to_last_access_times[ key ]
+            
+            self._in_memory_footprint -= self._in_keys_to_memory_footprints[ key ]
+            
+            del self._in_keys_to_memory_footprints[ key ]
+            
+        elif key in self._main_keys_to_last_access_times:
+            
+            del self._main_keys_to_last_access_times[ key ]
+            
+        
+    
+    def GetEvictionKey( self ):
+        
+        if len( self._main_keys_to_last_access_times ) == 0 or ( len( self._in_keys_to_last_access_times ) > 0 and self._in_memory_footprint > self._in_queue_max_size ):
+            
+            return next( iter( self._in_keys_to_last_access_times.keys() ) )
+            
+        else:
+            
+            return next( iter( self._main_keys_to_last_access_times.keys() ) )
+            
+        
+    
+    def GetTimedOutKeys( self, timeout ):
+        
+        # the 'in' queue is in insertion order, not access order, so this may leave a few stale keys behind the first fresh one. they'll get cleared up later
+        
+        timed_out_keys = []
+        
+        for keys_to_last_access_times in ( self._in_keys_to_last_access_times, self._main_keys_to_last_access_times ):
+            
+            for ( key, last_access_time ) in keys_to_last_access_times.items():
+                
+                if HydrusData.TimeHasPassed( last_access_time + timeout ):
+                    
+                    timed_out_keys.append( key )
+                    
+                else:
+                    
+                    break
+                    
+                
+            
+        
+        return timed_out_keys
+        
+    
+    def NotifyEvicted( self, key ):
+        
+        if key in self._in_keys_to_last_access_times:
+            
+            self._ghost_keys[ key ] = None
+            
+            self._ForgetGhosts()
+            
+        
+        self.Delete( key )
+        
+    
+    def Touch( self, key, memory_footprint ):
+        
+        if key in self._main_keys_to_last_access_times:
+            
+            self._main_keys_to_last_access_times[ key ] = HydrusData.GetNow()
+            
+            self._main_keys_to_last_access_times.move_to_end( key )
+            
+        elif key in self._in_keys_to_last_access_times:
+            
+            # no promotion, but keep the access time and footprint up to date
+            
+            self._in_keys_to_last_access_times[ key ] = HydrusData.GetNow()
+            
+            self._in_memory_footprint += memory_footprint - self._in_keys_to_memory_footprints[ key ]
+            
+            self._in_keys_to_memory_footprints[ key ] = memory_footprint
+            
+        
+    
 class DataCache( object ):
     
-    def __init__( self, controller, cache_size, timeout = 1200 ):
+    def __init__( self, controller, cache_size, timeout = 1200, eviction_policy = CACHE_EVICTION_LRU ):
         
         self._controller = controller
         self._cache_size = cache_size
         self._timeout = timeout
         
+        if eviction_policy == CACHE_EVICTION_2Q:
+            
+            self._eviction_policy = DataCache2QPolicy( cache_size )
+            
+        else:
+            
+            self._eviction_policy = DataCacheLRUPolicy( cache_size )
+            
+        
         self._keys_to_data = {}
-        self._keys_fifo = collections.OrderedDict()
+        self._keys_to_memory_footprints = {}
         
         self._total_estimated_memory_footprint = 0
         
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
+        
         self._lock = threading.Lock()
         
         self._controller.sub( self, 'MaintainCache', 'memory_maintenance_pulse' )
@@ -44,30 +268,35 @@ class DataCache( object ):
         
         del self._keys_to_data[ key ]
         
-        self._RecalcMemoryUsage()
+        self._total_estimated_memory_footprint -= self._keys_to_memory_footprints[ key ]
+        
+        del self._keys_to_memory_footprints[ key ]
+        
+        self._eviction_policy.Delete( key )
         
     
     def _DeleteItem( self ):
         
-        ( deletee_key, last_access_time ) = self._keys_fifo.popitem( last = False )
+        deletee_key = self._eviction_policy.GetEvictionKey()
         
-        self._Delete( deletee_key )
+        self._eviction_policy.NotifyEvicted( deletee_key )
         
-    
-    def _RecalcMemoryUsage( self ):
+        self._Delete( deletee_key )
         
-        self._total_estimated_memory_footprint = sum( ( data.GetEstimatedMemoryFootprint() for data in self._keys_to_data.values() ) )
+        self._num_evictions += 1
         
     
     def _TouchKey( self, key ):
         
-        # have to delete first, rather than overwriting, so the ordereddict updates its internal order
-        if key in self._keys_fifo:
-            
-            del self._keys_fifo[ key ]
-            
+        # some data, like an image renderer, changes its footprint as it loads, so we take a fresh look on every access
+        
+        memory_footprint = self._keys_to_data[ key ].GetEstimatedMemoryFootprint()
+        
+        self._total_estimated_memory_footprint += memory_footprint - self._keys_to_memory_footprints[ key ]
         
-        self._keys_fifo[ key ] = HydrusData.GetNow()
+        self._keys_to_memory_footprints[ key ] = memory_footprint
+        
+        self._eviction_policy.Touch( key, memory_footprint )
         
     
     def Clear( self ):
@@ -75,7 +304,9 @@ class DataCache( object ):
         with self._lock:
             
             self._keys_to_data = {}
-            self._keys_fifo = collections.OrderedDict()
+            self._keys_to_memory_footprints = {}
+            
+            self._eviction_policy.Clear()
             
             self._total_estimated_memory_footprint = 0
             
@@ -92,11 +323,14 @@ class DataCache( object ):
                     self._DeleteItem()
                     
                 
+                memory_footprint = data.GetEstimatedMemoryFootprint()
+                
                 self._keys_to_data[ key ] = data
+                self._keys_to_memory_footprints[ key ] = memory_footprint
                 
-                self._TouchKey( key )
+                self._total_estimated_memory_footprint += memory_footprint
                 
-                self._RecalcMemoryUsage()
+                self._eviction_policy.Add( key, memory_footprint )
                 
             
         
@@ -115,9 +349,13 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
+                self._num_misses += 1
+                
                 raise Exception( 'Cache error! Looking for {}, but it was missing.'.format( key ) )
                 
             
+            self._num_hits += 1
+            
             self._TouchKey( key )
             
             return self._keys_to_data[ key ]
@@ -130,17 +368,56 @@ class DataCache( object ):
             
             if key in self._keys_to_data:
                 
+                self._num_hits += 1
+                
                 self._TouchKey( key )
                 
                 return self._keys_to_data[ key ]
                 
             else:
                 
+                self._num_misses += 1
+                
                 return None
                 
             
         
     
+    def GetPrettyStatistics( self ):
+        
+        statistics = self.GetStatistics()
+        
+        num_lookups = statistics[ 'num_hits' ] + statistics[ 'num_misses' ]
+        
+        if num_lookups == 0:
+            
+            hit_rate = 'no lookups yet'
+            
+        else:
+            
+            hit_rate = HydrusData.ConvertFloatToPercentage( statistics[ 'num_hits' ] / num_lookups ) + ' hit rate'
+            
+        
+        return '{} items, {}/{}, {} hits, {} misses ({}), {} evictions'.format( HydrusData.ToHumanInt( statistics[ 'num_items' ] ), HydrusData.ToHumanBytes( statistics[ 'memory_footprint' ] ), HydrusData.ToHumanBytes( statistics[ 'cache_size' ] ), HydrusData.ToHumanInt( statistics[ 'num_hits' ] ), HydrusData.ToHumanInt( statistics[ 'num_misses' ] ), hit_rate, HydrusData.ToHumanInt( statistics[ 'num_evictions' ] ) )
+        
+    
+    def GetStatistics( self ):
+        
+        with self._lock:
+            
+            statistics = {}
+            
+            statistics[ 'num_items' ] = len( self._keys_to_data )
+            statistics[ 'memory_footprint' ] = self._total_estimated_memory_footprint
+            statistics[ 'cache_size' ] = self._cache_size
+            statistics[ 'num_hits' ] = self._num_hits
+            statistics[ 'num_misses' ] = self._num_misses
+            statistics[ 'num_evictions' ] = self._num_evictions
+            
+            return statistics
+            
+        
+    
     def HasData( self, key ):
         
         with self._lock:
@@ -153,25 +430,9 @@ class DataCache( object ):
         
         with self._lock:
             
-            while True:
+            for key in self._eviction_policy.GetTimedOutKeys( self._timeout ):
                 
-                if len( self._keys_fifo ) == 0:
-                    
-                    break
-                    
-                else:
-                    
-                    ( key, last_access_time ) = next( iter( self._keys_fifo.items() ) )
-                    
-                    if HydrusData.TimeHasPassed( last_access_time + self._timeout ):
-                        
-                        self._DeleteItem()
-                        
-                    else:
-                        
-                        break
-                        
-                    
+                self._Delete( key )
                 
             
         
@@ -336,6 +597,7 @@ class ParsingCache( object ):
         self._next_clean_cache_time = HydrusData.GetNow()
         
         self._html_to_soups = {}
+        self._html_to_lxml_trees = {}
         self._json_to_jsons = {}
         
         self._lock = threading.Lock()
@@ -345,7 +607,7 @@ class ParsingCache( object ):
         
         if HydrusData.TimeHasPassed( self._next_clean_cache_time ):
             
-            for cache in ( self._html_to_soups, self._json_to_jsons ):
+            for cache in ( self._html_to_soups, self._html_to_lxml_trees, self._json_to_jsons ):
                 
                 dead_datas = set()
                 
@@ -404,6 +666,35 @@ class ParsingCache( object ):
             
         
     
+    def GetLXMLTree( self, html ):
+        
+        with self._lock:
+            
+            now = HydrusData.GetNow()
+            
+            if html not in self._html_to_lxml_trees:
+                
+                lxml_tree = ClientParsing.GetLXMLTree( html )
+                
+                self._html_to_lxml_trees[ html ] = ( now, lxml_tree )
+                
+            
+            ( last_accessed, lxml_tree ) = self._html_to_lxml_trees[ html ]
+            
+            if last_accessed != now:
+                
+                self._html_to_lxml_trees[ html ] = ( now, lxml_tree )
+                
+            
+            if len( self._html_to_lxml_trees ) > 10:
+                
+                self._CleanCache()
+                
+            
+            return lxml_tree
+            
+        
+    
     def GetSoup( self, html ):
         
         with self._lock:
@@ -472,6 +763,11 @@ class RenderedImageCache( object ):
         return image_renderer
         
     
+    def GetPrettyCacheStatistics( self ):
+        
+        return self._data_cache.GetPrettyStatistics()
+        
+    
     def HasImageRenderer( self, hash ):
         
         key = hash
@@ -488,7 +784,8 @@ class ThumbnailCache( object ):
         cache_size = self._controller.options[ 'thumbnail_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        # thumbnails get scrolled past in great numbers, so we want a scan resistant cache here
+        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout, eviction_policy = CACHE_EVICTION_2Q )
         
         self._magic_mime_thumbnail_ease_score_lookup = {}
         
@@ -506,7 +803,19 @@ class ThumbnailCache( object ):
         self._delayed_regeneration_queue_quick = set()
         self._delayed_regeneration_queue = []
         
-        self._waterfall_event = threading.Event()
+        # each waterfall thread gets its own event, so a new waterfall wakes them all up
+        self._num_waterfall_threads = max( 1, self._controller.new_options.GetInteger( 'thumbnail_waterfall_num_threads' ) )
+        
+        self._waterfall_events = [ threading.Event() for i in range( self._num_waterfall_threads ) ]
+        
+        self._waterfall_num_in_flight = 0
+        
+        # the same file can be queued for several pages, so while one thread renders a hash, the other requests for it wait here and are published with it
+        self._waterfall_in_flight_hashes_to_waiting_results = {}
+        
+        self._waterfall_run_start_time = None
+        self._waterfall_run_num_rendered = 0
+        self._last_waterfall_run_summary = None
         
         self._special_thumbs = {}
         
@@ -514,10 +823,119 @@ class ThumbnailCache( object ):
         
         self._controller.CallToThreadLongRunning( self.MainLoop )
         
+        for waterfall_event in self._waterfall_events[1:]:
+            
+            self._controller.CallToThreadLongRunning( self.WaterfallWorkerLoop, waterfall_event )
+            
+        
         self._controller.sub( self, 'Clear', 'reset_thumbnail_cache' )
         self._controller.sub( self, 'ClearThumbnails', 'clear_thumbnails' )
         
     
+    def _DoWaterfallWork( self ):
+        
+        # render a typical frame's worth of thumbs and publish them. several threads may be doing this at once
+        
+        start_time = HydrusData.GetNowPrecise()
+        stop_time = start_time + 0.005 # a bit of a typical frame
+        
+        page_keys_to_rendered_medias = collections.defaultdict( list )
+        
+        num_done = 0
+        max_at_once = 16
+        
+        while not HydrusData.TimeHasPassedPrecise( stop_time ) and num_done <= max_at_once:
+            
+            with self._lock:
+                
+                if len( self._waterfall_queue ) == 0:
+                    
+                    break
+                    
+                
+                # the queue is sorted, so popping preserves priority no matter how many threads are popping
+                result = self._waterfall_queue.pop()
+                
+                if len( self._waterfall_queue ) == 0:
+                    
+                    self._waterfall_queue_empty_event.set()
+                    
+                
+                self._waterfall_queue_quick.discard( result )
+                
+                ( page_key, media ) = result
+                
+                display_media = media.GetDisplayMedia()
+                
+                if display_media is None:
+                    
+                    hash = None
+                    
+                else:
+                    
+                    hash = display_media.GetHash()
+                    
+                    if hash in self._waterfall_in_flight_hashes_to_waiting_results:
+                        
+                        self._waterfall_in_flight_hashes_to_waiting_results[ hash ].append( result )
+                        
+                        continue
+                        
+                    
+                    self._waterfall_in_flight_hashes_to_waiting_results[ hash ] = []
+                    
+                
+                self._waterfall_num_in_flight += 1
+                
+            
+            rendered = False
+            
+            try:
+                
+                if display_media is not None:
+                    
+                    self.GetThumbnail( media )
+                    
+                    rendered = True
+                    
+                
+            finally:
+                
+                with self._lock:
+                    
+                    waiting_results = self._waterfall_in_flight_hashes_to_waiting_results.pop( hash, [] )
+                    
+                    self._waterfall_num_in_flight -= 1
+                    self._waterfall_run_num_rendered += 1
+                    
+                    self._NotifyWaterfallProgress()
+                    
+                
+            
+            if rendered:
+                
+                page_keys_to_rendered_medias[ page_key ].append( media )
+                
+                for ( waiting_page_key, waiting_media ) in waiting_results:
+                    
+                    page_keys_to_rendered_medias[ waiting_page_key ].append( waiting_media )
+                    
+                
+            
+            num_done += 1
+            
+        
+        if len( page_keys_to_rendered_medias ) > 0:
+            
+            for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
+                
+                self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
+                
+            
+            time.sleep( 0.00001 )
+            
+        
+    
     def _GetThumbnailHydrusBitmap( self, display_media ):
         
         bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
@@ -529,7 +947,7 @@ class ThumbnailCache( object ):
         
         try:
             
-            path = self._controller.client_files_manager.GetThumbnailPath( display_media )
+            thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
             
         except HydrusExceptions.FileMissingException as e:
             
@@ -545,7 +963,7 @@ class ThumbnailCache( object ):
         
         try:
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
             
         except Exception as e:
             
@@ -554,6 +972,8 @@ class ThumbnailCache( object ):
                 # file is malformed, let's force a regen
                 self._controller.files_maintenance_manager.RunJobImmediately( [ display_media ], ClientFiles.REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, pub_job_key = False )
                 
+                thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
+                
             except Exception as e:
                 
                 summary = 'The thumbnail for file {} was not loadable. An attempt to regenerate it failed.'.format( hash.hex() )
@@ -565,7 +985,7 @@ class ThumbnailCache( object ):
             
             try:
                 
-                numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+                numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
                 
             except Exception as e:
                 
@@ -623,7 +1043,7 @@ class ThumbnailCache( object ):
                             
                         except HydrusExceptions.CantRenderWithCVException:
                             
-                            thumbnail_bytes = HydrusImageHandling.GenerateThumbnailBytesFromStaticImagePath( path, ( expected_width, expected_height ), mime )
+                            thumbnail_bytes = HydrusImageHandling.GenerateThumbnailBytesPIL( HydrusImageHandling.GeneratePILImageFromNumPyImage( numpy_image ), mime )
                             
                         
                     except:
@@ -779,6 +1199,35 @@ class ThumbnailCache( object ):
             
         
     
+    def _NotifyWaterfallProgress( self ):
+        
+        # a run is from when the queue gets work to when the last thumb of it is done
+        
+        if self._waterfall_run_start_time is None:
+            
+            if len( self._waterfall_queue ) > 0:
+                
+                self._waterfall_run_start_time = HydrusData.GetNowPrecise()
+                self._waterfall_run_num_rendered = 0
+                
+            
+        elif len( self._waterfall_queue ) == 0 and self._waterfall_num_in_flight == 0:
+            
+            time_took = HydrusData.GetNowPrecise() - self._waterfall_run_start_time
+            
+            thumbnails_per_second = self._waterfall_run_num_rendered / max( time_took, 0.001 )
+            
+            self._last_waterfall_run_summary = 'last waterfall rendered {} thumbnails in {} ({} thumbnails/s on {} threads)'.format( HydrusData.ToHumanInt( self._waterfall_run_num_rendered ), HydrusData.TimeDeltaToPrettyTimeDelta( time_took ), HydrusData.ToHumanInt( int( thumbnails_per_second ) ), self._num_waterfall_threads )
+            
+            if HG.file_report_mode:
+                
+                HydrusData.ShowText( self._last_waterfall_run_summary )
+                
+            
+            self._waterfall_run_start_time = None
+            
+        
+    
     def _RecalcQueues( self ):
         
         # here we sort by the hash since this is both breddy random and more likely to access faster on a well defragged hard drive!
@@ -840,7 +1289,14 @@ class ThumbnailCache( object ):
         
         with self._lock:
             
-            self._waterfall_queue_quick.difference_update( ( ( page_key, media ) for media in medias ) )
+            cancelled_results = { ( page_key, media ) for media in medias }
+            
+            self._waterfall_queue_quick.difference_update( cancelled_results )
+            
+            for waiting_results in self._waterfall_in_flight_hashes_to_waiting_results.values():
+                
+                waiting_results[:] = [ result for result in waiting_results if result not in cancelled_results ]
+                
             
             cancelled_display_medias = { media.GetDisplayMedia() for media in medias }
             
@@ -859,6 +1315,8 @@ class ThumbnailCache( object ):
             
             self._RecalcQueues()
             
+            self._NotifyWaterfallProgress()
+            
         
     
     def Clear( self ):
@@ -928,6 +1386,21 @@ class ThumbnailCache( object ):
             
         
     
+    def GetPrettyCacheStatistics( self ):
+        
+        pretty_statistics = self._data_cache.GetPrettyStatistics()
+        
+        with self._lock:
+            
+            if self._last_waterfall_run_summary is not None:
+                
+                pretty_statistics += ', ' + self._last_waterfall_run_summary
+                
+            
+        
+        return pretty_statistics
+        
+    
     def GetThumbnail( self, media ):
         
         display_media = media.GetDisplayMedia()
@@ -1017,8 +1490,13 @@ class ThumbnailCache( object ):
             
             self._RecalcQueues()
             
+            self._NotifyWaterfallProgress()
+            
         
-        self._waterfall_event.set()
+        for waterfall_event in self._waterfall_events:
+            
+            waterfall_event.set()
+            
         
     
     def MainLoop( self ):
@@ -1034,59 +1512,12 @@ class ThumbnailCache( object ):
             
             if do_wait:
                 
-                self._waterfall_event.wait( 1 )
+                self._waterfall_events[0].wait( 1 )
                 
-                self._waterfall_event.clear()
+                self._waterfall_events[0].clear()
                 
             
-            start_time = HydrusData.GetNowPrecise()
-            stop_time = start_time + 0.005 # a bit of a typical frame
-            
-            page_keys_to_rendered_medias = collections.defaultdict( list )
-            
-            num_done = 0
-            max_at_once = 16
-            
-            while not HydrusData.TimeHasPassedPrecise( stop_time ) and num_done <= max_at_once:
-                
-                with self._lock:
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        break
-                        
-                    
-                    result = self._waterfall_queue.pop()
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        self._waterfall_queue_empty_event.set()
-                        
-                    
-                    self._waterfall_queue_quick.discard( result )
-                    
-                
-                ( page_key, media ) = result
-                
-                if media.GetDisplayMedia() is not None:
-                    
-                    self.GetThumbnail( media )
-                    
-                    page_keys_to_rendered_medias[ page_key ].append( media )
-                    
-                
-                num_done += 1
-                
-            
-            if len( page_keys_to_rendered_medias ) > 0:
-                
-                for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
-                    
-                    self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
-                    
-                
-                time.sleep( 0.00001 )
-                
+            self._DoWaterfallWork()
             
             # now we will do regen if appropriate
             
@@ -1129,3 +1560,27 @@ class ThumbnailCache( object ):
             
         
     
+    def WaterfallWorkerLoop( self, waterfall_event ):
+        
+        # extra waterfall threads. decode, resize and lz4 all release the GIL, so these genuinely run in parallel
+        
+        while not HydrusThreading.IsThreadShuttingDown():
+            
+            time.sleep( 0.00001 )
+            
+            with self._lock:
+                
+                do_wait = len( self._waterfall_queue ) == 0
+                
+            
+            if do_wait:
+                
+                waterfall_event.wait( 1 )
+                
+                waterfall_event.clear()
+                
+            
+            self._DoWaterfallWork()
+            
+        
+    
@@ -44,6 +44,7 @@ from hydrus.client.gui import ClientGUIStyle
 from hydrus.client.gui import ClientGUITopLevelWindowsPanels
 from hydrus.client.gui import QtPorting as QP
 from hydrus.client.gui.lists import ClientGUIListManager
+from hydrus.client.importing import ClientImportFileSeeds
 from hydrus.client.importing import ClientImportSubscriptions
 from hydrus.client.metadata import ClientTags
 from hydrus.client.metadata import ClientTagsHandling
@@ -1249,6 +1250,20 @@ class Controller( HydrusController.HydrusController ):
             return
             
         
+        cooccurrence_stop_time = stop_time
+        
+        if cooccurrence_stop_time is None:
+            
+            cooccurrence_stop_time = HydrusData.GetNow() + 60
+            
+        
+        self.WriteSynchronous( 'maintain_tag_cooccurrence_index', maintenance_mode = maintenance_mode, stop_time = cooccurrence_stop_time )
+        
+        if self.ShouldStopThisWork( maintenance_mode, stop_time = stop_time ):
+            
+            return
+            
+        
         if self.new_options.GetBoolean( 'maintain_similar_files_duplicate_pairs_during_idle' ):
             
             search_distance = self.new_options.GetInteger( 'similar_files_duplicate_pairs_search_distance' )
@@ -1790,6 +1805,13 @@ class Controller( HydrusController.HydrusController ):
             self.SaveDirtyObjectsInfrequent()
             
         
+        if self.client_files_manager is not None:
+            
+            self.client_files_manager.Shutdown()
+            
+        
+        ClientImportFileSeeds.ShutdownFileImportProcessPool()
+        
         HydrusController.HydrusController.ShutdownModel( self )
         
     
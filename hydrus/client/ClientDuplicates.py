@@ -161,15 +161,25 @@ class DuplicatesManager( object ):
             
             still_work_to_do = True
             
+            total_num_done = 0
+            total_work_time = 0.0
+            
             while still_work_to_do:
                 
                 search_distance = HG.client_controller.new_options.GetInteger( 'similar_files_duplicate_pairs_search_distance' )
                 
+                work_started = HydrusData.GetNowPrecise()
+                
                 ( still_work_to_do, num_done ) = HG.client_controller.WriteSynchronous( 'maintain_similar_files_search_for_potential_duplicates', search_distance, maintenance_mode = HC.MAINTENANCE_FORCED, job_key = job_key, work_time_float = 0.5 )
                 
+                total_work_time += HydrusData.GetNowPrecise() - work_started
+                
                 num_searched_estimate += num_done
+                total_num_done += num_done
+                
+                files_per_second = total_num_done / max( total_work_time, 0.001 )
                 
-                text = 'searching: {}'.format( HydrusData.ConvertValueRangeToPrettyString( num_searched_estimate, total_num_files ) )
+                text = 'searching: {} ({} files/s)'.format( HydrusData.ConvertValueRangeToPrettyString( num_searched_estimate, total_num_files ), HydrusData.ToHumanInt( int( files_per_second ) ) )
                 job_key.SetVariable( 'popup_text_1', text )
                 job_key.SetVariable( 'popup_gauge_1', ( num_searched_estimate, total_num_files ) )
                 
@@ -13,6 +13,7 @@ from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusFileHandling
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusImageHandling
+from hydrus.core import HydrusNetwork
 from hydrus.core import HydrusNetworking
 from hydrus.core import HydrusPaths
 from hydrus.core import HydrusThreading
@@ -21,6 +22,7 @@ from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientImageHandling
 from hydrus.client import ClientPaths
 from hydrus.client import ClientThreading
+from hydrus.client import ClientThumbnailStore
 from hydrus.client.gui import QtPorting as QP
 
 REGENERATE_FILE_DATA_JOB_FILE_METADATA = 0
@@ -108,6 +110,9 @@ regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_
 regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA ] = [ REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP ]
 regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP ] = []
 
+# how many files we decode together when regenerating similar files metadata
+SIMILAR_FILES_METADATA_REGEN_BATCH_SIZE = 32
+
 ALL_REGEN_JOBS_IN_PREFERRED_ORDER = [ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE, REGENERATE_FILE_DATA_JOB_FILE_METADATA, REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL, REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA, REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP, REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS, REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP, REGENERATE_FILE_DATA_JOB_OTHER_HASHES, REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES ]
 
 def GetAllFilePaths( raw_paths, do_human_sort = True ):
@@ -149,6 +154,124 @@ def GetAllFilePaths( raw_paths, do_human_sort = True ):
     
     return file_paths
     
+class DirectoryChangeTracker( object ):
+    
+    # remembers the mtime and listing of every directory under a root, so a rescan only has to list the directories that changed
+    # adding, removing or renaming a file updates its directory's mtime, so unchanged directories can reuse their old listing
+    
+    # a directory that changes again within this many ns of us listing it may not get a new mtime, so we don't trust those listings
+    RACY_MTIME_WINDOW_NS = 2 * 1000000000
+    
+    def __init__( self, root_path ):
+        
+        self._root_path = root_path
+        
+        self._dir_paths_to_listings = {}
+        
+        self._lock = threading.Lock()
+        
+    
+    def _ListDirectory( self, dir_path ):
+        
+        subdir_paths = []
+        file_paths = []
+        
+        with os.scandir( dir_path ) as scan:
+            
+            for entry in scan:
+                
+                if entry.is_dir():
+                    
+                    subdir_paths.append( entry.path )
+                    
+                else:
+                    
+                    file_paths.append( entry.path )
+                    
+                
+            
+        
+        return ( subdir_paths, file_paths )
+        
+    
+    def GetAllFilePaths( self ):
+        
+        # every directory still gets a stat, but only the changed ones get a listdir
+        
+        with self._lock:
+            
+            file_paths = []
+            
+            seen_dir_paths = set()
+            
+            dir_paths_to_process = [ self._root_path ]
+            
+            while len( dir_paths_to_process ) > 0:
+                
+                if HG.view_shutdown:
+                    
+                    raise HydrusExceptions.ShutdownException()
+                    
+                
+                dir_path = dir_paths_to_process.pop()
+                
+                if dir_path in seen_dir_paths:
+                    
+                    continue
+                    
+                
+                seen_dir_paths.add( dir_path )
+                
+                try:
+                    
+                    mtime_ns = os.stat( dir_path ).st_mtime_ns
+                    
+                except OSError:
+                    
+                    continue # it went away while we were looking
+                    
+                
+                listing = self._dir_paths_to_listings.get( dir_path, None )
+                
+                if listing is not None:
+                    
+                    ( listed_mtime_ns, listed_time_ns, subdir_paths, dir_file_paths ) = listing
+                    
+                    if listed_mtime_ns != mtime_ns or listed_mtime_ns + self.RACY_MTIME_WINDOW_NS > listed_time_ns:
+                        
+                        listing = None
+                        
+                    
+                
+                if listing is None:
+                    
+                    listed_time_ns = time.time_ns()
+                    
+                    try:
+                        
+                        ( subdir_paths, dir_file_paths ) = self._ListDirectory( dir_path )
+                        
+                    except OSError:
+                        
+                        continue
+                        
+                    
+                    self._dir_paths_to_listings[ dir_path ] = ( mtime_ns, listed_time_ns, subdir_paths, dir_file_paths )
+                    
+                
+                dir_paths_to_process.extend( subdir_paths )
+                file_paths.extend( dir_file_paths )
+                
+            
+            for dir_path in set( self._dir_paths_to_listings.keys() ).difference( seen_dir_paths ):
+                
+                del self._dir_paths_to_listings[ dir_path ]
+                
+            
+            return file_paths
+            
+        
+    
 class ClientFilesManager( object ):
     
     def __init__( self, controller ):
@@ -164,6 +287,25 @@ class ClientFilesManager( object ):
         
         self._Reinit()
         
+        self._pack_new_thumbnails = self._controller.new_options.GetBoolean( 'use_packed_thumbnail_store' )
+        self._packed_thumbnail_store = None
+        
+        packed_thumbnail_store_dir = self._GetPackedThumbnailStoreDir()
+        
+        existing_packed_thumbnail_store_dirs = self._GetExistingPackedThumbnailStoreDirs()
+        
+        if len( existing_packed_thumbnail_store_dirs ) > 0 and packed_thumbnail_store_dir not in existing_packed_thumbnail_store_dirs:
+            
+            # the thumbnails were moved since we last booted. we open it where it is, and the next rebalance moves it over
+            packed_thumbnail_store_dir = existing_packed_thumbnail_store_dirs[0]
+            
+        
+        # if the user has turned packing off, we still read what is in there until it is unpacked
+        if self._pack_new_thumbnails or len( existing_packed_thumbnail_store_dirs ) > 0:
+            
+            self._packed_thumbnail_store = ClientThumbnailStore.PackedThumbnailStore( packed_thumbnail_store_dir )
+            
+        
     
     def _AddFile( self, hash, mime, source_path ):
         
@@ -186,6 +328,41 @@ class ClientFilesManager( object ):
         
         dest_path = self._GenerateExpectedThumbnailPath( hash )
         
+        # only one of the loose file or the packed record may exist, so neither is ever out of date
+        
+        if self._pack_new_thumbnails:
+            
+            if HG.file_report_mode:
+                
+                HydrusData.ShowText( 'Adding thumbnail to packed store: ' + str( ( len( thumbnail_bytes ), hash.hex() ) ) )
+                
+            
+            self._packed_thumbnail_store.AddThumbnail( hash, thumbnail_bytes )
+            
+            if os.path.exists( dest_path ):
+                
+                ClientPaths.DeletePath( dest_path, always_delete_fully = True )
+                
+            
+        else:
+            
+            self._AddThumbnailFileFromBytes( hash, dest_path, thumbnail_bytes )
+            
+            if self._packed_thumbnail_store is not None:
+                
+                self._packed_thumbnail_store.DeleteThumbnails( ( hash, ) )
+                
+            
+        
+        if not silent:
+            
+            self._controller.pub( 'clear_thumbnails', { hash } )
+            self._controller.pub( 'new_thumbnails', { hash } )
+            
+        
+    
+    def _AddThumbnailFileFromBytes( self, hash, dest_path, thumbnail_bytes ):
+        
         if HG.file_report_mode:
             
             HydrusData.ShowText( 'Adding thumbnail: ' + str( ( len( thumbnail_bytes ), dest_path ) ) )
@@ -218,12 +395,6 @@ class ClientFilesManager( object ):
             raise HydrusExceptions.FileMissingException( 'The thumbnail for file "{}" failed to write to path "{}". This event suggests that hydrus does not have permission to write to its thumbnail folder. Please check everything is ok.'.format( hash.hex(), dest_path ) )
             
         
-        if not silent:
-            
-            self._controller.pub( 'clear_thumbnails', { hash } )
-            self._controller.pub( 'new_thumbnails', { hash } )
-            
-        
     
     def _AttemptToHealMissingLocations( self ):
         
@@ -403,6 +574,55 @@ class ClientFilesManager( object ):
         return thumbnail_bytes
         
     
+    def _GetExistingPackedThumbnailStoreDirs( self ):
+        
+        locations = set( self._prefixes_to_locations.values() )
+        
+        locations.add( os.path.join( self._controller.GetDBDir(), 'client_files' ) )
+        
+        possible_dirs = [ os.path.join( location, 'packed_thumbnails' ) for location in locations ]
+        
+        return sorted( ( possible_dir for possible_dir in possible_dirs if os.path.exists( possible_dir ) ) )
+        
+    
+    def _GetPackedThumbnailStoreDir( self ):
+        
+        # the packed store lives with the thumbnails, so it goes wherever most of the 't' prefixes are
+        
+        thumbnail_locations_to_counts = collections.Counter( ( location for ( prefix, location ) in self._prefixes_to_locations.items() if prefix.startswith( 't' ) ) )
+        
+        if len( thumbnail_locations_to_counts ) == 0:
+            
+            location = os.path.join( self._controller.GetDBDir(), 'client_files' )
+            
+        else:
+            
+            location = max( sorted( thumbnail_locations_to_counts.keys() ), key = lambda l: thumbnail_locations_to_counts[ l ] )
+            
+        
+        return os.path.join( location, 'packed_thumbnails' )
+        
+    
+    
+    def _GetPackedThumbnailStoreMoveTuple( self ):
+        
+        if self._packed_thumbnail_store is None:
+            
+            return None
+            
+        
+        current_dir = self._packed_thumbnail_store.GetDirectory()
+        correct_dir = self._GetPackedThumbnailStoreDir()
+        
+        # we never merge segments into another store's directory, since the segment filenames would collide
+        if current_dir == correct_dir or os.path.exists( correct_dir ):
+            
+            return None
+            
+        
+        return ( current_dir, correct_dir )
+        
+    
     def _GetRecoverTuple( self ):
         
         all_locations = { location for location in list(self._prefixes_to_locations.values()) }
@@ -592,6 +812,31 @@ class ClientFilesManager( object ):
         raise HydrusExceptions.FileMissingException( 'File for ' + hash.hex() + ' not found!' )
         
     
+    def _ReadThumbnailBytes( self, hash ):
+        
+        if self._packed_thumbnail_store is not None:
+            
+            thumbnail_bytes = self._packed_thumbnail_store.GetThumbnail( hash )
+            
+            if thumbnail_bytes is not None:
+                
+                return thumbnail_bytes
+                
+            
+        
+        path = self._GenerateExpectedThumbnailPath( hash )
+        
+        if not os.path.exists( path ):
+            
+            return None
+            
+        
+        with open( path, 'rb' ) as f:
+            
+            return f.read()
+            
+        
+    
     def _Reinit( self ):
         
         self._prefixes_to_locations = self._controller.Read( 'client_files_locations' )
@@ -880,6 +1125,33 @@ class ClientFilesManager( object ):
                     
                 
             
+            orphan_packed_thumbnail_hashes = []
+            
+            if self._packed_thumbnail_store is not None:
+                
+                for ( i, hash ) in enumerate( self._packed_thumbnail_store.GetHashes() ):
+                    
+                    ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                    
+                    if should_quit:
+                        
+                        return
+                        
+                    
+                    if i % 100 == 0:
+                        
+                        status = 'reviewed ' + HydrusData.ToHumanInt( i ) + ' packed thumbnails, found ' + HydrusData.ToHumanInt( len( orphan_packed_thumbnail_hashes ) ) + ' orphans'
+                        
+                        job_key.SetVariable( 'popup_text_1', status )
+                        
+                    
+                    if HG.client_controller.Read( 'is_an_orphan', 'thumbnail', hash ):
+                        
+                        orphan_packed_thumbnail_hashes.append( hash )
+                        
+                    
+                
+            
             time.sleep( 2 )
             
             if move_location is None and len( orphan_paths ) > 0:
@@ -936,13 +1208,22 @@ class ClientFilesManager( object ):
                     
                 
             
-            if len( orphan_paths ) == 0 and len( orphan_thumbnails ) == 0:
+            if len( orphan_packed_thumbnail_hashes ) > 0:
+                
+                HydrusData.Print( 'Deleting ' + HydrusData.ToHumanInt( len( orphan_packed_thumbnail_hashes ) ) + ' orphan thumbnails from the packed thumbnail store' )
+                
+                self._packed_thumbnail_store.DeleteThumbnails( orphan_packed_thumbnail_hashes )
+                
+            
+            num_orphan_thumbnails = len( orphan_thumbnails ) + len( orphan_packed_thumbnail_hashes )
+            
+            if len( orphan_paths ) == 0 and num_orphan_thumbnails == 0:
                 
                 final_text = 'no orphans found!'
                 
             else:
                 
-                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( len( orphan_thumbnails ) ) + ' orphan thumbnails cleared!'
+                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( num_orphan_thumbnails ) + ' orphan thumbnails cleared!'
                 
             
             job_key.SetVariable( 'popup_text_1', final_text )
@@ -953,6 +1234,32 @@ class ClientFilesManager( object ):
             
         
     
+    def CompactThumbnailStore( self, job_key ):
+        
+        try:
+            
+            if self._packed_thumbnail_store is None:
+                
+                return
+                
+            
+            job_key.SetVariable( 'popup_text_1', 'compacting' )
+            
+            with self._rwlock.write:
+                
+                num_bytes_reclaimed = self._packed_thumbnail_store.Compact()
+                
+            
+            job_key.SetVariable( 'popup_text_1', 'done! {} reclaimed. {}'.format( HydrusData.ToHumanBytes( num_bytes_reclaimed ), self._packed_thumbnail_store.GetPrettyStatistics() ) )
+            
+            HydrusData.Print( job_key.ToString() )
+            
+        finally:
+            
+            job_key.Finish()
+            
+        
+    
     def DelayedDeleteFiles( self, hashes ):
         
         if HG.file_report_mode:
@@ -1002,6 +1309,11 @@ class ClientFilesManager( object ):
             
             with self._rwlock.write:
                 
+                if self._packed_thumbnail_store is not None:
+                    
+                    self._packed_thumbnail_store.DeleteThumbnails( hashes_chunk )
+                    
+                
                 for hash in hashes_chunk:
                     
                     path = self._GenerateExpectedThumbnailPath( hash )
@@ -1117,33 +1429,61 @@ class ClientFilesManager( object ):
         return path
         
     
-    def GetThumbnailPath( self, media ):
+    def GetThumbnailBytes( self, media ):
         
         hash = media.GetHash()
         mime = media.GetMime()
         
         if HG.file_report_mode:
             
-            HydrusData.ShowText( 'Thumbnail path request: ' + str( ( hash, mime ) ) )
+            HydrusData.ShowText( 'Thumbnail request: ' + str( ( hash, mime ) ) )
             
         
         with self._rwlock.read:
             
-            path = self._GenerateExpectedThumbnailPath( hash )
-            
-            thumb_missing = not os.path.exists( path )
+            thumbnail_bytes = self._ReadThumbnailBytes( hash )
             
         
-        if thumb_missing:
+        if thumbnail_bytes is None:
             
             self.RegenerateThumbnail( media )
             
+            with self._rwlock.read:
+                
+                thumbnail_bytes = self._ReadThumbnailBytes( hash )
+                
+            
+            if thumbnail_bytes is None:
+                
+                raise HydrusExceptions.FileMissingException( 'The thumbnail for file ' + hash.hex() + ' was missing and could not be regenerated!' )
+                
+            
         
-        return path
+        return thumbnail_bytes
+        
+    
+    def GetThumbnailStoreStatistics( self ):
+        
+        if self._packed_thumbnail_store is None:
+            
+            return 'thumbnails are stored as loose files'
+            
+        
+        return self._packed_thumbnail_store.GetPrettyStatistics()
+        
+    
+    def HasPackedThumbnailStore( self ):
+        
+        return self._packed_thumbnail_store is not None
         
     
     def LocklessHasThumbnail( self, hash ):
         
+        if self._packed_thumbnail_store is not None and self._packed_thumbnail_store.HasThumbnail( hash ):
+            
+            return True
+            
+        
         path = self._GenerateExpectedThumbnailPath( hash )
         
         if HG.file_report_mode:
@@ -1154,6 +1494,86 @@ class ClientFilesManager( object ):
         return os.path.exists( path )
         
     
+    def PackThumbnails( self, job_key ):
+        
+        # moves any loose thumbnail files into the packed store
+        
+        try:
+            
+            if not self._pack_new_thumbnails:
+                
+                job_key.SetVariable( 'popup_text_1', 'The packed thumbnail store is not turned on!' )
+                
+                return
+                
+            
+            num_packed = 0
+            
+            with self._rwlock.write:
+                
+                for ( i, path ) in enumerate( self._IterateAllThumbnailPaths() ):
+                    
+                    ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                    
+                    if should_quit:
+                        
+                        break
+                        
+                    
+                    if i % 100 == 0:
+                        
+                        job_key.SetVariable( 'popup_text_1', 'reviewed ' + HydrusData.ToHumanInt( i ) + ' thumbnail files, packed ' + HydrusData.ToHumanInt( num_packed ) )
+                        
+                    
+                    ( directory, filename ) = os.path.split( path )
+                    
+                    try:
+                        
+                        hash = bytes.fromhex( filename[:64] )
+                        
+                    except ValueError:
+                        
+                        continue
+                        
+                    
+                    if len( hash ) != 32:
+                        
+                        continue
+                        
+                    
+                    with open( path, 'rb' ) as f:
+                        
+                        thumbnail_bytes = f.read()
+                        
+                    
+                    if len( thumbnail_bytes ) == 0:
+                        
+                        continue
+                        
+                    
+                    if not self._packed_thumbnail_store.HasThumbnail( hash ):
+                        
+                        self._packed_thumbnail_store.AddThumbnail( hash, thumbnail_bytes )
+                        
+                        num_packed += 1
+                        
+                    
+                    ClientPaths.DeletePath( path, always_delete_fully = True )
+                    
+                
+                self._packed_thumbnail_store.SaveIndex()
+                
+            
+            job_key.SetVariable( 'popup_text_1', 'done! {} thumbnails packed. {}'.format( HydrusData.ToHumanInt( num_packed ), self._packed_thumbnail_store.GetPrettyStatistics() ) )
+            
+            HydrusData.Print( job_key.ToString() )
+            
+        finally:
+            
+            job_key.Finish()
+            
+        
+    
     def Rebalance( self, job_key ):
         
         try:
@@ -1221,6 +1641,33 @@ class ClientFilesManager( object ):
                     time.sleep( 0.01 )
                     
                 
+                packed_thumbnail_store_move_tuple = self._GetPackedThumbnailStoreMoveTuple()
+                
+                if packed_thumbnail_store_move_tuple is not None and not job_key.IsCancelled():
+                    
+                    ( current_dir, correct_dir ) = packed_thumbnail_store_move_tuple
+                    
+                    text = 'Moving the packed thumbnail store from ' + current_dir + ' to ' + correct_dir
+                    
+                    HydrusData.Print( text )
+                    
+                    job_key.SetVariable( 'popup_text_1', text )
+                    
+                    self._packed_thumbnail_store.Close()
+                    
+                    try:
+                        
+                        HydrusPaths.MergeTree( current_dir, correct_dir )
+                        
+                    finally:
+                        
+                        # if the move failed, we carry on from wherever the segments ended up
+                        store_dir = current_dir if os.path.exists( current_dir ) else correct_dir
+                        
+                        self._packed_thumbnail_store = ClientThumbnailStore.PackedThumbnailStore( store_dir )
+                        
+                    
+                
             
         finally:
             
@@ -1236,7 +1683,33 @@ class ClientFilesManager( object ):
         
         with self._rwlock.read:
             
-            return self._GetRebalanceTuple() is not None
+            return self._GetRebalanceTuple() is not None or self._GetPackedThumbnailStoreMoveTuple() is not None
+            
+        
+    
+    def RebuildThumbnailStoreIndex( self, job_key ):
+        
+        try:
+            
+            if self._packed_thumbnail_store is None:
+                
+                return
+                
+            
+            job_key.SetVariable( 'popup_text_1', 'scanning thumbnail segments' )
+            
+            with self._rwlock.write:
+                
+                self._packed_thumbnail_store.RebuildIndex()
+                
+            
+            job_key.SetVariable( 'popup_text_1', 'done! ' + self._packed_thumbnail_store.GetPrettyStatistics() )
+            
+            HydrusData.Print( job_key.ToString() )
+            
+        finally:
+            
+            job_key.Finish()
             
         
     
@@ -1284,9 +1757,14 @@ class ClientFilesManager( object ):
             
             ( media_width, media_height ) = media.GetResolution()
             
-            path = self._GenerateExpectedThumbnailPath( hash )
+            thumbnail_bytes = self._ReadThumbnailBytes( hash )
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+            if thumbnail_bytes is None:
+                
+                raise HydrusExceptions.FileMissingException( 'Thumbnail missing!' )
+                
+            
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
             
             ( current_width, current_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
             
@@ -1312,6 +1790,81 @@ class ClientFilesManager( object ):
         return do_it
         
     
+    def Shutdown( self ):
+        
+        if self._packed_thumbnail_store is not None:
+            
+            with self._rwlock.write:
+                
+                self._packed_thumbnail_store.Close()
+                
+            
+        
+    
+    def UnpackThumbnails( self, job_key ):
+        
+        # writes everything in the packed store back out to loose files and then deletes the store
+        
+        try:
+            
+            if self._pack_new_thumbnails:
+                
+                job_key.SetVariable( 'popup_text_1', 'The packed thumbnail store is still turned on! Turn it off in the options and restart the client first.' )
+                
+                return
+                
+            
+            if self._packed_thumbnail_store is None:
+                
+                return
+                
+            
+            with self._rwlock.write:
+                
+                hashes = self._packed_thumbnail_store.GetHashes()
+                
+                for ( i, hash ) in enumerate( hashes ):
+                    
+                    ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                    
+                    if should_quit:
+                        
+                        self._packed_thumbnail_store.SaveIndex()
+                        
+                        return
+                        
+                    
+                    if i % 100 == 0:
+                        
+                        job_key.SetVariable( 'popup_text_1', 'unpacking: ' + HydrusData.ConvertValueRangeToPrettyString( i, len( hashes ) ) )
+                        
+                    
+                    thumbnail_bytes = bytes( self._packed_thumbnail_store.GetThumbnail( hash ) )
+                    
+                    self._AddThumbnailFileFromBytes( hash, self._GenerateExpectedThumbnailPath( hash ), thumbnail_bytes )
+                    
+                    self._packed_thumbnail_store.DeleteThumbnails( ( hash, ) )
+                    
+                
+                packed_thumbnail_store_dir = self._packed_thumbnail_store.GetDirectory()
+                
+                self._packed_thumbnail_store.Close()
+                
+                self._packed_thumbnail_store = None
+                
+                ClientPaths.DeletePath( packed_thumbnail_store_dir, always_delete_fully = True )
+                
+            
+            job_key.SetVariable( 'popup_text_1', 'done! {} thumbnails unpacked'.format( HydrusData.ToHumanInt( len( hashes ) ) ) )
+            
+            HydrusData.Print( job_key.ToString() )
+            
+        finally:
+            
+            job_key.Finish()
+            
+        
+    
 class FilesMaintenanceManager( object ):
     
     def __init__( self, controller ):
@@ -1391,7 +1944,15 @@ class FilesMaintenanceManager( object ):
         
         if not file_is_missing and job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE ):
             
-            actual_hash = HydrusFileHandling.GetHashFromPath( path )
+            if mime in HC.HYDRUS_UPDATE_FILES:
+                
+                # binary updates are stored under the hash of the canonical json update they stand for
+                actual_hash = HydrusNetwork.GetUpdateHashFromPath( path )
+                
+            else:
+                
+                actual_hash = HydrusFileHandling.GetHashFromPath( path )
+                
             
             if hash != actual_hash:
                 
@@ -1667,30 +2228,53 @@ class FilesMaintenanceManager( object ):
             
         
     
-    def _RegenSimilarFilesMetadata( self, media_result ):
+    def _RegenSimilarFilesMetadataBatch( self, media_results ):
         
-        hash = media_result.GetHash()
-        mime = media_result.GetMime()
+        # returns hash -> phashes or None or the exception that happened
+        
+        hashes_to_results = {}
         
-        if mime not in HC.MIMES_WE_CAN_PHASH:
+        hashes_to_check_membership = set()
+        hashes_to_do = []
+        paths_and_mimes = []
+        
+        for media_result in media_results:
             
-            self._controller.WriteSynchronous( 'file_maintenance_add_jobs_hashes', { hash }, REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP )
+            hash = media_result.GetHash()
+            mime = media_result.GetMime()
             
-            return None
+            hashes_to_results[ hash ] = None
             
-        
-        try:
+            if mime not in HC.MIMES_WE_CAN_PHASH:
+                
+                hashes_to_check_membership.add( hash )
+                
+                continue
+                
             
-            path = self._controller.client_files_manager.GetFilePath( hash, mime )
+            try:
+                
+                path = self._controller.client_files_manager.GetFilePath( hash, mime )
+                
+            except HydrusExceptions.FileMissingException:
+                
+                continue
+                
             
-        except HydrusExceptions.FileMissingException:
+            hashes_to_do.append( hash )
+            paths_and_mimes.append( ( path, mime ) )
             
-            return None
+        
+        if len( hashes_to_check_membership ) > 0:
+            
+            self._controller.WriteSynchronous( 'file_maintenance_add_jobs_hashes', hashes_to_check_membership, REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP )
             
         
-        phashes = ClientImageHandling.GenerateShapePerceptualHashes( path, mime )
+        results = ClientImageHandling.GenerateShapePerceptualHashesBatch( paths_and_mimes )
         
-        return phashes
+        hashes_to_results.update( zip( hashes_to_do, results ) )
+        
+        return hashes_to_results
         
     
     def _RegenFileThumbnailForce( self, media_result ):
@@ -1768,6 +2352,8 @@ class FilesMaintenanceManager( object ):
                 HydrusData.ShowText( 'file maintenance: {} for {} files'.format( regen_file_enum_to_str_lookup[ job_type ], HydrusData.ToHumanInt( num_to_do ) ) )
                 
             
+            hashes_to_similar_files_metadata_results = {}
+            
             for ( i, media_result ) in enumerate( media_results ):
                 
                 hash = media_result.GetHash()
@@ -1823,7 +2409,19 @@ class FilesMaintenanceManager( object ):
                         
                     elif job_type == REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA:
                         
-                        additional_data = self._RegenSimilarFilesMetadata( media_result )
+                        if hash not in hashes_to_similar_files_metadata_results:
+                            
+                            hashes_to_similar_files_metadata_results = self._RegenSimilarFilesMetadataBatch( media_results[ i : i + SIMILAR_FILES_METADATA_REGEN_BATCH_SIZE ] )
+                            
+                        
+                        result = hashes_to_similar_files_metadata_results[ hash ]
+                        
+                        if isinstance( result, Exception ):
+                            
+                            raise result
+                            
+                        
+                        additional_data = result
                         
                     elif job_type == REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS:
                         
@@ -1,4 +1,4 @@
-from functools import reduce
+import concurrent.futures
 
 import numpy
 import numpy.core.multiarray # important this comes before cv!
@@ -20,177 +20,191 @@ cv_interpolation_enum_lookup[ CC.ZOOM_AREA ] = cv2.INTER_AREA
 cv_interpolation_enum_lookup[ CC.ZOOM_CUBIC ] = cv2.INTER_CUBIC
 cv_interpolation_enum_lookup[ CC.ZOOM_LANCZOS4 ] = cv2.INTER_LANCZOS4
 
+# the top eight rows of the orthonormal 32-point DCT-II matrix, which is what cv2.dct uses
+PHASH_DCT_MATRIX_8 = numpy.array( [ [ ( ( 1 if k == 0 else 2 ) / 32 ) ** 0.5 * numpy.cos( numpy.pi * ( 2 * n + 1 ) * k / 64 ) for n in range( 32 ) ] for k in range( 8 ) ] )
+PHASH_BATCH_NUM_THREADS = 4
+
 def DiscardBlankPerceptualHashes( phashes ):
     
     phashes = { phash for phash in phashes if HydrusData.Get64BitHammingDistance( phash, CC.BLANK_PHASH ) > 4 }
     
     return phashes
     
-def GenerateNumPyImage( path, mime ):
+def GenerateNumPyImage( path, mime, force_pil = None ):
     
-    force_pil = HG.client_controller.new_options.GetBoolean( 'load_images_with_pil' )
+    if force_pil is None:
+        
+        force_pil = HG.client_controller.new_options.GetBoolean( 'load_images_with_pil' )
+        
     
     return HydrusImageHandling.GenerateNumPyImage( path, mime, force_pil = force_pil )
     
-def GenerateShapePerceptualHashes( path, mime ):
+def GenerateNumPyImageFromBytes( image_bytes, mime ):
     
-    if HG.phash_generation_report_mode:
-        
-        HydrusData.ShowText( 'phash generation: loading image' )
-        
+    force_pil = HG.client_controller.new_options.GetBoolean( 'load_images_with_pil' )
     
-    numpy_image = GenerateNumPyImage( path, mime )
+    return HydrusImageHandling.GenerateNumPyImageFromBytes( image_bytes, mime, force_pil = force_pil )
     
-    if HG.phash_generation_report_mode:
-        
-        HydrusData.ShowText( 'phash generation: image shape: {}'.format( numpy_image.shape ) )
-        
+def GenerateShapePerceptualHashes( path, mime, force_pil = None ):
     
-    ( y, x, depth ) = numpy_image.shape
+    tile = GenerateShapePerceptualHashTile( path, mime, force_pil = force_pil )
     
-    if depth == 4:
-        
-        # doing this on 10000x10000 pngs eats ram like mad
-        target_resolution = HydrusImageHandling.GetThumbnailResolution( ( x, y ), ( 1024, 1024 ) )
-        
-        numpy_image = HydrusImageHandling.ResizeNumPyImage( numpy_image, target_resolution )
-        
-        ( y, x, depth ) = numpy_image.shape
-        
-        # create weight and transform numpy_image to greyscale
-        
-        numpy_alpha = numpy_image[ :, :, 3 ]
-        
-        numpy_alpha_float = numpy_alpha / 255.0
+    ( phashes, ) = GenerateShapePerceptualHashesFromTiles( [ tile ] )
+    
+    return phashes
+    
+def GenerateShapePerceptualHashesBatch( paths_and_mimes, force_pil = None, num_threads = PHASH_BATCH_NUM_THREADS ):
+    
+    # returns a list with a set of phashes or an exception for each path
+    # decoding is the slow part, and cv2 and PIL release the GIL while they do it, so threads are fine
+    
+    if force_pil is None:
         
-        numpy_image_bgr = numpy_image[ :, :, :3 ]
+        force_pil = HG.client_controller.new_options.GetBoolean( 'load_images_with_pil' )
         
-        numpy_image_gray_bare = cv2.cvtColor( numpy_image_bgr, cv2.COLOR_RGB2GRAY )
+    
+    time_started = HydrusData.GetNowPrecise()
+    
+    with concurrent.futures.ThreadPoolExecutor( max_workers = num_threads ) as executor:
         
-        # create a white greyscale canvas
+        futures = [ executor.submit( GenerateShapePerceptualHashTile, path, mime, force_pil = force_pil ) for ( path, mime ) in paths_and_mimes ]
         
-        white = numpy.ones( ( y, x ) ) * 255.0
+        concurrent.futures.wait( futures )
         
-        # paste the grayscale image onto the white canvas using: pixel * alpha + white * ( 1 - alpha )
+    
+    time_tiles_done = HydrusData.GetNowPrecise()
+    
+    results = []
+    tiles = []
+    
+    for future in futures:
         
-        numpy_image_gray = numpy.uint8( ( numpy_image_gray_bare * numpy_alpha_float ) + ( white * ( numpy.ones( ( y, x ) ) - numpy_alpha_float ) ) )
+        e = future.exception()
         
-    else:
+        if e is None:
+            
+            tiles.append( future.result() )
+            
         
-        numpy_image_gray = cv2.cvtColor( numpy_image, cv2.COLOR_RGB2GRAY )
+        results.append( e )
         
     
-    if HG.phash_generation_report_mode:
-        
-        HydrusData.ShowText( 'phash generation: grey image shape: {}'.format( numpy_image_gray.shape ) )
-        
+    tiles_phashes = iter( GenerateShapePerceptualHashesFromTiles( tiles ) )
     
-    numpy_image_tiny = cv2.resize( numpy_image_gray, ( 32, 32 ), interpolation = cv2.INTER_AREA )
+    results = [ next( tiles_phashes ) if e is None else e for e in results ]
+    
+    time_done = HydrusData.GetNowPrecise()
     
     if HG.phash_generation_report_mode:
         
-        HydrusData.ShowText( 'phash generation: tiny image shape: {}'.format( numpy_image_tiny.shape ) )
+        HydrusData.ShowText( 'phash generation: batch of {} files, decoding took {}, dct and packing took {}'.format( HydrusData.ToHumanInt( len( paths_and_mimes ) ), HydrusData.TimeDeltaToPrettyTimeDelta( time_tiles_done - time_started ), HydrusData.TimeDeltaToPrettyTimeDelta( time_done - time_tiles_done ) ) )
         
     
-    # convert to float and calc dct
+    return results
     
-    numpy_image_tiny_float = numpy.float32( numpy_image_tiny )
+def GenerateShapePerceptualHashesFromTiles( tiles ):
     
-    if HG.phash_generation_report_mode:
+    # tiles are 32x32 greyscale images, we do them all at once
+    
+    if len( tiles ) == 0:
         
-        HydrusData.ShowText( 'phash generation: tiny float image shape: {}'.format( numpy_image_tiny_float.shape ) )
-        HydrusData.ShowText( 'phash generation: generating dct' )
+        return []
         
     
-    dct = cv2.dct( numpy_image_tiny_float )
+    tiles = numpy.stack( tiles ).astype( numpy.float64 )
     
-    # take top left 8x8 of dct
+    # the top left 8x8 of a 2D dct is just the top eight rows of the dct matrix applied from both sides
     
-    dct_88 = dct[:8,:8]
+    dct_88s = PHASH_DCT_MATRIX_8 @ tiles @ PHASH_DCT_MATRIX_8.T
+    
+    dct_88s = dct_88s.reshape( ( len( tiles ), 64 ) )
     
     # get median of dct
     # exclude [0,0], which represents flat colour
-    # this [0,0] exclusion is apparently important for mean, but maybe it ain't so important for median--w/e
     
-    # old mean code
-    # mask = numpy.ones( ( 8, 8 ) )
-    # mask[0,0] = 0
-    # average = numpy.average( dct_88, weights = mask )
+    medians = numpy.median( dct_88s[ :, 1: ], axis = 1 )
+    
+    # make a monochromatic, 64-bit hash of whether the entry is above or below the median
+    # packbits goes big-endian, so each row of the 8x8 becomes one byte, just like TTTFTFTF -> 11101010
+    
+    dct_88s_boolean = dct_88s > medians[ :, numpy.newaxis ]
+    
+    packed_phashes = numpy.packbits( dct_88s_boolean, axis = 1 )
+    
+    # now discard the blank hash, which is 1000000... and not useful
     
-    median = numpy.median( dct_88.reshape( 64 )[1:] )
+    phashes_list = [ DiscardBlankPerceptualHashes( { packed_phash.tobytes() } ) for packed_phash in packed_phashes ]
     
     if HG.phash_generation_report_mode:
         
-        HydrusData.ShowText( 'phash generation: median: {}'.format( median ) )
+        HydrusData.ShowText( 'phash generation: phashes: {}'.format( [ [ phash.hex() for phash in phashes ] for phashes in phashes_list ] ) )
         
     
-    # make a monochromatic, 64-bit hash of whether the entry is above or below the median
+    # we good
     
-    dct_88_boolean = dct_88 > median
+    return phashes_list
+    
+def GenerateShapePerceptualHashTile( path, mime, force_pil = None ):
     
     if HG.phash_generation_report_mode:
         
-        HydrusData.ShowText( 'phash generation: collapsing bytes' )
+        HydrusData.ShowText( 'phash generation: loading image' )
         
     
-    # convert TTTFTFTF to 11101010 by repeatedly shifting answer and adding 0 or 1
-    # you can even go ( a << 1 ) + b and leave out the initial param on the reduce call as bools act like ints for this
-    # but let's not go crazy for another two nanoseconds
-    def collapse_bools_to_binary_uint( a, b ):
+    numpy_image = GenerateNumPyImage( path, mime, force_pil = force_pil )
+    
+    if HG.phash_generation_report_mode:
         
-        return ( a << 1 ) + int( b )
+        HydrusData.ShowText( 'phash generation: image shape: {}'.format( numpy_image.shape ) )
         
     
-    list_of_bytes = []
+    ( y, x, depth ) = numpy_image.shape
     
-    for i in range( 8 ):
+    if depth == 4:
         
-        '''
-        # old way of doing it, which compared value to median every time
-        byte = 0
+        # doing this on 10000x10000 pngs eats ram like mad
+        target_resolution = HydrusImageHandling.GetThumbnailResolution( ( x, y ), ( 1024, 1024 ) )
         
-        for j in range( 8 ):
-            
-            byte <<= 1 # shift byte one left
-            
-            value = dct_88[i,j]
-            
-            if value > median:
-                
-                byte |= 1
-                
-            
-        '''
+        numpy_image = HydrusImageHandling.ResizeNumPyImage( numpy_image, target_resolution )
         
-        # this is a 0-255 int
-        byte = reduce( collapse_bools_to_binary_uint, dct_88_boolean[i], 0 )
+        ( y, x, depth ) = numpy_image.shape
         
-        list_of_bytes.append( byte )
+        # create weight and transform numpy_image to greyscale
+        
+        numpy_alpha = numpy_image[ :, :, 3 ]
+        
+        numpy_alpha_float = numpy_alpha / 255.0
+        
+        numpy_image_bgr = numpy_image[ :, :, :3 ]
+        
+        numpy_image_gray_bare = cv2.cvtColor( numpy_image_bgr, cv2.COLOR_RGB2GRAY )
+        
+        # create a white greyscale canvas
+        
+        white = numpy.ones( ( y, x ) ) * 255.0
+        
+        # paste the grayscale image onto the white canvas using: pixel * alpha + white * ( 1 - alpha )
+        
+        numpy_image_gray = numpy.uint8( ( numpy_image_gray_bare * numpy_alpha_float ) + ( white * ( numpy.ones( ( y, x ) ) - numpy_alpha_float ) ) )
+        
+    else:
+        
+        numpy_image_gray = cv2.cvtColor( numpy_image, cv2.COLOR_RGB2GRAY )
         
-    
-    phash = bytes( list_of_bytes ) # this works!
     
     if HG.phash_generation_report_mode:
         
-        HydrusData.ShowText( 'phash generation: phash: {}'.format( phash.hex() ) )
+        HydrusData.ShowText( 'phash generation: grey image shape: {}'.format( numpy_image_gray.shape ) )
         
     
-    # now discard the blank hash, which is 1000000... and not useful
-    
-    phashes = set()
-    
-    phashes.add( phash )
-    
-    phashes = DiscardBlankPerceptualHashes( phashes )
+    numpy_image_tiny = cv2.resize( numpy_image_gray, ( 32, 32 ), interpolation = cv2.INTER_AREA )
     
     if HG.phash_generation_report_mode:
         
-        HydrusData.ShowText( 'phash generation: final phashes: {}'.format( len( phashes ) ) )
+        HydrusData.ShowText( 'phash generation: tiny image shape: {}'.format( numpy_image_tiny.shape ) )
         
     
-    # we good
-    
-    return phashes
+    return numpy_image_tiny
     
 def ResizeNumPyImageForMediaViewer( mime, numpy_image, target_resolution ):
     
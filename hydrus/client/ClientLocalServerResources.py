@@ -25,6 +25,17 @@ from hydrus.client.metadata import ClientTags
 from hydrus.client.networking import ClientNetworkingContexts
 from hydrus.client.networking import ClientNetworkingDomain
 
+try:
+    
+    import msgpack
+    
+    MSGPACK_OK = True
+    
+except:
+    
+    MSGPACK_OK = False
+    
+
 local_booru_css = FileResource( os.path.join( HC.STATIC_DIR, 'local_booru_style.css' ), defaultType = 'text/css' )
 
 LOCAL_BOORU_INT_PARAMS = set()
@@ -33,12 +44,269 @@ LOCAL_BOORU_STRING_PARAMS = set()
 LOCAL_BOORU_JSON_PARAMS = set()
 LOCAL_BOORU_JSON_BYTE_LIST_PARAMS = set()
 
-CLIENT_API_INT_PARAMS = { 'file_id' }
-CLIENT_API_BYTE_PARAMS = { 'hash', 'destination_page_key', 'page_key', 'Hydrus-Client-API-Access-Key', 'Hydrus-Client-API-Session-Key' }
+CLIENT_API_INT_PARAMS = { 'file_id', 'offset', 'limit' }
+CLIENT_API_BYTE_PARAMS = { 'hash', 'destination_page_key', 'page_key', 'cursor', 'Hydrus-Client-API-Access-Key', 'Hydrus-Client-API-Session-Key' }
 CLIENT_API_STRING_PARAMS = { 'name', 'url', 'domain' }
-CLIENT_API_JSON_PARAMS = { 'basic_permissions', 'system_inbox', 'system_archive', 'tags', 'file_ids', 'only_return_identifiers', 'detailed_url_information', 'simple' }
+CLIENT_API_JSON_PARAMS = { 'basic_permissions', 'system_inbox', 'system_archive', 'tags', 'file_ids', 'only_return_identifiers', 'detailed_url_information', 'simple', 'include_file_metadata', 'fields', 'columnar', 'msgpack' }
 CLIENT_API_JSON_BYTE_LIST_PARAMS = { 'hashes' }
 
+SEARCH_FILES_MAX_PAGE_SIZE = 10000
+SEARCH_FILES_STREAM_CHUNK_SIZE = 65536
+
+# the file_metadata fields, in their usual order, and which part of the db each one needs
+FILE_METADATA_FIELDS_TO_PARTS = collections.OrderedDict()
+
+FILE_METADATA_FIELDS_TO_PARTS[ 'file_id' ] = 'hashes'
+FILE_METADATA_FIELDS_TO_PARTS[ 'hash' ] = 'hashes'
+FILE_METADATA_FIELDS_TO_PARTS[ 'size' ] = 'info'
+FILE_METADATA_FIELDS_TO_PARTS[ 'mime' ] = 'info'
+FILE_METADATA_FIELDS_TO_PARTS[ 'ext' ] = 'info'
+FILE_METADATA_FIELDS_TO_PARTS[ 'width' ] = 'info'
+FILE_METADATA_FIELDS_TO_PARTS[ 'height' ] = 'info'
+FILE_METADATA_FIELDS_TO_PARTS[ 'duration' ] = 'info'
+FILE_METADATA_FIELDS_TO_PARTS[ 'num_frames' ] = 'info'
+FILE_METADATA_FIELDS_TO_PARTS[ 'num_words' ] = 'info'
+FILE_METADATA_FIELDS_TO_PARTS[ 'has_audio' ] = 'info'
+FILE_METADATA_FIELDS_TO_PARTS[ 'is_inbox' ] = 'locations'
+FILE_METADATA_FIELDS_TO_PARTS[ 'is_local' ] = 'locations'
+FILE_METADATA_FIELDS_TO_PARTS[ 'is_trashed' ] = 'locations'
+FILE_METADATA_FIELDS_TO_PARTS[ 'known_urls' ] = 'urls'
+FILE_METADATA_FIELDS_TO_PARTS[ 'detailed_known_urls' ] = 'urls'
+FILE_METADATA_FIELDS_TO_PARTS[ 'service_names_to_statuses_to_tags' ] = 'tags'
+FILE_METADATA_FIELDS_TO_PARTS[ 'service_names_to_statuses_to_display_tags' ] = 'tags'
+
+def GenerateDetailedKnownURLs( known_urls ):
+    
+    detailed_known_urls = []
+    
+    for known_url in known_urls:
+        
+        try:
+            
+            normalised_url = HG.client_controller.network_engine.domain_manager.NormaliseURL( known_url )
+            
+            ( url_type, match_name, can_parse ) = HG.client_controller.network_engine.domain_manager.GetURLParseCapability( normalised_url )
+            
+        except HydrusExceptions.URLClassException as e:
+            
+            continue
+            
+        
+        detailed_dict = { 'normalised_url' : normalised_url, 'url_type' : url_type, 'url_type_string' : HC.url_type_string_lookup[ url_type ], 'match_name' : match_name, 'can_parse' : can_parse }
+        
+        detailed_known_urls.append( detailed_dict )
+        
+    
+    return detailed_known_urls
+    
+def GenerateFileMetadataColumns( hash_ids, fields, parts_to_hash_ids_to_values ):
+    
+    # the 'media_result_parts' read gives us part -> hash_id -> raw value, so here we lay them out as field -> [ value for each file ]
+    
+    columns = collections.OrderedDict()
+    
+    hash_ids_to_hashes = parts_to_hash_ids_to_values[ 'hashes' ]
+    
+    if 'info' in parts_to_hash_ids_to_values:
+        
+        hash_ids_to_info = parts_to_hash_ids_to_values[ 'info' ]
+        
+        null_info = ( None, HC.APPLICATION_UNKNOWN, None, None, None, None, None, None )
+        
+        infos = [ hash_ids_to_info.get( hash_id, null_info ) for hash_id in hash_ids ]
+        
+    
+    if 'locations' in parts_to_hash_ids_to_values:
+        
+        locations = [ parts_to_hash_ids_to_values[ 'locations' ][ hash_id ] for hash_id in hash_ids ]
+        
+    
+    if 'urls' in parts_to_hash_ids_to_values:
+        
+        known_urls_column = [ sorted( parts_to_hash_ids_to_values[ 'urls' ][ hash_id ] ) for hash_id in hash_ids ]
+        
+    
+    if 'tags' in parts_to_hash_ids_to_values:
+        
+        tags_managers = [ parts_to_hash_ids_to_values[ 'tags' ][ hash_id ] for hash_id in hash_ids ]
+        
+        service_keys_to_names = {}
+        
+    
+    for field in fields:
+        
+        if field == 'file_id':
+            
+            column = list( hash_ids )
+            
+        elif field == 'hash':
+            
+            column = [ hash_ids_to_hashes[ hash_id ].hex() for hash_id in hash_ids ]
+            
+        elif field == 'size':
+            
+            column = [ info[0] for info in infos ]
+            
+        elif field == 'mime':
+            
+            column = [ HC.mime_mimetype_string_lookup[ info[1] ] for info in infos ]
+            
+        elif field == 'ext':
+            
+            column = [ HC.mime_ext_lookup[ info[1] ] for info in infos ]
+            
+        elif field == 'width':
+            
+            column = [ info[2] for info in infos ]
+            
+        elif field == 'height':
+            
+            column = [ info[3] for info in infos ]
+            
+        elif field == 'duration':
+            
+            column = [ info[4] for info in infos ]
+            
+        elif field == 'num_frames':
+            
+            column = [ info[5] for info in infos ]
+            
+        elif field == 'has_audio':
+            
+            column = [ info[6] for info in infos ]
+            
+        elif field == 'num_words':
+            
+            column = [ info[7] for info in infos ]
+            
+        elif field == 'is_inbox':
+            
+            column = [ inbox for ( inbox, current_service_keys ) in locations ]
+            
+        elif field == 'is_local':
+            
+            column = [ CC.COMBINED_LOCAL_FILE_SERVICE_KEY in current_service_keys for ( inbox, current_service_keys ) in locations ]
+            
+        elif field == 'is_trashed':
+            
+            column = [ CC.TRASH_SERVICE_KEY in current_service_keys for ( inbox, current_service_keys ) in locations ]
+            
+        elif field == 'known_urls':
+            
+            column = known_urls_column
+            
+        elif field == 'detailed_known_urls':
+            
+            column = [ GenerateDetailedKnownURLs( known_urls ) for known_urls in known_urls_column ]
+            
+        elif field == 'service_names_to_statuses_to_tags':
+            
+            column = [ GetServiceNamesToStatusesToTags( tags_manager, service_keys_to_names ) for tags_manager in tags_managers ]
+            
+        elif field == 'service_names_to_statuses_to_display_tags':
+            
+            column = [ GetServiceNamesToStatusesToDisplayTags( tags_manager, service_keys_to_names ) for tags_manager in tags_managers ]
+            
+        
+        columns[ field ] = column
+        
+    
+    return columns
+    
+def GenerateFileMetadataRows( media_results, detailed_url_information = False ):
+    
+    metadata = []
+    
+    service_keys_to_names = {}
+    
+    for media_result in media_results:
+        
+        metadata_row = {}
+        
+        file_info_manager = media_result.GetFileInfoManager()
+        
+        metadata_row[ 'file_id' ] = file_info_manager.hash_id
+        metadata_row[ 'hash' ] = file_info_manager.hash.hex()
+        metadata_row[ 'size' ] = file_info_manager.size
+        metadata_row[ 'mime' ] = HC.mime_mimetype_string_lookup[ file_info_manager.mime ]
+        metadata_row[ 'ext' ] = HC.mime_ext_lookup[ file_info_manager.mime ]
+        metadata_row[ 'width' ] = file_info_manager.width
+        metadata_row[ 'height' ] = file_info_manager.height
+        metadata_row[ 'duration' ] = file_info_manager.duration
+        metadata_row[ 'num_frames' ] = file_info_manager.num_frames
+        metadata_row[ 'num_words' ] = file_info_manager.num_words
+        metadata_row[ 'has_audio' ] = file_info_manager.has_audio
+        
+        locations_manager = media_result.GetLocationsManager()
+        
+        metadata_row[ 'is_inbox' ] = locations_manager.inbox
+        metadata_row[ 'is_local' ] = locations_manager.IsLocal()
+        metadata_row[ 'is_trashed' ] = locations_manager.IsTrashed()
+        
+        known_urls = sorted( locations_manager.GetURLs() )
+        
+        metadata_row[ 'known_urls' ] = known_urls
+        
+        if detailed_url_information:
+            
+            metadata_row[ 'detailed_known_urls' ] = GenerateDetailedKnownURLs( known_urls )
+            
+        
+        tags_manager = media_result.GetTagsManager()
+        
+        metadata_row[ 'service_names_to_statuses_to_tags' ] = GetServiceNamesToStatusesToTags( tags_manager, service_keys_to_names )
+        metadata_row[ 'service_names_to_statuses_to_display_tags' ] = GetServiceNamesToStatusesToDisplayTags( tags_manager, service_keys_to_names )
+        
+        metadata.append( metadata_row )
+        
+    
+    return metadata
+    
+def GetServiceNamesToStatusesToDisplayTags( tags_manager, service_keys_to_names ):
+    
+    service_names_to_statuses_to_tags = {}
+    
+    service_keys_to_statuses_to_tags = tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_ACTUAL )
+    
+    for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+        
+        if service_key not in service_keys_to_names:
+            
+            service_keys_to_names[ service_key ] = HG.client_controller.services_manager.GetName( service_key )
+            
+        
+        service_name = service_keys_to_names[ service_key ]
+        
+        service_names_to_statuses_to_tags[ service_name ] = { str( status ) : list( tags ) for ( status, tags ) in statuses_to_tags.items() }
+        
+    
+    return service_names_to_statuses_to_tags
+    
+def GetServiceNamesToStatusesToTags( tags_manager, service_keys_to_names ):
+    
+    service_names_to_statuses_to_tags = {}
+    
+    service_keys_to_statuses_to_tags = tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
+    
+    for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+        
+        if service_key not in service_keys_to_names:
+            
+            service_keys_to_names[ service_key ] = HG.client_controller.services_manager.GetName( service_key )
+            
+        
+        statuses_to_tags_json_serialisable = { str( status ) : list( tags ) for ( status, tags ) in statuses_to_tags.items() if len( tags ) > 0 }
+        
+        if len( statuses_to_tags_json_serialisable ) > 0:
+            
+            service_name = service_keys_to_names[ service_key ]
+            
+            service_names_to_statuses_to_tags[ service_name ] = statuses_to_tags_json_serialisable
+            
+        
+    
+    return service_names_to_statuses_to_tags
+    
 def ParseLocalBooruGETArgs( requests_args ):
     
     args = HydrusNetworking.ParseTwistedRequestGETArgs( requests_args, LOCAL_BOORU_INT_PARAMS, LOCAL_BOORU_BYTE_PARAMS, LOCAL_BOORU_STRING_PARAMS, LOCAL_BOORU_JSON_PARAMS, LOCAL_BOORU_JSON_BYTE_LIST_PARAMS )
@@ -481,9 +749,11 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
             
             client_files_manager = HG.client_controller.client_files_manager
             
-            path = client_files_manager.GetThumbnailPath( media_result )
+            thumbnail_bytes = client_files_manager.GetThumbnailBytes( media_result )
+            
+            response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_UNKNOWN, body = bytes( thumbnail_bytes ) )
             
-            response_context_mime = HC.APPLICATION_UNKNOWN
+            return response_context
             
         elif mime in HC.AUDIO:
             
@@ -1492,7 +1762,28 @@ class HydrusResourceClientAPIRestrictedGetFiles( HydrusResourceClientAPIRestrict
     
 class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClientAPIRestrictedGetFiles ):
     
-    def _threadDoGETJob( self, request ):
+    def _GenerateFileIdsBodyChunks( self, hash_ids ):
+        
+        # same bytes as json.dumps( { 'file_ids' : hash_ids } ), but a piece at a time
+        
+        yield b'{"file_ids": ['
+        
+        for ( i, chunk ) in enumerate( HydrusData.SplitListIntoChunks( hash_ids, SEARCH_FILES_STREAM_CHUNK_SIZE ) ):
+            
+            text = ', '.join( map( str, chunk ) )
+            
+            if i > 0:
+                
+                text = ', ' + text
+                
+            
+            yield text.encode( 'utf-8' )
+            
+        
+        yield b']}'
+        
+    
+    def _RunSearch( self, request ):
         
         tag_search_context = ClientSearch.TagSearchContext( service_key = CC.COMBINED_TAG_SERVICE_KEY )
         predicates = ParseClientAPISearchPredicates( request )
@@ -1504,9 +1795,68 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
         
         hash_ids = HG.client_controller.Read( 'file_query_ids', file_search_context, sort_by = sort_by )
         
-        request.client_api_permissions.SetLastSearchResults( hash_ids )
+        return hash_ids
+        
+    
+    def _threadDoGETJob( self, request ):
+        
+        include_file_metadata = request.parsed_request_args.GetValue( 'include_file_metadata', bool, default_value = False )
+        detailed_url_information = request.parsed_request_args.GetValue( 'detailed_url_information', bool, default_value = False )
+        
+        paginated = 'limit' in request.parsed_request_args or 'cursor' in request.parsed_request_args
+        
+        if include_file_metadata and not paginated:
+            
+            raise HydrusExceptions.BadRequestException( 'File metadata can only be included in paginated searches--please give a limit!' )
+            
+        
+        if not paginated:
+            
+            hash_ids = self._RunSearch( request )
+            
+            request.client_api_permissions.SetLastSearchResults( hash_ids )
+            
+            response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_JSON, body_chunks = self._GenerateFileIdsBodyChunks( hash_ids ) )
+            
+            return response_context
+            
         
-        body_dict = { 'file_ids' : list( hash_ids ) }
+        offset = request.parsed_request_args.GetValue( 'offset', int, default_value = 0 )
+        limit = request.parsed_request_args.GetValue( 'limit', int, default_value = SEARCH_FILES_MAX_PAGE_SIZE )
+        
+        if offset < 0 or limit < 1 or limit > SEARCH_FILES_MAX_PAGE_SIZE:
+            
+            raise HydrusExceptions.BadRequestException( 'The offset must be non-negative and the limit must be between 1 and {}!'.format( HydrusData.ToHumanInt( SEARCH_FILES_MAX_PAGE_SIZE ) ) )
+            
+        
+        if 'cursor' in request.parsed_request_args:
+            
+            cursor_key = request.parsed_request_args.GetValue( 'cursor', bytes )
+            
+        else:
+            
+            hash_ids = self._RunSearch( request )
+            
+            request.client_api_permissions.SetLastSearchResults( hash_ids )
+            
+            cursor_key = request.client_api_permissions.CreateSearchCursor( hash_ids )
+            
+        
+        ( page_hash_ids, num_files ) = request.client_api_permissions.GetSearchCursorPage( cursor_key, offset, limit )
+        
+        body_dict = {}
+        
+        body_dict[ 'file_ids' ] = page_hash_ids
+        body_dict[ 'cursor' ] = cursor_key.hex()
+        body_dict[ 'offset' ] = offset
+        body_dict[ 'num_files' ] = num_files
+        
+        if include_file_metadata:
+            
+            media_results = HG.client_controller.Read( 'media_results_from_ids', page_hash_ids )
+            
+            body_dict[ 'metadata' ] = GenerateFileMetadataRows( media_results, detailed_url_information = detailed_url_information )
+            
         
         body = json.dumps( body_dict )
         
@@ -1570,6 +1920,38 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
         
         only_return_identifiers = request.parsed_request_args.GetValue( 'only_return_identifiers', bool, default_value = False )
         detailed_url_information = request.parsed_request_args.GetValue( 'detailed_url_information', bool, default_value = False )
+        columnar = request.parsed_request_args.GetValue( 'columnar', bool, default_value = False )
+        use_msgpack = request.parsed_request_args.GetValue( 'msgpack', bool, default_value = False )
+        
+        if use_msgpack and not MSGPACK_OK:
+            
+            raise HydrusExceptions.BadRequestException( 'Sorry, this client does not have msgpack available, so it cannot respond with it!' )
+            
+        
+        if 'fields' in request.parsed_request_args:
+            
+            fields = request.parsed_request_args.GetValue( 'fields', list )
+            
+            if len( fields ) == 0:
+                
+                raise HydrusExceptions.BadRequestException( 'Please ask for at least one field!' )
+                
+            
+            bad_fields = [ field for field in fields if field not in FILE_METADATA_FIELDS_TO_PARTS ]
+            
+            if len( bad_fields ) > 0:
+                
+                raise HydrusExceptions.BadRequestException( 'Did not understand these fields: {}'.format( ', '.join( ( str( field ) for field in bad_fields ) ) ) )
+                
+            
+        elif columnar:
+            
+            fields = [ field for field in FILE_METADATA_FIELDS_TO_PARTS.keys() if field != 'detailed_known_urls' or detailed_url_information ]
+            
+        else:
+            
+            fields = None
+            
         
         try:
             
@@ -1583,6 +1965,10 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
                     
                     file_ids_to_hashes = HG.client_controller.Read( 'hash_ids_to_hashes', hash_ids = file_ids )
                     
+                elif fields is not None:
+                    
+                    hash_ids = file_ids
+                    
                 else:
                     
                     media_results = HG.client_controller.Read( 'media_results_from_ids', file_ids )
@@ -1598,6 +1984,19 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
                     
                     file_ids_to_hashes = HG.client_controller.Read( 'hash_ids_to_hashes', hashes = hashes )
                     
+                elif fields is not None:
+                    
+                    hash_ids_to_hashes = HG.client_controller.Read( 'hash_ids_to_hashes', hashes = hashes )
+                    
+                    hashes_to_hash_ids = { hash : hash_id for ( hash_id, hash ) in hash_ids_to_hashes.items() }
+                    
+                    if False in ( hash in hashes_to_hash_ids for hash in hashes ):
+                        
+                        raise HydrusExceptions.DataMissing( 'Missing a hash!' )
+                        
+                    
+                    hash_ids = [ hashes_to_hash_ids[ hash ] for hash in hashes ]
+                    
                 else:
                     
                     media_results = HG.client_controller.Read( 'media_results', hashes )
@@ -1608,6 +2007,13 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
                 raise HydrusExceptions.BadRequestException( 'Please include a file_ids or hashes parameter!' )
                 
             
+            if fields is not None and not only_return_identifiers:
+                
+                parts = { FILE_METADATA_FIELDS_TO_PARTS[ field ] for field in fields }
+                
+                parts_to_hash_ids_to_values = HG.client_controller.Read( 'media_result_parts', hash_ids, parts )
+                
+            
         except HydrusExceptions.DataMissing as e:
             
             raise HydrusExceptions.NotFoundException( 'One or more of those file identifiers did not exist in the database!' )
@@ -1629,120 +2035,36 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
                 metadata.append( metadata_row )
                 
             
-        else:
-            
-            services_manager = HG.client_controller.services_manager
+        elif fields is not None:
             
-            service_keys_to_names = {}
+            columns = GenerateFileMetadataColumns( hash_ids, fields, parts_to_hash_ids_to_values )
             
-            for media_result in media_results:
-                
-                metadata_row = {}
-                
-                file_info_manager = media_result.GetFileInfoManager()
-                
-                metadata_row[ 'file_id' ] = file_info_manager.hash_id
-                metadata_row[ 'hash' ] = file_info_manager.hash.hex()
-                metadata_row[ 'size' ] = file_info_manager.size
-                metadata_row[ 'mime' ] = HC.mime_mimetype_string_lookup[ file_info_manager.mime ]
-                metadata_row[ 'ext' ] = HC.mime_ext_lookup[ file_info_manager.mime ]
-                metadata_row[ 'width' ] = file_info_manager.width
-                metadata_row[ 'height' ] = file_info_manager.height
-                metadata_row[ 'duration' ] = file_info_manager.duration
-                metadata_row[ 'num_frames' ] = file_info_manager.num_frames
-                metadata_row[ 'num_words' ] = file_info_manager.num_words
-                metadata_row[ 'has_audio' ] = file_info_manager.has_audio
-                
-                locations_manager = media_result.GetLocationsManager()
-                
-                metadata_row[ 'is_inbox' ] = locations_manager.inbox
-                metadata_row[ 'is_local' ] = locations_manager.IsLocal()
-                metadata_row[ 'is_trashed' ] = locations_manager.IsTrashed()
-                
-                known_urls = sorted( locations_manager.GetURLs() )
-                
-                metadata_row[ 'known_urls' ] = known_urls
-                
-                if detailed_url_information:
-                    
-                    detailed_known_urls = []
-                    
-                    for known_url in known_urls:
-                        
-                        try:
-                            
-                            normalised_url = HG.client_controller.network_engine.domain_manager.NormaliseURL( known_url )
-                            
-                            ( url_type, match_name, can_parse ) = HG.client_controller.network_engine.domain_manager.GetURLParseCapability( normalised_url )
-                            
-                        except HydrusExceptions.URLClassException as e:
-                            
-                            continue
-                            
-                        
-                        detailed_dict = { 'normalised_url' : normalised_url, 'url_type' : url_type, 'url_type_string' : HC.url_type_string_lookup[ url_type ], 'match_name' : match_name, 'can_parse' : can_parse }
-                        
-                        detailed_known_urls.append( detailed_dict )
-                        
-                    
-                    metadata_row[ 'detailed_known_urls' ] = detailed_known_urls
-                    
-                
-                tags_manager = media_result.GetTagsManager()
-                
-                service_names_to_statuses_to_tags = {}
+            if columnar:
                 
-                service_keys_to_statuses_to_tags = tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
+                metadata = columns
                 
-                for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
-                    
-                    if service_key not in service_keys_to_names:
-                        
-                        service_keys_to_names[ service_key ] = services_manager.GetName( service_key )
-                        
-                    
-                    statuses_to_tags_json_serialisable = { str( status ) : list( tags ) for ( status, tags ) in statuses_to_tags.items() if len( tags ) > 0 }
-                    
-                    if len( statuses_to_tags_json_serialisable ) > 0:
-                        
-                        service_name = service_keys_to_names[ service_key ]
-                        
-                        service_names_to_statuses_to_tags[ service_name ] = statuses_to_tags_json_serialisable
-                        
-                    
-                
-                metadata_row[ 'service_names_to_statuses_to_tags' ] = service_names_to_statuses_to_tags
-                
-                #
-                
-                service_names_to_statuses_to_tags = {}
-                
-                service_keys_to_statuses_to_tags = tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_ACTUAL )
-                
-                for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
-                    
-                    if service_key not in service_keys_to_names:
-                        
-                        service_keys_to_names[ service_key ] = services_manager.GetName( service_key )
-                        
-                    
-                    service_name = service_keys_to_names[ service_key ]
-                    
-                    service_names_to_statuses_to_tags[ service_name ] = { str( status ) : list( tags ) for ( status, tags ) in statuses_to_tags.items() }
-                    
-                
-                metadata_row[ 'service_names_to_statuses_to_display_tags' ] = service_names_to_statuses_to_tags
-                
-                #
+            else:
                 
-                metadata.append( metadata_row )
+                metadata = [ dict( zip( columns.keys(), values ) ) for values in zip( *columns.values() ) ]
                 
             
+        else:
+            
+            metadata = GenerateFileMetadataRows( media_results, detailed_url_information = detailed_url_information )
+            
         
         body_dict[ 'metadata' ] = metadata
         
-        mime = HC.APPLICATION_JSON
-        body = json.dumps( body_dict )
+        if use_msgpack:
+            
+            mime = HC.APPLICATION_MSGPACK
+            body = msgpack.packb( body_dict )
+            
+        else:
+            
+            mime = HC.APPLICATION_JSON
+            body = json.dumps( body_dict )
+            
         
         response_context = HydrusServerResources.ResponseContext( 200, mime = mime, body = body )
         
@@ -1783,14 +2105,14 @@ class HydrusResourceClientAPIRestrictedGetFilesGetThumbnail( HydrusResourceClien
         
         try:
             
-            path = HG.client_controller.client_files_manager.GetThumbnailPath( media_result )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( media_result )
             
         except HydrusExceptions.FileMissingException:
             
             raise HydrusExceptions.NotFoundException( 'Could not find that file!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, body = bytes( thumbnail_bytes ) )
         
         return response_context
         
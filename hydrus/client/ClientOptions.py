@@ -148,6 +148,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'booleans' ][ 'maintain_similar_files_duplicate_pairs_during_idle' ] = False
         
+        self._dictionary[ 'booleans' ][ 'use_in_memory_similar_files_index' ] = True
+        
         self._dictionary[ 'booleans' ][ 'show_namespaces' ] = True
         
         self._dictionary[ 'booleans' ][ 'verify_regular_https' ] = True
@@ -159,6 +161,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'booleans' ][ 'thumbnail_fill' ] = False
         
+        self._dictionary[ 'booleans' ][ 'use_packed_thumbnail_store' ] = False
+        
         self._dictionary[ 'booleans' ][ 'import_page_progress_display' ] = True
         
         self._dictionary[ 'booleans' ][ 'process_subs_in_random_order' ] = True
@@ -234,6 +238,10 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'booleans' ][ 'show_session_size_warnings' ] = True
         
+        self._dictionary[ 'booleans' ][ 'parse_html_with_lxml_fast_path' ] = False
+        
+        self._dictionary[ 'booleans' ][ 'autocomplete_subtag_prefix_index' ] = False
+        
         #
         
         self._dictionary[ 'colours' ] = HydrusSerialisable.SerialisableDictionary()
@@ -350,6 +358,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'thumbnail_cache_timeout' ] = 86400
         self._dictionary[ 'integers' ][ 'image_cache_timeout' ] = 600
         
+        self._dictionary[ 'integers' ][ 'thumbnail_waterfall_num_threads' ] = 4
+        
         self._dictionary[ 'integers' ][ 'thumbnail_border' ] = 1
         self._dictionary[ 'integers' ][ 'thumbnail_margin' ] = 2
         
@@ -3,6 +3,7 @@ import bs4
 import calendar
 import collections
 import html
+import itertools
 import json
 import os
 import re
@@ -34,6 +35,8 @@ except ImportError:
 try:
     
     import lxml
+    import lxml.etree
+    import lxml.html
     
     LXML_IS_OK = True
     
@@ -322,6 +325,159 @@ def GetHashesFromParseResults( results ):
     
     return hash_results
     
+def ConvertStringToXPathLiteral( text ):
+    
+    if "'" not in text:
+        
+        return "'{}'".format( text )
+        
+    
+    if '"' not in text:
+        
+        return '"{}"'.format( text )
+        
+    
+    return 'concat( {} )'.format( ', "\'", '.join( "'{}'".format( part ) for part in text.split( "'" ) ) )
+    
+HTML_VOID_ELEMENTS = { 'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr' }
+
+def GenerateExampleHTMLForPageParser( page_parser ):
+    
+    # parsers remember their example urls but not the pages, so for parity tests and benchmarks we make up a page with something for each html formula to find
+    # ascending rules are skipped, since what they need depends on the rest of the page
+    
+    counter = itertools.count()
+    
+    def formula_to_html( formula, inner_html ):
+        
+        if isinstance( formula, ParseFormulaCompound ):
+            
+            return ''.join( ( formula_to_html( sub_formula, inner_html ) for sub_formula in formula.GetFormulae() ) )
+            
+        
+        if not isinstance( formula, ParseFormulaHTML ):
+            
+            return ''
+            
+        
+        tag_rules = formula.GetTagRules()
+        
+        if True in ( tag_rule.ToTuple()[0] == HTML_RULE_TYPE_ASCENDING for tag_rule in tag_rules ):
+            
+            return ''
+            
+        
+        content_to_fetch = formula.GetContentToFetch()
+        
+        leaf_attributes = {}
+        
+        if content_to_fetch == HTML_CONTENT_ATTRIBUTE:
+            
+            leaf_attributes[ formula.GetAttributeToFetch() ] = 'https://example.com/{}'.format( next( counter ) )
+            
+            element_html = ''
+            
+        elif inner_html is not None:
+            
+            element_html = inner_html
+            
+        else:
+            
+            element_html = 'example text {}'.format( next( counter ) )
+            
+        
+        for ( i, tag_rule ) in enumerate( reversed( tag_rules ) ):
+            
+            ( rule_type, tag_name, tag_attributes, tag_index, tag_depth, should_test_tag_string, tag_string_string_match ) = tag_rule.ToTuple()
+            
+            if tag_name is None:
+                
+                tag_name = 'div'
+                
+            
+            attributes = dict( tag_attributes )
+            
+            if i == 0:
+                
+                attributes.update( leaf_attributes )
+                
+                if should_test_tag_string and inner_html is None:
+                    
+                    element_html = tag_string_string_match.GetExampleString()
+                    
+                
+            
+            attributes_html = ''.join( ( ' {}="{}"'.format( name, html.escape( str( value ) ) ) for ( name, value ) in attributes.items() ) )
+            
+            if tag_name in HTML_VOID_ELEMENTS:
+                
+                if i > 0:
+                    
+                    return ''
+                    
+                
+                element_html = '<{}{}>'.format( tag_name, attributes_html )
+                
+            else:
+                
+                element_html = '<{0}{1}>{2}</{0}>'.format( tag_name, attributes_html, element_html )
+                
+            
+            if tag_index is None:
+                
+                num_copies = 2
+                
+            elif tag_index >= 0:
+                
+                num_copies = tag_index + 1
+                
+            else:
+                
+                num_copies = - tag_index
+                
+            
+            element_html = element_html * min( num_copies, 10 )
+            
+        
+        return element_html
+        
+    
+    def page_parser_to_html( page_parser ):
+        
+        ( sub_page_parsers, content_parsers ) = page_parser.GetContentParsers()
+        
+        htmls = []
+        
+        for ( formula, sub_page_parser ) in sub_page_parsers:
+            
+            htmls.append( formula_to_html( formula, page_parser_to_html( sub_page_parser ) ) )
+            
+        
+        for content_parser in content_parsers:
+            
+            ( name, content_type, formula, additional_info ) = content_parser.ToTuple()
+            
+            htmls.append( formula_to_html( formula, None ) )
+            
+        
+        return ''.join( htmls )
+        
+    
+    return '<!DOCTYPE html><html lang="en"><head><title>example page</title></head><body>' + page_parser_to_html( page_parser ) + '</body></html>'
+    
+def GetHTMLMultiValuedAttributes( tag_name, all_tags = False ):
+    
+    # bs4 splits these attributes into lists
+    
+    cdata_list_attributes = bs4.builder.HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+    
+    if all_tags:
+        
+        return set().union( *cdata_list_attributes.values() )
+        
+    
+    return cdata_list_attributes.get( '*', set() ).union( cdata_list_attributes.get( tag_name, set() ) )
+    
 def GetHTMLTagString( tag ):
     
     try:
@@ -344,6 +500,53 @@ def GetHTMLTagString( tag ):
     
     return result
     
+def GetLXMLElementString( element ):
+    
+    # the lxml equivalent of GetHTMLTagString
+    # bs4 gives no strings for script/style/template content when it parses with html5lib, so we match that
+    
+    if HTML5LIB_IS_OK:
+        
+        text_xpath = 'descendant::text()[ not( parent::script or parent::style or parent::template ) ]'
+        
+    else:
+        
+        text_xpath = 'descendant::text()'
+        
+    
+    try:
+        
+        all_strings = [ str( s ) for s in element.xpath( text_xpath ) if len( s ) > 0 ]
+        
+    except:
+        
+        return ''
+        
+    
+    if len( all_strings ) == 0:
+        
+        result = ''
+        
+    else:
+        
+        result = all_strings[0]
+        
+    
+    return result
+    
+def GetLXMLTree( html ):
+    
+    if not LXML_IS_OK:
+        
+        raise HydrusExceptions.ParseException( 'This client does not have access to lxml!' )
+        
+    
+    # lxml does not like unicode strings with an encoding declaration, so we go via utf-8
+    
+    parser = lxml.html.HTMLParser( encoding = 'utf-8' )
+    
+    return lxml.html.document_fromstring( html.encode( 'utf-8' ), parser = parser ).getroottree()
+    
 def GetNamespacesFromParsableContent( parsable_content ):
     
     content_type_to_additional_infos = HydrusData.BuildKeyToSetDict( ( ( content_type, additional_infos ) for ( name, content_type, additional_infos ) in parsable_content ) )
@@ -949,6 +1152,20 @@ class ParseFormulaHTML( ParseFormula ):
         
         self._attribute_to_fetch = attribute_to_fetch
         
+        self._can_use_lxml_fast_path = None
+        
+    
+    def _CanUseLXMLFastPath( self ):
+        
+        if self._can_use_lxml_fast_path is None:
+            
+            # serialising html out of lxml does not match bs4, so we only do attributes and strings
+            
+            self._can_use_lxml_fast_path = LXML_IS_OK and len( self._tag_rules ) > 0 and self._content_to_fetch != HTML_CONTENT_HTML and all( ( tag_rule.GetLXMLXPath() is not None for tag_rule in self._tag_rules ) )
+            
+        
+        return self._can_use_lxml_fast_path
+        
     
     def _FindHTMLTags( self, root ):
         
@@ -962,6 +1179,18 @@ class ParseFormulaHTML( ParseFormula ):
         return tags
         
     
+    def _FindLXMLElements( self, root ):
+        
+        elements = ( root, )
+        
+        for tag_rule in self._tag_rules:
+            
+            elements = tag_rule.GetLXMLNodes( elements )
+            
+        
+        return elements
+        
+    
     def _GetParsePrettySeparator( self ):
         
         if self._content_to_fetch == HTML_CONTENT_HTML:
@@ -1025,6 +1254,61 @@ class ParseFormulaHTML( ParseFormula ):
         return result
         
     
+    def _GetRawTextFromLXMLElement( self, element ):
+        
+        if self._content_to_fetch == HTML_CONTENT_ATTRIBUTE:
+            
+            result = element.get( self._attribute_to_fetch )
+            
+            if result is None:
+                
+                raise HydrusExceptions.ParseException( 'Attribute ' + self._attribute_to_fetch + ' not found!' )
+                
+            
+            # bs4 splits 'class' and friends into lists, which we join back up
+            if self._attribute_to_fetch in GetHTMLMultiValuedAttributes( element.tag ):
+                
+                result = ' '.join( result.split() )
+                
+            
+        elif self._content_to_fetch == HTML_CONTENT_STRING:
+            
+            result = GetLXMLElementString( element )
+            
+        else:
+            
+            result = None
+            
+        
+        if result is None or result == '':
+            
+            raise HydrusExceptions.ParseException( 'Empty/No results found!' )
+            
+        
+        return result
+        
+    
+    def _GetRawTextsFromLXMLElements( self, elements ):
+        
+        raw_texts = []
+        
+        for element in elements:
+            
+            try:
+                
+                raw_text = self._GetRawTextFromLXMLElement( element )
+                
+                raw_texts.append( raw_text )
+                
+            except HydrusExceptions.ParseException:
+                
+                continue
+                
+            
+        
+        return raw_texts
+        
+    
     def _GetRawTextsFromTags( self, tags ):
         
         raw_texts = []
@@ -1063,9 +1347,32 @@ class ParseFormulaHTML( ParseFormula ):
         
         self._string_processor = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_string_processor )
         
+        self._can_use_lxml_fast_path = None
+        
     
     def _ParseRawTexts( self, parsing_context, parsing_text ):
         
+        if HG.client_controller.new_options.GetBoolean( 'parse_html_with_lxml_fast_path' ) and self._CanUseLXMLFastPath():
+            
+            try:
+                
+                root = HG.client_controller.parsing_cache.GetLXMLTree( parsing_text )
+                
+            except Exception as e:
+                
+                root = None # let the soup deal with it
+                
+            
+            if root is not None:
+                
+                elements = self._FindLXMLElements( root )
+                
+                raw_texts = self._GetRawTextsFromLXMLElements( elements )
+                
+                return raw_texts
+                
+            
+        
         try:
             
             root = HG.client_controller.parsing_cache.GetSoup( parsing_text )
@@ -1269,6 +1576,8 @@ HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIAL
 HTML_RULE_TYPE_DESCENDING = 0
 HTML_RULE_TYPE_ASCENDING = 1
 
+SIMPLE_HTML_NAME_REGEX = r'[a-z][a-z0-9\-_]*'
+
 class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_PARSE_RULE_HTML
@@ -1317,76 +1626,206 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
         self._should_test_tag_string = should_test_tag_string
         self._tag_string_string_match = tag_string_string_match
         
+        self._lxml_xpaths = None
         
     
-    def _GetSerialisableInfo( self ):
-        
-        serialisable_tag_string_string_match = self._tag_string_string_match.GetSerialisableTuple()
-        
-        return ( self._rule_type, self._tag_name, self._tag_attributes, self._tag_index, self._tag_depth, self._should_test_tag_string, serialisable_tag_string_string_match )
-        
-    
-    def _InitialiseFromSerialisableInfo( self, serialisable_info ):
-        
-        ( self._rule_type, self._tag_name, self._tag_attributes, self._tag_index, self._tag_depth, self._should_test_tag_string, serialisable_tag_string_string_match ) = serialisable_info
+    def _CompileLXMLXPath( self, from_document = False ):
         
-        self._tag_string_string_match = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_tag_string_string_match )
-        
-    
-    def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
+        # returns None if we cannot do exactly what bs4 does
+        # a relative xpath on a tree starts at the root element, but the soup starts above html, so the first rule goes from the document
         
-        if version == 1:
-            
-            ( rule_type, tag_name, tag_attributes, tag_index, tag_depth ) = old_serialisable_info
+        if self._tag_name is None:
             
-            should_test_tag_string = False
+            name = '*'
             
-            tag_string_string_match = StringMatch()
+        elif re.fullmatch( SIMPLE_HTML_NAME_REGEX, self._tag_name ) is not None and self._tag_name != 'tbody': # html5lib adds tbody where lxml does not
             
-            serialisable_tag_string_string_match = tag_string_string_match.GetSerialisableTuple()
+            name = self._tag_name
             
-            new_serialisable_info = ( rule_type, tag_name, tag_attributes, tag_index, tag_depth, should_test_tag_string, serialisable_tag_string_string_match )
+        else:
             
-            return ( 2, new_serialisable_info )
+            return None
             
         
-    
-    def GetNodes( self, nodes ):
-        
-        new_nodes = []
-        
-        for node in nodes:
+        if self._rule_type == HTML_RULE_TYPE_DESCENDING:
             
-            if self._rule_type == HTML_RULE_TYPE_DESCENDING:
-                
-                # having class : [ 'a', 'b' ] works here, but it does OR not AND
-                # instead do node.find_all( lambda tag: 'class' in tag.attrs and 'a' in tag[ 'class' ] and 'b' in tag[ 'class' ] )
-                # which means we want to just roll all this into one method to support multiple class matching
-                
-                kwargs = { 'attrs' : self._tag_attributes }
+            predicates = []
+            
+            multi_valued_attributes = GetHTMLMultiValuedAttributes( self._tag_name, all_tags = self._tag_name is None )
+            
+            for ( key, value ) in self._tag_attributes.items():
                 
-                if self._tag_name is not None:
+                if not isinstance( key, str ) or not isinstance( value, str ) or re.fullmatch( SIMPLE_HTML_NAME_REGEX, key ) is None:
                     
-                    kwargs[ 'name' ] = self._tag_name
+                    return None
                     
                 
-                found_nodes = node.find_all( **kwargs )
-                
-                if self._tag_index is not None:
+                if key in multi_valued_attributes:
                     
-                    try:
+                    if key != 'class':
                         
-                        indexed_node = found_nodes[ self._tag_index ]
+                        return None
                         
-                    except IndexError:
+                    
+                    # bs4 matches either any single class or the whole class string exactly, which xpath cannot do for 'a b'
+                    if re.fullmatch( r'\S+', value ) is None:
                         
-                        continue
+                        return None
                         
                     
-                    found_nodes = [ indexed_node ]
+                    predicates.append( 'contains( concat( " ", normalize-space( @class ), " " ), {} )'.format( ConvertStringToXPathLiteral( ' ' + value + ' ' ) ) )
+                    
+                else:
+                    
+                    predicates.append( '@{} = {}'.format( key, ConvertStringToXPathLiteral( value ) ) )
                     
                 
-            elif self._rule_type == HTML_RULE_TYPE_ASCENDING:
+            
+            xpath = '{}::{}{}'.format( '/descendant' if from_document else 'descendant', name, ''.join( ( '[ {} ]'.format( predicate ) for predicate in predicates ) ) )
+            
+            if self._tag_index is not None:
+                
+                if self._tag_index >= 0:
+                    
+                    position = str( self._tag_index + 1 )
+                    
+                else:
+                    
+                    position = 'last() - {}'.format( - self._tag_index - 1 )
+                    
+                
+                xpath = '( {} )[ {} ]'.format( xpath, position )
+                
+            
+        elif self._rule_type == HTML_RULE_TYPE_ASCENDING:
+            
+            xpath = 'ancestor::{}[ {} ]'.format( name, int( self._tag_depth ) )
+            
+        else:
+            
+            return None
+            
+        
+        try:
+            
+            return lxml.etree.XPath( xpath )
+            
+        except lxml.etree.XPathError:
+            
+            return None
+            
+        
+    
+    def _GetSerialisableInfo( self ):
+        
+        serialisable_tag_string_string_match = self._tag_string_string_match.GetSerialisableTuple()
+        
+        return ( self._rule_type, self._tag_name, self._tag_attributes, self._tag_index, self._tag_depth, self._should_test_tag_string, serialisable_tag_string_string_match )
+        
+    
+    def _InitialiseFromSerialisableInfo( self, serialisable_info ):
+        
+        ( self._rule_type, self._tag_name, self._tag_attributes, self._tag_index, self._tag_depth, self._should_test_tag_string, serialisable_tag_string_string_match ) = serialisable_info
+        
+        self._tag_string_string_match = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_tag_string_string_match )
+        
+        self._lxml_xpaths = None
+        
+    
+    def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
+        
+        if version == 1:
+            
+            ( rule_type, tag_name, tag_attributes, tag_index, tag_depth ) = old_serialisable_info
+            
+            should_test_tag_string = False
+            
+            tag_string_string_match = StringMatch()
+            
+            serialisable_tag_string_string_match = tag_string_string_match.GetSerialisableTuple()
+            
+            new_serialisable_info = ( rule_type, tag_name, tag_attributes, tag_index, tag_depth, should_test_tag_string, serialisable_tag_string_string_match )
+            
+            return ( 2, new_serialisable_info )
+            
+        
+    
+    def GetLXMLNodes( self, nodes ):
+        
+        xpath = self.GetLXMLXPath()
+        document_xpath = self.GetLXMLXPath( from_document = True )
+        
+        new_nodes = []
+        
+        # one node at a time, so indices and duplicates work like the soup
+        for node in nodes:
+            
+            if isinstance( node, lxml.etree._ElementTree ):
+                
+                new_nodes.extend( document_xpath( node ) )
+                
+            else:
+                
+                new_nodes.extend( xpath( node ) )
+                
+            
+        
+        if self._should_test_tag_string:
+            
+            new_nodes = [ node for node in new_nodes if self._tag_string_string_match.Matches( GetLXMLElementString( node ) ) ]
+            
+        
+        return new_nodes
+        
+    
+    def GetLXMLXPath( self, from_document = False ):
+        
+        if self._lxml_xpaths is None:
+            
+            self._lxml_xpaths = ( self._CompileLXMLXPath(), self._CompileLXMLXPath( from_document = True ) )
+            
+        
+        ( xpath, document_xpath ) = self._lxml_xpaths
+        
+        return document_xpath if from_document else xpath
+        
+    
+    def GetNodes( self, nodes ):
+        
+        new_nodes = []
+        
+        for node in nodes:
+            
+            if self._rule_type == HTML_RULE_TYPE_DESCENDING:
+                
+                # having class : [ 'a', 'b' ] works here, but it does OR not AND
+                # instead do node.find_all( lambda tag: 'class' in tag.attrs and 'a' in tag[ 'class' ] and 'b' in tag[ 'class' ] )
+                # which means we want to just roll all this into one method to support multiple class matching
+                
+                kwargs = { 'attrs' : self._tag_attributes }
+                
+                if self._tag_name is not None:
+                    
+                    kwargs[ 'name' ] = self._tag_name
+                    
+                
+                found_nodes = node.find_all( **kwargs )
+                
+                if self._tag_index is not None:
+                    
+                    try:
+                        
+                        indexed_node = found_nodes[ self._tag_index ]
+                        
+                    except IndexError:
+                        
+                        continue
+                        
+                    
+                    found_nodes = [ indexed_node ]
+                    
+                
+            elif self._rule_type == HTML_RULE_TYPE_ASCENDING:
                 
                 found_nodes = []
                 
@@ -3130,219 +3569,280 @@ class StringConverter( StringProcessingStep ):
         
         self.example_string = example_string
         
-    
-    def _GetSerialisableInfo( self ):
-        
-        return ( self.conversions, self.example_string )
+        self._compiled_conversions = None
         
     
-    def _InitialiseFromSerialisableInfo( self, serialisable_info ):
-        
-        ( serialisable_conversions, self.example_string ) = serialisable_info
+    def _CompileConversion( self, conversion ):
         
-        self.conversions = []
+        ( conversion_type, data ) = conversion
         
-        try: # I initialised this bad one time and broke a dialog on subsequent loads, fugg
+        if conversion_type == STRING_CONVERSION_REMOVE_TEXT_FROM_BEGINNING:
             
-            for ( conversion_type, data ) in serialisable_conversions:
+            num_chars = data
+            
+            return lambda s: s[ num_chars : ]
+            
+        elif conversion_type == STRING_CONVERSION_REMOVE_TEXT_FROM_END:
+            
+            num_chars = data
+            
+            return lambda s: s[ : - num_chars ]
+            
+        elif conversion_type == STRING_CONVERSION_CLIP_TEXT_FROM_BEGINNING:
+            
+            num_chars = data
+            
+            return lambda s: s[ : num_chars ]
+            
+        elif conversion_type == STRING_CONVERSION_CLIP_TEXT_FROM_END:
+            
+            num_chars = data
+            
+            return lambda s: s[ - num_chars : ]
+            
+        elif conversion_type == STRING_CONVERSION_PREPEND_TEXT:
+            
+            text = data
+            
+            return lambda s: text + s
+            
+        elif conversion_type == STRING_CONVERSION_APPEND_TEXT:
+            
+            text = data
+            
+            return lambda s: s + text
+            
+        elif conversion_type == STRING_CONVERSION_ENCODE:
+            
+            encode_type = data
+            
+            if encode_type == 'url percent encoding':
                 
-                if isinstance( data, list ):
+                return lambda s: urllib.parse.quote( s, safe = '' )
+                
+            elif encode_type == 'unicode escape characters':
+                
+                return lambda s: s.encode( 'unicode-escape' ).decode( 'utf-8' )
+                
+            elif encode_type == 'html entities':
+                
+                return html.escape
+                
+            else:
+                
+                def encode_bytes( s ):
                     
-                    data = tuple( data ) # convert from list to tuple thing
+                    # due to py3, this is now a bit of a pain
+                    # _for now_, let's convert to bytes if not already and then spit out a str
+                    
+                    if isinstance( s, str ):
+                        
+                        s_bytes = bytes( s, 'utf-8' )
+                        
+                    else:
+                        
+                        s_bytes = s
+                        
+                    
+                    if encode_type == 'hex':
+                        
+                        s = s_bytes.hex()
+                        
+                    elif encode_type == 'base64':
+                        
+                        s_bytes = base64.b64encode( s_bytes )
+                        
+                        s = str( s_bytes, 'utf-8' )
+                        
+                    
+                    return s
                     
                 
-                self.conversions.append( ( conversion_type, data ) )
+                return encode_bytes
                 
             
-        except:
-            
-            pass
+        elif conversion_type == STRING_CONVERSION_DECODE:
             
-        
-    
-    def Convert( self, s, max_steps_allowed = None ):
-        
-        for ( i, conversion ) in enumerate( self.conversions ):
+            encode_type = data
             
-            if max_steps_allowed is not None and i >= max_steps_allowed:
+            if encode_type == 'url percent encoding':
                 
-                return s
+                return urllib.parse.unquote
+                
+            elif encode_type == 'unicode escape characters':
+                
+                return lambda s: s.encode( 'utf-8' ).decode( 'unicode-escape' )
+                
+            elif encode_type == 'html entities':
+                
+                return html.unescape
                 
             
-            try:
+            # the old 'hex' and 'base64' are now deprecated, no-ops
+            
+        elif conversion_type == STRING_CONVERSION_REVERSE:
+            
+            return lambda s: s[::-1]
+            
+        elif conversion_type == STRING_CONVERSION_REGEX_SUB:
+            
+            ( pattern, repl ) = data
+            
+            sub = re.compile( pattern ).sub
+            
+            return lambda s: sub( repl, s )
+            
+        elif conversion_type == STRING_CONVERSION_DATE_DECODE:
+            
+            ( phrase, timezone, timezone_offset ) = data
+            
+            def date_decode( s ):
                 
-                ( conversion_type, data ) = conversion
+                struct_time = time.strptime( s, phrase )
                 
-                if conversion_type == STRING_CONVERSION_REMOVE_TEXT_FROM_BEGINNING:
+                if timezone == HC.TIMEZONE_GMT:
                     
-                    num_chars = data
+                    # the given struct is in GMT, so calendar.timegm is appropriate here
                     
-                    s = s[ num_chars : ]
+                    timestamp = int( calendar.timegm( struct_time ) )
                     
-                elif conversion_type == STRING_CONVERSION_REMOVE_TEXT_FROM_END:
+                elif timezone == HC.TIMEZONE_LOCAL:
                     
-                    num_chars = data
+                    # the given struct is in local time, so time.mktime is correct
                     
-                    s = s[ : - num_chars ]
+                    timestamp = int( time.mktime( struct_time ) )
                     
-                elif conversion_type == STRING_CONVERSION_CLIP_TEXT_FROM_BEGINNING:
+                elif timezone == HC.TIMEZONE_OFFSET:
                     
-                    num_chars = data
+                    # the given struct is in server time, which is the same as GMT minus an offset
+                    # if we are 7200 seconds ahead, the correct GMT timestamp needs to be 7200 smaller
                     
-                    s = s[ : num_chars ]
+                    timestamp = int( calendar.timegm( struct_time ) ) - timezone_offset
                     
-                elif conversion_type == STRING_CONVERSION_CLIP_TEXT_FROM_END:
+                
+                return str( timestamp )
+                
+            
+            return date_decode
+            
+        elif conversion_type == STRING_CONVERSION_DATE_ENCODE:
+            
+            ( phrase, timezone ) = data
+            
+            def date_encode( s ):
+                
+                try:
+                    
+                    timestamp = int( s )
+                    
+                except:
                     
-                    num_chars = data
+                    raise Exception( '"{}" was not an integer!'.format( s ) )
                     
-                    s = s[ - num_chars : ]
+                
+                if timezone == HC.TIMEZONE_GMT:
                     
-                elif conversion_type == STRING_CONVERSION_PREPEND_TEXT:
+                    # user wants a UTC string, so we need UTC struct
                     
-                    text = data
+                    struct_time = time.gmtime( timestamp )
                     
-                    s = text + s
+                elif timezone == HC.TIMEZONE_LOCAL:
                     
-                elif conversion_type == STRING_CONVERSION_APPEND_TEXT:
+                    # user wants a local string, so we need localtime
                     
-                    text = data
+                    struct_time = time.localtime( timestamp )
                     
-                    s = s + text
+                
+                return time.strftime( phrase, struct_time )
+                
+            
+            return date_encode
+            
+        elif conversion_type == STRING_CONVERSION_INTEGER_ADDITION:
+            
+            delta = int( data )
+            
+            return lambda s: str( int( s ) + delta )
+            
+        
+        return lambda s: s
+        
+    
+    def _GetCompiledConversions( self ):
+        
+        # we do the type dispatch and regex compile once, and then every string just runs through a list of callables
+        
+        if self._compiled_conversions is None:
+            
+            compiled_conversions = []
+            
+            for conversion in self.conversions:
+                
+                try:
                     
-                elif conversion_type == STRING_CONVERSION_ENCODE:
+                    conversion_callable = self._CompileConversion( conversion )
                     
-                    encode_type = data
+                except Exception as e:
                     
-                    if encode_type == 'url percent encoding':
-                        
-                        s = urllib.parse.quote( s, safe = '' )
-                        
-                    elif encode_type == 'unicode escape characters':
+                    def conversion_callable( s, error_text = str( e ) ):
                         
-                        s = s.encode( 'unicode-escape' ).decode( 'utf-8' )
-                        
-                    elif encode_type == 'html entities':
-                        
-                        s = html.escape( s )
-                        
-                    else:
-                        
-                        # due to py3, this is now a bit of a pain
-                        # _for now_, let's convert to bytes if not already and then spit out a str
-                        
-                        if isinstance( s, str ):
-                            
-                            s_bytes = bytes( s, 'utf-8' )
-                            
-                        else:
-                            
-                            s_bytes = s
-                            
-                        
-                        if encode_type == 'hex':
-                            
-                            s = s_bytes.hex()
-                            
-                        elif encode_type == 'base64':
-                            
-                            s_bytes = base64.b64encode( s_bytes )
-                            
-                            s = str( s_bytes, 'utf-8' )
-                            
+                        raise Exception( error_text )
                         
                     
-                elif conversion_type == STRING_CONVERSION_DECODE:
-                    
-                    encode_type = data
-                    
-                    if encode_type == 'url percent encoding':
-                        
-                        s = urllib.parse.unquote( s )
-                        
-                    elif encode_type == 'unicode escape characters':
-                        
-                        s = s.encode( 'utf-8' ).decode( 'unicode-escape' )
-                        
-                    elif encode_type == 'html entities':
-                        
-                        s = html.unescape( s )
-                        
-                    
-                    # the old 'hex' and 'base64' are now deprecated, no-ops
-                    
-                elif conversion_type == STRING_CONVERSION_REVERSE:
-                    
-                    s = s[::-1]
-                    
-                elif conversion_type == STRING_CONVERSION_REGEX_SUB:
-                    
-                    ( pattern, repl ) = data
-                    
-                    s = re.sub( pattern, repl, s )
-                    
-                elif conversion_type == STRING_CONVERSION_DATE_DECODE:
-                    
-                    ( phrase, timezone, timezone_offset ) = data
-                    
-                    struct_time = time.strptime( s, phrase )
-                    
-                    if timezone == HC.TIMEZONE_GMT:
-                        
-                        # the given struct is in GMT, so calendar.timegm is appropriate here
-                        
-                        timestamp = int( calendar.timegm( struct_time ) )
-                        
-                    elif timezone == HC.TIMEZONE_LOCAL:
-                        
-                        # the given struct is in local time, so time.mktime is correct
-                        
-                        timestamp = int( time.mktime( struct_time ) )
-                        
-                    elif timezone == HC.TIMEZONE_OFFSET:
-                        
-                        # the given struct is in server time, which is the same as GMT minus an offset
-                        # if we are 7200 seconds ahead, the correct GMT timestamp needs to be 7200 smaller
-                        
-                        timestamp = int( calendar.timegm( struct_time ) ) - timezone_offset
-                        
-                    
-                    s = str( timestamp )
-                    
-                elif conversion_type == STRING_CONVERSION_DATE_ENCODE:
-                    
-                    ( phrase, timezone ) = data
-                    
-                    try:
-                        
-                        timestamp = int( s )
-                        
-                    except:
-                        
-                        raise Exception( '"{}" was not an integer!'.format( s ) )
-                        
-                    
-                    if timezone == HC.TIMEZONE_GMT:
-                        
-                        # user wants a UTC string, so we need UTC struct
-                        
-                        struct_time = time.gmtime( timestamp )
-                        
-                    elif timezone == HC.TIMEZONE_LOCAL:
-                        
-                        # user wants a local string, so we need localtime
-                        
-                        struct_time = time.localtime( timestamp )
-                        
-                    
-                    s = time.strftime( phrase, struct_time )
-                    
-                elif conversion_type == STRING_CONVERSION_INTEGER_ADDITION:
-                    
-                    delta = data
+                
+                compiled_conversions.append( ( conversion, conversion_callable ) )
+                
+            
+            self._compiled_conversions = compiled_conversions
+            
+        
+        return self._compiled_conversions
+        
+    
+    def _GetSerialisableInfo( self ):
+        
+        return ( self.conversions, self.example_string )
+        
+    
+    def _InitialiseFromSerialisableInfo( self, serialisable_info ):
+        
+        ( serialisable_conversions, self.example_string ) = serialisable_info
+        
+        self._compiled_conversions = None
+        
+        self.conversions = []
+        
+        try: # I initialised this bad one time and broke a dialog on subsequent loads, fugg
+            
+            for ( conversion_type, data ) in serialisable_conversions:
+                
+                if isinstance( data, list ):
                     
-                    s = str( int( s ) + int( delta ) )
+                    data = tuple( data ) # convert from list to tuple thing
                     
                 
+                self.conversions.append( ( conversion_type, data ) )
+                
+            
+        except:
+            
+            pass
+            
+        
+    
+    def Convert( self, s, max_steps_allowed = None ):
+        
+        for ( i, ( conversion, conversion_callable ) ) in enumerate( self._GetCompiledConversions() ):
+            
+            if max_steps_allowed is not None and i >= max_steps_allowed:
+                
+                return s
+                
+            
+            try:
+                
+                s = conversion_callable( s )
+                
             except Exception as e:
                 
                 raise HydrusExceptions.StringConvertException( 'ERROR: Could not apply "' + self.ConversionToString( conversion ) + '" to string "' + repr( s ) + '":' + str( e ) )
@@ -3352,6 +3852,39 @@ class StringConverter( StringProcessingStep ):
         return s
         
     
+    def ConvertStrings( self, texts: typing.Iterable[ str ] ) -> typing.List[ str ]:
+        
+        # the batch version for the string processor, which drops bytes and anything that fails
+        
+        conversion_callables = [ conversion_callable for ( conversion, conversion_callable ) in self._GetCompiledConversions() ]
+        
+        results = []
+        
+        for text in texts:
+            
+            if isinstance( text, bytes ):
+                
+                continue
+                
+            
+            try:
+                
+                for conversion_callable in conversion_callables:
+                    
+                    text = conversion_callable( text )
+                    
+                
+            except Exception:
+                
+                continue
+                
+            
+            results.append( text )
+            
+        
+        return results
+        
+    
     def GetConversionStrings( self ):
         
         return [ self.ConversionToString( conversion ) for conversion in self.conversions ]
@@ -3494,16 +4027,118 @@ class StringMatch( StringProcessingStep ):
         
         self._example_string = example_string
         
+        self._compiled_regex = None
+        self._compiled_matcher = None
+        
+    
+    def _CompileMatcher( self ):
+        
+        min_chars = self._min_chars
+        max_chars = self._max_chars
+        
+        if self._match_type == STRING_MATCH_FIXED:
+            
+            match_value = self._match_value
+            
+            test = lambda text: text == match_value
+            
+        elif self._match_type in ( STRING_MATCH_FLEXIBLE, STRING_MATCH_REGEX ):
+            
+            try:
+                
+                search = self._GetCompiledRegex().search
+                
+                test = lambda text: search( text ) is not None
+                
+            except Exception as e:
+                
+                test = lambda text: False
+                
+            
+        else:
+            
+            test = None
+            
+        
+        def matcher( text ):
+            
+            if isinstance( text, bytes ):
+                
+                return False
+                
+            
+            text_len = len( text )
+            
+            if min_chars is not None and text_len < min_chars:
+                
+                return False
+                
+            
+            if max_chars is not None and text_len > max_chars:
+                
+                return False
+                
+            
+            return test is None or test( text )
+            
+        
+        return matcher
+        
+    
+    def _GetCompiledRegex( self ):
+        
+        if self._compiled_regex is None:
+            
+            ( r, fail_reason ) = self._GetRegexAndFailReason()
+            
+            self._compiled_regex = re.compile( r )
+            
+        
+        return self._compiled_regex
+        
     
     def _GetSerialisableInfo( self ):
         
         return ( self._match_type, self._match_value, self._min_chars, self._max_chars, self._example_string )
         
     
+    def _GetRegexAndFailReason( self ):
+        
+        if self._match_type == STRING_MATCH_FLEXIBLE:
+            
+            if self._match_value == ALPHA:
+                
+                r = '^[a-zA-Z]+$'
+                fail_reason = ' had non-alpha characters'
+                
+            elif self._match_value == ALPHANUMERIC:
+                
+                r = '^[a-zA-Z\\d]+$'
+                fail_reason = ' had non-alphanumeric characters'
+                
+            elif self._match_value == NUMERIC:
+                
+                r = '^\\d+$'
+                fail_reason = ' had non-numeric characters'
+                
+            
+        else:
+            
+            r = self._match_value
+            
+            fail_reason = ' did not match "' + r + '"'
+            
+        
+        return ( r, fail_reason )
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         ( self._match_type, self._match_value, self._min_chars, self._max_chars, self._example_string ) = serialisable_info
         
+        self._compiled_regex = None
+        self._compiled_matcher = None
+        
     
     def GetExampleString( self ):
         
@@ -3527,27 +4162,41 @@ class StringMatch( StringProcessingStep ):
     
     def Matches( self, text ):
         
-        try:
-            
-            self.Test( text )
+        # same as Test, but with no exceptions, for url matching and other hot loops
+        
+        if self._compiled_matcher is None:
             
-            return True
+            self._compiled_matcher = self._CompileMatcher()
             
-        except HydrusExceptions.StringMatchException:
+        
+        return self._compiled_matcher( text )
+        
+    
+    def MatchStrings( self, texts: typing.Iterable[ str ] ) -> typing.List[ str ]:
+        
+        if self._compiled_matcher is None:
             
-            return False
+            self._compiled_matcher = self._CompileMatcher()
             
         
+        matcher = self._compiled_matcher
+        
+        return [ text for text in texts if matcher( text ) ]
+        
     
     def SetMaxChars( self, max_chars ):
         
         self._max_chars = max_chars
         
+        self._compiled_matcher = None
+        
     
     def SetMinChars( self, min_chars ):
         
         self._min_chars = min_chars
         
+        self._compiled_matcher = None
+        
     
     def Test( self, text ):
         
@@ -3579,34 +4228,11 @@ class StringMatch( StringProcessingStep ):
             
         elif self._match_type in ( STRING_MATCH_FLEXIBLE, STRING_MATCH_REGEX ):
             
-            if self._match_type == STRING_MATCH_FLEXIBLE:
-                
-                if self._match_value == ALPHA:
-                    
-                    r = '^[a-zA-Z]+$'
-                    fail_reason = ' had non-alpha characters'
-                    
-                elif self._match_value == ALPHANUMERIC:
-                    
-                    r = '^[a-zA-Z\\d]+$'
-                    fail_reason = ' had non-alphanumeric characters'
-                    
-                elif self._match_value == NUMERIC:
-                    
-                    r = '^\\d+$'
-                    fail_reason = ' had non-numeric characters'
-                    
-                
-            elif self._match_type == STRING_MATCH_REGEX:
-                
-                r = self._match_value
-                
-                fail_reason = ' did not match "' + r + '"'
-                
+            ( r, fail_reason ) = self._GetRegexAndFailReason()
             
             try:
                 
-                result = re.search( r, text )
+                result = self._GetCompiledRegex().search( text )
                 
             except Exception as e:
                 
@@ -4060,6 +4686,26 @@ class StringSplitter( StringProcessingStep ):
         return [ result for result in results if result != '' ]
         
     
+    def SplitStrings( self, texts: typing.Iterable[ str ] ) -> typing.List[ str ]:
+        
+        separator = self._separator
+        max_splits = -1 if self._max_splits is None else self._max_splits
+        
+        results = []
+        
+        for text in texts:
+            
+            if isinstance( text, bytes ):
+                
+                continue
+                
+            
+            results.extend( ( result for result in text.split( separator, max_splits ) if result != '' ) )
+            
+        
+        return results
+        
+    
     def ToString( self, simple = False, with_type = False ) -> str:
         
         if simple:
@@ -4096,6 +4742,67 @@ class StringProcessor( HydrusSerialisable.SerialisableBase ):
         
         self._processing_steps = []
         
+        self._compiled_pipeline = None
+        
+    
+    def _CompilePipeline( self ):
+        
+        # each step becomes a list -> list callable, so the per-string work is all done inside the steps' own precompiled loops
+        
+        pipeline = []
+        
+        for processing_step in self._processing_steps:
+            
+            if isinstance( processing_step, StringSorter ):
+                
+                def pipeline_callable( current_strings, processing_step = processing_step ):
+                    
+                    try:
+                        
+                        return processing_step.Sort( current_strings )
+                        
+                    except HydrusExceptions.StringSortException:
+                        
+                        return current_strings
+                        
+                    
+                
+            elif isinstance( processing_step, StringSlicer ):
+                
+                def pipeline_callable( current_strings, processing_step = processing_step ):
+                    
+                    try:
+                        
+                        return processing_step.Slice( current_strings )
+                        
+                    except:
+                        
+                        return current_strings
+                        
+                    
+                
+            elif isinstance( processing_step, StringConverter ):
+                
+                pipeline_callable = processing_step.ConvertStrings
+                
+            elif isinstance( processing_step, StringMatch ):
+                
+                pipeline_callable = processing_step.MatchStrings
+                
+            elif isinstance( processing_step, StringSplitter ):
+                
+                pipeline_callable = processing_step.SplitStrings
+                
+            else:
+                
+                pipeline_callable = lambda current_strings: []
+                
+            
+            pipeline.append( ( processing_step, pipeline_callable ) )
+            
+        
+        return pipeline
+        
     
     def _GetSerialisableInfo( self ):
         
@@ -4108,6 +4815,8 @@ class StringProcessor( HydrusSerialisable.SerialisableBase ):
         
         self._processing_steps = list( HydrusSerialisable.CreateFromSerialisableTuple( serialisable_processing_steps ) )
         
+        self._compiled_pipeline = None
+        
     
     def GetProcessingSteps( self ):
         
@@ -4135,104 +4844,26 @@ class StringProcessor( HydrusSerialisable.SerialisableBase ):
     
     def ProcessStrings( self, starting_strings: typing.Iterable[ str ], max_steps_allowed = None, no_slicing = False ) -> typing.List[ str ]:
         
+        if self._compiled_pipeline is None:
+            
+            self._compiled_pipeline = self._CompilePipeline()
+            
+        
         current_strings = list( starting_strings )
         
-        for ( i, processing_step ) in enumerate( self._processing_steps ):
+        for ( i, ( processing_step, pipeline_callable ) ) in enumerate( self._compiled_pipeline ):
             
             if max_steps_allowed is not None and i >= max_steps_allowed:
                 
                 break
                 
             
-            if isinstance( processing_step, StringSorter ):
-                
-                try:
-                    
-                    next_strings = processing_step.Sort( current_strings )
-                    
-                except HydrusExceptions.StringSortException:
-                    
-                    next_strings = current_strings
-                    
-                
-            elif isinstance( processing_step, StringSlicer ):
-                
-                if no_slicing:
-                    
-                    next_strings = current_strings
-                    
-                else:
-                    
-                    try:
-                        
-                        next_strings = processing_step.Slice( current_strings )
-                        
-                    except:
-                        
-                        next_strings = current_strings
-                        
-                    
-                
-            else:
-                
-                next_strings = []
+            if no_slicing and isinstance( processing_step, StringSlicer ):
                 
-                for current_string in current_strings:
-                    
-                    if isinstance( processing_step, StringConverter ):
-                        
-                        if isinstance( current_string, bytes ):
-                            
-                            continue
-                            
-                        
-                        try:
-                            
-                            next_string = processing_step.Convert( current_string )
-                            
-                            next_strings.append( next_string )
-                            
-                        except HydrusExceptions.StringConvertException:
-                            
-                            continue
-                            
-                        
-                    elif isinstance( processing_step, StringMatch ):
-                        
-                        try:
-                            
-                            if processing_step.Matches( current_string ):
-                                
-                                next_strings.append( current_string )
-                                
-                            
-                        except HydrusExceptions.StringMatchException:
-                            
-                            continue
-                            
-                        
-                    elif isinstance( processing_step, StringSplitter ):
-                        
-                        if isinstance( current_string, bytes ):
-                            
-                            continue
-                            
-                        
-                        try:
-                            
-                            split_strings = processing_step.Split( current_string )
-                            
-                            next_strings.extend( split_strings )
-                            
-                        except HydrusExceptions.StringSplitterException:
-                            
-                            continue
-                            
-                        
-                    
+                continue
                 
             
-            current_strings = next_strings
+            current_strings = pipeline_callable( current_strings )
             
         
         return current_strings
@@ -4242,6 +4873,8 @@ class StringProcessor( HydrusSerialisable.SerialisableBase ):
         
         self._processing_steps = list( processing_steps )
         
+        self._compiled_pipeline = None
+        
     
     def ToString( self ) -> str:
         
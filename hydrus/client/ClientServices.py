@@ -1,4 +1,4 @@
-import hashlib
+import collections
 import json
 import os
 import random
@@ -1270,6 +1270,171 @@ class ServiceRestricted( ServiceRemote ):
             
         
     
+class RepositoryUpdatePrefetcher( object ):
+    
+    # reading and decoding a big update takes a while, and the db sits idle while it happens
+    # this loads the next few updates on worker threads while the current one is written, giving them back strictly in order
+    
+    def __init__( self, controller, update_hashes_and_mimes, num_to_prefetch = 2 ):
+        
+        self._controller = controller
+        self._update_hashes_and_mimes = list( update_hashes_and_mimes )
+        self._num_to_prefetch = max( 1, num_to_prefetch )
+        
+        self._update_hashes_to_indices = { update_hash : index for ( index, ( update_hash, mime ) ) in enumerate( self._update_hashes_and_mimes ) }
+        
+        self._lock = threading.Lock()
+        
+        self._update_hashes_to_jobs = {}
+        self._next_index_to_submit = 0
+        
+        self._update_hashes_to_mimes = dict( self._update_hashes_and_mimes )
+        
+        # per-stage timings, by update mime, so definitions and content can be reported separately
+        self._mimes_to_stage_stats = collections.defaultdict( collections.Counter )
+        
+        self._shut_down = False
+        
+    
+    def _SubmitJobs( self, index ):
+        
+        # only ever keep a handful of decoded updates in memory
+        
+        while self._next_index_to_submit < min( index + 1 + self._num_to_prefetch, len( self._update_hashes_and_mimes ) ):
+            
+            ( update_hash, mime ) = self._update_hashes_and_mimes[ self._next_index_to_submit ]
+            
+            job = { 'done' : threading.Event(), 'update' : None, 'error' : None }
+            
+            self._update_hashes_to_jobs[ update_hash ] = job
+            
+            self._controller.CallToThread( self._WorkOnJob, update_hash, mime, job )
+            
+            self._next_index_to_submit += 1
+            
+        
+    
+    def _WorkOnJob( self, update_hash, mime, job ):
+        
+        try:
+            
+            with self._lock:
+                
+                if self._shut_down:
+                    
+                    return
+                    
+                
+            
+            read_start_time = HydrusData.GetNowPrecise()
+            
+            update_path = self._controller.client_files_manager.GetFilePath( update_hash, mime )
+            
+            with open( update_path, 'rb' ) as f:
+                
+                update_network_bytes = f.read()
+                
+            
+            decode_start_time = HydrusData.GetNowPrecise()
+            
+            try:
+                
+                update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
+                
+            except Exception as e:
+                
+                raise HydrusExceptions.SerialisationException( str( e ) )
+                
+            
+            decode_end_time = HydrusData.GetNowPrecise()
+            
+            num_rows = update.GetNumRows() if isinstance( update, ( HydrusNetwork.DefinitionsUpdate, HydrusNetwork.ContentUpdate ) ) else 0
+            
+            with self._lock:
+                
+                stage_stats = self._mimes_to_stage_stats[ mime ]
+                
+                stage_stats[ 'read_time' ] += decode_start_time - read_start_time
+                stage_stats[ 'decode_time' ] += decode_end_time - decode_start_time
+                stage_stats[ 'num_bytes_read' ] += len( update_network_bytes )
+                stage_stats[ 'num_rows_decoded' ] += num_rows
+                
+            
+            job[ 'update' ] = update
+            
+        except Exception as e:
+            
+            job[ 'error' ] = e
+            
+        finally:
+            
+            job[ 'done' ].set()
+            
+        
+    
+    def GetStageReport( self, mime ):
+        
+        with self._lock:
+            
+            stage_stats = self._mimes_to_stage_stats[ mime ]
+            
+            stage_statements = []
+            
+            if stage_stats[ 'read_time' ] > 0:
+                
+                stage_statements.append( 'read {} at {}/s'.format( HydrusData.ToHumanBytes( stage_stats[ 'num_bytes_read' ] ), HydrusData.ToHumanBytes( int( stage_stats[ 'num_bytes_read' ] / stage_stats[ 'read_time' ] ) ) ) )
+                
+            
+            if stage_stats[ 'decode_time' ] > 0:
+                
+                stage_statements.append( 'decoded at {} rows/s'.format( HydrusData.ToHumanInt( int( stage_stats[ 'num_rows_decoded' ] / stage_stats[ 'decode_time' ] ) ) ) )
+                
+            
+            stage_statements.append( 'waited {} on decode'.format( HydrusData.TimeDeltaToPrettyTimeDelta( stage_stats[ 'wait_time' ] ) ) )
+            
+            return ', '.join( stage_statements )
+            
+        
+    
+    def GetUpdate( self, update_hash ):
+        
+        self._SubmitJobs( self._update_hashes_to_indices[ update_hash ] )
+        
+        job = self._update_hashes_to_jobs.pop( update_hash )
+        
+        wait_start_time = HydrusData.GetNowPrecise()
+        
+        while not job[ 'done' ].wait( 0.5 ):
+            
+            if HG.model_shutdown:
+                
+                raise HydrusExceptions.ShutdownException()
+                
+            
+        
+        with self._lock:
+            
+            self._mimes_to_stage_stats[ self._update_hashes_to_mimes[ update_hash ] ][ 'wait_time' ] += HydrusData.GetNowPrecise() - wait_start_time
+            
+        
+        if job[ 'error' ] is not None:
+            
+            raise job[ 'error' ]
+            
+        
+        return job[ 'update' ]
+        
+    
+    def Shutdown( self ):
+        
+        with self._lock:
+            
+            self._shut_down = True
+            
+        
+        self._update_hashes_to_jobs = {}
+        
+    
 class ServiceRepository( ServiceRestricted ):
     
     def __init__( self, service_key, service_type, name, dictionary = None ):
@@ -1325,6 +1490,35 @@ class ServiceRepository( ServiceRestricted ):
         ServiceRestricted._CheckFunctional( self, including_external_communication = including_external_communication, including_bandwidth = including_bandwidth, including_account = including_account )
         
     
+    def _GetRepositoryUpdate( self, prefetcher, update_hash, update_class ):
+        
+        try:
+            
+            update = prefetcher.GetUpdate( update_hash )
+            
+        except HydrusExceptions.FileMissingException:
+            
+            HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
+            
+            raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
+            
+        except HydrusExceptions.SerialisationException:
+            
+            HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
+            
+            raise Exception( 'An unusual error has occured during repository processing: an update file was invalid. Your repository should be paused, and all update files have been scheduled for an integrity check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
+            
+        
+        if not isinstance( update, update_class ):
+            
+            HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA )
+            
+            raise Exception( 'An unusual error has occured during repository processing: an update file has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance to fix them, or tell it to do so manually, before unpausing your repository.' )
+            
+        
+        return update
+        
+    
     def _GetSerialisableDictionary( self ):
         
         dictionary = ServiceRestricted._GetSerialisableDictionary( self )
@@ -1343,7 +1537,7 @@ class ServiceRepository( ServiceRestricted ):
         self._paused = dictionary[ 'paused' ]
         
     
-    def _LogFinalRowSpeed( self, precise_timestamp, total_rows, row_name ):
+    def _LogFinalRowSpeed( self, precise_timestamp, total_rows, row_name, stage_report = None ):
         
         if total_rows == 0:
             
@@ -1356,6 +1550,11 @@ class ServiceRepository( ServiceRestricted ):
         
         summary = '{} processed {} {} at {} rows/s'.format( self._name, HydrusData.ToHumanInt( total_rows ), row_name, rows_s )
         
+        if stage_report is not None:
+            
+            summary += ' ({})'.format( stage_report )
+            
+        
         HydrusData.Print( summary )
         
     
@@ -1480,7 +1679,10 @@ class ServiceRepository( ServiceRestricted ):
                     
                     try:
                         
-                        update_network_string = self.Request( HC.GET, 'update', { 'update_hash' : update_hash } )
+                        # servers that do not know about binary updates ignore this and send json, which we read just the same
+                        update_format = HydrusNetwork.UPDATE_FORMAT_BINARY_ZSTD if HydrusNetwork.ZSTD_OK else HydrusNetwork.UPDATE_FORMAT_BINARY
+                        
+                        update_network_string = self.Request( HC.GET, 'update', { 'update_hash' : update_hash, 'update_format' : update_format } )
                         
                     except HydrusExceptions.CancelledException as e:
                         
@@ -1497,7 +1699,7 @@ class ServiceRepository( ServiceRestricted ):
                         return
                         
                     
-                    update_network_string_hash = hashlib.sha256( update_network_string ).digest()
+                    update_network_string_hash = HydrusNetwork.GetUpdateHashFromNetworkBytes( update_network_string )
                     
                     if update_network_string_hash != update_hash:
                         
@@ -1613,6 +1815,8 @@ class ServiceRepository( ServiceRestricted ):
         
         work_done = False
         
+        prefetcher = None
+        
         try:
             
             job_key = ClientThreading.JobKey( cancellable = True, maintenance_mode = maintenance_mode, stop_time = stop_time )
@@ -1642,6 +1846,12 @@ class ServiceRepository( ServiceRestricted ):
             did_definition_analyze = False
             did_content_analyze = False
             
+            update_hashes_and_mimes = [ ( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS ) for definition_hash in definition_hashes ]
+            update_hashes_and_mimes.extend( ( ( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) for content_hash in content_hashes ) )
+            
+            # the next updates are read and decoded in the background while the db works on the current one
+            prefetcher = RepositoryUpdatePrefetcher( HG.client_controller, update_hashes_and_mimes )
+            
             definition_start_time = HydrusData.GetNowPrecise()
             
             try:
@@ -1659,39 +1869,7 @@ class ServiceRepository( ServiceRestricted ):
                     job_key.SetVariable( 'popup_text_1', status )
                     job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                     
-                    try:
-                        
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
-                        
-                    except HydrusExceptions.FileMissingException:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        definition_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was invalid. Your repository should be paused, and all update files have been scheduled for an integrity check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    if not isinstance( definition_update, HydrusNetwork.DefinitionsUpdate ):
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance to fix them, or tell it to do so manually, before unpausing your repository.' )
-                        
+                    definition_update = self._GetRepositoryUpdate( prefetcher, definition_hash, HydrusNetwork.DefinitionsUpdate )
                     
                     rows_in_this_update = definition_update.GetNumRows()
                     rows_done_in_this_update = 0
@@ -1762,7 +1940,7 @@ class ServiceRepository( ServiceRestricted ):
                 
             finally:
                 
-                self._LogFinalRowSpeed( definition_start_time, total_definition_rows_completed, 'definitions' )
+                self._LogFinalRowSpeed( definition_start_time, total_definition_rows_completed, 'definitions', stage_report = prefetcher.GetStageReport( HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS ) )
                 
             
             if HG.client_controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time ) or job_key.IsCancelled():
@@ -1787,39 +1965,7 @@ class ServiceRepository( ServiceRestricted ):
                     job_key.SetVariable( 'popup_text_1', status )
                     job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                     
-                    try:
-                        
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
-                        
-                    except HydrusExceptions.FileMissingException:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        content_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was invalid. Your repository should be paused, and all update files have been scheduled for an integrity check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    if not isinstance( content_update, HydrusNetwork.ContentUpdate ):
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance to fix them, or tell it to do so manually, before unpausing your repository.' )
-                        
+                    content_update = self._GetRepositoryUpdate( prefetcher, content_hash, HydrusNetwork.ContentUpdate )
                     
                     rows_in_this_update = content_update.GetNumRows()
                     rows_done_in_this_update = 0
@@ -1896,7 +2042,7 @@ class ServiceRepository( ServiceRestricted ):
                 
             finally:
                 
-                self._LogFinalRowSpeed( content_start_time, total_content_rows_completed, 'content rows' )
+                self._LogFinalRowSpeed( content_start_time, total_content_rows_completed, 'content rows', stage_report = prefetcher.GetStageReport( HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) )
                 
             
         except HydrusExceptions.ShutdownException:
@@ -1923,6 +2069,11 @@ class ServiceRepository( ServiceRestricted ):
             
         finally:
             
+            if prefetcher is not None:
+                
+                prefetcher.Shutdown()
+                
+            
             if work_done:
                 
                 self._is_mostly_caught_up = None
@@ -0,0 +1,676 @@
+import collections
+import mmap
+import numpy
+import os
+import re
+import struct
+import threading
+import zlib
+
+from hydrus.core import HydrusData
+from hydrus.core import HydrusPaths
+
+# a thumbnail is usually 10-50KB, so one file per thumbnail spends a lot on directory entries, inodes and half-used filesystem blocks
+# this packs them into append-only segment files instead, with an in-memory index of hash -> ( segment_num, offset, length )
+# reads are a dict lookup and a slice of an mmapped segment, so no file open/close and no copy
+# a record is a header of ( hash, length, crc32 ) and then the thumbnail bytes. a record of length 0 is a deletion marker
+# the index is saved to disk on close. anything appended since the last save is recovered by scanning the segment tails on open
+
+RECORD_HEADER = struct.Struct( '>32sII' )
+
+INDEX_MAGIC = b'HTPI'
+INDEX_VERSION = 1
+
+INDEX_HEADER = struct.Struct( '>4sIII' )
+
+INDEX_SEGMENT_DTYPE = numpy.dtype( [ ( 'segment_num', '>u4' ), ( 'length', '>u8' ) ] )
+INDEX_ENTRY_DTYPE = numpy.dtype( [ ( 'hash', 'V32' ), ( 'segment_num', '>u4' ), ( 'offset', '>u8' ), ( 'length', '>u4' ) ] )
+
+INDEX_FILENAME = 'index.bin'
+
+SEGMENT_FILENAME_RE = re.compile( r'^segment_(\d{6})\.dat$' )
+
+SEGMENT_MAX_SIZE = 64 * 1024 * 1024
+
+def GetSegmentFilename( segment_num ):
+    
+    return 'segment_{:06}.dat'.format( segment_num )
+    
+class PackedThumbnailStore( object ):
+    
+    def __init__( self, directory, segment_max_size = SEGMENT_MAX_SIZE ):
+        
+        self._directory = directory
+        self._segment_max_size = segment_max_size
+        
+        self._lock = threading.Lock()
+        
+        self._hashes_to_locations = {}
+        
+        self._segment_nums_to_lengths = {}
+        self._segment_nums_to_live_bytes = collections.Counter()
+        self._segment_nums_to_mmaps = {}
+        
+        self._active_segment_num = None
+        self._active_segment_file = None
+        
+        self._index_dirty = False
+        
+        HydrusPaths.MakeSureDirectoryExists( self._directory )
+        
+        self._LoadIndex()
+        
+    
+    def _AppendRecord( self, hash, thumbnail_bytes ):
+        
+        record_size = RECORD_HEADER.size + len( thumbnail_bytes )
+        
+        if self._active_segment_file is None:
+            
+            if self._active_segment_num is None or self._segment_nums_to_lengths[ self._active_segment_num ] >= self._segment_max_size:
+                
+                self._StartNewSegment()
+                
+            else:
+                
+                self._active_segment_file = open( self._GetSegmentPath( self._active_segment_num ), 'ab' )
+                
+            
+        elif self._segment_nums_to_lengths[ self._active_segment_num ] + record_size > self._segment_max_size:
+            
+            self._StartNewSegment()
+            
+        
+        segment_num = self._active_segment_num
+        offset = self._segment_nums_to_lengths[ segment_num ]
+        
+        self._active_segment_file.write( RECORD_HEADER.pack( hash, len( thumbnail_bytes ), zlib.crc32( thumbnail_bytes ) ) )
+        self._active_segment_file.write( thumbnail_bytes )
+        
+        self._segment_nums_to_lengths[ segment_num ] += record_size
+        
+        self._SetLocation( hash, segment_num, offset + RECORD_HEADER.size, len( thumbnail_bytes ) )
+        
+        self._index_dirty = True
+        
+    
+    def _CloseActiveSegment( self ):
+        
+        if self._active_segment_file is not None:
+            
+            self._active_segment_file.close()
+            
+            self._active_segment_file = None
+            
+        
+    
+    def _CloseMMap( self, segment_num ):
+        
+        if segment_num in self._segment_nums_to_mmaps:
+            
+            m = self._segment_nums_to_mmaps[ segment_num ]
+            
+            del self._segment_nums_to_mmaps[ segment_num ]
+            
+            try:
+                
+                m.close()
+                
+            except BufferError:
+                
+                pass # someone still has a view into it. it will be released when they are done
+                
+            
+        
+    
+    def _GetMMap( self, segment_num, end ):
+        
+        m = self._segment_nums_to_mmaps.get( segment_num, None )
+        
+        if m is None or len( m ) < end:
+            
+            if segment_num == self._active_segment_num and self._active_segment_file is not None:
+                
+                self._active_segment_file.flush()
+                
+            
+            # we do not close the old map here. any views into it stay valid, and it goes when they do
+            
+            with open( self._GetSegmentPath( segment_num ), 'rb' ) as f:
+                
+                m = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+                
+            
+            self._segment_nums_to_mmaps[ segment_num ] = m
+            
+        
+        return m
+        
+    
+    def _GetSegmentNumsOnDisk( self ):
+        
+        segment_nums = []
+        
+        for filename in os.listdir( self._directory ):
+            
+            result = SEGMENT_FILENAME_RE.match( filename )
+            
+            if result is not None:
+                
+                segment_nums.append( int( result.group( 1 ) ) )
+                
+            
+        
+        segment_nums.sort()
+        
+        return segment_nums
+        
+    
+    def _GetSegmentPath( self, segment_num ):
+        
+        return os.path.join( self._directory, GetSegmentFilename( segment_num ) )
+        
+    
+    def _IterateRecordHeaders( self, segment_num ):
+        
+        # yields ( hash, offset, length ) for each record in the segment, where offset is where the thumbnail bytes start
+        
+        end = self._segment_nums_to_lengths[ segment_num ]
+        
+        if end == 0:
+            
+            return
+            
+        
+        m = self._GetMMap( segment_num, end )
+        
+        offset = 0
+        
+        while offset + RECORD_HEADER.size <= end:
+            
+            ( hash, length, crc ) = RECORD_HEADER.unpack_from( m, offset )
+            
+            yield ( hash, offset + RECORD_HEADER.size, length )
+            
+            offset += RECORD_HEADER.size + length
+            
+        
+    
+    def _LoadIndex( self, use_index_file = True ):
+        
+        self._hashes_to_locations = {}
+        self._segment_nums_to_lengths = {}
+        self._active_segment_num = None
+        
+        segment_nums_to_indexed_lengths = {}
+        
+        index_path = os.path.join( self._directory, INDEX_FILENAME )
+        
+        if use_index_file and os.path.exists( index_path ):
+            
+            try:
+                
+                ( self._hashes_to_locations, segment_nums_to_indexed_lengths ) = self._ReadIndexFile( index_path )
+                
+            except Exception as e:
+                
+                HydrusData.Print( 'The packed thumbnail index at "{}" could not be read, so it will be rebuilt from the segments. The error was:'.format( index_path ) )
+                HydrusData.PrintException( e, do_wait = False )
+                
+                self._hashes_to_locations = {}
+                segment_nums_to_indexed_lengths = {}
+                
+            
+        
+        segment_nums = self._GetSegmentNumsOnDisk()
+        
+        index_is_sane = True
+        
+        for ( segment_num, indexed_length ) in segment_nums_to_indexed_lengths.items():
+            
+            if segment_num not in segment_nums or os.path.getsize( self._GetSegmentPath( segment_num ) ) < indexed_length:
+                
+                index_is_sane = False
+                
+            
+        
+        if not index_is_sane:
+            
+            HydrusData.Print( 'The packed thumbnail index at "{}" did not match the segments on disk, so it will be rebuilt from them.'.format( index_path ) )
+            
+            self._hashes_to_locations = {}
+            segment_nums_to_indexed_lengths = {}
+            
+        
+        # segments are scanned oldest first, so later records correctly override earlier ones
+        
+        for segment_num in segment_nums:
+            
+            self._ScanSegment( segment_num, segment_nums_to_indexed_lengths.get( segment_num, 0 ) )
+            
+        
+        self._RecalcLiveBytes()
+        
+        if len( segment_nums ) > 0:
+            
+            self._active_segment_num = segment_nums[-1]
+            
+        
+        self._index_dirty = segment_nums_to_indexed_lengths != self._segment_nums_to_lengths
+        
+    
+    def _ReadIndexFile( self, index_path ):
+        
+        with open( index_path, 'rb' ) as f:
+            
+            ( magic, version, num_segments, num_entries ) = INDEX_HEADER.unpack( f.read( INDEX_HEADER.size ) )
+            
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                
+                raise Exception( 'Unknown index format!' )
+                
+            
+            segments = numpy.fromfile( f, dtype = INDEX_SEGMENT_DTYPE, count = num_segments )
+            entries = numpy.fromfile( f, dtype = INDEX_ENTRY_DTYPE, count = num_entries )
+            
+        
+        if len( segments ) != num_segments or len( entries ) != num_entries:
+            
+            raise Exception( 'Index was truncated!' )
+            
+        
+        segment_nums_to_indexed_lengths = dict( zip( segments[ 'segment_num' ].tolist(), segments[ 'length' ].tolist() ) )
+        
+        hashes_to_locations = dict( zip( entries[ 'hash' ].tolist(), zip( entries[ 'segment_num' ].tolist(), entries[ 'offset' ].tolist(), entries[ 'length' ].tolist() ) ) )
+        
+        return ( hashes_to_locations, segment_nums_to_indexed_lengths )
+        
+    
+    def _RecalcLiveBytes( self ):
+        
+        self._segment_nums_to_live_bytes = collections.Counter()
+        
+        for ( segment_num, offset, length ) in self._hashes_to_locations.values():
+            
+            self._segment_nums_to_live_bytes[ segment_num ] += RECORD_HEADER.size + length
+            
+        
+    
+    def _SaveIndex( self ):
+        
+        if self._active_segment_file is not None:
+            
+            self._active_segment_file.flush()
+            
+        
+        segments = numpy.empty( len( self._segment_nums_to_lengths ), dtype = INDEX_SEGMENT_DTYPE )
+        
+        if len( segments ) > 0:
+            
+            ( segments[ 'segment_num' ], segments[ 'length' ] ) = zip( *self._segment_nums_to_lengths.items() )
+            
+        
+        entries = numpy.empty( len( self._hashes_to_locations ), dtype = INDEX_ENTRY_DTYPE )
+        
+        if len( entries ) > 0:
+            
+            entries[ 'hash' ] = list( self._hashes_to_locations.keys() )
+            
+            ( entries[ 'segment_num' ], entries[ 'offset' ], entries[ 'length' ] ) = zip( *self._hashes_to_locations.values() )
+            
+        
+        index_path = os.path.join( self._directory, INDEX_FILENAME )
+        temp_index_path = index_path + '.temp'
+        
+        with open( temp_index_path, 'wb' ) as f:
+            
+            f.write( INDEX_HEADER.pack( INDEX_MAGIC, INDEX_VERSION, len( segments ), len( entries ) ) )
+            
+            segments.tofile( f )
+            entries.tofile( f )
+            
+        
+        os.replace( temp_index_path, index_path )
+        
+        self._index_dirty = False
+        
+    
+    def _ScanSegment( self, segment_num, start ):
+        
+        path = self._GetSegmentPath( segment_num )
+        
+        size = os.path.getsize( path )
+        
+        offset = start
+        
+        with open( path, 'rb' ) as f:
+            
+            f.seek( offset )
+            
+            while offset + RECORD_HEADER.size <= size:
+                
+                ( hash, length, crc ) = RECORD_HEADER.unpack( f.read( RECORD_HEADER.size ) )
+                
+                if offset + RECORD_HEADER.size + length > size:
+                    
+                    break
+                    
+                
+                if length == 0:
+                    
+                    if hash in self._hashes_to_locations:
+                        
+                        del self._hashes_to_locations[ hash ]
+                        
+                    
+                else:
+                    
+                    thumbnail_bytes = f.read( length )
+                    
+                    if zlib.crc32( thumbnail_bytes ) != crc:
+                        
+                        break
+                        
+                    
+                    self._hashes_to_locations[ hash ] = ( segment_num, offset + RECORD_HEADER.size, length )
+                    
+                
+                offset += RECORD_HEADER.size + length
+                
+            
+        
+        if offset < size:
+            
+            # a torn write from a crash, or damage. what comes after cannot be trusted
+            
+            HydrusData.Print( 'The packed thumbnail segment "{}" had {} bytes of bad data at its end, which were truncated.'.format( path, HydrusData.ToHumanInt( size - offset ) ) )
+            
+            with open( path, 'r+b' ) as f:
+                
+                f.truncate( offset )
+                
+            
+        
+        self._segment_nums_to_lengths[ segment_num ] = offset
+        
+    
+    def _SetLocation( self, hash, segment_num, offset, length ):
+        
+        if hash in self._hashes_to_locations:
+            
+            ( old_segment_num, old_offset, old_length ) = self._hashes_to_locations[ hash ]
+            
+            self._segment_nums_to_live_bytes[ old_segment_num ] -= RECORD_HEADER.size + old_length
+            
+            del self._hashes_to_locations[ hash ]
+            
+        
+        if length > 0:
+            
+            self._hashes_to_locations[ hash ] = ( segment_num, offset, length )
+            
+            self._segment_nums_to_live_bytes[ segment_num ] += RECORD_HEADER.size + length
+            
+        
+    
+    def _StartNewSegment( self ):
+        
+        self._CloseActiveSegment()
+        
+        if len( self._segment_nums_to_lengths ) == 0:
+            
+            segment_num = 0
+            
+        else:
+            
+            segment_num = max( self._segment_nums_to_lengths.keys() ) + 1
+            
+        
+        self._active_segment_num = segment_num
+        self._active_segment_file = open( self._GetSegmentPath( segment_num ), 'ab' )
+        
+        self._segment_nums_to_lengths[ segment_num ] = 0
+        
+    
+    def AddThumbnail( self, hash, thumbnail_bytes ):
+        
+        if len( thumbnail_bytes ) == 0:
+            
+            raise ValueError( 'Cannot store an empty thumbnail!' )
+            
+        
+        with self._lock:
+            
+            self._AppendRecord( hash, thumbnail_bytes )
+            
+        
+    
+    def Close( self ):
+        
+        with self._lock:
+            
+            if self._index_dirty:
+                
+                self._SaveIndex()
+                
+            
+            self._CloseActiveSegment()
+            
+            for segment_num in list( self._segment_nums_to_mmaps.keys() ):
+                
+                self._CloseMMap( segment_num )
+                
+            
+        
+    
+    def Compact( self, min_garbage_proportion = 0.25 ):
+        
+        # copies the live records of mostly-dead segments to the end of the store and then deletes those segments
+        
+        with self._lock:
+            
+            candidate_segment_nums = []
+            
+            for ( segment_num, length ) in self._segment_nums_to_lengths.items():
+                
+                if segment_num == self._active_segment_num or length == 0:
+                    
+                    continue
+                    
+                
+                garbage = length - self._segment_nums_to_live_bytes[ segment_num ]
+                
+                if garbage / length >= min_garbage_proportion:
+                    
+                    candidate_segment_nums.append( segment_num )
+                    
+                
+            
+            if len( candidate_segment_nums ) == 0:
+                
+                return 0
+                
+            
+            candidate_segment_nums_set = set( candidate_segment_nums )
+            
+            records_to_move = [ ( hash, location ) for ( hash, location ) in self._hashes_to_locations.items() if location[0] in candidate_segment_nums_set ]
+            
+            records_to_move.sort( key = lambda r: r[1] )
+            
+            for ( hash, ( segment_num, offset, length ) ) in records_to_move:
+                
+                m = self._GetMMap( segment_num, offset + length )
+                
+                self._AppendRecord( hash, m[ offset : offset + length ] )
+                
+            
+            # a deletion marker is what stops an older segment's copy of that thumbnail coming back on a rescan, so we keep it while any older segment survives with one
+            
+            tombstone_hashes_to_segment_nums = {}
+            
+            for segment_num in candidate_segment_nums:
+                
+                for ( hash, offset, length ) in self._IterateRecordHeaders( segment_num ):
+                    
+                    if length == 0 and hash not in self._hashes_to_locations:
+                        
+                        tombstone_hashes_to_segment_nums[ hash ] = max( segment_num, tombstone_hashes_to_segment_nums.get( hash, segment_num ) )
+                        
+                    
+                
+            
+            if len( tombstone_hashes_to_segment_nums ) > 0:
+                
+                newest_tombstone_segment_num = max( tombstone_hashes_to_segment_nums.values() )
+                
+                surviving_older_segment_nums = [ segment_num for segment_num in self._segment_nums_to_lengths.keys() if segment_num not in candidate_segment_nums_set and segment_num < newest_tombstone_segment_num ]
+                
+                tombstones_to_keep = set()
+                
+                for segment_num in surviving_older_segment_nums:
+                    
+                    for ( hash, offset, length ) in self._IterateRecordHeaders( segment_num ):
+                        
+                        if length > 0 and hash in tombstone_hashes_to_segment_nums and segment_num < tombstone_hashes_to_segment_nums[ hash ]:
+                            
+                            tombstones_to_keep.add( hash )
+                            
+                        
+                    
+                
+                for hash in tombstones_to_keep:
+                    
+                    self._AppendRecord( hash, b'' )
+                    
+                
+            
+            # the index has to point at the new copies before we delete anything
+            
+            self._SaveIndex()
+            
+            num_bytes_reclaimed = 0
+            
+            for segment_num in candidate_segment_nums:
+                
+                num_bytes_reclaimed += self._segment_nums_to_lengths[ segment_num ] - self._segment_nums_to_live_bytes[ segment_num ]
+                
+                self._CloseMMap( segment_num )
+                
+                del self._segment_nums_to_lengths[ segment_num ]
+                del self._segment_nums_to_live_bytes[ segment_num ]
+                
+                try:
+                    
+                    os.remove( self._GetSegmentPath( segment_num ) )
+                    
+                except Exception as e:
+                    
+                    HydrusData.Print( 'Could not delete the old packed thumbnail segment {}. It will be scanned harmlessly on the next boot. The error was:'.format( GetSegmentFilename( segment_num ) ) )
+                    HydrusData.PrintException( e, do_wait = False )
+                    
+                
+            
+            self._SaveIndex()
+            
+            return num_bytes_reclaimed
+            
+        
+    
+    def DeleteThumbnails( self, hashes ):
+        
+        with self._lock:
+            
+            for hash in hashes:
+                
+                if hash in self._hashes_to_locations:
+                    
+                    self._AppendRecord( hash, b'' )
+                    
+                
+            
+        
+    
+    def GetDirectory( self ):
+        
+        return self._directory
+        
+    
+    def GetHashes( self ):
+        
+        with self._lock:
+            
+            return list( self._hashes_to_locations.keys() )
+            
+        
+    
+    def GetPrettyStatistics( self ):
+        
+        ( num_thumbnails, num_segments, total_bytes, live_bytes ) = self.GetStatistics()
+        
+        return '{} thumbnails in {} segments, {} of {} in use'.format( HydrusData.ToHumanInt( num_thumbnails ), HydrusData.ToHumanInt( num_segments ), HydrusData.ToHumanBytes( live_bytes ), HydrusData.ToHumanBytes( total_bytes ) )
+        
+    
+    def GetStatistics( self ):
+        
+        with self._lock:
+            
+            num_thumbnails = len( self._hashes_to_locations )
+            num_segments = len( self._segment_nums_to_lengths )
+            total_bytes = sum( self._segment_nums_to_lengths.values() )
+            live_bytes = sum( self._segment_nums_to_live_bytes.values() )
+            
+        
+        return ( num_thumbnails, num_segments, total_bytes, live_bytes )
+        
+    
+    def GetThumbnail( self, hash ):
+        
+        # this is a view into the mmap, not a copy
+        
+        with self._lock:
+            
+            if hash not in self._hashes_to_locations:
+                
+                return None
+                
+            
+            ( segment_num, offset, length ) = self._hashes_to_locations[ hash ]
+            
+            m = self._GetMMap( segment_num, offset + length )
+            
+        
+        return memoryview( m )[ offset : offset + length ]
+        
+    
+    def HasThumbnail( self, hash ):
+        
+        with self._lock:
+            
+            return hash in self._hashes_to_locations
+            
+        
+    
+    def RebuildIndex( self ):
+        
+        with self._lock:
+            
+            self._CloseActiveSegment()
+            
+            for segment_num in list( self._segment_nums_to_mmaps.keys() ):
+                
+                self._CloseMMap( segment_num )
+                
+            
+            self._LoadIndex( use_index_file = False )
+            
+            self._SaveIndex()
+            
+        
+    
+    def SaveIndex( self ):
+        
+        with self._lock:
+            
+            if self._index_dirty:
+                
+                self._SaveIndex()
@@ -1,6 +1,7 @@
 import collections
 import hashlib
 import itertools    
+import numpy
 import os
 import random
 import re
@@ -12,6 +13,7 @@ import typing
 from qtpy import QtCore as QC
 from qtpy import QtWidgets as QW
 
+from hydrus.core import HydrusBitmaps
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusDB
@@ -40,6 +42,7 @@ from hydrus.client.db import ClientDBMaster
 from hydrus.client.db import ClientDBSerialisable
 from hydrus.client.db import ClientDBServices
 from hydrus.client.db import ClientDBSimilarFiles
+from hydrus.client.db import ClientDBTagCooccurrence
 from hydrus.client.media import ClientMedia
 from hydrus.client.media import ClientMediaManagers
 from hydrus.client.media import ClientMediaResult
@@ -144,6 +147,42 @@ from hydrus.client.networking import ClientNetworkingBandwidthLegacy
 MIN_CACHED_INTEGER = -99999999
 MAX_CACHED_INTEGER = 99999999
 
+# sits next to an online backup and records which files the backup's client_files has, so the next run only copies the difference
+CLIENT_FILES_BACKUP_MANIFEST_FILENAME = 'client_files_backup_manifest.db'
+
+COLUMN_SORTS = { CC.SORT_FILES_BY_IMPORT_TIME, CC.SORT_FILES_BY_FILESIZE, CC.SORT_FILES_BY_DURATION, CC.SORT_FILES_BY_FRAMERATE, CC.SORT_FILES_BY_NUM_FRAMES, CC.SORT_FILES_BY_WIDTH, CC.SORT_FILES_BY_HEIGHT, CC.SORT_FILES_BY_RATIO, CC.SORT_FILES_BY_NUM_PIXELS, CC.SORT_FILES_BY_APPROX_BITRATE }
+
+def ArgSortKeys( sort_keys, reverse, limit = None ):
+    
+    # sort_keys is a list of aligned arrays, primary first. the sort is stable, so ties keep their incoming order, just like list.sort
+    # when we only want the first few, we partition first and only properly sort those
+    
+    if reverse:
+        
+        sort_keys = [ -sort_key for sort_key in sort_keys ]
+        
+    
+    num_rows = len( sort_keys[0] )
+    
+    if len( sort_keys ) == 1 and limit is not None and 0 < limit < num_rows:
+        
+        sort_key = sort_keys[0]
+        
+        kth_value = numpy.partition( sort_key, limit - 1 )[ limit - 1 ]
+        
+        below = numpy.flatnonzero( sort_key < kth_value )
+        
+        # ties at the boundary go to whichever came first, as they would in a full stable sort
+        at = numpy.flatnonzero( sort_key == kth_value )[ : limit - len( below ) ]
+        
+        candidates = numpy.sort( numpy.concatenate( ( below, at ) ) )
+        
+        return candidates[ numpy.argsort( sort_key[ candidates ], kind = 'stable' ) ]
+        
+    
+    # lexsort wants the primary key last
+    return numpy.lexsort( sort_keys[::-1] )
+    
 def BlockingSafeShowMessage( message ):
     
     HG.client_controller.CallBlockingToQt( HG.client_controller.app, QW.QMessageBox.warning, None, 'Warning', message )
@@ -174,6 +213,79 @@ def DoingAFileJoinTagSearchIsFaster( estimated_file_row_count, estimated_tag_row
     
     return estimated_file_row_count * ( file_lookup_speed_ratio + temp_table_overhead ) < estimated_tag_row_count
     
+def GenerateColumnSortKeys( sort_data, columns ):
+    
+    # vectorised versions of the sort keys in _TryToSortHashIds. NULL columns come in as -1
+    # if we do not know the sort, we return None and the caller falls back to sql
+    
+    with numpy.errstate( divide = 'ignore', invalid = 'ignore' ):
+        
+        if sort_data == CC.SORT_FILES_BY_IMPORT_TIME:
+            
+            return [ columns[ 'timestamp' ] ]
+            
+        elif sort_data == CC.SORT_FILES_BY_FILESIZE:
+            
+            return [ columns[ 'size' ] ]
+            
+        elif sort_data == CC.SORT_FILES_BY_DURATION:
+            
+            return [ columns[ 'duration' ] ]
+            
+        elif sort_data == CC.SORT_FILES_BY_NUM_FRAMES:
+            
+            return [ columns[ 'num_frames' ] ]
+            
+        elif sort_data == CC.SORT_FILES_BY_WIDTH:
+            
+            return [ columns[ 'width' ] ]
+            
+        elif sort_data == CC.SORT_FILES_BY_HEIGHT:
+            
+            return [ columns[ 'height' ] ]
+            
+        
+        size = columns[ 'size' ]
+        width = columns[ 'width' ]
+        height = columns[ 'height' ]
+        duration = columns[ 'duration' ]
+        num_frames = columns[ 'num_frames' ]
+        
+        if sort_data == CC.SORT_FILES_BY_RATIO:
+            
+            return [ numpy.where( ( width == -1 ) | ( height <= 0 ), -1, width / height ) ]
+            
+        elif sort_data == CC.SORT_FILES_BY_FRAMERATE:
+            
+            return [ numpy.where( ( num_frames <= 0 ) | ( duration <= 0 ), -1, num_frames / duration ) ]
+            
+        elif sort_data == CC.SORT_FILES_BY_NUM_PIXELS:
+            
+            return [ numpy.where( ( width <= 0 ) | ( height <= 0 ), -1, width * height ) ]
+            
+        elif sort_data == CC.SORT_FILES_BY_APPROX_BITRATE:
+            
+            no_duration = duration <= 0
+            no_size = size <= 0
+            no_resolution = ( width == -1 ) | ( height == -1 )
+            num_pixels = width * height
+            
+            duration_bitrate = numpy.where( no_duration, 0, size / duration )
+            
+            still_frame_bitrate = numpy.where( no_resolution, 0, numpy.where( num_pixels == 0, -1, size / num_pixels ) )
+            moving_frame_bitrate = numpy.where( num_frames <= 0, 0, duration_bitrate / num_frames )
+            
+            frame_bitrate = numpy.where( no_duration, still_frame_bitrate, moving_frame_bitrate )
+            
+            duration_bitrate = numpy.where( no_size, -1, duration_bitrate )
+            frame_bitrate = numpy.where( no_size, -1, frame_bitrate )
+            
+            return [ duration_bitrate, frame_bitrate ]
+            
+        
+    
+    return None
+    
 def GenerateCombinedFilesMappingsACCacheTableName( tag_display_type, tag_service_id ):
     
     if tag_display_type == ClientTags.TAG_DISPLAY_STORAGE:
@@ -373,6 +485,23 @@ def GenerateTagSiblingsLookupCacheTableNames( service_id ):
     
     return ( cache_ideal_tag_siblings_lookup_table_name, cache_actual_tag_siblings_lookup_table_name )
     
+def GetBackupSnapshotHashesToMimes( c ):
+    
+    # called on the online backup's snapshot cursor, so this is exactly the set of files the backed up db thinks it has
+    
+    result = c.execute( 'SELECT service_id FROM services WHERE service_key = ?;', ( sqlite3.Binary( CC.COMBINED_LOCAL_FILE_SERVICE_KEY ), ) ).fetchone()
+    
+    if result is None:
+        
+        return {}
+        
+    
+    ( combined_local_file_service_id, ) = result
+    
+    select = 'SELECT hash, mime FROM current_files CROSS JOIN files_info USING ( hash_id ) CROSS JOIN external_master.hashes USING ( hash_id ) WHERE service_id = ?;'
+    
+    return { bytes( hash ) : mime for ( hash, mime ) in c.execute( select, ( combined_local_file_service_id, ) ) }
+    
 def WildcardHasFTS4SearchableCharacters( wildcard: str ):
     
     # fts4 says it can do alphanumeric or unicode with a value >= 128
@@ -502,6 +631,7 @@ class JobDatabaseClient( HydrusData.JobDatabase ):
 class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
+    READ_POOL_ACTIONS = [ 'autocomplete_predicates', 'file_hashes', 'file_query_ids', 'filter_hashes', 'hash_ids_to_hashes', 'inbox_hashes', 'media_result', 'media_result_parts', 'media_results', 'media_results_from_ids', 'related_tags', 'url_statuses' ]
     
     def __init__( self, controller, db_dir, db_name ):
         
@@ -522,6 +652,13 @@ class DB( HydrusDB.HydrusDB ):
         
         self._service_ids_to_display_application_status = {}
         
+        self._tag_siblings_lookup_caches = {}
+        self._tag_parents_lookup_caches = {}
+        
+        self._subtag_prefix_indices = {}
+        
+        self._service_ids_to_current_files_timestamp_caches = {}
+        
         HydrusDB.HydrusDB.__init__( self, controller, db_dir, db_name )
         
     
@@ -541,6 +678,11 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'INSERT OR IGNORE INTO current_files VALUES ( ?, ?, ? );', ( ( service_id, hash_id, timestamp ) for ( hash_id, timestamp ) in valid_rows ) )
             
+            if service_id in self._service_ids_to_current_files_timestamp_caches:
+                
+                self._service_ids_to_current_files_timestamp_caches[ service_id ].AddRows( valid_rows )
+                
+            
             self._c.executemany( 'DELETE FROM file_transfers WHERE service_id = ? AND hash_id = ?;', ( ( service_id, hash_id ) for hash_id in valid_hash_ids ) )
             
             delta_size = self.modules_files_metadata_basic.GetTotalSize( valid_hash_ids )
@@ -901,6 +1043,9 @@ class DB( HydrusDB.HydrusDB ):
                 HydrusPaths.MirrorTree( client_files_default, os.path.join( path, 'client_files' ), text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
                 
             
+            # we just did a full mirror, so any online backup manifest is out of date
+            HydrusPaths.DeletePath( os.path.join( path, CLIENT_FILES_BACKUP_MANIFEST_FILENAME ) )
+            
         finally:
             
             self._InitDBCursor()
@@ -911,6 +1056,293 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _BackupClientFilesIncremental( self, path, hashes_to_mimes, job_key ):
+        
+        # this runs in the online backup's thread, not the db thread
+        # the manifest remembers what the backup's client_files has, so we only copy new files and delete old ones rather than walking the whole tree
+        
+        client_files_source = os.path.join( self._db_dir, 'client_files' )
+        client_files_dest = os.path.join( path, 'client_files' )
+        manifest_path = os.path.join( path, CLIENT_FILES_BACKUP_MANIFEST_FILENAME )
+        
+        if not os.path.exists( client_files_source ):
+            
+            return
+            
+        
+        def is_cancelled_hook():
+            
+            return job_key.IsCancelled()
+            
+        
+        def text_update_hook( text ):
+            
+            job_key.SetVariable( 'popup_text_1', text )
+            
+        
+        def get_paths( client_files_dir, hash, mime ):
+            
+            hash_encoded = hash.hex()
+            
+            file_path = os.path.join( client_files_dir, 'f' + hash_encoded[:2], hash_encoded + HC.mime_ext_lookup[ mime ] )
+            thumbnail_path = os.path.join( client_files_dir, 't' + hash_encoded[:2], hash_encoded + '.thumbnail' )
+            
+            return ( file_path, thumbnail_path )
+            
+        
+        def get_thumbnail_size_and_mtime( thumbnail_path ):
+            
+            # a file never changes under its hash, but its thumbnail can be regenerated, so the manifest remembers what the thumbnail looked like
+            
+            try:
+                
+                stat_result = os.stat( thumbnail_path )
+                
+            except FileNotFoundError:
+                
+                return ( None, None )
+                
+            
+            return ( stat_result.st_size, int( stat_result.st_mtime ) )
+            
+        
+        we_have_a_manifest = os.path.exists( manifest_path ) and os.path.exists( client_files_dest )
+        
+        if not we_have_a_manifest:
+            
+            HydrusPaths.DeletePath( manifest_path )
+            
+            # we don't know what the backup has, so do it the slow way once
+            
+            HydrusPaths.MirrorTree( client_files_source, client_files_dest, text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+            
+            if job_key.IsCancelled():
+                
+                return
+                
+            
+        else:
+            
+            # the packed thumbnail store is a handful of big append-only segments, not a file per hash, so it is not in the manifest
+            # mirroring its directory every time only copies the segments that changed, and a torn tail on the active segment is truncated when the store opens
+            
+            packed_thumbnails_source = os.path.join( client_files_source, 'packed_thumbnails' )
+            packed_thumbnails_dest = os.path.join( client_files_dest, 'packed_thumbnails' )
+            
+            if os.path.exists( packed_thumbnails_source ):
+                
+                HydrusPaths.MirrorTree( packed_thumbnails_source, packed_thumbnails_dest, text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+                
+            elif os.path.exists( packed_thumbnails_dest ):
+                
+                HydrusPaths.DeletePath( packed_thumbnails_dest )
+                
+            
+            if job_key.IsCancelled():
+                
+                return
+                
+            
+        
+        manifest_db = sqlite3.connect( manifest_path, isolation_level = None )
+        
+        try:
+            
+            manifest_db.execute( 'CREATE TABLE IF NOT EXISTS backed_up_files ( hash BLOB_BYTES PRIMARY KEY, mime INTEGER, thumbnail_size INTEGER, thumbnail_mtime INTEGER );' )
+            
+            column_names = { column_name for ( cid, column_name, column_type, notnull, default_value, pk ) in manifest_db.execute( 'PRAGMA table_info( backed_up_files );' ) }
+            
+            if 'thumbnail_size' not in column_names:
+                
+                # an older manifest. its thumbnails will all be checked once
+                
+                manifest_db.execute( 'ALTER TABLE backed_up_files ADD COLUMN thumbnail_size INTEGER;' )
+                manifest_db.execute( 'ALTER TABLE backed_up_files ADD COLUMN thumbnail_mtime INTEGER;' )
+                
+            
+            if not we_have_a_manifest:
+                
+                manifest_db.execute( 'BEGIN IMMEDIATE;' )
+                
+                manifest_db.executemany( 'INSERT OR REPLACE INTO backed_up_files ( hash, mime, thumbnail_size, thumbnail_mtime ) VALUES ( ?, ?, ?, ? );', ( ( sqlite3.Binary( hash ), mime ) + get_thumbnail_size_and_mtime( get_paths( client_files_source, hash, mime )[1] ) for ( hash, mime ) in hashes_to_mimes.items() ) )
+                
+                manifest_db.execute( 'COMMIT;' )
+                
+                return
+                
+            
+            backed_up_hashes_to_rows = { bytes( hash ) : ( mime, thumbnail_size, thumbnail_mtime ) for ( hash, mime, thumbnail_size, thumbnail_mtime ) in manifest_db.execute( 'SELECT hash, mime, thumbnail_size, thumbnail_mtime FROM backed_up_files;' ) }
+            
+            backed_up_hashes_to_mimes = { hash : mime for ( hash, ( mime, thumbnail_size, thumbnail_mtime ) ) in backed_up_hashes_to_rows.items() }
+            
+            # a file whose mime changed is deleted under its old extension and copied again under its new one
+            deletees = [ ( hash, mime ) for ( hash, mime ) in backed_up_hashes_to_mimes.items() if hashes_to_mimes.get( hash, None ) != mime ]
+            additees = [ ( hash, mime ) for ( hash, mime ) in hashes_to_mimes.items() if backed_up_hashes_to_mimes.get( hash, None ) != mime ]
+            
+            pauser = HydrusData.BigJobPauser()
+            
+            manifest_db.execute( 'BEGIN IMMEDIATE;' )
+            
+            try:
+                
+                for ( i, ( hash, mime ) ) in enumerate( deletees ):
+                    
+                    if job_key.IsCancelled():
+                        
+                        return
+                        
+                    
+                    if i % 100 == 0:
+                        
+                        text_update_hook( 'deleting old files from the backup: ' + HydrusData.ConvertValueRangeToPrettyString( i, len( deletees ) ) )
+                        
+                    
+                    pauser.Pause()
+                    
+                    for dest_path in get_paths( client_files_dest, hash, mime ):
+                        
+                        HydrusPaths.DeletePath( dest_path )
+                        
+                    
+                    manifest_db.execute( 'DELETE FROM backed_up_files WHERE hash = ?;', ( sqlite3.Binary( hash ), ) )
+                    
+                
+                time_started = HydrusData.GetNowFloat()
+                num_bytes_done = 0
+                num_missing = 0
+                
+                for ( i, ( hash, mime ) ) in enumerate( additees ):
+                    
+                    if job_key.IsCancelled():
+                        
+                        return
+                        
+                    
+                    if i % 100 == 0:
+                        
+                        text_update_hook( HydrusDB.ConvertBackupProgressToPrettyString( 'copying new files', i, len( additees ), num_bytes_done, time_started ) )
+                        
+                        # checkpoint, so a cancel or crash does not lose the work so far
+                        manifest_db.execute( 'COMMIT;' )
+                        manifest_db.execute( 'BEGIN IMMEDIATE;' )
+                        
+                    
+                    pauser.Pause()
+                    
+                    ( source_file_path, source_thumbnail_path ) = get_paths( client_files_source, hash, mime )
+                    ( dest_file_path, dest_thumbnail_path ) = get_paths( client_files_dest, hash, mime )
+                    
+                    if not os.path.exists( source_file_path ):
+                        
+                        # probably deleted since our snapshot. we'll see next time
+                        
+                        num_missing += 1
+                        
+                        continue
+                        
+                    
+                    HydrusPaths.MakeSureDirectoryExists( os.path.dirname( dest_file_path ) )
+                    
+                    if not HydrusPaths.MirrorFile( source_file_path, dest_file_path ):
+                        
+                        continue
+                        
+                    
+                    num_bytes_done += os.path.getsize( source_file_path )
+                    
+                    if os.path.exists( source_thumbnail_path ):
+                        
+                        HydrusPaths.MakeSureDirectoryExists( os.path.dirname( dest_thumbnail_path ) )
+                        
+                        HydrusPaths.MirrorFile( source_thumbnail_path, dest_thumbnail_path )
+                        
+                    
+                    manifest_db.execute( 'INSERT OR REPLACE INTO backed_up_files ( hash, mime, thumbnail_size, thumbnail_mtime ) VALUES ( ?, ?, ?, ? );', ( sqlite3.Binary( hash ), mime ) + get_thumbnail_size_and_mtime( source_thumbnail_path ) )
+                    
+                
+                # files we already have may have had their thumbnails regenerated
+                
+                num_thumbnails_done = 0
+                
+                for ( i, ( hash, mime ) ) in enumerate( hashes_to_mimes.items() ):
+                    
+                    if job_key.IsCancelled():
+                        
+                        return
+                        
+                    
+                    if hash not in backed_up_hashes_to_rows:
+                        
+                        continue
+                        
+                    
+                    ( backed_up_mime, backed_up_thumbnail_size, backed_up_thumbnail_mtime ) = backed_up_hashes_to_rows[ hash ]
+                    
+                    if backed_up_mime != mime:
+                        
+                        continue
+                        
+                    
+                    if i % 1000 == 0:
+                        
+                        text_update_hook( 'checking thumbnails: ' + HydrusData.ConvertValueRangeToPrettyString( i, len( hashes_to_mimes ) ) )
+                        
+                        manifest_db.execute( 'COMMIT;' )
+                        manifest_db.execute( 'BEGIN IMMEDIATE;' )
+                        
+                    
+                    ( source_file_path, source_thumbnail_path ) = get_paths( client_files_source, hash, mime )
+                    ( dest_file_path, dest_thumbnail_path ) = get_paths( client_files_dest, hash, mime )
+                    
+                    ( thumbnail_size, thumbnail_mtime ) = get_thumbnail_size_and_mtime( source_thumbnail_path )
+                    
+                    if ( thumbnail_size, thumbnail_mtime ) == ( backed_up_thumbnail_size, backed_up_thumbnail_mtime ):
+                        
+                        continue
+                        
+                    
+                    pauser.Pause()
+                    
+                    if thumbnail_size is None:
+                        
+                        HydrusPaths.DeletePath( dest_thumbnail_path )
+                        
+                    else:
+                        
+                        HydrusPaths.MakeSureDirectoryExists( os.path.dirname( dest_thumbnail_path ) )
+                        
+                        if not HydrusPaths.MirrorFile( source_thumbnail_path, dest_thumbnail_path ):
+                            
+                            continue
+                            
+                        
+                        num_thumbnails_done += 1
+                        
+                    
+                    manifest_db.execute( 'UPDATE backed_up_files SET thumbnail_size = ?, thumbnail_mtime = ? WHERE hash = ?;', ( thumbnail_size, thumbnail_mtime, sqlite3.Binary( hash ) ) )
+                    
+                
+                if num_thumbnails_done > 0:
+                    
+                    HydrusData.Print( 'During the online backup, {} regenerated thumbnails were copied again.'.format( HydrusData.ToHumanInt( num_thumbnails_done ) ) )
+                    
+                
+                if num_missing > 0:
+                    
+                    HydrusData.Print( 'During the online backup, {} files were missing from the file store. They will be tried again next time.'.format( HydrusData.ToHumanInt( num_missing ) ) )
+                    
+                
+            finally:
+                
+                manifest_db.execute( 'COMMIT;' )
+                
+            
+        finally:
+            
+            manifest_db.close()
+            
+        
+    
     def _CacheCombinedFilesDisplayMappingsAddImplications( self, tag_service_id, implication_tag_ids, tag_id, status_hook = None ):
         
         if len( implication_tag_ids ) == 0:
@@ -2653,6 +3085,16 @@ class DB( HydrusDB.HydrusDB ):
         status[ 'num_actual_rows' ] = num_actual_rows
         status[ 'num_ideal_rows' ] = num_ideal_rows
         
+        lookup_caches = []
+        
+        for display_type in ( ClientTags.TAG_DISPLAY_ACTUAL, ClientTags.TAG_DISPLAY_IDEAL ):
+            
+            lookup_caches.append( self._tag_siblings_lookup_caches.get( ( display_type, service_id ), None ) )
+            lookup_caches.append( self._tag_parents_lookup_caches.get( ( display_type, service_id ), None ) )
+            
+        
+        status[ 'lookup_cache_memory_usage' ] = sum( ( lookup_cache.GetMemoryUsage() for lookup_cache in lookup_caches if lookup_cache is not None ) )
+        
         return status
         
     
@@ -3240,6 +3682,13 @@ class DB( HydrusDB.HydrusDB ):
                     
                     self._c.execute( 'DELETE FROM {} WHERE bad_tag_id = ? AND ideal_tag_id = ?;'.format( cache_actual_tag_siblings_lookup_table_name ), smallest_sibling_row )
                     
+                    lookup_cache = self._tag_siblings_lookup_caches.get( ( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id ), None )
+                    
+                    if lookup_cache is not None:
+                        
+                        lookup_cache.DeletePairs( ( smallest_sibling_row, ) )
+                        
+                    
                     after_chain_tag_ids_to_implied_by = self._CacheTagDisplayGetTagsToImpliedBy( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
                     
                     sibling_rows_to_remove.discard( smallest_sibling_row )
@@ -3262,6 +3711,13 @@ class DB( HydrusDB.HydrusDB ):
                     
                     self._c.execute( 'DELETE FROM {} WHERE child_tag_id = ? AND ancestor_tag_id = ?;'.format( cache_actual_tag_parents_lookup_table_name ), smallest_parent_row )
                     
+                    lookup_cache = self._tag_parents_lookup_caches.get( ( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id ), None )
+                    
+                    if lookup_cache is not None:
+                        
+                        lookup_cache.DeletePairs( ( smallest_parent_row, ) )
+                        
+                    
                     after_chain_tag_ids_to_implied_by = self._CacheTagDisplayGetTagsToImpliedBy( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
                     
                     parent_rows_to_remove.discard( smallest_parent_row )
@@ -3325,6 +3781,13 @@ class DB( HydrusDB.HydrusDB ):
                         
                         self._c.execute( 'INSERT OR IGNORE INTO {} ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );'.format( cache_actual_tag_siblings_lookup_table_name ), largest_sibling_row )
                         
+                        lookup_cache = self._tag_siblings_lookup_caches.get( ( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id ), None )
+                        
+                        if lookup_cache is not None:
+                            
+                            lookup_cache.AddPairs( ( largest_sibling_row, ) )
+                            
+                        
                         after_chain_tag_ids_to_implied_by = self._CacheTagDisplayGetTagsToImpliedBy( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
                         
                         sibling_rows_to_add.discard( largest_sibling_row )
@@ -3347,6 +3810,13 @@ class DB( HydrusDB.HydrusDB ):
                         
                         self._c.execute( 'INSERT OR IGNORE INTO {} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );'.format( cache_actual_tag_parents_lookup_table_name ), largest_parent_row )
                         
+                        lookup_cache = self._tag_parents_lookup_caches.get( ( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id ), None )
+                        
+                        if lookup_cache is not None:
+                            
+                            lookup_cache.AddPairs( ( largest_parent_row, ) )
+                            
+                        
                         after_chain_tag_ids_to_implied_by = self._CacheTagDisplayGetTagsToImpliedBy( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
                         
                         parent_rows_to_add.discard( largest_parent_row )
@@ -3447,9 +3917,21 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'DROP TABLE IF EXISTS {};'.format( cache_actual_tag_parents_lookup_table_name ) )
         self._c.execute( 'DROP TABLE IF EXISTS {};'.format( cache_ideal_tag_parents_lookup_table_name ) )
         
+        for display_type in ( ClientTags.TAG_DISPLAY_ACTUAL, ClientTags.TAG_DISPLAY_IDEAL ):
+            
+            self._tag_parents_lookup_caches.pop( ( display_type, tag_service_id ), None )
+            
+        
     
     def _CacheTagParentsFilterChained( self, display_type, tag_service_id, ideal_tag_ids ):
         
+        lookup_cache = self._CacheTagParentsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.FilterChained( ideal_tag_ids )
+            
+        
         if len( ideal_tag_ids ) == 0:
             
             return set()
@@ -3521,6 +4003,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagParentsGetAncestors( self, display_type: int, tag_service_id: int, ideal_tag_id: int ):
         
+        lookup_cache = self._CacheTagParentsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetAncestors( ideal_tag_id )
+            
+        
         cache_tag_parents_lookup_table_name = GenerateTagParentsLookupCacheTableName( display_type, tag_service_id )
         
         ancestor_ids = self._STS( self._c.execute( 'SELECT ancestor_tag_id FROM {} WHERE child_tag_id = ?;'.format( cache_tag_parents_lookup_table_name ), ( ideal_tag_id, ) ) )
@@ -3540,6 +4029,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagParentsGetChainMembers( self, display_type: int, tag_service_id: int, ideal_tag_id: int ):
         
+        lookup_cache = self._CacheTagParentsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetChainMembers( ideal_tag_id )
+            
+        
         cache_tag_parents_lookup_table_name = GenerateTagParentsLookupCacheTableName( display_type, tag_service_id )
         
         chain_ids = self._STS( self._c.execute( 'SELECT child_tag_id FROM {} WHERE ancestor_tag_id = ? UNION ALL SELECT ancestor_tag_id FROM {} WHERE child_tag_id = ?;'.format( cache_tag_parents_lookup_table_name, cache_tag_parents_lookup_table_name ), ( ideal_tag_id, ideal_tag_id ) ) )
@@ -3554,6 +4050,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagParentsGetChainsMembers( self, display_type: int, tag_service_id: int, ideal_tag_ids: typing.Collection[ int ] ):
         
+        lookup_cache = self._CacheTagParentsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetChainsMembers( ideal_tag_ids )
+            
+        
         if len( ideal_tag_ids ) == 0:
             
             return set()
@@ -3593,6 +4096,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagParentsGetDescendants( self, display_type: int, tag_service_id: int, ideal_tag_id: int ):
         
+        lookup_cache = self._CacheTagParentsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetDescendants( ideal_tag_id )
+            
+        
         cache_tag_parents_lookup_table_name = GenerateTagParentsLookupCacheTableName( display_type, tag_service_id )
         
         descendant_ids = self._STS( self._c.execute( 'SELECT child_tag_id FROM {} WHERE ancestor_tag_id = ?;'.format( cache_tag_parents_lookup_table_name ), ( ideal_tag_id, ) ) )
@@ -3610,8 +4120,36 @@ class DB( HydrusDB.HydrusDB ):
         return self._service_ids_to_parent_interested_service_ids[ tag_service_id ]
         
     
+    def _CacheTagParentsGetLookupCache( self, display_type: int, tag_service_id: int ) -> typing.Optional[ ClientTagsHandling.TagParentsLookupCache ]:
+        
+        # the read pool sees a committed snapshot, which this cache may be ahead of, so it sticks to the tables
+        
+        if HydrusDB.GetReadPoolCursor() is not None:
+            
+            return None
+            
+        
+        key = ( display_type, tag_service_id )
+        
+        if key not in self._tag_parents_lookup_caches:
+            
+            cache_tag_parents_lookup_table_name = GenerateTagParentsLookupCacheTableName( display_type, tag_service_id )
+            
+            self._tag_parents_lookup_caches[ key ] = ClientTagsHandling.TagParentsLookupCache( self._c.execute( 'SELECT child_tag_id, ancestor_tag_id FROM {};'.format( cache_tag_parents_lookup_table_name ) ) )
+            
+        
+        return self._tag_parents_lookup_caches[ key ]
+        
+    
     def _CacheTagParentsGetTagsToAncestors( self, display_type: int, tag_service_id: int, ideal_tag_ids: typing.Collection[ int ] ):
         
+        lookup_cache = self._CacheTagParentsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetTagsToAncestors( ideal_tag_ids )
+            
+        
         if len( ideal_tag_ids ) == 0:
             
             return {}
@@ -3645,6 +4183,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagParentsGetTagsToDescendants( self, display_type: int, tag_service_id: int, ideal_tag_ids: typing.Collection[ int ] ):
         
+        lookup_cache = self._CacheTagParentsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetTagsToDescendants( ideal_tag_ids )
+            
+        
         if len( ideal_tag_ids ) == 0:
             
             return {}
@@ -3696,6 +4241,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagParentsIsChained( self, display_type, tag_service_id, ideal_tag_id ):
         
+        lookup_cache = self._CacheTagParentsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.IsChained( ideal_tag_id )
+            
+        
         cache_tag_parents_lookup_table_name = GenerateTagParentsLookupCacheTableName( display_type, tag_service_id )
         
         return self._c.execute( 'SELECT 1 FROM {} WHERE ( child_tag_id = ? OR ancestor_tag_id = ? ) AND child_tag_id != ancestor_tag_id;'.format( cache_tag_parents_lookup_table_name ), ( ideal_tag_id, ideal_tag_id ) ).fetchone() is not None
@@ -3743,6 +4295,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'INSERT OR IGNORE INTO {} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );'.format( cache_tag_parents_lookup_table_name ), tps.IterateDescendantAncestorPairs() )
             
+            self._tag_parents_lookup_caches.pop( ( ClientTags.TAG_DISPLAY_IDEAL, tag_service_id ), None )
+            
             if tag_service_id in self._service_ids_to_display_application_status:
                 
                 del self._service_ids_to_display_application_status[ tag_service_id ]
@@ -3778,6 +4332,13 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'DELETE FROM {} WHERE child_tag_id = ? OR ancestor_tag_id = ?;'.format( cache_tag_parents_lookup_table_name ), ( ( tag_id, tag_id ) for tag_id in tag_ids_to_clear_and_regen ) )
             
+            lookup_cache = self._tag_parents_lookup_caches.get( ( ClientTags.TAG_DISPLAY_IDEAL, tag_service_id ), None )
+            
+            if lookup_cache is not None:
+                
+                lookup_cache.DeleteTagIds( tag_ids_to_clear_and_regen )
+                
+            
             # we wipe them
             
             applicable_tag_service_ids = self._CacheTagParentsGetApplicableServiceIds( tag_service_id )
@@ -3812,7 +4373,14 @@ class DB( HydrusDB.HydrusDB ):
                     
                 
             
-            self._c.executemany( 'INSERT OR IGNORE INTO {} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );'.format( cache_tag_parents_lookup_table_name ), tps.IterateDescendantAncestorPairs() )
+            pairs = list( tps.IterateDescendantAncestorPairs() )
+            
+            self._c.executemany( 'INSERT OR IGNORE INTO {} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );'.format( cache_tag_parents_lookup_table_name ), pairs )
+            
+            if lookup_cache is not None:
+                
+                lookup_cache.AddPairs( pairs )
+                
             
             if tag_service_id in self._service_ids_to_display_application_status:
                 
@@ -3873,6 +4441,8 @@ class DB( HydrusDB.HydrusDB ):
                 subtags_searchable_map_table_name = self._CacheTagsGetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
                 integer_subtags_table_name = self._CacheTagsGetIntegerSubtagsTableName( file_service_id, tag_service_id )
                 
+                subtag_prefix_index = self._subtag_prefix_indices.get( self._CacheTagsGetSubtagPrefixIndexKey( file_service_id, tag_service_id ), None )
+                
                 for ( subtag_id, subtag ) in subtag_ids_and_subtags:
                     
                     searchable_subtag = ClientSearch.ConvertSubtagToSearchable( subtag )
@@ -3888,6 +4458,11 @@ class DB( HydrusDB.HydrusDB ):
                     
                     self._c.execute( 'INSERT OR IGNORE INTO {} ( docid, subtag ) VALUES ( ?, ? );'.format( subtags_fts4_table_name ), ( subtag_id, searchable_subtag ) )
                     
+                    if subtag_prefix_index is not None:
+                        
+                        subtag_prefix_index.AddSubtags( ( ( subtag_id, searchable_subtag ), ) )
+                        
+                    
                     if subtag.isdecimal():
                         
                         try:
@@ -3951,6 +4526,14 @@ class DB( HydrusDB.HydrusDB ):
                 deletee_subtag_ids = subtag_ids.difference( still_existing_subtag_ids )
                 
                 self._c.executemany( 'DELETE FROM {} WHERE docid = ?;'.format( subtags_fts4_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
+                
+                subtag_prefix_index = self._subtag_prefix_indices.get( self._CacheTagsGetSubtagPrefixIndexKey( file_service_id, tag_service_id ), None )
+                
+                if subtag_prefix_index is not None:
+                    
+                    subtag_prefix_index.DeleteSubtagIds( deletee_subtag_ids )
+                    
+                
                 self._c.executemany( 'DELETE FROM {} WHERE subtag_id = ?;'.format( subtags_searchable_map_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
                 self._c.executemany( 'DELETE FROM {} WHERE subtag_id = ?;'.format( integer_subtags_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
                 
@@ -3967,6 +4550,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.execute( 'DROP TABLE IF EXISTS {};'.format( subtags_fts4_table_name ) )
         
+        self._subtag_prefix_indices.pop( self._CacheTagsGetSubtagPrefixIndexKey( file_service_id, tag_service_id ), None )
+        
         subtags_searchable_map_table_name = self._CacheTagsGetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
         
         self._c.execute( 'DROP TABLE IF EXISTS {};'.format( subtags_searchable_map_table_name ) )
@@ -4022,6 +4607,48 @@ class DB( HydrusDB.HydrusDB ):
         return integer_subtags_table_name
         
     
+    def _CacheTagsGetSubtagPrefixIndex( self, file_service_id, tag_service_id ) -> typing.Optional[ ClientTagsHandling.SubtagPrefixIndex ]:
+        
+        # the read pool sees a committed snapshot, which this index may be ahead of, so it sticks to the tables
+        
+        if HydrusDB.GetReadPoolCursor() is not None:
+            
+            return None
+            
+        
+        if not self._controller.new_options.GetBoolean( 'autocomplete_subtag_prefix_index' ):
+            
+            # free the memory if the user just turned it off
+            
+            self._subtag_prefix_indices = {}
+            
+            return None
+            
+        
+        key = self._CacheTagsGetSubtagPrefixIndexKey( file_service_id, tag_service_id )
+        
+        if key not in self._subtag_prefix_indices:
+            
+            subtags_fts4_table_name = self._CacheTagsGetSubtagsFTS4TableName( file_service_id, tag_service_id )
+            
+            self._subtag_prefix_indices[ key ] = ClientTagsHandling.SubtagPrefixIndex( self._c.execute( 'SELECT docid, subtag FROM {};'.format( subtags_fts4_table_name ) ) )
+            
+        
+        return self._subtag_prefix_indices[ key ]
+        
+    
+    def _CacheTagsGetSubtagPrefixIndexKey( self, file_service_id, tag_service_id ):
+        
+        # my files and trash share the all local files tables, and only that id gets the adds and deletes, so the index has to share that key
+        
+        if file_service_id != self.modules_services.combined_file_service_id and self._CacheTagsFileServiceIsCoveredByAllLocalFiles( file_service_id ):
+            
+            file_service_id = self.modules_services.combined_local_file_service_id
+            
+        
+        return ( file_service_id, tag_service_id )
+        
+    
     def _CacheTagsGetSubtagsFTS4TableName( self, file_service_id, tag_service_id ):
         
         if file_service_id == self.modules_services.combined_file_service_id:
@@ -4197,6 +4824,13 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.execute( 'INSERT OR IGNORE INTO {} ( docid, subtag ) VALUES ( ?, ? );'.format( subtags_fts4_table_name ), ( subtag_id, searchable_subtag ) )
             
+            subtag_prefix_index = self._subtag_prefix_indices.get( self._CacheTagsGetSubtagPrefixIndexKey( file_service_id, tag_service_id ), None )
+            
+            if subtag_prefix_index is not None:
+                
+                subtag_prefix_index.AddSubtags( ( ( subtag_id, searchable_subtag ), ) )
+                
+            
             if subtag.isdecimal():
                 
                 try:
@@ -4270,9 +4904,21 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'DROP TABLE IF EXISTS {};'.format( cache_actual_tag_siblings_lookup_table_name ) )
         self._c.execute( 'DROP TABLE IF EXISTS {};'.format( cache_ideal_tag_siblings_lookup_table_name ) )
         
+        for display_type in ( ClientTags.TAG_DISPLAY_ACTUAL, ClientTags.TAG_DISPLAY_IDEAL ):
+            
+            self._tag_siblings_lookup_caches.pop( ( display_type, tag_service_id ), None )
+            
+        
     
     def _CacheTagSiblingsFilterChained( self, display_type, tag_service_id, tag_ids ):
         
+        lookup_cache = self._CacheTagSiblingsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.FilterChained( tag_ids )
+            
+        
         if len( tag_ids ) == 0:
             
             return set()
@@ -4344,6 +4990,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagSiblingsGetChainMembersFromIdeal( self, display_type, tag_service_id, ideal_tag_id ) -> typing.Set[ int ]:
         
+        lookup_cache = self._CacheTagSiblingsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetChainMembersFromIdeal( ideal_tag_id )
+            
+        
         cache_tag_siblings_lookup_table_name = GenerateTagSiblingsLookupCacheTableName( display_type, tag_service_id )
         
         sibling_tag_ids = self._STS( self._c.execute( 'SELECT bad_tag_id FROM {} WHERE ideal_tag_id = ?;'.format( cache_tag_siblings_lookup_table_name ), ( ideal_tag_id, ) ) )
@@ -4355,6 +5008,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagSiblingsGetChainsMembersFromIdeals( self, display_type, tag_service_id, ideal_tag_ids ) -> typing.Set[ int ]:
         
+        lookup_cache = self._CacheTagSiblingsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetChainsMembersFromIdeals( ideal_tag_ids )
+            
+        
         if len( ideal_tag_ids ) == 0:
             
             return set()
@@ -4391,6 +5051,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagSiblingsGetIdeal( self, display_type, tag_service_id, tag_id ) -> int:
         
+        lookup_cache = self._CacheTagSiblingsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetIdeal( tag_id )
+            
+        
         cache_tag_siblings_lookup_table_name = GenerateTagSiblingsLookupCacheTableName( display_type, tag_service_id )
         
         result = self._c.execute( 'SELECT ideal_tag_id FROM {} WHERE bad_tag_id = ?;'.format( cache_tag_siblings_lookup_table_name ), ( tag_id, ) ).fetchone()
@@ -4409,6 +5076,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagSiblingsGetIdeals( self, display_type, tag_service_id, tag_ids ) -> typing.Set[ int ]:
         
+        lookup_cache = self._CacheTagSiblingsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetIdeals( tag_ids )
+            
+        
         if not isinstance( tag_ids, set ):
             
             tag_ids = set( tag_ids )
@@ -4447,6 +5121,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagSiblingsGetIdealsToChains( self, display_type, tag_service_id, ideal_tag_ids ):
         
+        lookup_cache = self._CacheTagSiblingsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetIdealsToChains( ideal_tag_ids )
+            
+        
         # this only takes ideal_tag_ids
         
         if len( ideal_tag_ids ) == 0:
@@ -4490,6 +5171,27 @@ class DB( HydrusDB.HydrusDB ):
         return self._service_ids_to_sibling_interested_service_ids[ tag_service_id ]
         
     
+    def _CacheTagSiblingsGetLookupCache( self, display_type: int, tag_service_id: int ) -> typing.Optional[ ClientTagsHandling.TagSiblingsLookupCache ]:
+        
+        # the read pool sees a committed snapshot, which this cache may be ahead of, so it sticks to the tables
+        
+        if HydrusDB.GetReadPoolCursor() is not None:
+            
+            return None
+            
+        
+        key = ( display_type, tag_service_id )
+        
+        if key not in self._tag_siblings_lookup_caches:
+            
+            cache_tag_siblings_lookup_table_name = GenerateTagSiblingsLookupCacheTableName( display_type, tag_service_id )
+            
+            self._tag_siblings_lookup_caches[ key ] = ClientTagsHandling.TagSiblingsLookupCache( self._c.execute( 'SELECT bad_tag_id, ideal_tag_id FROM {};'.format( cache_tag_siblings_lookup_table_name ) ) )
+            
+        
+        return self._tag_siblings_lookup_caches[ key ]
+        
+    
     def _CacheTagSiblingsGetTagSiblingsForTags( self, service_key, tags ):
         
         if service_key == CC.COMBINED_TAG_SERVICE_KEY:
@@ -4545,9 +5247,19 @@ class DB( HydrusDB.HydrusDB ):
         
         tag_service_id = self.modules_services.GetServiceId( service_key )
         
-        cache_tag_siblings_lookup_table_name = GenerateTagSiblingsLookupCacheTableName( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id )
+        lookup_cache = self._CacheTagSiblingsGetLookupCache( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id )
+        
+        if lookup_cache is None:
+            
+            cache_tag_siblings_lookup_table_name = GenerateTagSiblingsLookupCacheTableName( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id )
+            
+            pair_ids = self._c.execute( 'SELECT bad_tag_id, ideal_tag_id FROM {};'.format( cache_tag_siblings_lookup_table_name ) ).fetchall()
+            
+        else:
+            
+            pair_ids = list( lookup_cache.GetBadTagIdsToIdealTagIds().items() )
+            
         
-        pair_ids = self._c.execute( 'SELECT bad_tag_id, ideal_tag_id FROM {};'.format( cache_tag_siblings_lookup_table_name ) ).fetchall()
         
         all_tag_ids = set( itertools.chain.from_iterable( pair_ids ) )
         
@@ -4560,6 +5272,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagSiblingsGetTagsToIdeals( self, display_type, tag_service_id, tag_ids ):
         
+        lookup_cache = self._CacheTagSiblingsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.GetTagsToIdeals( tag_ids )
+            
+        
         if not isinstance( tag_ids, set ):
             
             tag_ids = set( tag_ids )
@@ -4598,6 +5317,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagSiblingsIsChained( self, display_type, tag_service_id, tag_id ):
         
+        lookup_cache = self._CacheTagSiblingsGetLookupCache( display_type, tag_service_id )
+        
+        if lookup_cache is not None:
+            
+            return lookup_cache.IsChained( tag_id )
+            
+        
         cache_tag_siblings_lookup_table_name = GenerateTagSiblingsLookupCacheTableName( display_type, tag_service_id )
         
         return self._c.execute( 'SELECT 1 FROM {} WHERE ( bad_tag_id = ? OR ideal_tag_id = ? ) AND bad_tag_id != ideal_tag_id;'.format( cache_tag_siblings_lookup_table_name ), ( tag_id, tag_id ) ).fetchone() is not None
@@ -4639,6 +5365,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'INSERT OR IGNORE INTO {} ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );'.format( cache_tag_siblings_lookup_table_name ), tss.GetBadTagsToIdealTags().items() )
             
+            self._tag_siblings_lookup_caches.pop( ( ClientTags.TAG_DISPLAY_IDEAL, tag_service_id ), None )
+            
             if tag_service_id in self._service_ids_to_display_application_status:
                 
                 del self._service_ids_to_display_application_status[ tag_service_id ]
@@ -4665,6 +5393,13 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'DELETE FROM {} WHERE bad_tag_id = ? OR ideal_tag_id = ?;'.format( cache_tag_siblings_lookup_table_name ), ( ( tag_id, tag_id ) for tag_id in tag_ids_to_clear_and_regen ) )
             
+            lookup_cache = self._tag_siblings_lookup_caches.get( ( ClientTags.TAG_DISPLAY_IDEAL, tag_service_id ), None )
+            
+            if lookup_cache is not None:
+                
+                lookup_cache.DeleteTagIds( tag_ids_to_clear_and_regen )
+                
+            
             applicable_tag_service_ids = self._CacheTagSiblingsGetApplicableServiceIds( tag_service_id )
             
             tss = ClientTagsHandling.TagSiblingsStructure()
@@ -4695,6 +5430,11 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'INSERT OR IGNORE INTO {} ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );'.format( cache_tag_siblings_lookup_table_name ), tss.GetBadTagsToIdealTags().items() )
             
+            if lookup_cache is not None:
+                
+                lookup_cache.AddPairs( tss.GetBadTagsToIdealTags().items() )
+                
+            
             if tag_service_id in self._service_ids_to_display_application_status:
                 
                 del self._service_ids_to_display_application_status[ tag_service_id ]
@@ -4720,6 +5460,18 @@ class DB( HydrusDB.HydrusDB ):
         self._CacheTagSiblingsRegenChains( interested_tag_service_ids, tag_ids_that_changed )
         
     
+    def _CanUseReadPool( self, action ):
+        
+        # only the writer uses the subtag prefix index, so while it is on, autocomplete has to go there to get it
+        
+        if action == 'autocomplete_predicates' and self._controller.new_options.GetBoolean( 'autocomplete_subtag_prefix_index' ):
+            
+            return False
+            
+        
+        return HydrusDB.HydrusDB._CanUseReadPool( self, action )
+        
+    
     def _CheckDBIntegrity( self ):
         
         prefix_string = 'checking db integrity: '
@@ -5031,6 +5783,9 @@ class DB( HydrusDB.HydrusDB ):
         self.modules_similar_files.CreateInitialTables()
         self.modules_similar_files.CreateInitialIndices()
         
+        self.modules_tag_cooccurrence.CreateInitialTables()
+        self.modules_tag_cooccurrence.CreateInitialIndices()
+        
         self._CreateDBCaches()
         
         # master
@@ -5278,6 +6033,11 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'DELETE FROM current_files WHERE service_id = ? AND hash_id = ?;', ( ( service_id, hash_id ) for hash_id in existing_hash_ids ) )
             
+            if service_id in self._service_ids_to_current_files_timestamp_caches:
+                
+                self._service_ids_to_current_files_timestamp_caches[ service_id ].DeleteKeys( existing_hash_ids )
+                
+            
             self._c.executemany( 'DELETE FROM file_petitions WHERE service_id = ? AND hash_id = ?;', ( ( service_id, hash_id ) for hash_id in existing_hash_ids ) )
             
             delta_size = self.modules_files_metadata_basic.GetTotalSize( existing_hash_ids )
@@ -5455,6 +6215,11 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'DELETE FROM tag_siblings WHERE service_id = ?;', ( service_id, ) )
         self._c.execute( 'DELETE FROM tag_sibling_petitions WHERE service_id = ?;', ( service_id, ) )
         
+        if service_id in self._service_ids_to_current_files_timestamp_caches:
+            
+            del self._service_ids_to_current_files_timestamp_caches[ service_id ]
+            
+        
         if service_type in HC.REPOSITORIES:
             
             repository_updates_table_name = GenerateRepositoryUpdatesTableName( service_id )
@@ -5471,6 +6236,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self.modules_mappings_storage.DropMappingsTables( service_id )
             
+            self.modules_tag_cooccurrence.Drop( service_id )
+            
             #
             
             self._c.execute( 'DELETE FROM tag_siblings WHERE service_id = ?;', ( service_id, ) )
@@ -5576,13 +6343,30 @@ class DB( HydrusDB.HydrusDB ):
             
         else:
             
-            predicates_string = ''
+            predicates_string = ''
+            
+        
+        self._c.execute( 'DELETE FROM service_info{};'.format( predicates_string ) )
+        
+        self.pub_after_job( 'notify_new_pending' )
+        
+    
+    def _DeleteTagCooccurrenceIndex( self, tag_service_key = None ):
+        
+        if tag_service_key is None:
+            
+            tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            tag_service_ids = ( self.modules_services.GetServiceId( tag_service_key ), )
+            
+        
+        for tag_service_id in tag_service_ids:
+            
+            self.modules_tag_cooccurrence.Drop( tag_service_id )
             
         
-        self._c.execute( 'DELETE FROM service_info{};'.format( predicates_string ) )
-        
-        self.pub_after_job( 'notify_new_pending' )
-        
     
     def _DeleteTagParents( self, service_id, pairs, defer_cache_update = False ):
         
@@ -5934,7 +6718,7 @@ class DB( HydrusDB.HydrusDB ):
         
         # can't just pull explicit king_hash_ids, since files not in the system are considered king of their group
         
-        if not isinstance( allowed_hash_ids, set ):
+        if not isinstance( allowed_hash_ids, ( set, HydrusBitmaps.IntegerBitmap ) ):
             
             allowed_hash_ids = set( allowed_hash_ids )
             
@@ -8401,6 +9185,20 @@ class DB( HydrusDB.HydrusDB ):
         return result
         
     
+    def _GetCurrentFilesTimestampCache( self, service_id ):
+        
+        # only the writer builds these. a read pool snapshot may be behind the writer's uncommitted rows, and we would miss those edits forever
+        
+        if service_id not in self._service_ids_to_current_files_timestamp_caches and HydrusDB.GetReadPoolCursor() is None:
+            
+            rows = self._c.execute( 'SELECT hash_id, IFNULL( timestamp, -1 ) FROM current_files WHERE service_id = ?;', ( service_id, ) )
+            
+            self._service_ids_to_current_files_timestamp_caches[ service_id ] = ClientDBFilesMetadataBasic.IntegerColumnCache( ( 'timestamp', ), rows )
+            
+        
+        return self._service_ids_to_current_files_timestamp_caches.get( service_id, None )
+        
+    
     def _GetFileNotes( self, hash ):
         
         hash_id = self.modules_hashes_local_cache.GetHashId( hash )
@@ -8859,7 +9657,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if query_hash_ids is not None:
             
-            query_hash_ids = set( query_hash_ids )
+            query_hash_ids = HydrusBitmaps.IntegerBitmap( query_hash_ids )
             
         
         have_cross_referenced_file_service = False
@@ -9076,17 +9874,13 @@ class DB( HydrusDB.HydrusDB ):
         there_are_simple_files_info_preds_to_search_for = len( files_info_predicates ) > 0
         
         # start with some quick ways to populate query_hash_ids
+        # we hold them in a compressed bitmap, not a set, so searches over millions of files do not make millions of python ints
         
-        def intersection_update_qhi( query_hash_ids, some_hash_ids, force_create_new_set = False ):
+        def intersection_update_qhi( query_hash_ids, some_hash_ids ):
             
             if query_hash_ids is None:
                 
-                if not isinstance( some_hash_ids, set ) or force_create_new_set:
-                    
-                    some_hash_ids = set( some_hash_ids )
-                    
-                
-                return some_hash_ids
+                return HydrusBitmaps.IntegerBitmap( some_hash_ids )
                 
             else:
                 
@@ -9119,7 +9913,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 # blue eyes OR green eyes
                 
-                or_query_hash_ids = set()
+                or_query_hash_ids = HydrusBitmaps.IntegerBitmap()
                 
                 for or_subpredicate in or_predicate.GetValue():
                     
@@ -9196,7 +9990,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 pred_string = ' AND '.join( import_timestamp_predicates )
                 
-                import_timestamp_hash_ids = self._STS( self._c.execute( 'SELECT hash_id FROM current_files WHERE service_id = ? AND {};'.format( pred_string ), ( file_service_id, ) ) )
+                import_timestamp_hash_ids = self._STI( self._c.execute( 'SELECT hash_id FROM current_files WHERE service_id = ? AND {};'.format( pred_string ), ( file_service_id, ) ) )
                 
                 query_hash_ids = intersection_update_qhi( query_hash_ids, import_timestamp_hash_ids )
                 
@@ -9213,7 +10007,7 @@ class DB( HydrusDB.HydrusDB ):
             
             pred_string = ' AND '.join( modified_timestamp_predicates )
             
-            modified_timestamp_hash_ids = self._STS( self._c.execute( 'SELECT hash_id FROM file_modified_timestamps WHERE {};'.format( pred_string ) ) )
+            modified_timestamp_hash_ids = self._STI( self._c.execute( 'SELECT hash_id FROM file_modified_timestamps WHERE {};'.format( pred_string ) ) )
             
             query_hash_ids = intersection_update_qhi( query_hash_ids, modified_timestamp_hash_ids )
             
@@ -9304,7 +10098,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if is_inbox:
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, self.modules_files_metadata_basic.inbox_hash_ids, force_create_new_set = True )
+            query_hash_ids = intersection_update_qhi( query_hash_ids, self.modules_files_metadata_basic.inbox_hash_ids )
             
         
         for ( operator, num_relationships, dupe_type ) in system_predicates.GetDuplicateRelationshipCountPredicates():
@@ -9388,9 +10182,9 @@ class DB( HydrusDB.HydrusDB ):
                 
                 have_cross_referenced_file_service = True
                 
-                if query_hash_ids == set():
+                if len( query_hash_ids ) == 0:
                     
-                    return query_hash_ids
+                    return set()
                     
                 
             
@@ -9414,9 +10208,9 @@ class DB( HydrusDB.HydrusDB ):
                 
                 have_cross_referenced_file_service = True
                 
-                if query_hash_ids == set():
+                if len( query_hash_ids ) == 0:
                     
-                    return query_hash_ids
+                    return set()
                     
                 
             
@@ -9440,9 +10234,9 @@ class DB( HydrusDB.HydrusDB ):
                 
                 have_cross_referenced_file_service = True
                 
-                if query_hash_ids == set():
+                if len( query_hash_ids ) == 0:
                     
-                    return query_hash_ids
+                    return set()
                     
                 
             
@@ -9481,13 +10275,13 @@ class DB( HydrusDB.HydrusDB ):
                 
                 if query_hash_ids is None:
                     
-                    query_hash_ids = intersection_update_qhi( query_hash_ids, self._STS( self._c.execute( 'SELECT hash_id FROM current_files NATURAL JOIN files_info WHERE {};'.format( ' AND '.join( files_info_predicates ) ) ) ) )
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, self._STI( self._c.execute( 'SELECT hash_id FROM current_files NATURAL JOIN files_info WHERE {};'.format( ' AND '.join( files_info_predicates ) ) ) ) )
                     
                 else:
                     
                     if is_inbox and len( query_hash_ids ) == len( self.modules_files_metadata_basic.inbox_hash_ids ):
                         
-                        query_hash_ids = intersection_update_qhi( query_hash_ids, self._STS( self._c.execute( 'SELECT hash_id FROM {} NATURAL JOIN current_files NATURAL JOIN files_info WHERE {};'.format( 'file_inbox', ' AND '.join( files_info_predicates ) ) ) ) )
+                        query_hash_ids = intersection_update_qhi( query_hash_ids, self._STI( self._c.execute( 'SELECT hash_id FROM {} NATURAL JOIN current_files NATURAL JOIN files_info WHERE {};'.format( 'file_inbox', ' AND '.join( files_info_predicates ) ) ) ) )
                         
                     else:
                         
@@ -9495,7 +10289,7 @@ class DB( HydrusDB.HydrusDB ):
                             
                             self._AnalyzeTempTable( temp_table_name )
                             
-                            query_hash_ids = intersection_update_qhi( query_hash_ids, self._STS( self._c.execute( 'SELECT hash_id FROM {} NATURAL JOIN current_files NATURAL JOIN files_info WHERE {};'.format( temp_table_name, ' AND '.join( files_info_predicates ) ) ) ) )
+                            query_hash_ids = intersection_update_qhi( query_hash_ids, self._STI( self._c.execute( 'SELECT hash_id FROM {} NATURAL JOIN current_files NATURAL JOIN files_info WHERE {};'.format( temp_table_name, ' AND '.join( files_info_predicates ) ) ) ) )
                             
                         
                     
@@ -9576,7 +10370,7 @@ class DB( HydrusDB.HydrusDB ):
             
             if len( query_hash_ids ) == 0:
                 
-                return query_hash_ids
+                return set()
                 
             
         
@@ -9593,7 +10387,7 @@ class DB( HydrusDB.HydrusDB ):
             
             if len( query_hash_ids ) == 0:
                 
-                return query_hash_ids
+                return set()
                 
             
         
@@ -9610,7 +10404,7 @@ class DB( HydrusDB.HydrusDB ):
             
             if len( query_hash_ids ) == 0:
                 
-                return query_hash_ids
+                return set()
                 
             
         
@@ -9800,7 +10594,7 @@ class DB( HydrusDB.HydrusDB ):
             
             if must_not_be_local:
                 
-                query_hash_ids = set()
+                query_hash_ids = HydrusBitmaps.IntegerBitmap()
                 
             
         elif must_be_local or must_not_be_local:
@@ -9952,7 +10746,7 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
-        query_hash_ids = list( query_hash_ids )
+        query_hash_ids = query_hash_ids.ToList()
         
         #
         
@@ -9969,7 +10763,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if sort_by is not None and file_service_id != self.modules_services.combined_file_service_id:
             
-            ( did_sort, query_hash_ids ) = self._TryToSortHashIds( file_service_id, query_hash_ids, sort_by )
+            ( did_sort, query_hash_ids ) = self._TryToSortHashIds( file_service_id, query_hash_ids, sort_by, limit = limit if we_are_applying_limit else None )
             
         
         #
@@ -10051,7 +10845,7 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
-        result_hash_ids = set()
+        result_hash_ids = HydrusBitmaps.IntegerBitmap()
         
         table_names = self._GetMappingTables( tag_display_type, file_service_key, tag_search_context )
         
@@ -10144,30 +10938,37 @@ class DB( HydrusDB.HydrusDB ):
                 domain_ids = self.modules_urls.GetURLDomainAndSubdomainIds( domain, only_www_subdomains = True )
                 
             
-            result_hash_ids = set()
+            we_are_filtering = hash_ids_table_name is not None and hash_ids is not None and len( hash_ids ) < 50000
             
             with HydrusDB.TemporaryIntegerTable( self._c, domain_ids, 'domain_id' ) as temp_domain_table_name:
                 
-                if hash_ids_table_name is not None and hash_ids is not None and len( hash_ids ) < 50000:
+                if we_are_filtering:
                     
                     # if we aren't gonk mode with the number of files, temp hashes to url map to urls to domains
                     # next step here is irl profiling and a domain->url_count cache so I can decide whether to do this or not based on url domain count
-                    select = 'SELECT hash_id, url FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id ) CROSS JOIN {} USING ( domain_id );'.format( hash_ids_table_name, temp_domain_table_name )
+                    select = 'SELECT DISTINCT url_id, url FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id ) CROSS JOIN {} USING ( domain_id );'.format( hash_ids_table_name, temp_domain_table_name )
                     
                 else:
                     
-                    # domains to urls to url map
-                    select = 'SELECT hash_id, url FROM {} CROSS JOIN urls USING ( domain_id ) CROSS JOIN url_map USING ( url_id );'.format( temp_domain_table_name )
+                    # domains to urls
+                    select = 'SELECT url_id, url FROM {} CROSS JOIN urls USING ( domain_id );'.format( temp_domain_table_name )
                     
                 
-                for ( hash_id, url ) in self._c.execute( select ):
-                    
-                    # this is actually insufficient, as more detailed url classes may match
-                    if hash_id not in result_hash_ids and url_class.Matches( url ):
-                        
-                        result_hash_ids.add( hash_id )
-                        
-                    
+                urls_to_url_ids = { url : url_id for ( url_id, url ) in self._c.execute( select ) }
+                
+            
+            # test each distinct url once, rather than once per file that has it
+            # this is actually insufficient, as more detailed url classes may match
+            matching_url_ids = [ urls_to_url_ids[ url ] for url in url_class.FilterMatchingURLs( urls_to_url_ids.keys() ) ]
+            
+            with HydrusDB.TemporaryIntegerTable( self._c, matching_url_ids, 'url_id' ) as temp_url_table_name:
+                
+                result_hash_ids = self._STS( self._c.execute( 'SELECT hash_id FROM {} CROSS JOIN url_map USING ( url_id );'.format( temp_url_table_name ) ) )
+                
+            
+            if we_are_filtering:
+                
+                result_hash_ids.intersection_update( hash_ids )
                 
             
             return result_hash_ids
@@ -10319,7 +11120,7 @@ class DB( HydrusDB.HydrusDB ):
                     
                 
             
-            nonzero_tag_hash_ids = set()
+            nonzero_tag_hash_ids = HydrusBitmaps.IntegerBitmap()
             
             for query in queries:
                 
@@ -10548,6 +11349,13 @@ class DB( HydrusDB.HydrusDB ):
             jobs_to_do.append( 'similar files work' )
             
         
+        tag_cooccurrence_due = self.modules_tag_cooccurrence.MaintenanceDue()
+        
+        if tag_cooccurrence_due:
+            
+            jobs_to_do.append( 'tag co-occurrence index work' )
+            
+        
         return jobs_to_do
         
     
@@ -10767,6 +11575,52 @@ class DB( HydrusDB.HydrusDB ):
         return predicates
         
     
+    def _GetMediaResultParts( self, hash_ids: typing.Collection[ int ], parts: typing.Collection[ str ] ):
+        
+        # a cheaper alternative to full media results when the caller only wants some of it
+        # only the tables for the requested parts are hit, and nothing is put in the media result cache
+        
+        parts_to_hash_ids_to_values = {}
+        
+        parts_to_hash_ids_to_values[ 'hashes' ] = self.modules_hashes_local_cache.GetHashIdsToHashes( hash_ids = hash_ids )
+        
+        with HydrusDB.TemporaryIntegerTable( self._c, hash_ids, 'hash_id' ) as temp_table_name:
+            
+            self._AnalyzeTempTable( temp_table_name )
+            
+            if 'info' in parts:
+                
+                parts_to_hash_ids_to_values[ 'info' ] = { hash_id : ( size, mime, width, height, duration, num_frames, has_audio, num_words ) for ( hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words ) in self._c.execute( 'SELECT * FROM {} CROSS JOIN files_info USING ( hash_id );'.format( temp_table_name ) ) }
+                
+            
+            if 'locations' in parts or 'tags' in parts:
+                
+                hash_ids_to_current_file_service_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT hash_id, service_id FROM {} CROSS JOIN current_files USING ( hash_id );'.format( temp_table_name ) ) )
+                
+                if 'locations' in parts:
+                    
+                    service_ids_to_service_keys = self.modules_services.GetServiceIdsToServiceKeys()
+                    
+                    inbox_hash_ids = self.modules_files_metadata_basic.inbox_hash_ids
+                    
+                    parts_to_hash_ids_to_values[ 'locations' ] = { hash_id : ( hash_id in inbox_hash_ids, { service_ids_to_service_keys[ service_id ] for service_id in hash_ids_to_current_file_service_ids[ hash_id ] } ) for hash_id in hash_ids }
+                    
+                
+                if 'tags' in parts:
+                    
+                    parts_to_hash_ids_to_values[ 'tags' ] = self._GetForceRefreshTagsManagersWithTableHashIds( hash_ids, temp_table_name, hash_ids_to_current_file_service_ids = hash_ids_to_current_file_service_ids )
+                    
+                
+            
+            if 'urls' in parts:
+                
+                parts_to_hash_ids_to_values[ 'urls' ] = HydrusData.BuildKeyToSetDict( self._c.execute( 'SELECT hash_id, url FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id );'.format( temp_table_name ) ) )
+                
+            
+        
+        return parts_to_hash_ids_to_values
+        
+    
     def _GetMediaResults( self, hash_ids: typing.Iterable[ int ] ):
         
         ( cached_media_results, missing_hash_ids ) = self._weakref_media_result_cache.GetMediaResultsAndMissing( hash_ids )
@@ -10897,7 +11751,9 @@ class DB( HydrusDB.HydrusDB ):
                 missing_media_results.append( ClientMediaResult.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager ) )
                 
             
-            self._weakref_media_result_cache.AddMediaResults( missing_media_results )
+            # a read pool job only shares these once it knows no write landed while it was working
+            
+            HydrusDB.CallIfReadIsCurrent( lambda: self._weakref_media_result_cache.AddMediaResults( missing_media_results ) )
             
             cached_media_results.extend( missing_media_results )
             
@@ -11263,6 +12119,20 @@ class DB( HydrusDB.HydrusDB ):
         
         tag_ids = [ self.modules_tags.GetTagId( tag ) for tag in search_tags ]
         
+        inclusive = True
+        pending_count = 0
+        
+        # if the user has built the co-occurrence index for this service, we can answer completely without touching the mappings
+        
+        results = self.modules_tag_cooccurrence.GetRelatedTagIdsAndCounts( service_id, tag_ids, max_results, skip_hash_id = skip_hash_id )
+        
+        if results is not None:
+            
+            tag_ids_to_full_counts = { tag_id : ( current_count, None, pending_count, None ) for ( tag_id, current_count ) in results }
+            
+            return self._GeneratePredicatesFromTagIdsAndCounts( ClientTags.TAG_DISPLAY_STORAGE, service_id, tag_ids_to_full_counts, inclusive )
+            
+        
         random.shuffle( tag_ids )
         
         hash_ids_counter = collections.Counter()
@@ -11330,9 +12200,6 @@ class DB( HydrusDB.HydrusDB ):
         
         results = counter.most_common( max_results )
         
-        inclusive = True
-        pending_count = 0
-        
         tag_ids_to_full_counts = { tag_id : ( current_count, None, pending_count, None ) for ( tag_id, current_count ) in results }
         
         predicates = self._GeneratePredicatesFromTagIdsAndCounts( ClientTags.TAG_DISPLAY_STORAGE, service_id, tag_ids_to_full_counts, inclusive )
@@ -11722,6 +12589,20 @@ class DB( HydrusDB.HydrusDB ):
             
             if '*' in subtag_wildcard:
                 
+                subtag_prefix_index = self._CacheTagsGetSubtagPrefixIndex( file_service_id, search_tag_service_id )
+                
+                if subtag_prefix_index is not None:
+                    
+                    loop_of_subtag_ids = subtag_prefix_index.GetSubtagIdsFromWildcard( subtag_wildcard )
+                    
+                    if loop_of_subtag_ids is not None:
+                        
+                        result_subtag_ids.update( loop_of_subtag_ids )
+                        
+                        continue
+                        
+                    
+                
                 subtags_fts4_table_name = self._CacheTagsGetSubtagsFTS4TableName( file_service_id, search_tag_service_id )
                 
                 wildcard_has_fts4_searchable_characters = WildcardHasFTS4SearchableCharacters( subtag_wildcard )
@@ -12715,10 +13596,17 @@ class DB( HydrusDB.HydrusDB ):
         return ( status, note )
         
     
+    def _ImportFiles( self, file_import_jobs ):
+        
+        return [ self._ImportFile( file_import_job ) for file_import_job in file_import_jobs ]
+        
+    
     def _ImportUpdate( self, update_network_bytes, update_hash, mime ):
         
         try:
             
+            update_network_bytes = HydrusNetwork.ConvertBinaryUpdateNetworkBytesForStorage( update_network_bytes )
+            
             HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
             
         except:
@@ -12772,6 +13660,13 @@ class DB( HydrusDB.HydrusDB ):
         
         HG.client_controller.frame_splash_status.SetText( 'preparing db caches' )
         
+        # the update code writes to the lookup tables directly
+        
+        self._tag_siblings_lookup_caches = {}
+        self._tag_parents_lookup_caches = {}
+        
+        self._subtag_prefix_indices = {}
+        
         HG.client_controller.frame_splash_status.SetSubtext( 'inbox' )
         
     
@@ -12888,9 +13783,29 @@ class DB( HydrusDB.HydrusDB ):
         
         self._modules.append( self.modules_mappings_storage )
         
+        self.modules_tag_cooccurrence = ClientDBTagCooccurrence.ClientDBTagCooccurrence( self._c, self.modules_services )
+        
+        self._modules.append( self.modules_tag_cooccurrence )
+        
     
     def _ManageDBError( self, job, e ):
         
+        if HydrusDB.GetReadPoolCursor() is None:
+            
+            # the job's writes are about to be rolled back, so we can't trust what we mirrored in memory
+            
+            self._tag_siblings_lookup_caches = {}
+            self._tag_parents_lookup_caches = {}
+            
+            self._subtag_prefix_indices = {}
+            
+            self._service_ids_to_current_files_timestamp_caches = {}
+            
+            self.modules_files_metadata_basic.ClearFilesInfoColumnCache()
+            
+            self.modules_similar_files.ClearPHashIndex()
+            
+        
         if isinstance( e, MemoryError ):
             
             HydrusData.ShowText( 'The client is running out of memory! Restart it ASAP!' )
@@ -13216,15 +14131,20 @@ class DB( HydrusDB.HydrusDB ):
         num_done = 0
         still_work_to_do = True
         
-        group_of_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM shape_search_cache WHERE searched_distance IS NULL or searched_distance < ?;', ( search_distance, ) ).fetchmany( 10 ) )
+        # we search in batches, sized to take about a second, or less if our work time is shorter
+        # the first batch is small so we can measure how fast we are going
+        
+        MAX_BATCH_SIZE = 4096
+        
+        batch_size = 16
         
-        while len( group_of_hash_ids ) > 0:
+        # the similar files module keeps a cache of the tree for the length of this search, so it has to go however we leave
         
-            text = 'searching potential duplicates: {}'.format( HydrusData.ToHumanInt( num_done ) )
+        try:
             
-            HG.client_controller.frame_splash_status.SetSubtext( text )
+            group_of_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM shape_search_cache WHERE searched_distance IS NULL or searched_distance < ?;', ( search_distance, ) ).fetchmany( batch_size ) )
             
-            for ( i, hash_id ) in enumerate( group_of_hash_ids ):
+            while len( group_of_hash_ids ) > 0:
                 
                 if work_time_float is not None and HydrusData.TimeHasPassedFloat( time_started_float + work_time_float ):
                     
@@ -13248,23 +14168,58 @@ class DB( HydrusDB.HydrusDB ):
                     return ( still_work_to_do, num_done )
                     
                 
-                media_id = self._DuplicatesGetMediaId( hash_id )
+                batch_time_started_float = HydrusData.GetNowFloat()
+                
+                hash_ids_to_similar_hash_ids_and_distances = self.modules_similar_files.SearchMany( group_of_hash_ids, search_distance )
+                
+                for ( hash_id, similar_hash_ids_and_distances ) in hash_ids_to_similar_hash_ids_and_distances.items():
+                    
+                    media_id = self._DuplicatesGetMediaId( hash_id )
+                    
+                    potential_duplicate_media_ids_and_distances = [ ( self._DuplicatesGetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in similar_hash_ids_and_distances if duplicate_hash_id != hash_id ]
+                    
+                    self._DuplicatesAddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
+                    
+                
+                self._c.executemany( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( ( search_distance, hash_id ) for hash_id in group_of_hash_ids ) )
+                
+                num_done += len( group_of_hash_ids )
+                
+                now_float = HydrusData.GetNowFloat()
+                
+                files_per_second = num_done / max( now_float - time_started_float, 0.001 )
+                
+                text = 'searching potential duplicates: {} ({} files/s)'.format( HydrusData.ToHumanInt( num_done ), HydrusData.ToHumanInt( int( files_per_second ) ) )
+                
+                HG.client_controller.frame_splash_status.SetSubtext( text )
+                
+                if HG.db_report_mode:
+                    
+                    HydrusData.ShowText( text )
+                    
+                
+                target_batch_time = 1.0
                 
-                potential_duplicate_media_ids_and_distances = [ ( self._DuplicatesGetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in self.modules_similar_files.Search( hash_id, search_distance ) if duplicate_hash_id != hash_id ]
+                if work_time_float is not None:
+                    
+                    target_batch_time = min( target_batch_time, max( ( time_started_float + work_time_float ) - now_float, 0.05 ) )
+                    
                 
-                self._DuplicatesAddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
+                time_per_file = max( now_float - batch_time_started_float, 0.001 ) / len( group_of_hash_ids )
                 
-                self._c.execute( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( search_distance, hash_id ) )
+                batch_size = max( 1, min( MAX_BATCH_SIZE, batch_size * 4, int( target_batch_time / time_per_file ) ) )
                 
-                num_done += 1
+                group_of_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM shape_search_cache WHERE searched_distance IS NULL or searched_distance < ?;', ( search_distance, ) ).fetchmany( batch_size ) )
                 
             
-            group_of_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM shape_search_cache WHERE searched_distance IS NULL or searched_distance < ?;', ( search_distance, ) ).fetchmany( 10 ) )
+            still_work_to_do = False
+            
+            return ( still_work_to_do, num_done )
+            
+        finally:
+            
+            self.modules_similar_files.ClearBatchSearchCache()
             
-        
-        still_work_to_do = False
-        
-        return ( still_work_to_do, num_done )
         
     
     def _ProcessContentUpdates( self, service_keys_to_content_updates, publish_content_updates = True ):
@@ -14358,6 +15313,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'maintenance_due': result = self._GetMaintenanceDue( *args, **kwargs )
         elif action == 'media_predicates': result = self._GetMediaPredicates( *args, **kwargs )
         elif action == 'media_result': result = self._GetMediaResultFromHash( *args, **kwargs )
+        elif action == 'media_result_parts': result = self._GetMediaResultParts( *args, **kwargs )
         elif action == 'media_results': result = self._GetMediaResultsFromHashes( *args, **kwargs )
         elif action == 'media_results_from_ids': result = self._GetMediaResults( *args, **kwargs )
         elif action == 'migration_get_mappings': result = self._MigrationGetMappings( *args, **kwargs )
@@ -14700,6 +15656,25 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RegenerateTagCooccurrenceIndex( self, tag_service_key = None ):
+        
+        # this just clears and queues the rebuild. the counting happens a few tags at a time in idle maintenance
+        
+        if tag_service_key is None:
+            
+            tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            tag_service_ids = ( self.modules_services.GetServiceId( tag_service_key ), )
+            
+        
+        for tag_service_id in tag_service_ids:
+            
+            self.modules_tag_cooccurrence.Regenerate( tag_service_id )
+            
+        
+    
     def _RegenerateTagDisplayMappingsCache( self, tag_service_key = None ):
         
         job_key = ClientThreading.JobKey( cancellable = True )
@@ -14739,6 +15714,9 @@ class DB( HydrusDB.HydrusDB ):
                 self._c.execute( 'DELETE FROM {};'.format( cache_actual_tag_siblings_lookup_table_name ) )
                 self._c.execute( 'DELETE FROM {};'.format( cache_actual_tag_parents_lookup_table_name ) )
                 
+                self._tag_siblings_lookup_caches.pop( ( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id ), None )
+                self._tag_parents_lookup_caches.pop( ( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id ), None )
+                
                 if tag_service_id in self._service_ids_to_display_application_status:
                     
                     del self._service_ids_to_display_application_status[ tag_service_id ]
@@ -14932,6 +15910,9 @@ class DB( HydrusDB.HydrusDB ):
                 self._c.execute( 'DELETE FROM {};'.format( cache_actual_tag_siblings_lookup_table_name ) )
                 self._c.execute( 'DELETE FROM {};'.format( cache_actual_tag_parents_lookup_table_name ) )
                 
+                self._tag_siblings_lookup_caches.pop( ( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id ), None )
+                self._tag_parents_lookup_caches.pop( ( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id ), None )
+                
                 if tag_service_id in self._service_ids_to_display_application_status:
                     
                     del self._service_ids_to_display_application_status[ tag_service_id ]
@@ -15215,6 +16196,20 @@ class DB( HydrusDB.HydrusDB ):
             self._CreateDBCaches()
             
         
+        # the co-occurrence index is optional and can always be recounted, so we fix it up quietly
+        
+        self.modules_tag_cooccurrence.CreateInitialTables()
+        
+        for tag_service_id in tag_service_ids:
+            
+            cooccurrence_table_names = ( ClientDBTagCooccurrence.GenerateTagCooccurrenceTableName( tag_service_id ), ClientDBTagCooccurrence.GenerateTagCooccurrenceDirtyTableName( tag_service_id ) )
+            
+            if self.modules_tag_cooccurrence.IsOn( tag_service_id ) and True in ( table_name.split( '.' )[1] not in existing_cache_tables for table_name in cooccurrence_table_names ):
+                
+                self.modules_tag_cooccurrence.Regenerate( tag_service_id )
+                
+            
+        
         if version >= 414:
             
             # tag display caches
@@ -15946,7 +16941,7 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'INSERT INTO service_directory_file_map ( service_id, directory_id, hash_id ) VALUES ( ?, ?, ? );', ( ( service_id, directory_id, hash_id ) for hash_id in hash_ids ) )
         
     
-    def _TryToSortHashIds( self, file_service_id, hash_ids, sort_by: ClientMedia.MediaSort ):
+    def _TryToSortHashIds( self, file_service_id, hash_ids, sort_by: ClientMedia.MediaSort, limit = None ):
         
         did_sort = False
         
@@ -15958,6 +16953,16 @@ class DB( HydrusDB.HydrusDB ):
         
         if sort_metadata == 'system':
             
+            if sort_data in COLUMN_SORTS:
+                
+                sorted_hash_ids = self._TryToSortHashIdsWithColumnCaches( file_service_id, hash_ids, sort_data, sort_order == CC.SORT_DESC, limit = limit )
+                
+                if sorted_hash_ids is not None:
+                    
+                    return ( True, sorted_hash_ids )
+                    
+                
+            
             simple_sorts = []
             
             simple_sorts.append( CC.SORT_FILES_BY_IMPORT_TIME )
@@ -16182,6 +17187,67 @@ class DB( HydrusDB.HydrusDB ):
         return ( did_sort, hash_ids )
         
     
+    def _TryToSortHashIdsWithColumnCaches( self, file_service_id, hash_ids, sort_data, reverse, limit = None ):
+        
+        # rather than a point lookup per file, we fetch the sort columns for all of them from memory and sort with numpy
+        # if we are on a read pool thread and the caches are not built yet, we return None and the caller falls back to sql
+        
+        files_info_column_cache = self.modules_files_metadata_basic.GetFilesInfoColumnCache()
+        
+        if files_info_column_cache is None:
+            
+            return None
+            
+        
+        timestamp_cache = None
+        
+        if sort_data == CC.SORT_FILES_BY_IMPORT_TIME:
+            
+            timestamp_cache = self._GetCurrentFilesTimestampCache( file_service_id )
+            
+            if timestamp_cache is None:
+                
+                return None
+                
+            
+        
+        hash_ids_array = numpy.fromiter( hash_ids, dtype = numpy.int64, count = len( hash_ids ) )
+        
+        ( found, columns ) = files_info_column_cache.GetColumns( hash_ids_array )
+        
+        if timestamp_cache is not None:
+            
+            ( timestamp_found, timestamp_columns ) = timestamp_cache.GetColumns( hash_ids_array )
+            
+            found &= timestamp_found
+            
+            columns.update( timestamp_columns )
+            
+        
+        column_sort_keys = GenerateColumnSortKeys( sort_data, columns )
+        
+        if column_sort_keys is None:
+            
+            return None
+            
+        
+        found_positions = numpy.flatnonzero( found )
+        
+        sort_keys = [ sort_key[ found_positions ] for sort_key in column_sort_keys ]
+        
+        order = ArgSortKeys( sort_keys, reverse, limit = limit )
+        
+        sorted_hash_ids = hash_ids_array[ found_positions[ order ] ].tolist()
+        
+        if limit is None or len( sorted_hash_ids ) < limit:
+            
+            # files without a row go at the end, as in the sql sort
+            sorted_hash_ids.extend( hash_ids_array[ ~found ].tolist() )
+            
+        
+        return sorted_hash_ids
+        
+    
     def _UnloadModules( self ):
         
         del self.modules_hashes
@@ -18777,6 +19843,8 @@ class DB( HydrusDB.HydrusDB ):
                     self._CacheCombinedFilesDisplayMappingsAddMappingsForChained( tag_service_id, tag_id, hash_ids )
                     
                 
+                self.modules_tag_cooccurrence.AddMappings( tag_service_id, tag_id, hash_ids )
+                
                 self._c.executemany( 'DELETE FROM ' + deleted_mappings_table_name + ' WHERE tag_id = ? AND hash_id = ?;', ( ( tag_id, hash_id ) for hash_id in hash_ids ) )
                 
                 num_deleted_deleted = HydrusDB.GetRowCount( self._c )
@@ -18813,6 +19881,8 @@ class DB( HydrusDB.HydrusDB ):
                     self._CacheCombinedFilesDisplayMappingsDeleteMappingsForChained( tag_service_id, tag_id, hash_ids )
                     
                 
+                self.modules_tag_cooccurrence.DeleteMappings( tag_service_id, tag_id, hash_ids )
+                
                 self._c.executemany( 'DELETE FROM ' + current_mappings_table_name + ' WHERE tag_id = ? AND hash_id = ?;', ( ( tag_id, hash_id ) for hash_id in hash_ids ) )
                 
                 num_current_deleted = HydrusDB.GetRowCount( self._c )
@@ -19235,6 +20305,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'delete_pending': self._DeletePending( *args, **kwargs )
         elif action == 'delete_serialisable_named': self.modules_serialisable.DeleteJSONDumpNamed( *args, **kwargs )
         elif action == 'delete_service_info': self._DeleteServiceInfo( *args, **kwargs )
+        elif action == 'delete_tag_cooccurrence_index': self._DeleteTagCooccurrenceIndex( *args, **kwargs )
         elif action == 'delete_potential_duplicate_pairs': self._DuplicatesDeleteAllPotentialDuplicatePairs( *args, **kwargs )
         elif action == 'dirty_services': self._SaveDirtyServices( *args, **kwargs )
         elif action == 'dissolve_alternates_group': self._DuplicatesDissolveAlternatesGroupIdFromHashes( *args, **kwargs )
@@ -19246,13 +20317,16 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'file_maintenance_cancel_jobs': self._FileMaintenanceCancelJobs( *args, **kwargs )
         elif action == 'file_maintenance_clear_jobs': self._FileMaintenanceClearJobs( *args, **kwargs )
         elif action == 'imageboard': self.modules_serialisable.SetYAMLDump( ClientDBSerialisable.YAML_DUMP_ID_IMAGEBOARD, *args, **kwargs )
+        elif action == 'force_commit': self._cursor_transaction_wrapper.CommitAndBegin()
         elif action == 'ideal_client_files_locations': self._SetIdealClientFilesLocations( *args, **kwargs )
         elif action == 'import_file': result = self._ImportFile( *args, **kwargs )
+        elif action == 'import_files': result = self._ImportFiles( *args, **kwargs )
         elif action == 'import_update': self._ImportUpdate( *args, **kwargs )
         elif action == 'last_shutdown_work_time': self._SetLastShutdownWorkTime( *args, **kwargs )
         elif action == 'local_booru_share': self.modules_serialisable.SetYAMLDump( ClientDBSerialisable.YAML_DUMP_ID_LOCAL_BOORU, *args, **kwargs )
         elif action == 'maintain_similar_files_search_for_potential_duplicates': result = self._PHashesSearchForPotentialDuplicates( *args, **kwargs )
         elif action == 'maintain_similar_files_tree': self.modules_similar_files.MaintainTree( *args, **kwargs )
+        elif action == 'maintain_tag_cooccurrence_index': self.modules_tag_cooccurrence.MaintainIndex( *args, **kwargs )
         elif action == 'migration_clear_job': self._MigrationClearJob( *args, **kwargs )
         elif action == 'migration_start_mappings_job': self._MigrationStartMappingsJob( *args, **kwargs )
         elif action == 'migration_start_pairs_job': self._MigrationStartPairsJob( *args, **kwargs )
@@ -19264,6 +20338,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'regenerate_similar_files': self.modules_similar_files.RegenerateTree( *args, **kwargs )
         elif action == 'regenerate_searchable_subtag_maps': self._RegenerateTagCacheSearchableSubtagMaps( *args, **kwargs )
         elif action == 'regenerate_tag_cache': self._RegenerateTagCache( *args, **kwargs )
+        elif action == 'regenerate_tag_cooccurrence_index': self._RegenerateTagCooccurrenceIndex( *args, **kwargs )
         elif action == 'regenerate_tag_display_mappings_cache': self._RegenerateTagDisplayMappingsCache( *args, **kwargs )
         elif action == 'regenerate_tag_display_pending_mappings_cache': self._RegenerateTagDisplayPendingMappingsCache( *args, **kwargs )
         elif action == 'regenerate_tag_mappings_cache': self._RegenerateTagMappingsCache( *args, **kwargs )
@@ -19318,6 +20393,72 @@ class DB( HydrusDB.HydrusDB ):
         self._controller.pub( 'set_status_bar_dirty' )
         
     
+    def BackupOnline( self, path ):
+        
+        # unlike the 'backup' job, this runs in the caller's thread and leaves the db open and working
+        
+        job_key = ClientThreading.JobKey( cancellable = True )
+        
+        job_key.SetVariable( 'popup_title', 'backing up db (online)' )
+        
+        self._controller.pub( 'message', job_key )
+        
+        try:
+            
+            def is_cancelled_hook():
+                
+                return job_key.IsCancelled() or HG.model_shutdown
+                
+            
+            def text_update_hook( text ):
+                
+                job_key.SetVariable( 'popup_text_1', text )
+                
+            
+            text_update_hook( 'committing db' )
+            
+            self.Write( 'force_commit', True )
+            
+            hashes_to_mimes = self.BackupDBFilesOnline( path, text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook, snapshot_callable = GetBackupSnapshotHashesToMimes )
+            
+            for additional_filename in self._GetPossibleAdditionalDBFilenames():
+                
+                source = os.path.join( self._db_dir, additional_filename )
+                dest = os.path.join( path, additional_filename )
+                
+                if os.path.exists( source ):
+                    
+                    HydrusPaths.MirrorFile( source, dest )
+                    
+                
+            
+            self._BackupClientFilesIncremental( path, hashes_to_mimes, job_key )
+            
+            if job_key.IsCancelled():
+                
+                text_update_hook( 'backup cancelled!' )
+                
+            else:
+                
+                text_update_hook( 'backup complete!' )
+                
+            
+        except HydrusExceptions.CancelledException:
+            
+            job_key.SetVariable( 'popup_text_1', 'backup cancelled! the previous backup is intact.' )
+            
+        except Exception as e:
+            
+            job_key.SetVariable( 'popup_text_1', 'backup failed!' )
+            
+            HydrusData.ShowException( e )
+            
+        finally:
+            
+            job_key.Finish()
+            
+        
+    
     def GetInitialMessages( self ):
         
         return self._initial_messages
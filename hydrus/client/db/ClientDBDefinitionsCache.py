@@ -1,4 +1,5 @@
 import sqlite3
+import threading
 import typing
 
 from hydrus.core import HydrusDB
@@ -15,6 +16,7 @@ class ClientDBCacheLocalHashes( HydrusDBModule.HydrusDBModule ):
         self.modules_hashes = modules_hashes
         
         self._hash_ids_to_hashes_cache = {}
+        self._hash_ids_to_hashes_cache_lock = threading.Lock()
         
         HydrusDBModule.HydrusDBModule.__init__( self, 'client hashes local cache', cursor )
         
@@ -26,20 +28,38 @@ class ClientDBCacheLocalHashes( HydrusDBModule.HydrusDBModule ):
         return index_generation_tuples
         
     
-    def _PopulateHashIdsToHashesCache( self, hash_ids ):
+    def _PopulateHashIdsToHashesCache( self, hash_ids ) -> typing.Dict[ int, bytes ]:
         
-        if len( self._hash_ids_to_hashes_cache ) > 100000:
+        # read pool threads share this cache, so only touch it under the lock, and hand back what was asked for, since another thread may prune it as soon as we let go
+        
+        hash_ids_to_hashes = {}
+        uncached_hash_ids = set()
+        
+        with self._hash_ids_to_hashes_cache_lock:
             
-            if not isinstance( hash_ids, set ):
+            if len( self._hash_ids_to_hashes_cache ) > 100000:
+                
+                if not isinstance( hash_ids, set ):
+                    
+                    hash_ids = set( hash_ids )
+                    
                 
-                hash_ids = set( hash_ids )
+                self._hash_ids_to_hashes_cache = { hash_id : hash for ( hash_id, hash ) in self._hash_ids_to_hashes_cache.items() if hash_id in hash_ids }
                 
             
-            self._hash_ids_to_hashes_cache = { hash_id : hash for ( hash_id, hash ) in self._hash_ids_to_hashes_cache.items() if hash_id in hash_ids }
+            for hash_id in hash_ids:
+                
+                if hash_id in self._hash_ids_to_hashes_cache:
+                    
+                    hash_ids_to_hashes[ hash_id ] = self._hash_ids_to_hashes_cache[ hash_id ]
+                    
+                else:
+                    
+                    uncached_hash_ids.add( hash_id )
+                    
+                
             
         
-        uncached_hash_ids = { hash_id for hash_id in hash_ids if hash_id not in self._hash_ids_to_hashes_cache }
-        
         if len( uncached_hash_ids ) > 0:
             
             if len( uncached_hash_ids ) == 1:
@@ -58,17 +78,29 @@ class ClientDBCacheLocalHashes( HydrusDBModule.HydrusDBModule ):
                     
                 
             
-            self._hash_ids_to_hashes_cache.update( local_uncached_hash_ids_to_hashes )
+            with self._hash_ids_to_hashes_cache_lock:
+                
+                self._hash_ids_to_hashes_cache.update( local_uncached_hash_ids_to_hashes )
+                
+            
+            hash_ids_to_hashes.update( local_uncached_hash_ids_to_hashes )
             
-            uncached_hash_ids = { hash_id for hash_id in uncached_hash_ids if hash_id not in self._hash_ids_to_hashes_cache }
+            uncached_hash_ids = { hash_id for hash_id in uncached_hash_ids if hash_id not in local_uncached_hash_ids_to_hashes }
             
         
         if len( uncached_hash_ids ) > 0:
             
-            hash_ids_to_hashes = self.modules_hashes.GetHashIdsToHashes( hash_ids = uncached_hash_ids )
+            master_hash_ids_to_hashes = self.modules_hashes.GetHashIdsToHashes( hash_ids = uncached_hash_ids )
             
-            self._hash_ids_to_hashes_cache.update( hash_ids_to_hashes )
+            with self._hash_ids_to_hashes_cache_lock:
+                
+                self._hash_ids_to_hashes_cache.update( master_hash_ids_to_hashes )
+                
             
+            hash_ids_to_hashes.update( master_hash_ids_to_hashes )
+            
+        
+        return hash_ids_to_hashes
         
     
     def CreateInitialTables( self ):
@@ -104,16 +136,16 @@ class ClientDBCacheLocalHashes( HydrusDBModule.HydrusDBModule ):
     
     def GetHash( self, hash_id ) -> str:
         
-        self._PopulateHashIdsToHashesCache( ( hash_id, ) )
+        hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( ( hash_id, ) )
         
-        return self._hash_ids_to_hashes_cache[ hash_id ]
+        return hash_ids_to_hashes[ hash_id ]
         
     
     def GetHashes( self, hash_ids ) -> typing.List[ bytes ]:
         
-        self._PopulateHashIdsToHashesCache( hash_ids )
+        hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( hash_ids )
         
-        return [ self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids ]
+        return [ hash_ids_to_hashes[ hash_id ] for hash_id in hash_ids ]
         
     
     def GetHashId( self, hash ) -> int:
@@ -170,9 +202,7 @@ class ClientDBCacheLocalHashes( HydrusDBModule.HydrusDBModule ):
         
         if hash_ids is not None:
             
-            self._PopulateHashIdsToHashesCache( hash_ids )
-            
-            hash_ids_to_hashes = { hash_id : self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids }
+            hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( hash_ids )
             
         elif hashes is not None:
             
@@ -203,6 +233,7 @@ class ClientDBCacheLocalTags( HydrusDBModule.HydrusDBModule ):
         self.modules_tags = modules_tags
         
         self._tag_ids_to_tags_cache = {}
+        self._tag_ids_to_tags_cache_lock = threading.Lock()
         
         HydrusDBModule.HydrusDBModule.__init__( self, 'client tags local cache', cursor )
         
@@ -214,20 +245,38 @@ class ClientDBCacheLocalTags( HydrusDBModule.HydrusDBModule ):
         return index_generation_tuples
         
     
-    def _PopulateTagIdsToTagsCache( self, tag_ids ):
+    def _PopulateTagIdsToTagsCache( self, tag_ids ) -> typing.Dict[ int, str ]:
+        
+        # read pool threads share this cache, so only touch it under the lock, and hand back what was asked for, since another thread may prune it as soon as we let go
         
-        if len( self._tag_ids_to_tags_cache ) > 100000:
+        tag_ids_to_tags = {}
+        uncached_tag_ids = set()
+        
+        with self._tag_ids_to_tags_cache_lock:
             
-            if not isinstance( tag_ids, set ):
+            if len( self._tag_ids_to_tags_cache ) > 100000:
+                
+                if not isinstance( tag_ids, set ):
+                    
+                    tag_ids = set( tag_ids )
+                    
                 
-                tag_ids = set( tag_ids )
+                self._tag_ids_to_tags_cache = { tag_id : tag for ( tag_id, tag ) in self._tag_ids_to_tags_cache.items() if tag_id in tag_ids }
                 
             
-            self._tag_ids_to_tags_cache = { tag_id : tag for ( tag_id, tag ) in self._tag_ids_to_tags_cache.items() if tag_id in tag_ids }
+            for tag_id in tag_ids:
+                
+                if tag_id in self._tag_ids_to_tags_cache:
+                    
+                    tag_ids_to_tags[ tag_id ] = self._tag_ids_to_tags_cache[ tag_id ]
+                    
+                else:
+                    
+                    uncached_tag_ids.add( tag_id )
+                    
+                
             
         
-        uncached_tag_ids = { tag_id for tag_id in tag_ids if tag_id not in self._tag_ids_to_tags_cache }
-        
         if len( uncached_tag_ids ) > 0:
             
             if len( uncached_tag_ids ) == 1:
@@ -246,18 +295,30 @@ class ClientDBCacheLocalTags( HydrusDBModule.HydrusDBModule ):
                     
                 
             
-            self._tag_ids_to_tags_cache.update( local_uncached_tag_ids_to_tags )
+            with self._tag_ids_to_tags_cache_lock:
+                
+                self._tag_ids_to_tags_cache.update( local_uncached_tag_ids_to_tags )
+                
+            
+            tag_ids_to_tags.update( local_uncached_tag_ids_to_tags )
             
-            uncached_tag_ids = { tag_id for tag_id in uncached_tag_ids if tag_id not in self._tag_ids_to_tags_cache }
+            uncached_tag_ids = { tag_id for tag_id in uncached_tag_ids if tag_id not in local_uncached_tag_ids_to_tags }
             
         
         if len( uncached_tag_ids ) > 0:
             
-            tag_ids_to_tags = self.modules_tags.GetTagIdsToTags( tag_ids = uncached_tag_ids )
+            master_tag_ids_to_tags = self.modules_tags.GetTagIdsToTags( tag_ids = uncached_tag_ids )
+            
+            with self._tag_ids_to_tags_cache_lock:
+                
+                self._tag_ids_to_tags_cache.update( master_tag_ids_to_tags )
+                
             
-            self._tag_ids_to_tags_cache.update( tag_ids_to_tags )
+            tag_ids_to_tags.update( master_tag_ids_to_tags )
             
         
+        return tag_ids_to_tags
+        
     
     def CreateInitialTables( self ):
         
@@ -299,9 +360,9 @@ class ClientDBCacheLocalTags( HydrusDBModule.HydrusDBModule ):
     
     def GetTag( self, tag_id ) -> str:
         
-        self._PopulateTagIdsToTagsCache( ( tag_id, ) )
+        tag_ids_to_tags = self._PopulateTagIdsToTagsCache( ( tag_id, ) )
         
-        return self._tag_ids_to_tags_cache[ tag_id ]
+        return tag_ids_to_tags[ tag_id ]
         
     
     def GetTagId( self, tag ) -> int:
@@ -335,9 +396,7 @@ class ClientDBCacheLocalTags( HydrusDBModule.HydrusDBModule ):
         
         if tag_ids is not None:
             
-            self._PopulateTagIdsToTagsCache( tag_ids )
-            
-            tag_ids_to_tags = { tag_id : self._tag_ids_to_tags_cache[ tag_id ] for tag_id in tag_ids }
+            tag_ids_to_tags = self._PopulateTagIdsToTagsCache( tag_ids )
             
         elif tags is not None:
             
@@ -351,9 +410,12 @@ class ClientDBCacheLocalTags( HydrusDBModule.HydrusDBModule ):
         
         self._c.execute( 'UPDATE local_tags_cache SET tag = ? WHERE tag_id = ?;', ( tag, tag_id ) )
         
-        if tag_id in self._tag_ids_to_tags_cache:
+        with self._tag_ids_to_tags_cache_lock:
             
-            del self._tag_ids_to_tags_cache[ tag_id ]
+            if tag_id in self._tag_ids_to_tags_cache:
+                
+                del self._tag_ids_to_tags_cache[ tag_id ]
+                
             
         
     
@@ -1,5 +1,7 @@
+import numpy
 import os
 import sqlite3
+import threading
 import typing
 
 from hydrus.core import HydrusConstants as HC
@@ -13,6 +15,166 @@ from hydrus.core import HydrusTags
 from hydrus.client.db import ClientDBServices
 from hydrus.client.metadata import ClientTags
 
+FILES_INFO_CACHE_COLUMN_NAMES = ( 'size', 'width', 'height', 'duration', 'num_frames' )
+
+class IntegerColumnCache( object ):
+    
+    # some integer columns of a table, held as numpy arrays sorted by key, so we can fetch them for a million keys in one vectorised lookup
+    # NULL is stored as -1, which is what the sort code treats NULL as anyway
+    # edits are buffered and merged in on the next lookup, so importing one file at a time does not copy the whole array every time
+    
+    NULL_VALUE = -1
+    
+    def __init__( self, column_names, rows ):
+        
+        self._lock = threading.Lock()
+        
+        self._column_names = list( column_names )
+        
+        # initial rows should have their NULLs already swapped for NULL_VALUE, which is easy with IFNULL
+        
+        array = numpy.array( list( rows ), dtype = numpy.int64 ).reshape( -1, 1 + len( self._column_names ) )
+        
+        order = numpy.argsort( array[ :, 0 ], kind = 'stable' )
+        
+        array = array[ order ]
+        
+        self._keys = array[ :, 0 ].copy()
+        self._columns = { column_name : array[ :, i + 1 ].copy() for ( i, column_name ) in enumerate( self._column_names ) }
+        
+        self._pending_sets = {}
+        self._pending_deletes = set()
+        
+    
+    def _MergePending( self ):
+        
+        if len( self._pending_sets ) == 0 and len( self._pending_deletes ) == 0:
+            
+            return
+            
+        
+        keys = self._keys
+        columns = self._columns
+        
+        if len( self._pending_sets ) > 0:
+            
+            # insert-or-ignore rows only go in if the key is not already in here
+            
+            set_keys = numpy.fromiter( self._pending_sets.keys(), dtype = numpy.int64, count = len( self._pending_sets ) )
+            
+            already_in = numpy.isin( set_keys, keys )
+            
+            rows = [ row for ( row, overwrite ) in self._pending_sets.values() ]
+            overwrites = numpy.fromiter( ( overwrite for ( row, overwrite ) in self._pending_sets.values() ), dtype = numpy.bool_, count = len( self._pending_sets ) )
+            
+            do_it = overwrites | ~already_in
+            
+            set_keys = set_keys[ do_it ]
+            rows = [ row for ( row, do ) in zip( rows, do_it.tolist() ) if do ]
+            
+        else:
+            
+            set_keys = numpy.empty( 0, dtype = numpy.int64 )
+            rows = []
+            
+        
+        keys_to_remove = set_keys
+        
+        if len( self._pending_deletes ) > 0:
+            
+            keys_to_remove = numpy.concatenate( ( keys_to_remove, numpy.fromiter( self._pending_deletes, dtype = numpy.int64, count = len( self._pending_deletes ) ) ) )
+            
+        
+        keep = numpy.isin( keys, keys_to_remove, invert = True )
+        
+        keys = keys[ keep ]
+        columns = { column_name : column[ keep ] for ( column_name, column ) in columns.items() }
+        
+        if len( set_keys ) > 0:
+            
+            added_columns = numpy.array( [ [ self.NULL_VALUE if value is None else value for value in row ] for row in rows ], dtype = numpy.int64 ).reshape( len( rows ), len( self._column_names ) )
+            
+            keys = numpy.concatenate( ( keys, set_keys ) )
+            
+            columns = { column_name : numpy.concatenate( ( columns[ column_name ], added_columns[ :, i ] ) ) for ( i, column_name ) in enumerate( self._column_names ) }
+            
+            # the existing keys are already sorted, so this is mostly a merge of two runs
+            order = numpy.argsort( keys, kind = 'stable' )
+            
+            keys = keys[ order ]
+            columns = { column_name : column[ order ] for ( column_name, column ) in columns.items() }
+            
+        
+        # we replace rather than edit in place, so a lookup that already grabbed the old arrays is unaffected
+        
+        self._keys = keys
+        self._columns = columns
+        
+        self._pending_sets = {}
+        self._pending_deletes = set()
+        
+    
+    def AddRows( self, rows, overwrite = True ):
+        
+        # rows are ( key, value, value, ... ) in column order
+        
+        with self._lock:
+            
+            for row in rows:
+                
+                key = row[0]
+                
+                self._pending_sets[ key ] = ( row[1:], overwrite )
+                self._pending_deletes.discard( key )
+                
+            
+        
+    
+    def DeleteKeys( self, keys ):
+        
+        with self._lock:
+            
+            for key in keys:
+                
+                if key in self._pending_sets:
+                    
+                    del self._pending_sets[ key ]
+                    
+                
+                self._pending_deletes.add( key )
+                
+            
+        
+    
+    def GetColumns( self, keys: numpy.ndarray ):
+        
+        # returns a mask of which keys we have, and the columns aligned to the given keys, with NULL_VALUE where we do not
+        
+        with self._lock:
+            
+            self._MergePending()
+            
+            ( cache_keys, cache_columns ) = ( self._keys, self._columns )
+            
+        
+        if len( cache_keys ) == 0:
+            
+            found = numpy.zeros( len( keys ), dtype = numpy.bool_ )
+            
+            return ( found, { column_name : numpy.full( len( keys ), self.NULL_VALUE, dtype = numpy.int64 ) for column_name in self._column_names } )
+            
+        
+        positions = numpy.searchsorted( cache_keys, keys )
+        
+        positions[ positions == len( cache_keys ) ] = 0
+        
+        found = cache_keys[ positions ] == keys
+        
+        columns = { column_name : numpy.where( found, column[ positions ], self.NULL_VALUE ) for ( column_name, column ) in cache_columns.items() }
+        
+        return ( found, columns )
+        
+    
 class ClientDBFilesMetadataBasic( HydrusDBModule.HydrusDBModule ):
     
     def __init__( self, cursor: sqlite3.Cursor ):
@@ -21,6 +183,8 @@ class ClientDBFilesMetadataBasic( HydrusDBModule.HydrusDBModule ):
         
         self.inbox_hash_ids = set()
         
+        self._files_info_column_cache = None
+        
         self._InitCaches()
         
     
@@ -60,6 +224,11 @@ class ClientDBFilesMetadataBasic( HydrusDBModule.HydrusDBModule ):
         # hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words
         self._c.executemany( insert_phrase + ' files_info ( hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ? );', rows )
         
+        if self._files_info_column_cache is not None:
+            
+            self._files_info_column_cache.AddRows( ( ( hash_id, size, width, height, duration, num_frames ) for ( hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words ) in rows ), overwrite = overwrite )
+            
+        
     
     def ArchiveFiles( self, hash_ids: typing.Collection[ int ] ) -> typing.Set[ int ]:
         
@@ -80,6 +249,11 @@ class ClientDBFilesMetadataBasic( HydrusDBModule.HydrusDBModule ):
         return archiveable_hash_ids
         
     
+    def ClearFilesInfoColumnCache( self ):
+        
+        self._files_info_column_cache = None
+        
+    
     def CreateInitialTables( self ):
         
         self._c.execute( 'CREATE TABLE file_inbox ( hash_id INTEGER PRIMARY KEY );' )
@@ -96,6 +270,20 @@ class ClientDBFilesMetadataBasic( HydrusDBModule.HydrusDBModule ):
         return expected_table_names
         
     
+    def GetFilesInfoColumnCache( self ) -> typing.Optional[ IntegerColumnCache ]:
+        
+        # only the writer builds the cache. a read pool snapshot may be behind the writer's uncommitted rows, and we would miss those edits forever
+        
+        if self._files_info_column_cache is None and HydrusDB.GetReadPoolCursor() is None:
+            
+            rows = self._c.execute( 'SELECT hash_id, IFNULL( size, -1 ), IFNULL( width, -1 ), IFNULL( height, -1 ), IFNULL( duration, -1 ), IFNULL( num_frames, -1 ) FROM files_info;' )
+            
+            self._files_info_column_cache = IntegerColumnCache( FILES_INFO_CACHE_COLUMN_NAMES, rows )
+            
+        
+        return self._files_info_column_cache
+        
+    
     def GetMime( self, hash_id: int ) -> int:
         
         result = self._c.execute( 'SELECT mime FROM files_info WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
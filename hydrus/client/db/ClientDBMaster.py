@@ -1,5 +1,6 @@
 import os
 import sqlite3
+import threading
 import typing
 
 from hydrus.core import HydrusConstants as HC
@@ -18,6 +19,7 @@ class ClientDBMasterHashes( HydrusDBModule.HydrusDBModule ):
         HydrusDBModule.HydrusDBModule.__init__( self, 'client hashes master', cursor )
         
         self._hash_ids_to_hashes_cache = {}
+        self._hash_ids_to_hashes_cache_lock = threading.Lock()
         
     
     def _GetInitialIndexGenerationTuples( self ):
@@ -31,20 +33,38 @@ class ClientDBMasterHashes( HydrusDBModule.HydrusDBModule ):
         return index_generation_tuples
         
     
-    def _PopulateHashIdsToHashesCache( self, hash_ids, exception_on_error = False ):
+    def _PopulateHashIdsToHashesCache( self, hash_ids, exception_on_error = False ) -> typing.Dict[ int, bytes ]:
         
-        if len( self._hash_ids_to_hashes_cache ) > 100000:
+        # read pool threads share this cache, so only touch it under the lock, and hand back what was asked for, since another thread may prune it as soon as we let go
+        
+        hash_ids_to_hashes = {}
+        uncached_hash_ids = set()
+        
+        with self._hash_ids_to_hashes_cache_lock:
             
-            if not isinstance( hash_ids, set ):
+            if len( self._hash_ids_to_hashes_cache ) > 100000:
+                
+                if not isinstance( hash_ids, set ):
+                    
+                    hash_ids = set( hash_ids )
+                    
                 
-                hash_ids = set( hash_ids )
+                self._hash_ids_to_hashes_cache = { hash_id : hash for ( hash_id, hash ) in self._hash_ids_to_hashes_cache.items() if hash_id in hash_ids }
                 
             
-            self._hash_ids_to_hashes_cache = { hash_id : hash for ( hash_id, hash ) in self._hash_ids_to_hashes_cache.items() if hash_id in hash_ids }
+            for hash_id in hash_ids:
+                
+                if hash_id in self._hash_ids_to_hashes_cache:
+                    
+                    hash_ids_to_hashes[ hash_id ] = self._hash_ids_to_hashes_cache[ hash_id ]
+                    
+                else:
+                    
+                    uncached_hash_ids.add( hash_id )
+                    
+                
             
         
-        uncached_hash_ids = { hash_id for hash_id in hash_ids if hash_id not in self._hash_ids_to_hashes_cache }
-        
         if len( uncached_hash_ids ) > 0:
             
             pubbed_error = False
@@ -94,9 +114,16 @@ class ClientDBMasterHashes( HydrusDBModule.HydrusDBModule ):
                     
                 
             
-            self._hash_ids_to_hashes_cache.update( uncached_hash_ids_to_hashes )
+            with self._hash_ids_to_hashes_cache_lock:
+                
+                self._hash_ids_to_hashes_cache.update( uncached_hash_ids_to_hashes )
+                
+            
+            hash_ids_to_hashes.update( uncached_hash_ids_to_hashes )
             
         
+        return hash_ids_to_hashes
+        
     
     def CreateInitialTables( self ):
         
@@ -171,16 +198,16 @@ class ClientDBMasterHashes( HydrusDBModule.HydrusDBModule ):
     
     def GetHash( self, hash_id ) -> bytes:
         
-        self._PopulateHashIdsToHashesCache( ( hash_id, ) )
+        hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( ( hash_id, ) )
         
-        return self._hash_ids_to_hashes_cache[ hash_id ]
+        return hash_ids_to_hashes[ hash_id ]
         
     
     def GetHashes( self, hash_ids ) -> typing.List[ bytes ]:
         
-        self._PopulateHashIdsToHashesCache( hash_ids )
+        hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( hash_ids )
         
-        return [ self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids ]
+        return [ hash_ids_to_hashes[ hash_id ] for hash_id in hash_ids ]
         
     
     def GetHashId( self, hash ) -> int:
@@ -271,9 +298,7 @@ class ClientDBMasterHashes( HydrusDBModule.HydrusDBModule ):
         
         if hash_ids is not None:
             
-            self._PopulateHashIdsToHashesCache( hash_ids, exception_on_error = True )
-            
-            hash_ids_to_hashes = { hash_id : self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids }
+            hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( hash_ids, exception_on_error = True )
             
         elif hashes is not None:
             
@@ -433,6 +458,7 @@ class ClientDBMasterTags( HydrusDBModule.HydrusDBModule ):
         self.null_namespace_id = None
         
         self._tag_ids_to_tags_cache = {}
+        self._tag_ids_to_tags_cache_lock = threading.Lock()
         
     
     def _GetInitialIndexGenerationTuples( self ):
@@ -445,20 +471,38 @@ class ClientDBMasterTags( HydrusDBModule.HydrusDBModule ):
         return index_generation_tuples
         
     
-    def _PopulateTagIdsToTagsCache( self, tag_ids ):
+    def _PopulateTagIdsToTagsCache( self, tag_ids ) -> typing.Dict[ int, str ]:
+        
+        # read pool threads share this cache, so only touch it under the lock, and hand back what was asked for, since another thread may prune it as soon as we let go
+        
+        tag_ids_to_tags = {}
+        uncached_tag_ids = set()
         
-        if len( self._tag_ids_to_tags_cache ) > 100000:
+        with self._tag_ids_to_tags_cache_lock:
             
-            if not isinstance( tag_ids, set ):
+            if len( self._tag_ids_to_tags_cache ) > 100000:
                 
-                tag_ids = set( tag_ids )
+                if not isinstance( tag_ids, set ):
+                    
+                    tag_ids = set( tag_ids )
+                    
+                
+                self._tag_ids_to_tags_cache = { tag_id : tag for ( tag_id, tag ) in self._tag_ids_to_tags_cache.items() if tag_id in tag_ids }
                 
             
-            self._tag_ids_to_tags_cache = { tag_id : tag for ( tag_id, tag ) in self._tag_ids_to_tags_cache.items() if tag_id in tag_ids }
+            for tag_id in tag_ids:
+                
+                if tag_id in self._tag_ids_to_tags_cache:
+                    
+                    tag_ids_to_tags[ tag_id ] = self._tag_ids_to_tags_cache[ tag_id ]
+                    
+                else:
+                    
+                    uncached_tag_ids.add( tag_id )
+                    
+                
             
         
-        uncached_tag_ids = { tag_id for tag_id in tag_ids if tag_id not in self._tag_ids_to_tags_cache }
-        
         if len( uncached_tag_ids ) > 0:
             
             if len( uncached_tag_ids ) == 1:
@@ -498,9 +542,16 @@ class ClientDBMasterTags( HydrusDBModule.HydrusDBModule ):
                     
                 
             
-            self._tag_ids_to_tags_cache.update( uncached_tag_ids_to_tags )
+            with self._tag_ids_to_tags_cache_lock:
+                
+                self._tag_ids_to_tags_cache.update( uncached_tag_ids_to_tags )
+                
+            
+            tag_ids_to_tags.update( uncached_tag_ids_to_tags )
             
         
+        return tag_ids_to_tags
+        
     
     def CreateInitialTables( self ):
         
@@ -577,9 +628,9 @@ class ClientDBMasterTags( HydrusDBModule.HydrusDBModule ):
     
     def GetTag( self, tag_id ) -> str:
         
-        self._PopulateTagIdsToTagsCache( ( tag_id, ) )
+        tag_ids_to_tags = self._PopulateTagIdsToTagsCache( ( tag_id, ) )
         
-        return self._tag_ids_to_tags_cache[ tag_id ]
+        return tag_ids_to_tags[ tag_id ]
         
     
     def GetTagId( self, tag ) -> int:
@@ -622,9 +673,7 @@ class ClientDBMasterTags( HydrusDBModule.HydrusDBModule ):
         
         if tag_ids is not None:
             
-            self._PopulateTagIdsToTagsCache( tag_ids )
-            
-            tag_ids_to_tags = { tag_id : self._tag_ids_to_tags_cache[ tag_id ] for tag_id in tag_ids }
+            tag_ids_to_tags = self._PopulateTagIdsToTagsCache( tag_ids )
             
         elif tags is not None:
             
@@ -732,9 +781,12 @@ class ClientDBMasterTags( HydrusDBModule.HydrusDBModule ):
         
         self._c.execute( 'UPDATE tags SET namespace_id = ?, subtag_id = ? WHERE tag_id = ?;', ( namespace_id, subtag_id, tag_id ) )
     
-        if tag_id in self._tag_ids_to_tags_cache:
-    
-            del self._tag_ids_to_tags_cache[ tag_id ]
+        with self._tag_ids_to_tags_cache_lock:
+            
+            if tag_id in self._tag_ids_to_tags_cache:
+                
+                del self._tag_ids_to_tags_cache[ tag_id ]
+                
             
         
     
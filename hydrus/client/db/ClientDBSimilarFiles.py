@@ -1,6 +1,8 @@
 import collections
+import numpy
 import random
 import sqlite3
+import threading
 import typing
 
 from hydrus.core import HydrusConstants as HC
@@ -12,12 +14,341 @@ from hydrus.core import HydrusGlobals as HG
 
 from hydrus.client import ClientThreading
 
+# past this, the pigeonhole blocks are so narrow that too much is a candidate and brute force is about as fast
+MAX_BLOCK_SEARCH_DISTANCE = 10
+
+# caps how many candidate pairs we expand at once in a block search, which caps memory at about 100MB
+MAX_CANDIDATES_PER_STEP = 4 * 1024 * 1024
+
+def GetBlockSearchPlan( max_hamming_distance: int ):
+    
+    # pigeonhole: split the 64 bits into n blocks, and any two phashes within the distance must have a block with at most distance // n differences
+    # at small distances, we can afford a block per bit of distance and look up exact block matches
+    # beyond that, the blocks get too narrow to be selective, so we use half as many wider blocks and also look up every one-bit neighbour of each block
+    
+    if 64 // ( max_hamming_distance + 1 ) >= 12:
+        
+        max_block_errors = 0
+        num_blocks = max_hamming_distance + 1
+        
+    else:
+        
+        max_block_errors = 1
+        num_blocks = ( max_hamming_distance // 2 ) + 1
+        
+    
+    shifts_and_widths = []
+    
+    shift = 0
+    
+    for i in range( num_blocks ):
+        
+        width = 64 // num_blocks
+        
+        if i < 64 % num_blocks:
+            
+            width += 1
+            
+        
+        shifts_and_widths.append( ( shift, width ) )
+        
+        shift += width
+        
+    
+    return ( max_block_errors, shifts_and_widths )
+    
+def GetHammingDistances( phashes: numpy.ndarray, search_phashes ) -> numpy.ndarray:
+    
+    # vectorised version of HydrusData.Get64BitHammingDistance, popcount on the xor via the usual SWAR bit tricks
+    # search_phashes may be a single integer or an array the same length as phashes
+    
+    x = numpy.bitwise_xor( phashes, numpy.asarray( search_phashes, dtype = numpy.uint64 ) )
+    
+    x = x - ( ( x >> numpy.uint64( 1 ) ) & numpy.uint64( 0x5555555555555555 ) )
+    x = ( x & numpy.uint64( 0x3333333333333333 ) ) + ( ( x >> numpy.uint64( 2 ) ) & numpy.uint64( 0x3333333333333333 ) )
+    x = ( x + ( x >> numpy.uint64( 4 ) ) ) & numpy.uint64( 0x0f0f0f0f0f0f0f0f )
+    x = ( x * numpy.uint64( 0x0101010101010101 ) ) >> numpy.uint64( 56 )
+    
+    return x.astype( numpy.uint8 )
+    
+def PHashesToArray( phashes ) -> numpy.ndarray:
+    
+    return numpy.frombuffer( b''.join( phashes ), dtype = '>u8' ).astype( numpy.uint64 )
+    
+def PHashToInteger( phash: bytes ) -> int:
+    
+    return int.from_bytes( phash, 'big' )
+    
+class PHashIndex( object ):
+    
+    # all the phashes in one contiguous array, so a search is a couple of vectorised passes rather than a vptree walk
+    # 16 bytes per phash, so a few million phashes is tens of MB
+    # edits are buffered and merged in on the next search, so importing one file at a time does not copy the whole array every time
+    
+    def __init__( self, phash_ids, phashes ):
+        
+        self._lock = threading.Lock()
+        
+        self._phash_ids = numpy.array( phash_ids, dtype = numpy.int64 )
+        self._phashes = PHashesToArray( phashes )
+        
+        self._pending_adds = {}
+        self._pending_deletes = set()
+        
+        self._max_hamming_distances_to_block_tables = {}
+        
+    
+    def _GetBlockTables( self, max_hamming_distance ):
+        
+        # for each block, the block values sorted, and the positions in the main arrays they came from
+        # this is 6-8 bytes per phash per block, so we only hold it while a big search is going on
+        
+        if max_hamming_distance not in self._max_hamming_distances_to_block_tables:
+            
+            ( max_block_errors, shifts_and_widths ) = GetBlockSearchPlan( max_hamming_distance )
+            
+            block_tables = []
+            
+            for ( shift, width ) in shifts_and_widths:
+                
+                dtype = numpy.uint16 if width <= 16 else numpy.uint32
+                
+                keys = ( ( self._phashes >> numpy.uint64( shift ) ) & numpy.uint64( ( 1 << width ) - 1 ) ).astype( dtype )
+                
+                # stable sort on small ints is a radix sort, nice and quick
+                order = numpy.argsort( keys, kind = 'stable' ).astype( numpy.int32 if len( keys ) < 2 ** 31 else numpy.int64 )
+                
+                block_tables.append( ( shift, width, keys[ order ], order ) )
+                
+            
+            self._max_hamming_distances_to_block_tables[ max_hamming_distance ] = ( max_block_errors, block_tables )
+            
+        
+        return self._max_hamming_distances_to_block_tables[ max_hamming_distance ]
+        
+    
+    def _MergePending( self ):
+        
+        if len( self._pending_adds ) == 0 and len( self._pending_deletes ) == 0:
+            
+            return
+            
+        
+        phash_ids_to_remove = set( self._pending_deletes )
+        phash_ids_to_remove.update( self._pending_adds.keys() )
+        
+        keep = numpy.isin( self._phash_ids, numpy.fromiter( phash_ids_to_remove, dtype = numpy.int64, count = len( phash_ids_to_remove ) ), invert = True )
+        
+        phash_ids = self._phash_ids[ keep ]
+        phashes = self._phashes[ keep ]
+        
+        if len( self._pending_adds ) > 0:
+            
+            ( added_phash_ids, added_phashes ) = zip( *self._pending_adds.items() )
+            
+            phash_ids = numpy.concatenate( ( phash_ids, numpy.array( added_phash_ids, dtype = numpy.int64 ) ) )
+            phashes = numpy.concatenate( ( phashes, PHashesToArray( added_phashes ) ) )
+            
+        
+        # we replace rather than edit in place, so a search that already grabbed the old arrays is unaffected
+        
+        self._phash_ids = phash_ids
+        self._phashes = phashes
+        
+        self._pending_adds = {}
+        self._pending_deletes = set()
+        
+        self._max_hamming_distances_to_block_tables = {}
+        
+    
+    def AddPHashes( self, phash_ids_and_phashes ):
+        
+        with self._lock:
+            
+            for ( phash_id, phash ) in phash_ids_and_phashes:
+                
+                self._pending_adds[ phash_id ] = phash
+                self._pending_deletes.discard( phash_id )
+                
+            
+        
+    
+    def ClearBlockTables( self ):
+        
+        with self._lock:
+            
+            self._max_hamming_distances_to_block_tables = {}
+            
+        
+    
+    def DeletePHashIds( self, phash_ids ):
+        
+        with self._lock:
+            
+            for phash_id in phash_ids:
+                
+                if phash_id in self._pending_adds:
+                    
+                    del self._pending_adds[ phash_id ]
+                    
+                
+                self._pending_deletes.add( phash_id )
+                
+            
+        
+    
+    def GetArrays( self ):
+        
+        with self._lock:
+            
+            self._MergePending()
+            
+            return ( self._phash_ids, self._phashes )
+            
+        
+    
+    def Search( self, search_phashes, max_hamming_distance ):
+        
+        ( phash_ids, phashes ) = self.GetArrays()
+        
+        similar_phash_ids_to_distances = {}
+        
+        for search_phash in search_phashes:
+            
+            distances = GetHammingDistances( phashes, PHashToInteger( search_phash ) )
+            
+            hits = numpy.flatnonzero( distances <= max_hamming_distance )
+            
+            for ( phash_id, distance ) in zip( phash_ids[ hits ].tolist(), distances[ hits ].tolist() ):
+                
+                if phash_id not in similar_phash_ids_to_distances or distance < similar_phash_ids_to_distances[ phash_id ]:
+                    
+                    similar_phash_ids_to_distances[ phash_id ] = distance
+                    
+                
+            
+        
+        return similar_phash_ids_to_distances
+        
+    
+    def SearchMany( self, search_phashes, max_hamming_distance ):
+        
+        # returns three aligned arrays of every hit: index into search_phashes, the phash_id found, and the distance
+        
+        search_array = PHashesToArray( search_phashes )
+        
+        search_indices_chunks = []
+        positions_chunks = []
+        distances_chunks = []
+        
+        if max_hamming_distance > MAX_BLOCK_SEARCH_DISTANCE:
+            
+            ( phash_ids, phashes ) = self.GetArrays()
+            
+            for ( search_index, search_phash ) in enumerate( search_array ):
+                
+                distances = GetHammingDistances( phashes, search_phash )
+                
+                hits = numpy.flatnonzero( distances <= max_hamming_distance )
+                
+                search_indices_chunks.append( numpy.full( len( hits ), search_index, dtype = numpy.int64 ) )
+                positions_chunks.append( hits )
+                distances_chunks.append( distances[ hits ] )
+                
+            
+        else:
+            
+            with self._lock:
+                
+                self._MergePending()
+                
+                ( phash_ids, phashes ) = ( self._phash_ids, self._phashes )
+                
+                ( max_block_errors, block_tables ) = self._GetBlockTables( max_hamming_distance )
+                
+            
+            for ( shift, width, sorted_keys, order ) in block_tables:
+                
+                search_keys = ( ( search_array >> numpy.uint64( shift ) ) & numpy.uint64( ( 1 << width ) - 1 ) ).astype( sorted_keys.dtype )
+                
+                probe_search_indices = numpy.arange( len( search_array ), dtype = numpy.int64 )
+                probe_keys = search_keys
+                
+                if max_block_errors == 1:
+                    
+                    # the block itself, and every block one bit away from it
+                    
+                    flips = numpy.concatenate( ( [ 0 ], 1 << numpy.arange( width ) ) ).astype( sorted_keys.dtype )
+                    
+                    probe_search_indices = numpy.repeat( probe_search_indices, len( flips ) )
+                    probe_keys = numpy.bitwise_xor( search_keys[ :, None ], flips[ None, : ] ).ravel()
+                    
+                
+                lefts = numpy.searchsorted( sorted_keys, probe_keys, side = 'left' )
+                counts = numpy.searchsorted( sorted_keys, probe_keys, side = 'right' ) - lefts
+                
+                cumulative_counts = numpy.cumsum( counts )
+                
+                start = 0
+                
+                while start < len( probe_keys ):
+                    
+                    # expand as many probes' candidate ranges as we can afford in one go
+                    
+                    previous_total = cumulative_counts[ start - 1 ] if start > 0 else 0
+                    
+                    end = max( start + 1, int( numpy.searchsorted( cumulative_counts, previous_total + MAX_CANDIDATES_PER_STEP, side = 'right' ) ) )
+                    
+                    step_counts = counts[ start : end ]
+                    
+                    num_candidates = int( step_counts.sum() )
+                    
+                    if num_candidates > 0:
+                        
+                        candidate_search_indices = numpy.repeat( probe_search_indices[ start : end ], step_counts )
+                        
+                        offsets_within_ranges = numpy.arange( num_candidates, dtype = numpy.int64 ) - numpy.repeat( numpy.cumsum( step_counts ) - step_counts, step_counts )
+                        
+                        candidate_positions = order[ numpy.repeat( lefts[ start : end ], step_counts ) + offsets_within_ranges ].astype( numpy.int64 )
+                        
+                        distances = GetHammingDistances( phashes[ candidate_positions ], search_array[ candidate_search_indices ] )
+                        
+                        hits = distances <= max_hamming_distance
+                        
+                        search_indices_chunks.append( candidate_search_indices[ hits ] )
+                        positions_chunks.append( candidate_positions[ hits ] )
+                        distances_chunks.append( distances[ hits ] )
+                        
+                    
+                    start = end
+                    
+                
+            
+        
+        if len( search_indices_chunks ) == 0:
+            
+            return ( numpy.array( [], dtype = numpy.int64 ), numpy.array( [], dtype = numpy.int64 ), numpy.array( [], dtype = numpy.uint8 ) )
+            
+        
+        search_indices = numpy.concatenate( search_indices_chunks )
+        positions = numpy.concatenate( positions_chunks )
+        distances = numpy.concatenate( distances_chunks )
+        
+        # a pair that matches on several blocks will have been found several times
+        
+        ( unique_pair_keys, unique_indices ) = numpy.unique( search_indices * len( phashes ) + positions, return_index = True )
+        
+        return ( search_indices[ unique_indices ], phash_ids[ positions[ unique_indices ] ], distances[ unique_indices ] )
+        
+    
 class ClientDBSimilarFiles( HydrusDBModule.HydrusDBModule ):
     
     def __init__( self, cursor: sqlite3.Cursor ):
         
         HydrusDBModule.HydrusDBModule.__init__( self, 'client similar files', cursor )
         
+        self._phash_index = None
+        
     
     def _AddLeaf( self, phash_id, phash ):
         
@@ -219,6 +550,36 @@ class ClientDBSimilarFiles( HydrusDBModule.HydrusDBModule ):
         return phash_id
         
     
+    def _GetPHashIndex( self ):
+        
+        if not HG.client_controller.new_options.GetBoolean( 'use_in_memory_similar_files_index' ):
+            
+            self._phash_index = None
+            
+            return None
+            
+        
+        # only the writer builds the index. a read pool snapshot may be behind the writer's uncommitted phashes, and we would miss those edits forever
+        
+        if self._phash_index is None and HydrusDB.GetReadPoolCursor() is None:
+            
+            rows = self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
+            
+            if len( rows ) > 0:
+                
+                ( phash_ids, phashes ) = zip( *rows )
+                
+            else:
+                
+                ( phash_ids, phashes ) = ( [], [] )
+                
+            
+            self._phash_index = PHashIndex( phash_ids, phashes )
+            
+        
+        return self._phash_index
+        
+    
     def _PopBestRootNode( self, node_rows ):
         
         if len( node_rows ) == 1:
@@ -342,6 +703,11 @@ class ClientDBSimilarFiles( HydrusDBModule.HydrusDBModule ):
         
         self._c.executemany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( p_id, ) for p_id in orphan_phash_ids ) )
         
+        if self._phash_index is not None:
+            
+            self._phash_index.DeletePHashIds( orphan_phash_ids )
+            
+        
         useful_nodes = [ row for row in unbalanced_nodes if row[0] in useful_phash_ids ]
         
         useful_population = len( useful_nodes )
@@ -379,15 +745,135 @@ class ClientDBSimilarFiles( HydrusDBModule.HydrusDBModule ):
             
         
     
+    def _SearchVPTree( self, search_phashes, search_radius ):
+        
+        top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+        
+        if top_node_result is None:
+            
+            return {}
+            
+        
+        ( root_node_phash_id, ) = top_node_result
+        
+        similar_phash_ids_to_distances = {}
+        
+        num_cycles = 0
+        total_nodes_searched = 0
+        
+        for search_phash in search_phashes:
+            
+            next_potentials = [ root_node_phash_id ]
+            
+            while len( next_potentials ) > 0:
+                
+                current_potentials = next_potentials
+                next_potentials = []
+                
+                num_cycles += 1
+                total_nodes_searched += len( current_potentials )
+                
+                for group_of_current_potentials in HydrusData.SplitListIntoChunks( current_potentials, 10000 ):
+                    
+                    # this is split into fixed lists of results of subgroups because as an iterable it was causing crashes on linux!!
+                    # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching phashes it presumably was still hanging on to
+                    # the crash was in sqlite code, again presumably on subsequent fetch
+                    # adding a delay in seemed to fix it as well. guess it was some memory maintenance buffer/bytes thing
+                    # anyway, we now just get the whole lot of results first and then work on the whole lot
+                    '''
+                    #old method
+                    select_statement = 'SELECT phash_id, phash, radius, inner_id, outer_id FROM shape_perceptual_hashes NATURAL JOIN shape_vptree WHERE phash_id = ?;'
+                    
+                    results = list( self._ExecuteManySelectSingleParam( select_statement, group_of_current_potentials ) )
+                    '''
+                    
+                    with HydrusDB.TemporaryIntegerTable( self._c, group_of_current_potentials, 'phash_id' ) as temp_table_name:
+                        
+                        # temp phash_ids to actual phashes and tree info
+                        results = self._c.execute( 'SELECT phash_id, phash, radius, inner_id, outer_id FROM {} CROSS JOIN shape_perceptual_hashes USING ( phash_id ) CROSS JOIN shape_vptree USING ( phash_id );'.format( temp_table_name ) ).fetchall()
+                        
+                    
+                    for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in results:
+                        
+                        # first check the node itself--is it similar?
+                        
+                        node_hamming_distance = HydrusData.Get64BitHammingDistance( search_phash, node_phash )
+                        
+                        if node_hamming_distance <= search_radius:
+                            
+                            if node_phash_id in similar_phash_ids_to_distances:
+                                
+                                current_distance = similar_phash_ids_to_distances[ node_phash_id ]
+                                
+                                similar_phash_ids_to_distances[ node_phash_id ] = min( node_hamming_distance, current_distance )
+                                
+                            else:
+                                
+                                similar_phash_ids_to_distances[ node_phash_id ] = node_hamming_distance
+                                
+                            
+                        
+                        # now how about its children?
+                        
+                        if node_radius is not None:
+                            
+                            # we have two spheres--node and search--their centers separated by node_hamming_distance
+                            # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
+                            # there are four possibles:
+                            # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
+                            # (----N---(-)-S--)      intersects with both
+                            # (----N-(--S-)-)        intersects with both
+                            # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
+                            
+                            if inner_phash_id is not None:
+                                
+                                spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
+                                
+                                if not spheres_disjoint: # i.e. they intersect at some point
+                                    
+                                    next_potentials.append( inner_phash_id )
+                                    
+                                
+                            
+                            if outer_phash_id is not None:
+                                
+                                search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
+                                
+                                if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
+                                    
+                                    next_potentials.append( outer_phash_id )
+                                    
+                                
+                            
+                        
+                    
+                
+            
+        
+        if HG.db_report_mode:
+            
+            HydrusData.ShowText( 'Similar file search touched {} nodes over {} cycles.'.format( HydrusData.ToHumanInt( total_nodes_searched ), HydrusData.ToHumanInt( num_cycles ) ) )
+            
+        
+        return similar_phash_ids_to_distances
+        
+    
     def AssociatePHashes( self, hash_id, phashes ):
         
         phash_ids = set()
+        phash_ids_and_phashes = []
         
         for phash in phashes:
             
             phash_id = self._GetPHashId( phash )
             
             phash_ids.add( phash_id )
+            phash_ids_and_phashes.append( ( phash_id, phash ) )
+            
+        
+        if self._phash_index is not None:
+            
+            self._phash_index.AddPHashes( phash_ids_and_phashes )
             
         
         self._c.executemany( 'INSERT OR IGNORE INTO shape_perceptual_hash_map ( phash_id, hash_id ) VALUES ( ?, ? );', ( ( phash_id, hash_id ) for phash_id in phash_ids ) )
@@ -400,6 +886,19 @@ class ClientDBSimilarFiles( HydrusDBModule.HydrusDBModule ):
         return phash_ids
         
     
+    def ClearBatchSearchCache( self ):
+        
+        if self._phash_index is not None:
+            
+            self._phash_index.ClearBlockTables()
+            
+        
+    
+    def ClearPHashIndex( self ):
+        
+        self._phash_index = None
+        
+    
     def CreateInitialTables( self ):
         
         self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.shape_perceptual_hashes ( phash_id INTEGER PRIMARY KEY, phash BLOB_BYTES UNIQUE );' )
@@ -423,6 +922,11 @@ class ClientDBSimilarFiles( HydrusDBModule.HydrusDBModule ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO shape_maintenance_branch_regen ( phash_id ) VALUES ( ? );', ( ( phash_id, ) for phash_id in useless_phash_ids ) )
         
+        if self._phash_index is not None:
+            
+            self._phash_index.DeletePHashIds( useless_phash_ids )
+            
+        
     
     def GetExpectedTableNames( self ) -> typing.Collection[ str ]:
         
@@ -563,6 +1067,8 @@ class ClientDBSimilarFiles( HydrusDBModule.HydrusDBModule ):
             
             self._GenerateBranch( job_key, None, root_id, root_phash, all_nodes )
             
+            self._phash_index = None
+            
         finally:
             
             job_key.SetVariable( 'popup_text_1', 'done!' )
@@ -589,121 +1095,27 @@ class ClientDBSimilarFiles( HydrusDBModule.HydrusDBModule ):
             
         else:
             
-            search_radius = max_hamming_distance
-            
-            top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+            search_phashes = self._STL( self._c.execute( 'SELECT phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
             
-            if top_node_result is None:
+            if len( search_phashes ) == 0:
                 
                 return []
                 
             
-            ( root_node_phash_id, ) = top_node_result
-            
-            search = self._STL( self._c.execute( 'SELECT phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
+            phash_index = self._GetPHashIndex()
             
-            if len( search ) == 0:
+            if phash_index is None:
                 
-                return []
+                similar_phash_ids_to_distances = self._SearchVPTree( search_phashes, max_hamming_distance )
                 
-            
-            similar_phash_ids_to_distances = {}
-            
-            num_cycles = 0
-            total_nodes_searched = 0
-            
-            for search_phash in search:
+            else:
                 
-                next_potentials = [ root_node_phash_id ]
-                
-                while len( next_potentials ) > 0:
-                    
-                    current_potentials = next_potentials
-                    next_potentials = []
-                    
-                    num_cycles += 1
-                    total_nodes_searched += len( current_potentials )
-                    
-                    for group_of_current_potentials in HydrusData.SplitListIntoChunks( current_potentials, 10000 ):
-                        
-                        # this is split into fixed lists of results of subgroups because as an iterable it was causing crashes on linux!!
-                        # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching phashes it presumably was still hanging on to
-                        # the crash was in sqlite code, again presumably on subsequent fetch
-                        # adding a delay in seemed to fix it as well. guess it was some memory maintenance buffer/bytes thing
-                        # anyway, we now just get the whole lot of results first and then work on the whole lot
-                        '''
-                        #old method
-                        select_statement = 'SELECT phash_id, phash, radius, inner_id, outer_id FROM shape_perceptual_hashes NATURAL JOIN shape_vptree WHERE phash_id = ?;'
-                        
-                        results = list( self._ExecuteManySelectSingleParam( select_statement, group_of_current_potentials ) )
-                        '''
-                        
-                        with HydrusDB.TemporaryIntegerTable( self._c, group_of_current_potentials, 'phash_id' ) as temp_table_name:
-                            
-                            # temp phash_ids to actual phashes and tree info
-                            results = self._c.execute( 'SELECT phash_id, phash, radius, inner_id, outer_id FROM {} CROSS JOIN shape_perceptual_hashes USING ( phash_id ) CROSS JOIN shape_vptree USING ( phash_id );'.format( temp_table_name ) ).fetchall()
-                            
-                        
-                        for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in results:
-                            
-                            # first check the node itself--is it similar?
-                            
-                            node_hamming_distance = HydrusData.Get64BitHammingDistance( search_phash, node_phash )
-                            
-                            if node_hamming_distance <= search_radius:
-                                
-                                if node_phash_id in similar_phash_ids_to_distances:
-                                    
-                                    current_distance = similar_phash_ids_to_distances[ node_phash_id ]
-                                    
-                                    similar_phash_ids_to_distances[ node_phash_id ] = min( node_hamming_distance, current_distance )
-                                    
-                                else:
-                                    
-                                    similar_phash_ids_to_distances[ node_phash_id ] = node_hamming_distance
-                                    
-                                
-                            
-                            # now how about its children?
-                            
-                            if node_radius is not None:
-                                
-                                # we have two spheres--node and search--their centers separated by node_hamming_distance
-                                # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
-                                # there are four possibles:
-                                # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
-                                # (----N---(-)-S--)      intersects with both
-                                # (----N-(--S-)-)        intersects with both
-                                # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
-                                
-                                if inner_phash_id is not None:
-                                    
-                                    spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
-                                    
-                                    if not spheres_disjoint: # i.e. they intersect at some point
-                                        
-                                        next_potentials.append( inner_phash_id )
-                                        
-                                    
-                                
-                                if outer_phash_id is not None:
-                                    
-                                    search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
-                                    
-                                    if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
-                                        
-                                        next_potentials.append( outer_phash_id )
-                                        
-                                    
-                                
-                            
-                        
-                    
+                similar_phash_ids_to_distances = phash_index.Search( search_phashes, max_hamming_distance )
                 
             
-            if HG.db_report_mode:
+            if len( similar_phash_ids_to_distances ) == 0:
                 
-                HydrusData.ShowText( 'Similar file search touched {} nodes over {} cycles.'.format( HydrusData.ToHumanInt( total_nodes_searched ), HydrusData.ToHumanInt( num_cycles ) ) )
+                return []
                 
             
             # so, now we have phash_ids and distances. let's map that to actual files.
@@ -747,6 +1159,88 @@ class ClientDBSimilarFiles( HydrusDBModule.HydrusDBModule ):
         return similar_hash_ids_and_distances
         
     
+    def SearchMany( self, hash_ids, max_hamming_distance ):
+        
+        # like Search, but for a whole batch of files at once
+        
+        hash_ids_to_similar_hash_ids_and_distances = { hash_id : [] for hash_id in hash_ids }
+        
+        if max_hamming_distance == 0:
+            
+            with HydrusDB.TemporaryIntegerTable( self._c, hash_ids, 'hash_id' ) as temp_table_name:
+                
+                # temp hashes to hash map to hash map
+                rows = self._c.execute( 'SELECT DISTINCT search_map.hash_id, result_map.hash_id FROM {} CROSS JOIN shape_perceptual_hash_map AS search_map USING ( hash_id ) CROSS JOIN shape_perceptual_hash_map AS result_map ON ( search_map.phash_id = result_map.phash_id );'.format( temp_table_name ) ).fetchall()
+                
+            
+            for ( hash_id, similar_hash_id ) in rows:
+                
+                hash_ids_to_similar_hash_ids_and_distances[ hash_id ].append( ( similar_hash_id, 0 ) )
+                
+            
+            return hash_ids_to_similar_hash_ids_and_distances
+            
+        
+        phash_index = self._GetPHashIndex()
+        
+        if phash_index is None:
+            
+            for hash_id in hash_ids:
+                
+                hash_ids_to_similar_hash_ids_and_distances[ hash_id ] = self.Search( hash_id, max_hamming_distance )
+                
+            
+            return hash_ids_to_similar_hash_ids_and_distances
+            
+        
+        with HydrusDB.TemporaryIntegerTable( self._c, hash_ids, 'hash_id' ) as temp_table_name:
+            
+            # temp hashes to hash map to phashes
+            rows = self._c.execute( 'SELECT hash_id, phash FROM {} CROSS JOIN shape_perceptual_hash_map USING ( hash_id ) CROSS JOIN shape_perceptual_hashes USING ( phash_id );'.format( temp_table_name ) ).fetchall()
+            
+        
+        if len( rows ) == 0:
+            
+            return hash_ids_to_similar_hash_ids_and_distances
+            
+        
+        ( search_hash_ids, search_phashes ) = zip( *rows )
+        
+        ( search_indices, similar_phash_ids, distances ) = phash_index.SearchMany( search_phashes, max_hamming_distance )
+        
+        with HydrusDB.TemporaryIntegerTable( self._c, set( similar_phash_ids.tolist() ), 'phash_id' ) as temp_table_name:
+            
+            # temp phashes to hash map
+            similar_phash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT phash_id, hash_id FROM {} CROSS JOIN shape_perceptual_hash_map USING ( phash_id );'.format( temp_table_name ) ) )
+            
+        
+        # files can have multiple phashes, so keep the smallest distance for each pair
+        
+        pairs_to_distances = {}
+        
+        for ( search_index, similar_phash_id, distance ) in zip( search_indices.tolist(), similar_phash_ids.tolist(), distances.tolist() ):
+            
+            hash_id = search_hash_ids[ search_index ]
+            
+            for similar_hash_id in similar_phash_ids_to_hash_ids.get( similar_phash_id, [] ):
+                
+                pair = ( hash_id, similar_hash_id )
+                
+                if pair not in pairs_to_distances or distance < pairs_to_distances[ pair ]:
+                    
+                    pairs_to_distances[ pair ] = distance
+                    
+                
+            
+        
+        for ( ( hash_id, similar_hash_id ), distance ) in pairs_to_distances.items():
+            
+            hash_ids_to_similar_hash_ids_and_distances[ hash_id ].append( ( similar_hash_id, distance ) )
+            
+        
+        return hash_ids_to_similar_hash_ids_and_distances
+        
+    
     def SetPHashes( self, hash_id, phashes ):
         
         current_phash_ids = self._STS( self._c.execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
@@ -0,0 +1,436 @@
+import collections
+import sqlite3
+import typing
+
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusDBModule
+from hydrus.core import HydrusGlobals as HG
+
+from hydrus.client import ClientThreading
+from hydrus.client.db import ClientDBMappingsStorage
+from hydrus.client.db import ClientDBServices
+
+# how many neighbours we keep for each tag. this bounds the table at about this many rows per tag, however many tags are on each file
+NUM_NEIGHBOURS_TO_KEEP = 100
+
+# a tag on more files than this has its neighbours counted from its first this-many files and scaled up. the suggestions only need the ranking
+MAX_FILES_TO_COUNT = 10000
+
+# how many dirty tags we fetch per maintenance query
+DIRTY_TAG_BLOCK_SIZE = 256
+
+def GenerateTagCooccurrenceDirtyTableName( service_id: int ) -> str:
+    
+    return 'external_caches.tag_cooccurrence_dirty_{}'.format( service_id )
+    
+def GenerateTagCooccurrenceTableName( service_id: int ) -> str:
+    
+    return 'external_caches.tag_cooccurrence_{}'.format( service_id )
+    
+class ClientDBTagCooccurrence( HydrusDBModule.HydrusDBModule ):
+    
+    # for each tag service the user turns it on for, keeps each tag's top NUM_NEIGHBOURS_TO_KEEP co-occurring tags in current storage mappings, with how many files they share
+    # ( tag_id, tag_id ) is the number of files with that tag, which we use to normalise
+    # a mapping edit only marks its tag dirty. idle maintenance recounts dirty tags and refreshes the other side of each pair it finds
+    # a new index marks every tag dirty, and until that first pass is done the caller falls back to sampling
+    
+    def __init__( self, cursor: sqlite3.Cursor, modules_services: ClientDBServices.ClientDBMasterServices ):
+        
+        self.modules_services = modules_services
+        
+        HydrusDBModule.HydrusDBModule.__init__( self, 'client tag co-occurrence', cursor )
+        
+    
+    def _AddReciprocalNeighbour( self, service_id: int, tag_id: int, other_tag_id: int, count: int ):
+        
+        # tag_id has just been counted, and shares count files with other_tag_id. other_tag_id keeps it if it is in its top NUM_NEIGHBOURS_TO_KEEP
+        
+        cooccurrence_table_name = GenerateTagCooccurrenceTableName( service_id )
+        
+        ( num_neighbours, min_count ) = self._c.execute( 'SELECT COUNT( * ), MIN( count ) FROM {} WHERE tag_id = ? AND other_tag_id != ?;'.format( cooccurrence_table_name ), ( other_tag_id, other_tag_id ) ).fetchone()
+        
+        if num_neighbours >= NUM_NEIGHBOURS_TO_KEEP and count <= min_count:
+            
+            self._c.execute( 'DELETE FROM {} WHERE tag_id = ? AND other_tag_id = ?;'.format( cooccurrence_table_name ), ( other_tag_id, tag_id ) )
+            
+            return
+            
+        
+        self._c.execute( 'REPLACE INTO {} ( tag_id, other_tag_id, count ) VALUES ( ?, ?, ? );'.format( cooccurrence_table_name ), ( other_tag_id, tag_id, count ) )
+        
+        if num_neighbours >= NUM_NEIGHBOURS_TO_KEEP:
+            
+            self._c.execute( 'DELETE FROM {} WHERE tag_id = ? AND other_tag_id IN ( SELECT other_tag_id FROM {} WHERE tag_id = ? AND other_tag_id != ? ORDER BY count ASC LIMIT ? );'.format( cooccurrence_table_name, cooccurrence_table_name ), ( other_tag_id, other_tag_id, other_tag_id, num_neighbours + 1 - NUM_NEIGHBOURS_TO_KEEP ) )
+            
+        
+    
+    def _GetInitialIndexGenerationTuples( self ):
+        
+        index_generation_tuples = []
+        
+        return index_generation_tuples
+        
+    
+    def _GetRebuildStatus( self, service_id: int ):
+        
+        # returns ( is_on, is_built )
+        
+        result = self._c.execute( 'SELECT initial_count_done FROM tag_cooccurrence_services WHERE service_id = ?;', ( service_id, ) ).fetchone()
+        
+        if result is None:
+            
+            return ( False, False )
+            
+        
+        ( initial_count_done, ) = result
+        
+        return ( True, bool( initial_count_done ) )
+        
+    
+    def _RecountTag( self, service_id: int, tag_id: int ):
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ClientDBMappingsStorage.GenerateMappingsTableNames( service_id )
+        
+        cooccurrence_table_name = GenerateTagCooccurrenceTableName( service_id )
+        
+        ( num_files, ) = self._c.execute( 'SELECT COUNT( * ) FROM {} WHERE tag_id = ?;'.format( current_mappings_table_name ), ( tag_id, ) ).fetchone()
+        
+        num_files_counted = min( num_files, MAX_FILES_TO_COUNT )
+        
+        # first hash_ids to mappings
+        other_tag_ids_and_counts = self._c.execute( 'SELECT b.tag_id, COUNT( * ) FROM ( SELECT hash_id FROM {} WHERE tag_id = ? LIMIT ? ) AS a CROSS JOIN {} AS b USING ( hash_id ) WHERE b.tag_id != ? GROUP BY b.tag_id;'.format( current_mappings_table_name, current_mappings_table_name ), ( tag_id, num_files_counted, tag_id ) ).fetchall()
+        
+        if num_files_counted < num_files:
+            
+            other_tag_ids_and_counts = [ ( other_tag_id, max( 1, round( count * num_files / num_files_counted ) ) ) for ( other_tag_id, count ) in other_tag_ids_and_counts ]
+            
+        
+        other_tag_ids_and_counts.sort( key = lambda row: row[1], reverse = True )
+        
+        self._c.execute( 'DELETE FROM {} WHERE tag_id = ?;'.format( cooccurrence_table_name ), ( tag_id, ) )
+        
+        if num_files == 0:
+            
+            self._c.execute( 'DELETE FROM {} WHERE other_tag_id = ?;'.format( cooccurrence_table_name ), ( tag_id, ) )
+            
+            return
+            
+        
+        self._c.execute( 'INSERT INTO {} ( tag_id, other_tag_id, count ) VALUES ( ?, ?, ? );'.format( cooccurrence_table_name ), ( tag_id, tag_id, num_files ) )
+        
+        self._c.executemany( 'INSERT INTO {} ( tag_id, other_tag_id, count ) VALUES ( ?, ?, ? );'.format( cooccurrence_table_name ), ( ( tag_id, other_tag_id, count ) for ( other_tag_id, count ) in other_tag_ids_and_counts[ : NUM_NEIGHBOURS_TO_KEEP ] ) )
+        
+        # now the other side of each pair. if we saw every file, a tag we did not see no longer shares any with this one
+        
+        if num_files_counted == num_files:
+            
+            self._c.execute( 'DELETE FROM {} WHERE other_tag_id = ? AND tag_id != ?;'.format( cooccurrence_table_name ), ( tag_id, tag_id ) )
+            
+        
+        for ( other_tag_id, count ) in other_tag_ids_and_counts:
+            
+            self._AddReciprocalNeighbour( service_id, tag_id, other_tag_id, count )
+            
+        
+    
+    def _ServiceHasDirtyTags( self, service_id: int ):
+        
+        dirty_table_name = GenerateTagCooccurrenceDirtyTableName( service_id )
+        
+        result = self._c.execute( 'SELECT 1 FROM {} LIMIT 1;'.format( dirty_table_name ) ).fetchone()
+        
+        return result is not None
+        
+    
+    def _SetDirty( self, service_id: int, tag_id: int, hash_ids: typing.Collection[ int ] ):
+        
+        ( is_on, is_built ) = self._GetRebuildStatus( service_id )
+        
+        if not is_on or len( hash_ids ) == 0:
+            
+            return
+            
+        
+        dirty_table_name = GenerateTagCooccurrenceDirtyTableName( service_id )
+        
+        self._c.execute( 'INSERT OR IGNORE INTO {} ( tag_id ) VALUES ( ? );'.format( dirty_table_name ), ( tag_id, ) )
+        
+    
+    def AddMappings( self, service_id: int, tag_id: int, hash_ids: typing.Collection[ int ] ):
+        
+        self._SetDirty( service_id, tag_id, hash_ids )
+        
+    
+    def CreateInitialTables( self ):
+        
+        self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.tag_cooccurrence_services ( service_id INTEGER PRIMARY KEY, initial_count_done INTEGER_BOOLEAN );' )
+        
+    
+    def DeleteMappings( self, service_id: int, tag_id: int, hash_ids: typing.Collection[ int ] ):
+        
+        self._SetDirty( service_id, tag_id, hash_ids )
+        
+    
+    def Drop( self, service_id: int ):
+        
+        cooccurrence_table_name = GenerateTagCooccurrenceTableName( service_id )
+        dirty_table_name = GenerateTagCooccurrenceDirtyTableName( service_id )
+        
+        self._c.execute( 'DROP TABLE IF EXISTS {};'.format( cooccurrence_table_name ) )
+        self._c.execute( 'DROP TABLE IF EXISTS {};'.format( dirty_table_name ) )
+        
+        self._c.execute( 'DELETE FROM tag_cooccurrence_services WHERE service_id = ?;', ( service_id, ) )
+        
+    
+    def GetExpectedTableNames( self ) -> typing.Collection[ str ]:
+        
+        expected_table_names = [
+            'external_caches.tag_cooccurrence_services'
+        ]
+        
+        return expected_table_names
+        
+    
+    def GetRelatedTagIdsAndCounts( self, service_id: int, search_tag_ids: typing.Collection[ int ], max_results: int, skip_hash_id = None ):
+        
+        # returns None if the index is off or not yet built for this service, so the caller can fall back to a scan
+        
+        ( is_on, is_built ) = self._GetRebuildStatus( service_id )
+        
+        if not is_on or not is_built:
+            
+            return None
+            
+        
+        cooccurrence_table_name = GenerateTagCooccurrenceTableName( service_id )
+        
+        search_tag_ids = set( search_tag_ids )
+        
+        # the file we are suggesting for is counted in the index, so we take its own tags back out, same as the scan skips it
+        
+        skip_tag_ids = set()
+        
+        if skip_hash_id is not None:
+            
+            ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ClientDBMappingsStorage.GenerateMappingsTableNames( service_id )
+            
+            skip_tag_ids = self._STS( self._c.execute( 'SELECT tag_id FROM {} WHERE hash_id = ?;'.format( current_mappings_table_name ), ( skip_hash_id, ) ) )
+            
+        
+        tag_ids_to_num_files = {}
+        
+        def get_num_files( tag_id ):
+            
+            if tag_id not in tag_ids_to_num_files:
+                
+                result = self._c.execute( 'SELECT count FROM {} WHERE tag_id = ? AND other_tag_id = ?;'.format( cooccurrence_table_name ), ( tag_id, tag_id ) ).fetchone()
+                
+                num_files = 0 if result is None else result[0]
+                
+                if tag_id in skip_tag_ids:
+                    
+                    num_files -= 1
+                    
+                
+                tag_ids_to_num_files[ tag_id ] = num_files
+                
+            
+            return tag_ids_to_num_files[ tag_id ]
+            
+        
+        # a raw count favours tags that are everywhere, and pmi favours tags that are on one file
+        # count * P( search tag | tag ) sits between--a tag has to be common alongside the search tag and not too common otherwise
+        
+        tag_ids_to_scores = collections.Counter()
+        tag_ids_to_counts = collections.Counter()
+        
+        for search_tag_id in search_tag_ids:
+            
+            if get_num_files( search_tag_id ) == 0:
+                
+                continue
+                
+            
+            neighbours = self._c.execute( 'SELECT other_tag_id, count FROM {} WHERE tag_id = ? AND other_tag_id != ?;'.format( cooccurrence_table_name ), ( search_tag_id, search_tag_id ) ).fetchall()
+            
+            for ( tag_id, count ) in neighbours:
+                
+                if tag_id in search_tag_ids:
+                    
+                    continue
+                    
+                
+                if search_tag_id in skip_tag_ids and tag_id in skip_tag_ids:
+                    
+                    count -= 1
+                    
+                
+                num_files = get_num_files( tag_id )
+                
+                if count <= 0 or num_files <= 0:
+                    
+                    continue
+                    
+                
+                tag_ids_to_scores[ tag_id ] += count * count / num_files
+                tag_ids_to_counts[ tag_id ] += count
+                
+            
+        
+        return [ ( tag_id, tag_ids_to_counts[ tag_id ] ) for ( tag_id, score ) in tag_ids_to_scores.most_common( max_results ) ]
+        
+    
+    def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> typing.List[ typing.Tuple[ str, str ] ]:
+        
+        if content_type == HC.CONTENT_TYPE_TAG:
+            
+            tables_and_columns = []
+            
+            for service_id in self._STL( self._c.execute( 'SELECT service_id FROM tag_cooccurrence_services;' ) ):
+                
+                cooccurrence_table_name = GenerateTagCooccurrenceTableName( service_id )
+                dirty_table_name = GenerateTagCooccurrenceDirtyTableName( service_id )
+                
+                tables_and_columns.extend( [
+                    ( cooccurrence_table_name, 'tag_id' ),
+                    ( cooccurrence_table_name, 'other_tag_id' ),
+                    ( dirty_table_name, 'tag_id' )
+                ] )
+                
+            
+            return tables_and_columns
+            
+        
+        return []
+        
+    
+    def IsOn( self, service_id: int ) -> bool:
+        
+        ( is_on, is_built ) = self._GetRebuildStatus( service_id )
+        
+        return is_on
+        
+    
+    def MaintainIndex( self, maintenance_mode = HC.MAINTENANCE_FORCED, job_key = None, stop_time = None ):
+        
+        service_ids = [ service_id for service_id in self._STL( self._c.execute( 'SELECT service_id FROM tag_cooccurrence_services;' ) ) if self._ServiceHasDirtyTags( service_id ) ]
+        
+        if len( service_ids ) == 0:
+            
+            return
+            
+        
+        time_started = HydrusData.GetNow()
+        pub_job_key = False
+        job_key_pubbed = False
+        
+        if job_key is None:
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+            pub_job_key = True
+            
+        
+        try:
+            
+            job_key.SetVariable( 'popup_title', 'tag co-occurrence index maintenance' )
+            
+            for service_id in service_ids:
+                
+                dirty_table_name = GenerateTagCooccurrenceDirtyTableName( service_id )
+                
+                service_name = self.modules_services.GetService( service_id ).GetName()
+                
+                num_done = 0
+                
+                while True:
+                    
+                    dirty_tag_ids = self._STL( self._c.execute( 'SELECT tag_id FROM {} LIMIT ?;'.format( dirty_table_name ), ( DIRTY_TAG_BLOCK_SIZE, ) ) )
+                    
+                    if len( dirty_tag_ids ) == 0:
+                        
+                        self._c.execute( 'UPDATE tag_cooccurrence_services SET initial_count_done = ? WHERE service_id = ?;', ( True, service_id ) )
+                        
+                        break
+                        
+                    
+                    ( num_to_do, ) = self._c.execute( 'SELECT COUNT( * ) FROM {};'.format( dirty_table_name ) ).fetchone()
+                    
+                    for tag_id in dirty_tag_ids:
+                        
+                        if pub_job_key and not job_key_pubbed and HydrusData.TimeHasPassed( time_started + 5 ):
+                            
+                            HG.client_controller.pub( 'modal_message', job_key )
+                            
+                            job_key_pubbed = True
+                            
+                        
+                        ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                        
+                        should_stop = HG.client_controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time )
+                        
+                        if should_quit or should_stop:
+                            
+                            return
+                            
+                        
+                        if num_done % 10 == 0:
+                            
+                            text = 'counting {} tag co-occurrences - {} tags left'.format( service_name, HydrusData.ToHumanInt( num_to_do ) )
+                            
+                            HG.client_controller.frame_splash_status.SetSubtext( text )
+                            job_key.SetVariable( 'popup_text_1', text )
+                            
+                        
+                        self._RecountTag( service_id, tag_id )
+                        
+                        self._c.execute( 'DELETE FROM {} WHERE tag_id = ?;'.format( dirty_table_name ), ( tag_id, ) )
+                        
+                        num_done += 1
+                        num_to_do -= 1
+                        
+                    
+                
+            
+        finally:
+            
+            job_key.SetVariable( 'popup_text_1', 'done!' )
+            
+            job_key.Finish()
+            job_key.Delete( 5 )
+            
+        
+    
+    def MaintenanceDue( self ):
+        
+        service_ids = self._STL( self._c.execute( 'SELECT service_id FROM tag_cooccurrence_services;' ) )
+        
+        return True in ( self._ServiceHasDirtyTags( service_id ) for service_id in service_ids )
+        
+    
+    def Regenerate( self, service_id: int ):
+        
+        # clears the index and marks every tag dirty. the actual counting happens in MaintainIndex
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ClientDBMappingsStorage.GenerateMappingsTableNames( service_id )
+        
+        cooccurrence_table_name = GenerateTagCooccurrenceTableName( service_id )
+        dirty_table_name = GenerateTagCooccurrenceDirtyTableName( service_id )
+        
+        self._c.execute( 'DROP TABLE IF EXISTS {};'.format( cooccurrence_table_name ) )
+        self._c.execute( 'DROP TABLE IF EXISTS {};'.format( dirty_table_name ) )
+        
+        self._c.execute( 'CREATE TABLE {} ( tag_id INTEGER, other_tag_id INTEGER, count INTEGER, PRIMARY KEY ( tag_id, other_tag_id ) ) WITHOUT ROWID;'.format( cooccurrence_table_name ) )
+        
+        self._CreateIndex( cooccurrence_table_name, [ 'tag_id', 'count' ] )
+        self._CreateIndex( cooccurrence_table_name, [ 'other_tag_id' ] )
+        
+        self._c.execute( 'CREATE TABLE {} ( tag_id INTEGER PRIMARY KEY );'.format( dirty_table_name ) )
+        
+        # the mappings primary key is ( tag_id, hash_id ), so this walks it in order
+        self._c.execute( 'INSERT INTO {} ( tag_id ) SELECT DISTINCT tag_id FROM {};'.format( dirty_table_name, current_mappings_table_name ) )
+        
+        self._c.execute( 'REPLACE INTO tag_cooccurrence_services ( service_id, initial_count_done ) VALUES ( ?, ? );', ( service_id, False ) )
+        
+    
@@ -1,6 +1,5 @@
 import collections
 import gc
-import hashlib
 import os
 import random
 import re
@@ -38,6 +37,7 @@ from hydrus.client import ClientExporting
 from hydrus.client import ClientParsing
 from hydrus.client import ClientPaths
 from hydrus.client import ClientRendering
+from hydrus.client import ClientSearch
 from hydrus.client import ClientServices
 from hydrus.client import ClientThreading
 from hydrus.client.gui import ClientGUIAsync
@@ -535,6 +535,7 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         library_versions.append( ( 'temp dir', HydrusPaths.GetCurrentTempDir() ) )
         library_versions.append( ( 'db journal mode', HG.db_journal_mode ) )
         library_versions.append( ( 'db cache size per file', '{}MB'.format( HG.db_cache_size ) ) )
+        library_versions.append( ( 'db read pool size', str( HG.db_read_pool_size ) ) )
         library_versions.append( ( 'db synchronous value', str( HG.db_synchronous ) ) )
         library_versions.append( ( 'db using memory for temp?', str( HG.no_db_temp_files ) ) )
         
@@ -718,19 +719,49 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         
         text = action + ' backup at "' + path + '"?'
         text += os.linesep * 2
-        text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
         
-        result = ClientGUIDialogsQuick.GetYesNo( self, text )
-        
-        if result == QW.QDialog.Accepted:
+        if HG.db_journal_mode == 'WAL':
             
-            session = self._notebook.GetCurrentGUISession( 'last session' )
+            text += 'An online backup copies the database while it stays open, so you can keep working. Only files added or deleted since the last online backup are copied or removed.'
+            text += os.linesep * 2
+            text += 'An offline backup locks the database while it occurs, which may lock up your gui as well, but it checks every file in your file storage.'
             
-            self._controller.SaveGUISession( session )
+            ( result, was_cancelled ) = ClientGUIDialogsQuick.GetYesNo( self, text, title = 'Choose how to back up.', yes_label = 'online', no_label = 'offline', check_for_cancelled = True )
             
-            session.SetName( 'exit session' )
+            if was_cancelled:
+                
+                return
+                
             
-            self._controller.SaveGUISession( session )
+            do_online = result == QW.QDialog.Accepted
+            
+        else:
+            
+            text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
+            
+            result = ClientGUIDialogsQuick.GetYesNo( self, text )
+            
+            if result != QW.QDialog.Accepted:
+                
+                return
+                
+            
+            do_online = False
+            
+        
+        session = self._notebook.GetCurrentGUISession( 'last session' )
+        
+        self._controller.SaveGUISession( session )
+        
+        session.SetName( 'exit session' )
+        
+        self._controller.SaveGUISession( session )
+        
+        if do_online:
+            
+            self._controller.CallToThread( self._controller.db.BackupOnline, path )
+            
+        else:
             
             self._controller.Write( 'backup', path )
             
@@ -1171,6 +1202,13 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
             
         
     
+    def _DebugShowCacheStatistics( self ):
+        
+        HydrusData.ShowText( 'image cache: ' + self._controller.GetCache( 'images' ).GetPrettyCacheStatistics() )
+        HydrusData.ShowText( 'thumbnail cache: ' + self._controller.GetCache( 'thumbnail' ).GetPrettyCacheStatistics() )
+        HydrusData.ShowText( 'thumbnail store: ' + self._controller.client_files_manager.GetThumbnailStoreStatistics() )
+        
+    
     def _DebugShowGarbageDifferences( self ):
         
         count = collections.Counter()
@@ -1358,6 +1396,27 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
             
         
     
+    def _DeleteTagCooccurrenceIndex( self ):
+        
+        message = 'This deletes the related tags co-occurrence index for one or all tag services and stops keeping it up to date. Related tag suggestions will go back to sampling files on every request.'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, message, yes_label = 'do it--now choose which service', no_label = 'forget it' )
+        
+        if result == QW.QDialog.Accepted:
+            
+            try:
+                
+                tag_service_key = GetTagServiceKeyForMaintenance( self )
+                
+            except HydrusExceptions.CancelledException:
+                
+                return
+                
+            
+            self._controller.Write( 'delete_tag_cooccurrence_index', tag_service_key = tag_service_key )
+            
+        
+    
     def _DestroyPages( self, pages ):
         
         for page in pages:
@@ -1604,7 +1663,7 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
                             update_network_bytes = f.read()
                             
                         
-                        update_network_string_hash = hashlib.sha256( update_network_bytes ).digest()
+                        update_network_string_hash = HydrusNetwork.GetUpdateHashFromNetworkBytes( update_network_bytes )
                         
                         try:
                             
@@ -2253,6 +2312,10 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
                         self._controller.Write( 'delete_serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_IMPORT_FOLDER, name )
                         
                     
+                    from hydrus.client.importing import ClientImportLocal
+                    
+                    ClientImportLocal.PruneImportFolderDirectoryTrackers( { import_folder.GetPath() for import_folder in import_folders } )
+                    
                     self._controller.pub( 'notify_new_import_folders' )
                     
                 
@@ -3226,6 +3289,31 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
             
         
     
+    def _RegenerateTagCooccurrenceIndex( self ):
+        
+        message = 'This will (re)build an index of which tags appear together on the same files, for one or all tag services. Once it is built, related tag suggestions are instant and complete, rather than sampled against a time limit.'
+        message += os.linesep * 2
+        message += 'The counting happens in idle maintenance time, and related tags will use the old sampling until it is done. When mappings change, the tags involved are recounted in later idle time, so suggestions for just-edited tags can lag a little.'
+        message += os.linesep * 2
+        message += 'Only the most common co-occurring tags are kept for each tag, so the index stays a manageable size, but on a service with millions of tags, like the PTR, the first count will take a long time. Consider only turning it on for your local tag services.'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, message, yes_label = 'do it--now choose which service', no_label = 'forget it' )
+        
+        if result == QW.QDialog.Accepted:
+            
+            try:
+                
+                tag_service_key = GetTagServiceKeyForMaintenance( self )
+                
+            except HydrusExceptions.CancelledException:
+                
+                return
+                
+            
+            self._controller.Write( 'regenerate_tag_cooccurrence_index', tag_service_key = tag_service_key )
+            
+        
+    
     def _RegenerateTagParentsLookupCache( self ):
         
         message = 'This will delete and then recreate the tag parents lookup cache, which is used for all basic tag parents operations. This is useful if it has become damaged or otherwise desynchronised.'
@@ -3410,6 +3498,112 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         self._controller.pub( 'notify_new_export_folders' )
         
     
+    def _RunAutocompleteBenchmark( self ):
+        
+        def do_it( controller, tags ):
+            
+            # replay every prefix the user would type, as autocomplete would see it
+            
+            search_texts = []
+            
+            for tag in tags:
+                
+                for i in range( 1, len( tag ) + 1 ):
+                    
+                    search_texts.append( tag[ : i ] + '*' )
+                    
+                
+            
+            tag_search_context = ClientSearch.TagSearchContext( service_key = CC.COMBINED_TAG_SERVICE_KEY )
+            file_service_key = CC.COMBINED_LOCAL_FILE_SERVICE_KEY
+            
+            original_value = controller.new_options.GetBoolean( 'autocomplete_subtag_prefix_index' )
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+            job_key.SetVariable( 'popup_title', 'autocomplete benchmark' )
+            
+            controller.pub( 'message', job_key )
+            
+            lines = []
+            
+            # the read pool only ever searches the tables, so keep both runs on the main connection for a fair comparison
+            
+            if controller.db.ReadPoolIsRunning():
+                
+                lines.append( 'the read pool was turned off for this benchmark, so every search went through the main db connection' )
+                
+            
+            original_read_pool_enabled = controller.db.ReadPoolIsEnabled()
+            
+            controller.db.SetReadPoolEnabled( False )
+            
+            try:
+                
+                for ( label, value ) in ( ( 'tables', False ), ( 'in-memory index', True ) ):
+                    
+                    controller.new_options.SetBoolean( 'autocomplete_subtag_prefix_index', value )
+                    
+                    # a first read builds the index, so keep that out of the timings
+                    
+                    controller.Read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_ACTUAL, tag_search_context, file_service_key, search_text = search_texts[0] )
+                    
+                    times = []
+                    num_results = 0
+                    
+                    for ( i, search_text ) in enumerate( search_texts ):
+                        
+                        if job_key.IsCancelled():
+                            
+                            return
+                            
+                        
+                        job_key.SetVariable( 'popup_text_1', '{}: {}'.format( label, HydrusData.ConvertValueRangeToPrettyString( i + 1, len( search_texts ) ) ) )
+                        
+                        time_started = HydrusData.GetNowPrecise()
+                        
+                        predicates = controller.Read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_ACTUAL, tag_search_context, file_service_key, search_text = search_text )
+                        
+                        times.append( HydrusData.GetNowPrecise() - time_started )
+                        
+                        num_results += len( predicates )
+                        
+                    
+                    times.sort()
+                    
+                    lines.append( '{}: {} searches, {} results, total {}, median {}, worst {}'.format( label, HydrusData.ToHumanInt( len( times ) ), HydrusData.ToHumanInt( num_results ), HydrusData.TimeDeltaToPrettyTimeDelta( sum( times ) ), HydrusData.TimeDeltaToPrettyTimeDelta( times[ len( times ) // 2 ] ), HydrusData.TimeDeltaToPrettyTimeDelta( times[-1] ) ) )
+                    
+                
+            finally:
+                
+                controller.new_options.SetBoolean( 'autocomplete_subtag_prefix_index', original_value )
+                
+                controller.db.SetReadPoolEnabled( original_read_pool_enabled )
+                
+                job_key.Delete()
+                
+            
+            HydrusData.ShowText( 'autocomplete benchmark:' + os.linesep * 2 + os.linesep.join( lines ) )
+            
+        
+        message = 'Enter some tags to type, separated by commas. Every prefix of each will be searched, once against the database tables and once against the in-memory subtag index.'
+        
+        with ClientGUIDialogs.DialogTextEntry( self, message, default = 'samus aran, character:princess peach, blue eyes' ) as dlg:
+            
+            if dlg.exec() == QW.QDialog.Accepted:
+                
+                tags = [ tag.strip() for tag in dlg.GetValue().split( ',' ) ]
+                
+                tags = [ tag for tag in tags if tag != '' ]
+                
+                if len( tags ) > 0:
+                    
+                    self._controller.CallToThread( do_it, self._controller, tags )
+                    
+                
+            
+        
+    
     def _RunClientAPITest( self ):
         
         # this is not to be a comprehensive test of client api functions, but a holistic sanity check to make sure everything is wired up right at UI level, with a live functioning client
@@ -3665,78 +3859,734 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         HG.client_controller.CallToThread( do_it )
         
     
-    def _RunUITest( self ):
+    def _RunDataCacheBenchmark( self ):
         
-        def qt_open_pages():
-            
-            page_of_pages = self._notebook.NewPagesNotebook( on_deepest_notebook = False, select_page = True )
-            
-            t = 0.25
-            
-            HG.client_controller.CallLaterQtSafe(self, t, self._notebook.NewPageQuery, CC.LOCAL_FILE_SERVICE_KEY, page_name ='test', on_deepest_notebook = True)
-            
-            t += 0.25
+        from hydrus.client import ClientCaches
+        
+        class FakeThumbnail( object ):
             
-            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_PAGE_OF_PAGES))
+            def GetEstimatedMemoryFootprint( self ):
+                
+                return 1
+                
             
-            t += 0.25
+        
+        def do_it( cache_size, num_hot, num_scroll, num_rounds ):
             
-            HG.client_controller.CallLaterQtSafe(self, t, page_of_pages.NewPageQuery, CC.LOCAL_FILE_SERVICE_KEY, page_name ='test', on_deepest_notebook = False)
+            job_key = ClientThreading.JobKey( cancellable = True )
             
-            t += 0.25
+            job_key.SetVariable( 'popup_title', 'data cache benchmark' )
             
-            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_DUPLICATE_FILTER_PAGE))
+            HG.client_controller.pub( 'message', job_key )
             
-            t += 0.25
+            lines = []
             
-            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_GALLERY_DOWNLOADER_PAGE))
+            try:
+                
+                # the user flicks around a few pages they care about, and now and then scrolls through a huge page once
+                
+                trace = []
+                
+                hot_keys = [ ( 'hot', i ) for i in range( num_hot ) ]
+                
+                scroll_position = 0
+                
+                for i in range( num_rounds ):
+                    
+                    trace.extend( random.sample( hot_keys, len( hot_keys ) ) )
+                    
+                    trace.extend( ( ( 'scroll', j ) for j in range( scroll_position, scroll_position + num_scroll ) ) )
+                    
+                    scroll_position += num_scroll
+                    
+                
+                lines.append( 'trace: {} lookups, {} hot thumbnails, {} scrolled past once, cache holds {}'.format( HydrusData.ToHumanInt( len( trace ) ), HydrusData.ToHumanInt( num_hot ), HydrusData.ToHumanInt( scroll_position ), HydrusData.ToHumanInt( cache_size ) ) )
+                
+                for ( name, eviction_policy ) in ( ( 'lru', ClientCaches.CACHE_EVICTION_LRU ), ( '2Q', ClientCaches.CACHE_EVICTION_2Q ) ):
+                    
+                    job_key.SetVariable( 'popup_text_1', 'running ' + name )
+                    
+                    if job_key.IsCancelled():
+                        
+                        return
+                        
+                    
+                    data_cache = ClientCaches.DataCache( HG.client_controller, cache_size, eviction_policy = eviction_policy )
+                    
+                    time_started = HydrusData.GetNowPrecise()
+                    
+                    for key in trace:
+                        
+                        if data_cache.GetIfHasData( key ) is None:
+                            
+                            data_cache.AddData( key, FakeThumbnail() )
+                            
+                        
+                    
+                    time_taken = HydrusData.GetNowPrecise() - time_started
+                    
+                    statistics = data_cache.GetStatistics()
+                    
+                    hit_rate = statistics[ 'num_hits' ] / max( 1, statistics[ 'num_hits' ] + statistics[ 'num_misses' ] )
+                    
+                    lines.append( '{}: {} hit rate, {} evictions, {} per lookup'.format( name, HydrusData.ConvertFloatToPercentage( hit_rate ), HydrusData.ToHumanInt( statistics[ 'num_evictions' ] ), HydrusData.TimeDeltaToPrettyTimeDelta( time_taken / len( trace ) ) ) )
+                    
+                
+            finally:
+                
+                job_key.Delete()
+                
             
-            t += 0.25
+            HydrusData.ShowText( 'data cache benchmark:' + os.linesep * 2 + os.linesep.join( lines ) )
             
-            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_SIMPLE_DOWNLOADER_PAGE))
+        
+        message = 'This will replay a made-up thumbnail viewing trace, a few pages looked at again and again with a long one-off scroll in between, through an lru and a 2Q data cache and report hit rates and the cost per lookup. It does not touch your real caches or your database. Go?'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, message )
+        
+        if result == QW.QDialog.Accepted:
             
-            t += 0.25
+            self._controller.CallToThread( do_it, 2000, 1000, 5000, 20 )
             
-            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_URL_DOWNLOADER_PAGE))
+        
+    
+    def _RunDBReadPoolBenchmark( self ):
+        
+        def do_it( controller ):
             
-            t += 0.25
+            if not controller.db.ReadPoolIsRunning():
+                
+                HydrusData.ShowText( 'The db read pool is not running, so there is nothing to compare! Launch the client with --db_read_pool_size and WAL journalling to try it.' )
+                
+                return
+                
             
-            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_WATCHER_DOWNLOADER_PAGE))
+            file_search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY )
+            tag_search_context = ClientSearch.TagSearchContext()
             
-            t += 0.25
+            all_hash_ids = list( controller.Read( 'file_query_ids', file_search_context ) )
             
-            HG.client_controller.CallLaterQtSafe(self, t, self.ProposeSaveGUISession, 'last session' )
+            if len( all_hash_ids ) == 0:
+                
+                HydrusData.ShowText( 'The read pool benchmark needs some files in \'my files\' to read!' )
+                
+                return
+                
             
-            return page_of_pages
+            # the mixed load: one caller keeps running a full file search, like a big client api query, while the others do thumbnail and autocomplete sized reads
             
-        
-        def qt_close_unclose_one_page():
+            def slow_reads( stop_time ):
+                
+                while not HydrusData.TimeHasPassedPrecise( stop_time ):
+                    
+                    controller.Read( 'file_query_ids', file_search_context )
+                    
+                
             
-            self._notebook.CloseCurrentPage()
+            def fast_reads( stop_time, caller_index, counts ):
+                
+                r = random.Random( caller_index )
+                
+                num_done = 0
+                
+                while not HydrusData.TimeHasPassedPrecise( stop_time ):
+                    
+                    if num_done % 2 == 0:
+                        
+                        controller.Read( 'media_results_from_ids', r.sample( all_hash_ids, min( 64, len( all_hash_ids ) ) ) )
+                        
+                    else:
+                        
+                        controller.Read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_ACTUAL, tag_search_context, CC.COMBINED_LOCAL_FILE_SERVICE_KEY, search_text = r.choice( 'abcdefghijklmnopqrstuvwxyz' ) + '*' )
+                        
+                    
+                    num_done += 1
+                    
+                
+                counts[ caller_index ] = num_done
+                
             
-            HG.client_controller.CallLaterQtSafe(self, 0.5, self._UnclosePage)
+            run_time = 5
             
-        
-        def qt_close_pages( page_of_pages ):
+            job_key = ClientThreading.JobKey( cancellable = True )
             
-            indices = list( range( page_of_pages.count() ) )
+            job_key.SetVariable( 'popup_title', 'db read pool benchmark' )
             
-            indices.reverse()
+            controller.pub( 'message', job_key )
             
-            t = 0.0
+            lines = []
             
-            for i in indices:
-                
-                HG.client_controller.CallLaterQtSafe(self, t, page_of_pages._ClosePage, i)
+            if controller.new_options.GetBoolean( 'autocomplete_subtag_prefix_index' ):
                 
-                t += 0.25
+                lines.append( 'the in-memory subtag index is on, so the autocomplete reads always went through the main db connection' )
                 
             
-            t += 0.25
-            
-            HG.client_controller.CallLaterQtSafe(self, t, self._notebook.CloseCurrentPage)
+            original_read_pool_enabled = controller.db.ReadPoolIsEnabled()
             
-            t += 0.25
+            try:
+                
+                for ( label, value ) in ( ( 'pool off', False ), ( 'pool on', True ) ):
+                    
+                    controller.db.SetReadPoolEnabled( value )
+                    
+                    for num_callers in ( 1, 2, 4, 8 ):
+                        
+                        if job_key.IsCancelled():
+                            
+                            return
+                            
+                        
+                        job_key.SetVariable( 'popup_text_1', '{}, {} callers'.format( label, num_callers ) )
+                        
+                        stop_time = HydrusData.GetNowPrecise() + run_time
+                        
+                        counts = [ 0 ] * num_callers
+                        
+                        threads = [ threading.Thread( target = slow_reads, args = ( stop_time, ) ) ]
+                        
+                        threads.extend( ( threading.Thread( target = fast_reads, args = ( stop_time, i, counts ) ) for i in range( num_callers ) ) )
+                        
+                        for thread in threads:
+                            
+                            thread.start()
+                            
+                        
+                        for thread in threads:
+                            
+                            thread.join()
+                            
+                        
+                        lines.append( '{}, {} callers: {} reads/s'.format( label, num_callers, HydrusData.ToHumanInt( int( sum( counts ) / run_time ) ) ) )
+                        
+                    
+                
+            finally:
+                
+                controller.db.SetReadPoolEnabled( original_read_pool_enabled )
+                
+                job_key.Delete()
+                
+            
+            HydrusData.ShowText( 'db read pool benchmark:' + os.linesep * 2 + os.linesep.join( lines ) )
+            
+        
+        message = 'This will run a mixed load of reads against your database for about 40 seconds, once with the read pool off and once with it on. It is safe, but the client will be sluggish while it runs. Go?'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, message )
+        
+        if result == QW.QDialog.Accepted:
+            
+            self._controller.CallToThread( do_it, self._controller )
+            
+        
+    
+    def _RunFileSeedCacheBenchmark( self ):
+        
+        from hydrus.client.importing import ClientImportFileSeeds
+        
+        def do_it( num_file_seeds, num_to_work ):
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+            job_key.SetVariable( 'popup_title', 'file seed cache benchmark' )
+            
+            HG.client_controller.pub( 'message', job_key )
+            
+            lines = []
+            
+            try:
+                
+                job_key.SetVariable( 'popup_text_1', 'creating file seeds' )
+                
+                file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, os.path.join( 'benchmark', '{}.jpg'.format( i ) ) ) for i in range( num_file_seeds ) ]
+                
+                file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+                
+                job_key.SetVariable( 'popup_text_1', 'adding file seeds' )
+                
+                time_started = HydrusData.GetNowPrecise()
+                
+                file_seed_cache.AddFileSeeds( file_seeds )
+                
+                lines.append( 'adding {} file seeds: {}'.format( HydrusData.ToHumanInt( num_file_seeds ), HydrusData.TimeDeltaToPrettyTimeDelta( HydrusData.GetNowPrecise() - time_started ) ) )
+                
+                # work through the queue like a downloader does, asking for the next seed and whether there is more to do each time
+                
+                time_started = HydrusData.GetNowPrecise()
+                
+                for i in range( num_to_work ):
+                    
+                    if i % 1000 == 0:
+                        
+                        if job_key.IsCancelled():
+                            
+                            return
+                            
+                        
+                        job_key.SetVariable( 'popup_text_1', 'working: {}'.format( HydrusData.ConvertValueRangeToPrettyString( i, num_to_work ) ) )
+                        
+                    
+                    file_seed = file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+                    
+                    file_seed.SetStatus( random.choice( ( CC.STATUS_SUCCESSFUL_AND_NEW, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, CC.STATUS_ERROR ) ) )
+                    
+                    file_seed_cache.WorkToDo()
+                    
+                
+                time_taken = HydrusData.GetNowPrecise() - time_started
+                
+                lines.append( 'working {} file seeds, next seed and work to do check each: {}, {} per file seed'.format( HydrusData.ToHumanInt( num_to_work ), HydrusData.TimeDeltaToPrettyTimeDelta( time_taken ), HydrusData.TimeDeltaToPrettyTimeDelta( time_taken / num_to_work ) ) )
+                
+                num_lookups = 100
+                
+                time_started = HydrusData.GetNowPrecise()
+                
+                for i in range( num_lookups ):
+                    
+                    file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+                    file_seed_cache.GetFileSeedCount( CC.STATUS_ERROR )
+                    
+                
+                indexed_time = ( HydrusData.GetNowPrecise() - time_started ) / num_lookups
+                
+                # what the cache used to do, for comparison
+                
+                time_started = HydrusData.GetNowPrecise()
+                
+                for i in range( num_lookups ):
+                    
+                    next( ( file_seed for file_seed in file_seeds if file_seed.status == CC.STATUS_UNKNOWN ), None )
+                    len( [ file_seed for file_seed in file_seeds if file_seed.status == CC.STATUS_ERROR ] )
+                    
+                
+                scan_time = ( HydrusData.GetNowPrecise() - time_started ) / num_lookups
+                
+                lines.append( 'next seed plus an error count: {} indexed, {} with a full list scan'.format( HydrusData.TimeDeltaToPrettyTimeDelta( indexed_time ), HydrusData.TimeDeltaToPrettyTimeDelta( scan_time ) ) )
+                
+                counts_match = all( ( file_seed_cache.GetFileSeedCount( status ) == len( [ file_seed for file_seed in file_seeds if file_seed.status == status ] ) for status in ( CC.STATUS_UNKNOWN, CC.STATUS_SUCCESSFUL_AND_NEW, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, CC.STATUS_ERROR ) ) )
+                
+                lines.append( 'indexed counts match a full scan: {}'.format( counts_match ) )
+                
+            finally:
+                
+                job_key.Delete()
+                
+            
+            HydrusData.ShowText( 'file seed cache benchmark:' + os.linesep * 2 + os.linesep.join( lines ) )
+            
+        
+        message = 'This will make a file seed cache of 500,000 fake file paths in memory and work through some of it like a downloader. It does not touch your database, but it will use a few hundred MB and take a minute. Go?'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, message )
+        
+        if result == QW.QDialog.Accepted:
+            
+            self._controller.CallToThread( do_it, 500000, 20000 )
+            
+        
+    
+    def _RunHTMLParsingBenchmark( self ):
+        
+        from hydrus.client import ClientDefaults
+        
+        def get_formulae( page_parser ):
+            
+            formulae = []
+            
+            def add_formula( formula ):
+                
+                if isinstance( formula, ClientParsing.ParseFormulaCompound ):
+                    
+                    for sub_formula in formula.GetFormulae():
+                        
+                        add_formula( sub_formula )
+                        
+                    
+                else:
+                    
+                    formulae.append( formula )
+                    
+                
+            
+            def add_page_parser( page_parser ):
+                
+                ( sub_page_parsers, content_parsers ) = page_parser.GetContentParsers()
+                
+                for ( formula, sub_page_parser ) in sub_page_parsers:
+                    
+                    add_formula( formula )
+                    
+                    add_page_parser( sub_page_parser )
+                    
+                
+                for content_parser in content_parsers:
+                    
+                    ( name, content_type, formula, additional_info ) = content_parser.ToTuple()
+                    
+                    add_formula( formula )
+                    
+                
+            
+            add_page_parser( page_parser )
+            
+            return formulae
+            
+        
+        def do_it( num_filler_elements, num_runs ):
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+            job_key.SetVariable( 'popup_title', 'html parsing benchmark' )
+            
+            HG.client_controller.pub( 'message', job_key )
+            
+            new_options = HG.client_controller.new_options
+            
+            original_use_lxml = new_options.GetBoolean( 'parse_html_with_lxml_fast_path' )
+            
+            lines = []
+            
+            try:
+                
+                # the shipped parsers do not come with their example pages, so we make one for each that has something for every formula, padded out to a normal page size
+                
+                filler = '<div class="filler"><a href="/filler">filler link</a> <span>filler text</span></div>' * num_filler_elements
+                
+                page_parsers_and_htmls = []
+                
+                for page_parser in ClientDefaults.GetDefaultParsers():
+                    
+                    formulae = get_formulae( page_parser )
+                    
+                    if len( formulae ) == 0 or False in ( isinstance( formula, ClientParsing.ParseFormulaHTML ) for formula in formulae ):
+                        
+                        continue
+                        
+                    
+                    html = ClientParsing.GenerateExampleHTMLForPageParser( page_parser ).replace( '<body>', '<body>' + filler, 1 )
+                    
+                    page_parsers_and_htmls.append( ( page_parser, html ) )
+                    
+                
+                lines.append( '{} shipped html parsers, example pages of about {}, each parsed {} times'.format( HydrusData.ToHumanInt( len( page_parsers_and_htmls ) ), HydrusData.ToHumanBytes( sum( ( len( html ) for ( page_parser, html ) in page_parsers_and_htmls ) ) // max( 1, len( page_parsers_and_htmls ) ) ), HydrusData.ToHumanInt( num_runs ) ) )
+                
+                use_lxml_to_times = {}
+                use_lxml_to_results = {}
+                
+                for use_lxml in ( False, True ):
+                    
+                    new_options.SetBoolean( 'parse_html_with_lxml_fast_path', use_lxml )
+                    
+                    results = []
+                    
+                    time_started = HydrusData.GetNowPrecise()
+                    
+                    for ( i, ( page_parser, html ) ) in enumerate( page_parsers_and_htmls ):
+                        
+                        if job_key.IsCancelled():
+                            
+                            return
+                            
+                        
+                        job_key.SetVariable( 'popup_text_1', '{}: {}'.format( 'lxml' if use_lxml else 'soup', HydrusData.ConvertValueRangeToPrettyString( i + 1, len( page_parsers_and_htmls ) ) ) )
+                        
+                        for run in range( num_runs ):
+                            
+                            # a fresh string each time, so the parsing cache does not hand us the tree from last time
+                            
+                            result = page_parser.Parse( {}, html + '<!-- {} -->'.format( run ) )
+                            
+                        
+                        results.append( result )
+                        
+                    
+                    use_lxml_to_times[ use_lxml ] = HydrusData.GetNowPrecise() - time_started
+                    use_lxml_to_results[ use_lxml ] = results
+                    
+                
+                num_parses = max( 1, len( page_parsers_and_htmls ) * num_runs )
+                
+                soup_time = use_lxml_to_times[ False ]
+                lxml_time = use_lxml_to_times[ True ]
+                
+                lines.append( 'lxml path off: {}, {} per page'.format( HydrusData.TimeDeltaToPrettyTimeDelta( soup_time ), HydrusData.TimeDeltaToPrettyTimeDelta( soup_time / num_parses ) ) )
+                lines.append( 'lxml path on: {}, {} per page'.format( HydrusData.TimeDeltaToPrettyTimeDelta( lxml_time ), HydrusData.TimeDeltaToPrettyTimeDelta( lxml_time / num_parses ) ) )
+                lines.append( 'speedup: {:.2f}x'.format( soup_time / max( lxml_time, 0.000001 ) ) )
+                
+                mismatched_names = [ page_parser.GetName() for ( ( page_parser, html ), soup_result, lxml_result ) in zip( page_parsers_and_htmls, use_lxml_to_results[ False ], use_lxml_to_results[ True ] ) if soup_result != lxml_result ]
+                
+                if len( mismatched_names ) == 0:
+                    
+                    lines.append( 'every parser got the same results both ways' )
+                    
+                else:
+                    
+                    lines.append( 'these parsers got different results: ' + ', '.join( mismatched_names ) )
+                    
+                
+            finally:
+                
+                new_options.SetBoolean( 'parse_html_with_lxml_fast_path', original_use_lxml )
+                
+                job_key.Delete()
+                
+            
+            HydrusData.ShowText( 'html parsing benchmark:' + os.linesep * 2 + os.linesep.join( lines ) )
+            
+        
+        if not ClientParsing.LXML_IS_OK:
+            
+            QW.QMessageBox.information( self, 'Information', 'This client does not have lxml, so there is nothing to compare!' )
+            
+            return
+            
+        
+        message = 'This will make an example page for each of the shipped html parsers and parse them with the lxml fast path off and then on, reporting the times and whether the results match. It does not touch your database. Go?'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, message )
+        
+        if result == QW.QDialog.Accepted:
+            
+            self._controller.CallToThread( do_it, 1000, 5 )
+            
+        
+    
+    def _RunStringProcessingBenchmark( self ):
+        
+        def do_it( num_strings, num_runs ):
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+            job_key.SetVariable( 'popup_title', 'string processing benchmark' )
+            
+            HG.client_controller.pub( 'message', job_key )
+            
+            lines = []
+            
+            try:
+                
+                # something like a tag parser: filter, strip the prefix, split, clean up, filter again, namespace
+                
+                conversions = []
+                
+                conversions.append( ( ClientParsing.STRING_CONVERSION_REGEX_SUB, ( r'_?\(\d+\)$', '' ) ) )
+                conversions.append( ( ClientParsing.STRING_CONVERSION_REGEX_SUB, ( '_+', ' ' ) ) )
+                conversions.append( ( ClientParsing.STRING_CONVERSION_CLIP_TEXT_FROM_BEGINNING, 64 ) )
+                
+                processing_steps = []
+                
+                processing_steps.append( ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_REGEX, match_value = '^tag:' ) )
+                processing_steps.append( ClientParsing.StringConverter( conversions = [ ( ClientParsing.STRING_CONVERSION_REMOVE_TEXT_FROM_BEGINNING, 4 ) ] ) )
+                processing_steps.append( ClientParsing.StringSplitter( separator = ', ' ) )
+                processing_steps.append( ClientParsing.StringConverter( conversions = conversions ) )
+                processing_steps.append( ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_REGEX, match_value = '^[a-z][a-z0-9 ]*$', min_chars = 1 ) )
+                processing_steps.append( ClientParsing.StringConverter( conversions = [ ( ClientParsing.STRING_CONVERSION_PREPEND_TEXT, 'character:' ) ] ) )
+                
+                string_processor = ClientParsing.StringProcessor()
+                
+                string_processor.SetProcessingSteps( processing_steps )
+                
+                texts = []
+                
+                for i in range( num_strings ):
+                    
+                    if i % 4 == 0:
+                        
+                        texts.append( 'url:https://example.com/post/{}'.format( i ) )
+                        
+                    else:
+                        
+                        texts.append( 'tag:samus_aran_{}, blue_eyes_(1234), {}'.format( i, i % 97 ) )
+                        
+                    
+                
+                # this is how the processor used to work, each string sent through each step one at a time
+                
+                def process_one_at_a_time( current_strings ):
+                    
+                    for processing_step in processing_steps:
+                        
+                        next_strings = []
+                        
+                        for current_string in current_strings:
+                            
+                            try:
+                                
+                                if isinstance( processing_step, ClientParsing.StringConverter ):
+                                    
+                                    next_strings.append( processing_step.Convert( current_string ) )
+                                    
+                                elif isinstance( processing_step, ClientParsing.StringMatch ):
+                                    
+                                    if processing_step.Matches( current_string ):
+                                        
+                                        next_strings.append( current_string )
+                                        
+                                    
+                                elif isinstance( processing_step, ClientParsing.StringSplitter ):
+                                    
+                                    next_strings.extend( processing_step.Split( current_string ) )
+                                    
+                                
+                            except HydrusExceptions.ParseException:
+                                
+                                continue
+                                
+                            
+                        
+                        current_strings = next_strings
+                        
+                    
+                    return current_strings
+                    
+                
+                lines.append( '{} strings through {} steps, {} runs'.format( HydrusData.ToHumanInt( num_strings ), HydrusData.ToHumanInt( len( processing_steps ) ), HydrusData.ToHumanInt( num_runs ) ) )
+                
+                name_to_results = {}
+                
+                for ( name, func ) in ( ( 'one string at a time', process_one_at_a_time ), ( 'compiled pipeline', string_processor.ProcessStrings ) ):
+                    
+                    job_key.SetVariable( 'popup_text_1', name )
+                    
+                    times = []
+                    
+                    for run in range( num_runs ):
+                        
+                        if job_key.IsCancelled():
+                            
+                            return
+                            
+                        
+                        time_started = HydrusData.GetNowPrecise()
+                        
+                        results = func( texts )
+                        
+                        times.append( HydrusData.GetNowPrecise() - time_started )
+                        
+                    
+                    name_to_results[ name ] = results
+                    
+                    best_time = min( times )
+                    
+                    lines.append( '{}: best {}, {} strings/sec'.format( name, HydrusData.TimeDeltaToPrettyTimeDelta( best_time ), HydrusData.ToHumanInt( int( num_strings / max( best_time, 0.000001 ) ) ) ) )
+                    
+                
+                if name_to_results[ 'one string at a time' ] == name_to_results[ 'compiled pipeline' ]:
+                    
+                    lines.append( 'both got the same {} results'.format( HydrusData.ToHumanInt( len( name_to_results[ 'compiled pipeline' ] ) ) ) )
+                    
+                else:
+                    
+                    lines.append( 'the results were different!' )
+                    
+                
+                # and the commonest single call in the downloader, a url class style match
+                
+                url_match = ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_REGEX, match_value = r'^\d+$', min_chars = 1, max_chars = 32 )
+                
+                url_components = [ str( i ) if i % 2 == 0 else 'post{}'.format( i ) for i in range( num_strings ) ]
+                
+                time_started = HydrusData.GetNowPrecise()
+                
+                for url_component in url_components:
+                    
+                    url_match.Matches( url_component )
+                    
+                
+                time_took = HydrusData.GetNowPrecise() - time_started
+                
+                lines.append( 'url component StringMatch.Matches: {} strings/sec'.format( HydrusData.ToHumanInt( int( num_strings / max( time_took, 0.000001 ) ) ) ) )
+                
+            finally:
+                
+                job_key.Delete()
+                
+            
+            HydrusData.ShowText( 'string processing benchmark:' + os.linesep * 2 + os.linesep.join( lines ) )
+            
+        
+        message = 'This will run some made-up tags through a typical string processor, one string at a time and then with the compiled pipeline, and report the strings/sec. It does not touch your database. Go?'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, message )
+        
+        if result == QW.QDialog.Accepted:
+            
+            self._controller.CallToThread( do_it, 40000, 5 )
+            
+        
+    
+    def _RunUITest( self ):
+        
+        def qt_open_pages():
+            
+            page_of_pages = self._notebook.NewPagesNotebook( on_deepest_notebook = False, select_page = True )
+            
+            t = 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, self._notebook.NewPageQuery, CC.LOCAL_FILE_SERVICE_KEY, page_name ='test', on_deepest_notebook = True)
+            
+            t += 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_PAGE_OF_PAGES))
+            
+            t += 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, page_of_pages.NewPageQuery, CC.LOCAL_FILE_SERVICE_KEY, page_name ='test', on_deepest_notebook = False)
+            
+            t += 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_DUPLICATE_FILTER_PAGE))
+            
+            t += 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_GALLERY_DOWNLOADER_PAGE))
+            
+            t += 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_SIMPLE_DOWNLOADER_PAGE))
+            
+            t += 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_URL_DOWNLOADER_PAGE))
+            
+            t += 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, self.ProcessApplicationCommand, CAC.ApplicationCommand(CAC.APPLICATION_COMMAND_TYPE_SIMPLE, CAC.SIMPLE_NEW_WATCHER_DOWNLOADER_PAGE))
+            
+            t += 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, self.ProposeSaveGUISession, 'last session' )
+            
+            return page_of_pages
+            
+        
+        def qt_close_unclose_one_page():
+            
+            self._notebook.CloseCurrentPage()
+            
+            HG.client_controller.CallLaterQtSafe(self, 0.5, self._UnclosePage)
+            
+        
+        def qt_close_pages( page_of_pages ):
+            
+            indices = list( range( page_of_pages.count() ) )
+            
+            indices.reverse()
+            
+            t = 0.0
+            
+            for i in indices:
+                
+                HG.client_controller.CallLaterQtSafe(self, t, page_of_pages._ClosePage, i)
+                
+                t += 0.25
+                
+            
+            t += 0.25
+            
+            HG.client_controller.CallLaterQtSafe(self, t, self._notebook.CloseCurrentPage)
+            
+            t += 0.25
             
             HG.client_controller.CallLaterQtSafe(self, t, self.DeleteAllClosedPages)
             
@@ -4024,6 +4874,17 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
             
         
     
+    def _RunThumbnailStoreJob( self, title, func ):
+        
+        job_key = ClientThreading.JobKey( pausable = True, cancellable = True )
+        
+        job_key.SetVariable( 'popup_title', title )
+        
+        self._controller.pub( 'message', job_key )
+        
+        self._controller.CallToThread( func, job_key )
+        
+    
     def _SaveSplitterPositions( self ):
         
         page = self._notebook.GetCurrentMediaPage()
@@ -4999,6 +5860,20 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             ClientGUIMenus.AppendMenuItem( submenu, 'clear orphan files', 'Clear out surplus files that have found their way into the file structure.', self._ClearOrphanFiles )
             ClientGUIMenus.AppendMenuItem( submenu, 'clear orphan file records', 'Clear out surplus file records that have not been deleted correctly.', self._ClearOrphanFileRecords )
             
+            client_files_manager = self._controller.client_files_manager
+            
+            if client_files_manager.HasPackedThumbnailStore():
+                
+                thumbnail_store_menu = QW.QMenu( submenu )
+                
+                ClientGUIMenus.AppendMenuItem( thumbnail_store_menu, 'pack loose thumbnail files', 'Move any thumbnails still stored as individual files into the packed thumbnail store.', self._RunThumbnailStoreJob, 'packing thumbnails', client_files_manager.PackThumbnails )
+                ClientGUIMenus.AppendMenuItem( thumbnail_store_menu, 'compact', 'Rewrite the packed thumbnail segments that are mostly deleted thumbnails, reclaiming their space.', self._RunThumbnailStoreJob, 'compacting thumbnail store', client_files_manager.CompactThumbnailStore )
+                ClientGUIMenus.AppendMenuItem( thumbnail_store_menu, 'rebuild index', 'Rebuild the packed thumbnail index by scanning all the segments.', self._RunThumbnailStoreJob, 'rebuilding thumbnail store index', client_files_manager.RebuildThumbnailStoreIndex )
+                ClientGUIMenus.AppendMenuItem( thumbnail_store_menu, 'unpack to loose files', 'Write every packed thumbnail back out as an individual file and delete the store. Turn the packed store off in the options and restart first.', self._RunThumbnailStoreJob, 'unpacking thumbnails', client_files_manager.UnpackThumbnails )
+                
+                ClientGUIMenus.AppendMenu( submenu, thumbnail_store_menu, 'thumbnail store' )
+                
+            
             if self._controller.new_options.GetBoolean( 'advanced_mode' ):
                 
                 ClientGUIMenus.AppendMenuItem( submenu, 'clear orphan tables', 'Clear out surplus db tables that have not been deleted correctly.', self._ClearOrphanTables )
@@ -5024,6 +5899,7 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             ClientGUIMenus.AppendMenuItem( submenu, 'tag text search cache', 'Delete and regenerate the cache hydrus uses for fast tag search.', self._RegenerateTagCache )
             ClientGUIMenus.AppendMenuItem( submenu, 'tag text search cache (subtags repopulation)', 'Repopulate the subtags for the cache hydrus uses for fast tag search.', self._RepopulateTagCacheMissingSubtags )
             ClientGUIMenus.AppendMenuItem( submenu, 'tag text search cache (searchable subtag maps)', 'Regenerate the searchable subtag maps.', self._RegenerateTagCacheSearchableSubtagsMaps )
+            ClientGUIMenus.AppendMenuItem( submenu, 'related tags co-occurrence index', 'Build or rebuild the index of tags that appear together, for fast related tag suggestions.', self._RegenerateTagCooccurrenceIndex )
             
             ClientGUIMenus.AppendSeparator( submenu )
             
@@ -5033,6 +5909,7 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             ClientGUIMenus.AppendSeparator( submenu )
             
             ClientGUIMenus.AppendMenuItem( submenu, 'clear service info cache', 'Delete all cached service info like total number of mappings or files, in case it has become desynchronised. Some parts of the gui may be laggy immediately after this as these numbers are recalculated.', self._DeleteServiceInfo )
+            ClientGUIMenus.AppendMenuItem( submenu, 'clear related tags co-occurrence index', 'Delete the index of tags that appear together and stop maintaining it.', self._DeleteTagCooccurrenceIndex )
             ClientGUIMenus.AppendMenuItem( submenu, 'similar files search tree', 'Delete and recreate the similar files search tree.', self._RegenerateSimilarFilesTree )
             
             ClientGUIMenus.AppendMenu( menu, submenu, 'regenerate' )
@@ -5466,6 +6343,7 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             ClientGUIMenus.AppendMenuItem( memory_actions, 'run slow memory maintenance', 'Tell all the slow caches to maintain themselves.', self._controller.MaintainMemorySlow )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'clear image rendering cache', 'Tell the image rendering system to forget all current images. This will often free up a bunch of memory immediately.', self._controller.ClearCaches )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'clear thumbnail cache', 'Tell the thumbnail cache to forget everything and redraw all current thumbs.', self._controller.pub, 'reset_thumbnail_cache' )
+            ClientGUIMenus.AppendMenuItem( memory_actions, 'show image and thumbnail cache statistics', 'Show how full the image and thumbnail caches are and how often they are hit.', self._DebugShowCacheStatistics )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'print garbage', 'Print some information about the python garbage to the log.', self._DebugPrintGarbage )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'take garbage snapshot', 'Capture current garbage object counts.', self._DebugTakeGarbageSnapshot )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'show garbage snapshot changes', 'Show object count differences from the last snapshot.', self._DebugShowGarbageDifferences )
@@ -5482,7 +6360,13 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             
             ClientGUIMenus.AppendMenuItem( tests, 'run the ui test', 'Run hydrus_dev\'s weekly UI Test. Guaranteed to work and not mess up your session, ha ha.', self._RunUITest )
             ClientGUIMenus.AppendMenuItem( tests, 'run the client api test', 'Run hydrus_dev\'s weekly Client API Test. Guaranteed to work and not mess up your session, ha ha.', self._RunClientAPITest )
+            ClientGUIMenus.AppendMenuItem( tests, 'run the autocomplete benchmark', 'Replay some typed tag searches through autocomplete, with and without the in-memory subtag index, and report the timings.', self._RunAutocompleteBenchmark )
+            ClientGUIMenus.AppendMenuItem( tests, 'run the data cache benchmark', 'Replay a thumbnail viewing trace with a long one-off scroll through an lru and a 2Q data cache and report the hit rates and per-lookup cost.', self._RunDataCacheBenchmark )
+            ClientGUIMenus.AppendMenuItem( tests, 'run the db read pool benchmark', 'Hammer the database with concurrent reads alongside a slow file search, with and without the read pool, and report the throughput.', self._RunDBReadPoolBenchmark )
+            ClientGUIMenus.AppendMenuItem( tests, 'run the file seed cache benchmark', 'Work through a very large in-memory file seed cache like a downloader and report the per-seed cost.', self._RunFileSeedCacheBenchmark )
+            ClientGUIMenus.AppendMenuItem( tests, 'run the html parsing benchmark', 'Parse a made-up example page for each shipped html parser with the lxml fast path off and on, and report the times and whether the results match.', self._RunHTMLParsingBenchmark )
             ClientGUIMenus.AppendMenuItem( tests, 'run the server test', 'This will try to boot the server in your install folder and initialise it. This is mostly here for testing purposes.', self._RunServerTest )
+            ClientGUIMenus.AppendMenuItem( tests, 'run the string processing benchmark', 'Run some made-up tags through a typical string processor, one string at a time and then with the compiled pipeline, and report the strings/sec.', self._RunStringProcessingBenchmark )
             
             ClientGUIMenus.AppendMenu( debug, tests, 'tests, do not touch' )
             
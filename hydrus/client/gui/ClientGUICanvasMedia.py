@@ -11,6 +11,7 @@ from hydrus.core import HydrusPaths
 
 from hydrus.client import ClientApplicationCommand as CAC
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientImageHandling
 from hydrus.client import ClientRendering
 from hydrus.client.gui import ClientGUIFunctions
 from hydrus.client.gui import ClientGUIMedia
@@ -1484,9 +1485,9 @@ class EmbedButton( QW.QWidget ):
             
             mime = self._media.GetMime()
             
-            thumbnail_path = HG.client_controller.client_files_manager.GetThumbnailPath( self._media )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( self._media )
             
-            self._thumbnail_qt_pixmap = ClientRendering.GenerateHydrusBitmap( thumbnail_path, mime ).GetQtPixmap()
+            self._thumbnail_qt_pixmap = ClientRendering.GenerateHydrusBitmapFromNumPyImage( ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime ) ).GetQtPixmap()
             
             self.update()
             
@@ -1512,9 +1513,9 @@ class OpenExternallyPanel( QW.QWidget ):
             
             mime = self._media.GetMime()
             
-            thumbnail_path = HG.client_controller.client_files_manager.GetThumbnailPath( self._media )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( self._media )
             
-            qt_pixmap = ClientRendering.GenerateHydrusBitmap( thumbnail_path, mime ).GetQtPixmap()
+            qt_pixmap = ClientRendering.GenerateHydrusBitmapFromNumPyImage( ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime ) ).GetQtPixmap()
             
             thumbnail_window = ClientGUICommon.BufferedWindowIcon( self, qt_pixmap )
             
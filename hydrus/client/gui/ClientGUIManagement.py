@@ -812,6 +812,8 @@ class ManagementPanel( QW.QScrollArea ):
         
         if self._current_selection_tags_list is not None:
             
+            media_panel.AddTagCountAggregator( self._current_selection_tags_list.GetTagCountAggregator() )
+            
             media_panel.selectedMediaTagPresentationChanged.connect( self._current_selection_tags_list.SetTagsByMediaFromMediaPanel )
             media_panel.selectedMediaTagPresentationIncremented.connect( self._current_selection_tags_list.IncrementTagsByMedia )
             self._media_sort.sortChanged.connect( media_panel.Sort )
@@ -963,6 +965,10 @@ class ManagementPanelDuplicateFilter( ManagementPanel ):
         
         menu_items.append( ( 'check', 'search for duplicate pairs at the current distance during normal db maintenance', 'Tell the client to find duplicate pairs in its normal db maintenance cycles, whether you have that set to idle or shutdown time.', check_manager ) )
         
+        check_manager = ClientGUICommon.CheckboxManagerOptions( 'use_in_memory_similar_files_index' )
+        
+        menu_items.append( ( 'check', 'keep similar files search data in memory', 'Hold all the perceptual hashes in memory (about 16 bytes each) so similar files searches at non-zero distance are much faster.', check_manager ) )
+        
         self._cog_button = ClientGUIMenuButton.MenuBitmapButton( self._main_left_panel, CC.global_pixmaps().cog, menu_items )
         
         menu_items = []
@@ -19,6 +19,7 @@ from hydrus.core import HydrusText
 
 from hydrus.client import ClientApplicationCommand as CAC
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientParsing
 from hydrus.client.gui import ClientGUIDialogs
 from hydrus.client.gui import ClientGUIDialogsQuick
 from hydrus.client.gui import ClientGUIFunctions
@@ -490,6 +491,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._stop_character = QW.QLineEdit( misc )
             self._show_new_on_file_seed_short_summary = QW.QCheckBox( misc )
             self._show_deleted_on_file_seed_short_summary = QW.QCheckBox( misc )
+            self._parse_html_with_lxml_fast_path = QW.QCheckBox( misc )
             
             if self._new_options.GetBoolean( 'advanced_mode' ):
                 
@@ -537,6 +539,10 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._show_new_on_file_seed_short_summary.setChecked( self._new_options.GetBoolean( 'show_new_on_file_seed_short_summary' ) )
             self._show_deleted_on_file_seed_short_summary.setChecked( self._new_options.GetBoolean( 'show_deleted_on_file_seed_short_summary' ) )
             
+            self._parse_html_with_lxml_fast_path.setChecked( self._new_options.GetBoolean( 'parse_html_with_lxml_fast_path' ) )
+            self._parse_html_with_lxml_fast_path.setToolTip( 'Parse html with lxml and xpath instead of BeautifulSoup where a parsing formula allows it. This is much faster on big pages, but lxml can build a slightly different tree from broken html than html5lib, so if a downloader stops working, turn this off.' )
+            self._parse_html_with_lxml_fast_path.setEnabled( ClientParsing.LXML_IS_OK )
+            
             self._watcher_page_wait_period.setValue( self._new_options.GetInteger( 'watcher_page_wait_period' ) )
             self._watcher_page_wait_period.setToolTip( gallery_page_tt )
             self._highlight_new_watcher.setChecked( self._new_options.GetBoolean( 'highlight_new_watcher' ) )
@@ -592,6 +598,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Stop character:', self._stop_character ) )
             rows.append( ( 'Show a \'N\' (for \'new\') count on short file import summaries:', self._show_new_on_file_seed_short_summary ) )
             rows.append( ( 'Show a \'D\' (for \'deleted\') count on short file import summaries:', self._show_deleted_on_file_seed_short_summary ) )
+            rows.append( ( 'Use the fast lxml html parser where possible:', self._parse_html_with_lxml_fast_path ) )
             rows.append( ( 'Delay time on a gallery/watcher network error:', self._downloader_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription network error:', self._subscription_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription other error:', self._subscription_other_error_delay ) )
@@ -636,6 +643,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetString( 'stop_character', self._stop_character.text() )
             self._new_options.SetBoolean( 'show_new_on_file_seed_short_summary', self._show_new_on_file_seed_short_summary.isChecked() )
             self._new_options.SetBoolean( 'show_deleted_on_file_seed_short_summary', self._show_deleted_on_file_seed_short_summary.isChecked() )
+            self._new_options.SetBoolean( 'parse_html_with_lxml_fast_path', self._parse_html_with_lxml_fast_path.isChecked() )
             
             self._new_options.SetInteger( 'subscription_network_error_delay', self._subscription_network_error_delay.GetValue() )
             self._new_options.SetInteger( 'subscription_other_error_delay', self._subscription_other_error_delay.GetValue() )
@@ -2507,6 +2515,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._image_cache_timeout = ClientGUITime.TimeDeltaButton( media_panel, min = 300, days = True, hours = True, minutes = True )
             self._image_cache_timeout.setToolTip( 'The amount of time after which a rendered image in the cache will naturally be removed, if it is not shunted out due to a new member exceeding the size limit. Requires restart to kick in.' )
             
+            self._thumbnail_waterfall_num_threads = QP.MakeQSpinBox( media_panel, min = 1, max = 32 )
+            self._thumbnail_waterfall_num_threads.setToolTip( 'How many threads load and render thumbnails in the background when you open a page. More threads fill big pages faster on a many-core machine with a fast drive. Requires restart to kick in.' )
+            
             #
             
             buffer_panel = ClientGUICommon.StaticBox( self, 'video buffer' )
@@ -2522,6 +2533,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._forced_search_limit = ClientGUICommon.NoneableSpinCtrl( misc_panel, '', min = 1, max = 100000 )
             
+            self._autocomplete_subtag_prefix_index = QW.QCheckBox( misc_panel )
+            self._autocomplete_subtag_prefix_index.setToolTip( 'Keep a sorted copy of every searchable subtag in memory so tag autocomplete can answer \'sam*\' style searches without going to the database\'s text search tables. This makes typing in a tag search much snappier on big clients, but it can use a lot of memory--several hundred MB or more if you sync with the PTR--and the first search on each tag domain takes a moment to build it.' )
+            
             #
             
             self._thumbnail_cache_size.setValue( int( HC.options['thumbnail_cache_size'] // 1048576 ) )
@@ -2530,11 +2544,14 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._thumbnail_cache_timeout.SetValue( self._new_options.GetInteger( 'thumbnail_cache_timeout' ) )
             self._image_cache_timeout.SetValue( self._new_options.GetInteger( 'image_cache_timeout' ) )
+            self._thumbnail_waterfall_num_threads.setValue( self._new_options.GetInteger( 'thumbnail_waterfall_num_threads' ) )
             
             self._video_buffer_size_mb.setValue( self._new_options.GetInteger( 'video_buffer_size_mb' ) )
             
             self._forced_search_limit.SetValue( self._new_options.GetNoneableInteger( 'forced_search_limit' ) )
             
+            self._autocomplete_subtag_prefix_index.setChecked( self._new_options.GetBoolean( 'autocomplete_subtag_prefix_index' ) )
+            
             #
             
             vbox = QP.VBoxLayout()
@@ -2562,6 +2579,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'MB memory reserved for image cache: ', fullscreens_sizer ) )
             rows.append( ( 'Thumbnail cache timeout: ', self._thumbnail_cache_timeout ) )
             rows.append( ( 'Image cache timeout: ', self._image_cache_timeout ) )
+            rows.append( ( 'Thumbnail rendering threads: ', self._thumbnail_waterfall_num_threads ) )
             
             gridbox = ClientGUICommon.WrapInGrid( media_panel, rows )
             
@@ -2596,6 +2614,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows = []
             
             rows.append( ( 'Forced system:limit for all searches: ', self._forced_search_limit ) )
+            rows.append( ( 'Keep an in-memory index for tag autocomplete: ', self._autocomplete_subtag_prefix_index ) )
             
             gridbox = ClientGUICommon.WrapInGrid( misc_panel, rows )
             
@@ -2654,11 +2673,14 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._new_options.SetInteger( 'thumbnail_cache_timeout', self._thumbnail_cache_timeout.GetValue() )
             self._new_options.SetInteger( 'image_cache_timeout', self._image_cache_timeout.GetValue() )
+            self._new_options.SetInteger( 'thumbnail_waterfall_num_threads', self._thumbnail_waterfall_num_threads.value() )
             
             self._new_options.SetInteger( 'video_buffer_size_mb', self._video_buffer_size_mb.value() )
             
             self._new_options.SetNoneableInteger( 'forced_search_limit', self._forced_search_limit.GetValue() )
             
+            self._new_options.SetBoolean( 'autocomplete_subtag_prefix_index', self._autocomplete_subtag_prefix_index.isChecked() )
+            
         
     
     class _StylePanel( QW.QWidget ):
@@ -3422,6 +3444,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._thumbnail_fill = QW.QCheckBox( self )
             
+            self._use_packed_thumbnail_store = QW.QCheckBox( self )
+            self._use_packed_thumbnail_store.setToolTip( 'Store new thumbnails in a few large segment files rather than one file each. This is faster and kinder to the filesystem for big clients. Use database->maintenance->thumbnail store to move your existing thumbnails over. To go back, turn this off, restart, and then unpack from that same menu.' )
+            
             self._thumbnail_visibility_scroll_percent = QP.MakeQSpinBox( self, min=1, max=99 )
             self._thumbnail_visibility_scroll_percent.setToolTip( 'Lower numbers will cause fewer scrolls, higher numbers more.' )
             
@@ -3443,6 +3468,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._thumbnail_fill.setChecked( self._new_options.GetBoolean( 'thumbnail_fill' ) )
             
+            self._use_packed_thumbnail_store.setChecked( self._new_options.GetBoolean( 'use_packed_thumbnail_store' ) )
+            
             self._thumbnail_visibility_scroll_percent.setValue( self._new_options.GetInteger( 'thumbnail_visibility_scroll_percent' ) )
             
             media_background_bmp_path = self._new_options.GetNoneableString( 'media_background_bmp_path' )
@@ -3465,6 +3492,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'EXPERIMENTAL: Scroll thumbnails at this rate per scroll tick: ', self._thumbnail_scroll_rate ) )
             rows.append( ( 'EXPERIMENTAL: Zoom thumbnails so they \'fill\' their space: ', self._thumbnail_fill ) )
             rows.append( ( 'EXPERIMENTAL: Image path for thumbnail panel background image (set blank to clear): ', self._media_background_bmp_path ) )
+            rows.append( ( 'EXPERIMENTAL: Store thumbnails in packed segment files (requires restart): ', self._use_packed_thumbnail_store ) )
             
             gridbox = ClientGUICommon.WrapInGrid( self, rows )
             
@@ -3501,6 +3529,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._new_options.SetBoolean( 'thumbnail_fill', self._thumbnail_fill.isChecked() )
             
+            self._new_options.SetBoolean( 'use_packed_thumbnail_store', self._use_packed_thumbnail_store.isChecked() )
+            
             self._new_options.SetInteger( 'thumbnail_visibility_scroll_percent', self._thumbnail_visibility_scroll_percent.value() )
             
             media_background_bmp_path = self._media_background_bmp_path.GetPath()
@@ -4826,6 +4826,8 @@ class ReviewTagDisplayMaintenancePanel( ClientGUIScrolledPanels.ReviewPanel ):
                 
                 self._siblings_and_parents_st.setText( message )
                 
+                self._siblings_and_parents_st.setToolTip( 'The sibling and parent lookups for this service are currently using {} of memory.'.format( HydrusData.ToHumanBytes( status[ 'lookup_cache_memory_usage' ] ) ) )
+                
                 #
                 
                 num_actual_rows = status[ 'num_actual_rows' ]
@@ -3428,14 +3428,12 @@ class ListBoxTagsMedia( ListBoxTagsDisplayCapable ):
         
         self._tag_sort = HG.client_controller.new_options.GetDefaultTagSort()
         
-        self._last_media = set()
-        
         self._include_counts = include_counts
         
-        self._current_tags_to_count = collections.Counter()
-        self._deleted_tags_to_count = collections.Counter()
-        self._pending_tags_to_count = collections.Counter()
-        self._petitioned_tags_to_count = collections.Counter()
+        self._tag_count_aggregator = ClientMedia.MediaTagCountAggregator( self._service_key, self._tag_display_type )
+        
+        # these are live views of the aggregator's counts
+        ( self._current_tags_to_count, self._deleted_tags_to_count, self._pending_tags_to_count, self._petitioned_tags_to_count ) = self._tag_count_aggregator.GetCounts()
         
         self._show_current = True
         self._show_deleted = False
@@ -3555,7 +3553,11 @@ class ListBoxTagsMedia( ListBoxTagsDisplayCapable ):
         
         ListBoxTagsDisplayCapable.SetTagServiceKey( self, service_key )
         
-        self.SetTagsByMedia( self._last_media )
+        self._tag_count_aggregator.SetTagServiceKey( service_key )
+        
+        self._UpdateTerms()
+        
+        self._DataHasChanged()
         
     
     def SetSort( self, tag_sort: ClientTagSorting.TagSort ):
@@ -3577,118 +3579,61 @@ class ListBoxTagsMedia( ListBoxTagsDisplayCapable ):
         self._UpdateTerms()
         
     
-    def IncrementTagsByMedia( self, media ):
-        
-        media = set( media )
-        media = media.difference( self._last_media )
+    def GetTagCountAggregator( self ) -> ClientMedia.MediaTagCountAggregator:
         
-        ( current_tags_to_count, deleted_tags_to_count, pending_tags_to_count, petitioned_tags_to_count ) = ClientMedia.GetMediasTagCount( media, self._service_key, self._tag_display_type )
+        return self._tag_count_aggregator
         
-        tags_changed = set()
-        
-        if self._show_current: tags_changed.update( current_tags_to_count.keys() )
-        if self._show_deleted: tags_changed.update( deleted_tags_to_count.keys() )
-        if self._show_pending: tags_changed.update( pending_tags_to_count.keys() )
-        if self._show_petitioned: tags_changed.update( petitioned_tags_to_count.keys() )
+    
+    def IncrementTagsByMedia( self, media ):
         
-        self._current_tags_to_count.update( current_tags_to_count )
-        self._deleted_tags_to_count.update( deleted_tags_to_count )
-        self._pending_tags_to_count.update( pending_tags_to_count )
-        self._petitioned_tags_to_count.update( petitioned_tags_to_count )
+        tags_changed = self._tag_count_aggregator.AddMedias( media )
         
         if len( tags_changed ) > 0:
             
             self._UpdateTerms( tags_changed )
             
         
-        self._last_media.update( media )
-        
         self._DataHasChanged()
         
     
     def SetTagsByMedia( self, media ):
         
-        media = set( media )
-        
-        ( current_tags_to_count, deleted_tags_to_count, pending_tags_to_count, petitioned_tags_to_count ) = ClientMedia.GetMediasTagCount( media, self._service_key, self._tag_display_type )
+        # we don't know if anyone has been keeping our counts in sync with tag changes, so count fresh
         
-        self._current_tags_to_count = current_tags_to_count
-        self._deleted_tags_to_count = deleted_tags_to_count
-        self._pending_tags_to_count = pending_tags_to_count
-        self._petitioned_tags_to_count = petitioned_tags_to_count
+        self._tag_count_aggregator.ResetMedias( media )
         
         self._UpdateTerms()
         
-        self._last_media = media
-        
         self._DataHasChanged()
         
     
     def SetTagsByMediaFromMediaPanel( self, media, tags_changed ):
         
-        # this uses the last-set media and count cache to generate new numbers and is faster than re-counting from scratch when the tags have not changed
+        # the media panel keeps our aggregator in sync with content updates and removals, so we only have to apply the selection delta
         
-        selection_shrank_a_lot = len( media ) < len( self._last_media ) // 10 # if we are dropping to a much smaller selection (e.g. 5000 -> 1), we should just recalculate from scratch
+        tags_delta = self._tag_count_aggregator.SetMedias( media )
         
-        if tags_changed or selection_shrank_a_lot:
-            
-            self.SetTagsByMedia( media )
+        if tags_changed:
             
-            return
+            self._UpdateTerms()
             
-        
-        media = set( media )
-        
-        removees = self._last_media.difference( media )
-        
-        if len( removees ) == 0:
+        elif len( tags_delta ) > 0:
             
-            self.IncrementTagsByMedia( media )
+            self._UpdateTerms( tags_delta )
             
-            return
-            
-        
-        adds = media.difference( self._last_media )
-        
-        ( current_tags_to_count, deleted_tags_to_count, pending_tags_to_count, petitioned_tags_to_count ) = ClientMedia.GetMediasTagCount( removees, self._service_key, self._tag_display_type )
         
-        self._current_tags_to_count.subtract( current_tags_to_count )
-        self._deleted_tags_to_count.subtract( deleted_tags_to_count )
-        self._pending_tags_to_count.subtract( pending_tags_to_count )
-        self._petitioned_tags_to_count.subtract( petitioned_tags_to_count )
+        self._DataHasChanged()
         
-        ( current_tags_to_count, deleted_tags_to_count, pending_tags_to_count, petitioned_tags_to_count ) = ClientMedia.GetMediasTagCount( adds, self._service_key, self._tag_display_type )
+    
+    def ForceTagRecalc( self ):
         
-        self._current_tags_to_count.update( current_tags_to_count )
-        self._deleted_tags_to_count.update( deleted_tags_to_count )
-        self._pending_tags_to_count.update( pending_tags_to_count )
-        self._petitioned_tags_to_count.update( petitioned_tags_to_count )
-        
-        for counter in ( self._current_tags_to_count, self._deleted_tags_to_count, self._pending_tags_to_count, self._petitioned_tags_to_count ):
-            
-            tags = list( counter.keys() )
-            
-            for tag in tags:
-                
-                if counter[ tag ] == 0:
-                    
-                    del counter[ tag ]
-                    
-                
-            
+        self._tag_count_aggregator.RecountAll()
         
         self._UpdateTerms()
         
-        self._last_media = media
-        
         self._DataHasChanged()
         
     
-    def ForceTagRecalc( self ):
-        
-        self.SetTagsByMedia( self._last_media )
-        
-    
 class StaticBoxSorterForListBoxTags( ClientGUICommon.StaticBox ):
     
     def __init__( self, parent, title, show_siblings_sort = False ):
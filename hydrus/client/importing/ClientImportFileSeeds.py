@@ -1,5 +1,8 @@
 import collections
+import concurrent.futures
+import heapq
 import itertools
+import multiprocessing
 import os
 import random
 import threading
@@ -7,6 +10,7 @@ import time
 import traceback
 import typing
 import urllib.parse
+import weakref
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
@@ -17,6 +21,7 @@ from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusPaths
 from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusTags
+from hydrus.core import HydrusVideoHandling
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientData
@@ -28,6 +33,180 @@ from hydrus.client.importing import ClientImportOptions
 from hydrus.client.metadata import ClientTags
 from hydrus.client.networking import ClientNetworkingDomain
 
+# the hashing, metadata, thumbnail and phash work of file imports can run on a process pool, so these do not touch the controller
+FILE_IMPORT_NUM_PROCESSES = max( 1, min( 8, ( os.cpu_count() or 1 ) - 1 ) )
+FILE_IMPORT_PROCESS_POOL = None
+FILE_IMPORT_PROCESS_POOL_LOCK = threading.Lock()
+
+def DoFileImportWork( process_state, func, *args ):
+    
+    # the pool's processes are spawned fresh, so they do not see what the client changed in its own globals since import. we send it with each job so toggling report mode takes effect immediately
+    
+    ( ffmpeg_path, file_import_report_mode ) = process_state
+    
+    HydrusVideoHandling.FFMPEG_PATH = ffmpeg_path
+    HG.file_import_report_mode = file_import_report_mode
+    
+    return func( *args )
+    
+def GenerateFileImportHash( temp_path ):
+    
+    HydrusImageHandling.ConvertToPNGIfBMP( temp_path )
+    
+    return HydrusFileHandling.GetHashFromPath( temp_path )
+    
+def GenerateFileImportInfo( temp_path, allow_decompression_bombs, thumbnail_bounding_dimensions, video_thumbnail_percentage_in, load_images_with_pil ):
+    
+    mime = HydrusFileHandling.GetMime( temp_path )
+    
+    if HG.file_import_report_mode:
+        
+        HydrusData.ShowText( 'File import job mime: {}'.format( HC.mime_string_lookup[ mime ] ) )
+        
+    
+    if mime in HC.DECOMPRESSION_BOMB_IMAGES and not allow_decompression_bombs:
+        
+        if HG.file_import_report_mode:
+            
+            HydrusData.ShowText( 'File import job testing for decompression bomb' )
+            
+        
+        if HydrusImageHandling.IsDecompressionBomb( temp_path ):
+            
+            if HG.file_import_report_mode:
+                
+                HydrusData.ShowText( 'File import job: it was a decompression bomb' )
+                
+            
+            raise HydrusExceptions.DecompressionBombException( 'Image seems to be a Decompression Bomb!' )
+            
+        
+    
+    file_info = HydrusFileHandling.GetFileInfo( temp_path, mime )
+    
+    ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = file_info
+    
+    if HG.file_import_report_mode:
+        
+        HydrusData.ShowText( 'File import job file info: {}'.format( file_info ) )
+        
+    
+    thumbnail_bytes = None
+    
+    if mime in HC.MIMES_WITH_THUMBNAILS:
+        
+        if HG.file_import_report_mode:
+            
+            HydrusData.ShowText( 'File import job generating thumbnail' )
+            
+        
+        target_resolution = HydrusImageHandling.GetThumbnailResolution( ( width, height ), thumbnail_bounding_dimensions )
+        
+        thumbnail_bytes = HydrusFileHandling.GenerateThumbnailBytes( temp_path, target_resolution, mime, duration, num_frames, percentage_in = video_thumbnail_percentage_in )
+        
+    
+    phashes = None
+    
+    if mime in HC.MIMES_WE_CAN_PHASH:
+        
+        if HG.file_import_report_mode:
+            
+            HydrusData.ShowText( 'File import job generating phashes' )
+            
+        
+        phashes = ClientImageHandling.GenerateShapePerceptualHashes( temp_path, mime, force_pil = load_images_with_pil )
+        
+        if HG.file_import_report_mode:
+            
+            HydrusData.ShowText( 'File import job generated {} phashes: {}'.format( len( phashes ), [ phash.hex() for phash in phashes ] ) )
+            
+        
+    
+    if HG.file_import_report_mode:
+        
+        HydrusData.ShowText( 'File import job generating other hashes' )
+        
+    
+    extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( temp_path )
+    
+    file_modified_timestamp = HydrusFileHandling.GetFileModifiedTimestamp( temp_path )
+    
+    return ( file_info, thumbnail_bytes, phashes, extra_hashes, file_modified_timestamp )
+    
+def GetFileImportProcessPool():
+    
+    global FILE_IMPORT_PROCESS_POOL
+    
+    with FILE_IMPORT_PROCESS_POOL_LOCK:
+        
+        if FILE_IMPORT_PROCESS_POOL is None:
+            
+            # spawn, not fork--we have a bunch of threads and a Qt event loop going on
+            mp_context = multiprocessing.get_context( 'spawn' )
+            
+            FILE_IMPORT_PROCESS_POOL = concurrent.futures.ProcessPoolExecutor( max_workers = FILE_IMPORT_NUM_PROCESSES, mp_context = mp_context )
+            
+        
+        return FILE_IMPORT_PROCESS_POOL
+        
+    
+def GetFileImportWorkResult( future: concurrent.futures.Future, func, *args ):
+    
+    try:
+        
+        return future.result()
+        
+    except concurrent.futures.BrokenExecutor:
+        
+        HydrusData.Print( 'The file import process pool broke! Doing this job in the current thread and resetting the pool.' )
+        
+        ShutdownFileImportProcessPool()
+        
+        return func( *args )
+        
+    
+def ShutdownFileImportProcessPool():
+    
+    global FILE_IMPORT_PROCESS_POOL
+    
+    with FILE_IMPORT_PROCESS_POOL_LOCK:
+        
+        if FILE_IMPORT_PROCESS_POOL is not None:
+            
+            FILE_IMPORT_PROCESS_POOL.shutdown( wait = False )
+            
+            FILE_IMPORT_PROCESS_POOL = None
+            
+        
+    
+def SubmitFileImportWork( func, *args ) -> concurrent.futures.Future:
+    
+    try:
+        
+        process_state = ( HydrusVideoHandling.FFMPEG_PATH, HG.file_import_report_mode )
+        
+        return GetFileImportProcessPool().submit( DoFileImportWork, process_state, func, *args )
+        
+    except Exception as e:
+        
+        # pool could not start or is shutting down, so just do it here
+        
+        HydrusData.Print( 'Could not submit file import work to the process pool: {}'.format( e ) )
+        
+        future = concurrent.futures.Future()
+        
+        try:
+            
+            future.set_result( func( *args ) )
+            
+        except Exception as e:
+            
+            future.set_exception( e )
+            
+        
+        return future
+        
+    
 class FileImportJob( object ):
     
     def __init__( self, temp_path, file_import_options = None ):
@@ -55,6 +234,11 @@ class FileImportJob( object ):
         self._file_modified_timestamp = None
         
     
+    def AddToClientFiles( self ):
+        
+        HG.client_controller.client_files_manager.AddFile( self._hash, self.GetMime(), self._temp_path, thumbnail_bytes = self._thumbnail_bytes )
+        
+    
     def CheckIsGoodToImport( self ):
         
         if HG.file_import_report_mode:
@@ -90,30 +274,16 @@ class FileImportJob( object ):
             
             self.GenerateInfo()
             
-            try:
-                
-                self.CheckIsGoodToImport()
-                
-                ok_to_go = True
-                
-            except HydrusExceptions.FileSizeException as e:
-                
-                ok_to_go = False
-                
-                import_status = CC.STATUS_SKIPPED
-                note = str( e )
-                
+            skip_result = self.GetSkipResult()
             
-            if ok_to_go:
-                
-                mime = self.GetMime()
+            if skip_result is None:
                 
                 if status_hook is not None:
                     
                     status_hook( 'copying file' )
                     
                 
-                HG.client_controller.client_files_manager.AddFile( hash, mime, self._temp_path, thumbnail_bytes = self._thumbnail_bytes )
+                self.AddToClientFiles()
                 
                 if status_hook is not None:
                     
@@ -122,6 +292,10 @@ class FileImportJob( object ):
                 
                 ( import_status, note ) = HG.client_controller.WriteSynchronous( 'import_file', self )
                 
+            else:
+                
+                ( import_status, note ) = skip_result
+                
             
         else:
             
@@ -138,11 +312,14 @@ class FileImportJob( object ):
         return ( import_status, hash, note )
         
     
-    def GenerateHashAndStatus( self ):
+    def GenerateHashAndStatus( self, hash = None ):
         
-        HydrusImageHandling.ConvertToPNGIfBMP( self._temp_path )
+        if hash is None:
+            
+            hash = GenerateFileImportHash( self._temp_path )
+            
         
-        self._hash = HydrusFileHandling.GetHashFromPath( self._temp_path )
+        self._hash = hash
         
         if HG.file_import_report_mode:
             
@@ -159,83 +336,14 @@ class FileImportJob( object ):
         return ( self._pre_import_status, self._hash, note )
         
     
-    def GenerateInfo( self ):
-        
-        mime = HydrusFileHandling.GetMime( self._temp_path )
+    def GenerateInfo( self, file_import_info = None ):
         
-        if HG.file_import_report_mode:
+        if file_import_info is None:
             
-            HydrusData.ShowText( 'File import job mime: {}'.format( HC.mime_string_lookup[ mime ] ) )
+            file_import_info = GenerateFileImportInfo( *self.GetInfoGenerationArgs() )
             
         
-        new_options = HG.client_controller.new_options
-        
-        if mime in HC.DECOMPRESSION_BOMB_IMAGES and not self._file_import_options.AllowsDecompressionBombs():
-            
-            if HG.file_import_report_mode:
-                
-                HydrusData.ShowText( 'File import job testing for decompression bomb' )
-                
-            
-            if HydrusImageHandling.IsDecompressionBomb( self._temp_path ):
-                
-                if HG.file_import_report_mode:
-                    
-                    HydrusData.ShowText( 'File import job: it was a decompression bomb' )
-                    
-                
-                raise HydrusExceptions.DecompressionBombException( 'Image seems to be a Decompression Bomb!' )
-                
-            
-        
-        self._file_info = HydrusFileHandling.GetFileInfo( self._temp_path, mime )
-        
-        ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = self._file_info
-        
-        if HG.file_import_report_mode:
-            
-            HydrusData.ShowText( 'File import job file info: {}'.format( self._file_info ) )
-            
-        
-        if mime in HC.MIMES_WITH_THUMBNAILS:
-            
-            if HG.file_import_report_mode:
-                
-                HydrusData.ShowText( 'File import job generating thumbnail' )
-                
-            
-            bounding_dimensions = HG.client_controller.options[ 'thumbnail_dimensions' ]
-            
-            target_resolution = HydrusImageHandling.GetThumbnailResolution( ( width, height ), bounding_dimensions )
-            
-            percentage_in = HG.client_controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
-            
-            self._thumbnail_bytes = HydrusFileHandling.GenerateThumbnailBytes( self._temp_path, target_resolution, mime, duration, num_frames, percentage_in = percentage_in )
-            
-        
-        if mime in HC.MIMES_WE_CAN_PHASH:
-            
-            if HG.file_import_report_mode:
-                
-                HydrusData.ShowText( 'File import job generating phashes' )
-                
-            
-            self._phashes = ClientImageHandling.GenerateShapePerceptualHashes( self._temp_path, mime )
-            
-            if HG.file_import_report_mode:
-                
-                HydrusData.ShowText( 'File import job generated {} phashes: {}'.format( len( self._phashes ), [ phash.hex() for phash in self._phashes ] ) )
-                
-            
-        
-        if HG.file_import_report_mode:
-            
-            HydrusData.ShowText( 'File import job generating other hashes' )
-            
-        
-        self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
-        
-        self._file_modified_timestamp = HydrusFileHandling.GetFileModifiedTimestamp( self._temp_path )
+        ( self._file_info, self._thumbnail_bytes, self._phashes, self._extra_hashes, self._file_modified_timestamp ) = file_import_info
         
     
     def GetExtraHashes( self ):
@@ -270,6 +378,16 @@ class FileImportJob( object ):
         return mime
         
     
+    def GetInfoGenerationArgs( self ):
+        
+        allow_decompression_bombs = self._file_import_options.AllowsDecompressionBombs()
+        thumbnail_bounding_dimensions = HG.client_controller.options[ 'thumbnail_dimensions' ]
+        video_thumbnail_percentage_in = HG.client_controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
+        load_images_with_pil = HG.client_controller.new_options.GetBoolean( 'load_images_with_pil' )
+        
+        return ( self._temp_path, allow_decompression_bombs, thumbnail_bounding_dimensions, video_thumbnail_percentage_in, load_images_with_pil )
+        
+    
     def GetPreImportStatus( self ):
         
         return self._pre_import_status
@@ -280,6 +398,25 @@ class FileImportJob( object ):
         return self._phashes
         
     
+    def GetSkipResult( self ):
+        
+        try:
+            
+            self.CheckIsGoodToImport()
+            
+            return None
+            
+        except HydrusExceptions.FileSizeException as e:
+            
+            return ( CC.STATUS_SKIPPED, str( e ) )
+            
+        
+    
+    def GetTempPath( self ):
+        
+        return self._temp_path
+        
+    
     def PubsubContentUpdates( self ):
         
         if self._pre_import_status == CC.STATUS_SUCCESSFUL_BUT_REDUNDANT:
@@ -352,6 +489,9 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         self._tags = set()
         self._hashes = {}
         
+        # the caches we are in, which index us by status
+        self._file_seed_caches = weakref.WeakSet()
+        
     
     def __eq__( self, other ):
         
@@ -408,23 +548,15 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
     
     def _NormaliseAndFilterAssociableURLs( self, urls ):
         
-        normalised_urls = set()
+        domain_manager = HG.client_controller.network_engine.domain_manager
         
-        for url in urls:
-            
-            try:
-                
-                url = HG.client_controller.network_engine.domain_manager.NormaliseURL( url )
-                
-            except HydrusExceptions.URLClassException:
-                
-                continue # not a url--something like "file:///C:/Users/Tall%20Man/Downloads/maxresdefault.jpg" ha ha ha
-                
-            
-            normalised_urls.add( url )
-            
+        # anything that is not a url--something like "file:///C:/Users/Tall%20Man/Downloads/maxresdefault.jpg" ha ha ha--is dropped here
+        
+        normalised_urls = set( domain_manager.NormaliseURLs( urls ).values() )
         
-        associable_urls = { url for url in normalised_urls if HG.client_controller.network_engine.domain_manager.ShouldAssociateURLWithFiles( url ) }
+        normalised_urls_to_url_classes = domain_manager.GetURLsToURLClasses( normalised_urls )
+        
+        associable_urls = { url for ( url, url_class ) in normalised_urls_to_url_classes.items() if url_class is None or url_class.ShouldAssociateWithFiles() }
         
         return associable_urls
         
@@ -776,19 +908,12 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
                                 
                                 this_files_urls = media_result.GetLocationsManager().GetURLs()
                                 
-                                for this_files_url in this_files_urls:
+                                this_files_urls_to_url_classes = HG.client_controller.network_engine.domain_manager.GetURLsToURLClasses( this_files_urls )
+                                
+                                for ( this_files_url, this_url_class ) in this_files_urls_to_url_classes.items():
                                     
                                     if this_files_url != my_url:
                                         
-                                        try:
-                                            
-                                            this_url_class = HG.client_controller.network_engine.domain_manager.GetURLClass( this_files_url )
-                                            
-                                        except HydrusExceptions.URLClassException:
-                                            
-                                            continue
-                                            
-                                        
                                         if my_url_class == this_url_class:
                                             
                                             # oh no, the file this source url refers to has a different known url in this same domain
@@ -1019,6 +1144,11 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def RegisterFileSeedCache( self, file_seed_cache: 'FileSeedCache' ):
+        
+        self._file_seed_caches.add( file_seed_cache )
+        
+    
     def SetExternalAdditionalServiceKeysToTags( self, service_keys_to_tags ):
         
         self._external_additional_service_keys_to_tags = ClientTags.ServiceKeysToTags( service_keys_to_tags )
@@ -1061,6 +1191,11 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         
         self._UpdateModified()
         
+        for file_seed_cache in list( self._file_seed_caches ):
+            
+            file_seed_cache.NotifyFileSeedStatusChanged( self )
+            
+        
     
     def ShouldPresent( self, file_import_options: ClientImportOptions.FileImportOptions, in_inbox = None ):
         
@@ -1741,6 +1876,13 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         self._file_seeds_to_indices = {}
         
+        # the file seeds' statuses as of their last notify, and heaps of their indices per status, so next seed and counts are not full scans
+        # heap entries go stale when a file seed moves or changes status, so we check them against the live list as we go
+        self._file_seeds_to_statuses = {}
+        self._statuses_to_indices_heaps = collections.defaultdict( list )
+        self._statuses_to_counts = collections.Counter()
+        self._latest_added_time = 0
+        
         self._file_seed_cache_key = HydrusData.GenerateKey()
         
         self._status_cache = FileSeedCacheStatus()
@@ -1755,6 +1897,19 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return len( self._file_seeds )
         
     
+    def _CleanIndicesHeap( self, status: int ):
+        
+        heap = self._statuses_to_indices_heaps[ status ]
+        
+        valid_indices = { index for index in heap if self._IndexIsValid( index, status ) }
+        
+        heap = list( valid_indices )
+        
+        heapq.heapify( heap )
+        
+        self._statuses_to_indices_heaps[ status ] = heap
+        
+    
     def _GenerateStatus( self ):
         
         fscs = FileSeedCacheStatus()
@@ -1775,33 +1930,32 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         else:
             
-            return [ file_seed for file_seed in self._file_seeds if file_seed.status == status ]
+            self._CleanIndicesHeap( status )
+            
+            return [ self._file_seeds[ index ] for index in sorted( self._statuses_to_indices_heaps[ status ] ) ]
             
         
     
     def _GetLatestAddedTime( self ):
         
-        if len( self._file_seeds ) == 0:
-            
-            latest_timestamp = 0
-            
-        else:
-            
-            latest_timestamp = max( ( file_seed.created for file_seed in self._file_seeds ) )
-            
-        
-        return latest_timestamp
+        return self._latest_added_time
         
     
     def _GetNextFileSeed( self, status: int ) -> typing.Optional[ FileSeed ]:
         
-        for file_seed in self._file_seeds:
+        heap = self._statuses_to_indices_heaps[ status ]
+        
+        while len( heap ) > 0:
+            
+            index = heap[0]
             
-            if file_seed.status == status:
+            if self._IndexIsValid( index, status ):
                 
-                return file_seed
+                return self._file_seeds[ index ]
                 
             
+            heapq.heappop( heap )
+            
         
         return None
         
@@ -1828,12 +1982,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def _GetStatusesToCounts( self ):
         
-        statuses_to_counts = collections.Counter()
-        
-        for file_seed in self._file_seeds:
-            
-            statuses_to_counts[ file_seed.status ] += 1
-            
+        statuses_to_counts = collections.Counter( { status : count for ( status, count ) in self._statuses_to_counts.items() if count > 0 } )
         
         return statuses_to_counts
         
@@ -1847,13 +1996,66 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return has_file_seed
         
     
+    def _IndexFileSeed( self, file_seed: FileSeed, index: int ):
+        
+        status = file_seed.status
+        
+        self._file_seeds_to_indices[ file_seed ] = index
+        self._file_seeds_to_statuses[ file_seed ] = status
+        self._statuses_to_counts[ status ] += 1
+        
+        file_seed.RegisterFileSeedCache( self )
+        
+        heapq.heappush( self._statuses_to_indices_heaps[ status ], index )
+        
+        self._latest_added_time = max( self._latest_added_time, file_seed.created )
+        
+    
+    def _IndexIsValid( self, index: int, status: int ):
+        
+        return index < len( self._file_seeds ) and self._file_seeds[ index ].status == status
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         with self._lock:
             
             self._file_seeds = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_info )
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._ReindexFileSeeds()
+            
+        
+    
+    def _MoveFileSeed( self, file_seed: FileSeed, new_index: int ):
+        
+        # swaps the file seed with whatever is at new_index
+        
+        index = self._file_seeds_to_indices[ file_seed ]
+        
+        other_file_seed = self._file_seeds[ new_index ]
+        
+        self._file_seeds[ new_index ] = file_seed
+        self._file_seeds[ index ] = other_file_seed
+        
+        for ( moved_file_seed, moved_index ) in ( ( file_seed, new_index ), ( other_file_seed, index ) ):
+            
+            self._file_seeds_to_indices[ moved_file_seed ] = moved_index
+            
+            heapq.heappush( self._statuses_to_indices_heaps[ self._file_seeds_to_statuses[ moved_file_seed ] ], moved_index )
+            
+        
+    
+    def _ReindexFileSeeds( self ):
+        
+        self._file_seeds_to_indices = {}
+        self._file_seeds_to_statuses = {}
+        self._statuses_to_indices_heaps = collections.defaultdict( list )
+        self._statuses_to_counts = collections.Counter()
+        self._latest_added_time = 0
+        
+        for ( index, file_seed ) in enumerate( self._file_seeds ):
+            
+            self._IndexFileSeed( file_seed, index )
             
         
     
@@ -1862,6 +2064,39 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         self._status_dirty = True
         
     
+    def _UpdateFileSeedStatuses( self, file_seeds: typing.Iterable[ FileSeed ] ):
+        
+        for file_seed in file_seeds:
+            
+            if file_seed not in self._file_seeds_to_statuses:
+                
+                continue
+                
+            
+            old_status = self._file_seeds_to_statuses[ file_seed ]
+            new_status = file_seed.status
+            
+            if old_status == new_status:
+                
+                continue
+                
+            
+            self._file_seeds_to_statuses[ file_seed ] = new_status
+            
+            self._statuses_to_counts[ old_status ] -= 1
+            self._statuses_to_counts[ new_status ] += 1
+            
+            heap = self._statuses_to_indices_heaps[ new_status ]
+            
+            heapq.heappush( heap, self._file_seeds_to_indices[ file_seed ] )
+            
+            if len( heap ) > 2 * self._statuses_to_counts[ new_status ] + 256:
+                
+                self._CleanIndicesHeap( new_status )
+                
+            
+        
+    
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
         if version == 1:
@@ -2101,7 +2336,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 self._file_seeds.append( file_seed )
                 
-                self._file_seeds_to_indices[ file_seed ] = len( self._file_seeds ) - 1
+                self._IndexFileSeed( file_seed, len( self._file_seeds ) - 1 )
                 
             
             self._SetStatusDirty()
@@ -2122,12 +2357,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 if index > 0:
                     
-                    self._file_seeds.remove( file_seed )
+                    self._MoveFileSeed( file_seed, index - 1 )
                     
-                    self._file_seeds.insert( index - 1, file_seed )
-                    
-                
-                self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
                 
             
         
@@ -2185,7 +2416,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             new_file_seeds.extend( self._file_seeds[-self.COMPACT_NUMBER:] )
             
             self._file_seeds = new_file_seeds
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            
+            self._ReindexFileSeeds()
             
             self._SetStatusDirty()
             
@@ -2201,13 +2433,9 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 if index < len( self._file_seeds ) - 1:
                     
-                    self._file_seeds.remove( file_seed )
-                    
-                    self._file_seeds.insert( index + 1, file_seed )
+                    self._MoveFileSeed( file_seed, index + 1 )
                     
                 
-                self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
-                
             
         
         self.NotifyFileSeedsUpdated( ( file_seed, ) )
@@ -2302,13 +2530,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
             else:
                 
-                for file_seed in self._file_seeds:
-                    
-                    if file_seed.status == status:
-                        
-                        result += 1
-                        
-                    
+                result = self._statuses_to_counts[ status ]
                 
             
         
@@ -2364,6 +2586,42 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetNextFileSeeds( self, status: int, num_file_seeds: int ):
+        
+        with self._lock:
+            
+            heap = self._statuses_to_indices_heaps[ status ]
+            
+            # walk the heap tree smallest-first, so we only look at the top of it
+            
+            indices = []
+            seen_indices = set()
+            
+            candidates = [ ( heap[0], 0 ) ] if len( heap ) > 0 else []
+            
+            while len( candidates ) > 0 and len( indices ) < num_file_seeds:
+                
+                ( index, position ) = heapq.heappop( candidates )
+                
+                if index not in seen_indices and self._IndexIsValid( index, status ):
+                    
+                    indices.append( index )
+                    seen_indices.add( index )
+                    
+                
+                for child_position in ( 2 * position + 1, 2 * position + 2 ):
+                    
+                    if child_position < len( heap ):
+                        
+                        heapq.heappush( candidates, ( heap[ child_position ], child_position ) )
+                        
+                    
+                
+            
+            return [ self._file_seeds[ index ] for index in indices ]
+            
+        
+    
     def GetNumNewFilesSince( self, since: int ):
         
         num_files = 0
@@ -2489,7 +2747,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 index += 1
                 
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._ReindexFileSeeds()
             
             self._SetStatusDirty()
             
@@ -2499,10 +2757,24 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return len( new_file_seeds )
         
     
+    def NotifyFileSeedStatusChanged( self, file_seed: FileSeed ):
+        
+        # called by the file seed itself, so the status index is right even if whoever set the status never notifies us
+        
+        with self._lock:
+            
+            self._UpdateFileSeedStatuses( ( file_seed, ) )
+            
+            self._SetStatusDirty()
+            
+        
+    
     def NotifyFileSeedsUpdated( self, file_seeds: typing.Collection[ FileSeed ] ):
         
         with self._lock:
             
+            self._UpdateFileSeedStatuses( file_seeds )
+            
             self._SetStatusDirty()
             
         
@@ -2517,7 +2789,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             self._file_seeds = HydrusSerialisable.SerialisableList( [ file_seed for file_seed in self._file_seeds if file_seed not in file_seeds_to_delete ] )
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._ReindexFileSeeds()
             
             self._SetStatusDirty()
             
@@ -2529,7 +2801,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            file_seeds_to_delete = [ file_seed for file_seed in self._file_seeds if file_seed.status in statuses_to_remove ]
+            file_seeds_to_delete = list( itertools.chain.from_iterable( ( self._GetFileSeeds( status ) for status in statuses_to_remove ) ) )
             
         
         self.RemoveFileSeeds( file_seeds_to_delete )
@@ -2551,10 +2823,10 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             failed_file_seeds = self._GetFileSeeds( CC.STATUS_ERROR )
             
-            for file_seed in failed_file_seeds:
-                
-                file_seed.SetStatus( CC.STATUS_UNKNOWN )
-                
+        
+        for file_seed in failed_file_seeds:
+            
+            file_seed.SetStatus( CC.STATUS_UNKNOWN )
             
         
         self.NotifyFileSeedsUpdated( failed_file_seeds )
@@ -2566,10 +2838,10 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             ignored_file_seeds = self._GetFileSeeds( CC.STATUS_VETOED )
             
-            for file_seed in ignored_file_seeds:
-                
-                file_seed.SetStatus( CC.STATUS_UNKNOWN )
-                
+        
+        for file_seed in ignored_file_seeds:
+            
+            file_seed.SetStatus( CC.STATUS_UNKNOWN )
             
         
         self.NotifyFileSeedsUpdated( ignored_file_seeds )
@@ -2601,3 +2873,211 @@ def GenerateFileSeedCachesStatus( file_seed_caches: typing.Iterable[ FileSeedCac
     
     return fscs
     
+def ImportFileSeedPaths( file_seed_cache: FileSeedCache, file_seeds: typing.Collection[ FileSeed ], file_import_options: ClientImportOptions.FileImportOptions, status_hook = None ):
+    
+    # a batch version of FileSeed.ImportPath
+    # hashing and metadata/thumbnail/phash generation goes to the process pool, and the successful files are committed in one db job
+    
+    def set_error( file_seed, e ):
+        
+        if isinstance( e, HydrusExceptions.VetoException ):
+            
+            file_seed.SetStatus( CC.STATUS_VETOED, note = str( e ) )
+            
+        else:
+            
+            file_seed.SetStatus( CC.STATUS_ERROR, exception = e )
+            
+        
+    
+    def publish_status( text ):
+        
+        if status_hook is not None:
+            
+            status_hook( '{} files: {}'.format( HydrusData.ToHumanInt( len( file_seeds ) ), text ) )
+            
+        
+    
+    file_seeds_to_temp_paths = {}
+    file_seeds_to_file_import_jobs = {}
+    
+    try:
+        
+        publish_status( 'copying to temp' )
+        
+        for file_seed in file_seeds:
+            
+            try:
+                
+                if file_seed.file_seed_type != FILE_SEED_TYPE_HDD:
+                    
+                    raise HydrusExceptions.VetoException( 'Attempted to import as a path, but I do not think I am a path!' )
+                    
+                
+                path = file_seed.file_seed_data
+                
+                if not os.path.exists( path ):
+                    
+                    raise HydrusExceptions.VetoException( 'Source file does not exist!' )
+                    
+                
+                ( os_file_handle, temp_path ) = HydrusPaths.GetTempPath()
+                
+                file_seeds_to_temp_paths[ file_seed ] = ( os_file_handle, temp_path )
+                
+                copied = HydrusPaths.MirrorFile( path, temp_path )
+                
+                if not copied:
+                    
+                    raise Exception( 'File failed to copy to temp path--see log for error.' )
+                    
+                
+                file_seeds_to_file_import_jobs[ file_seed ] = FileImportJob( temp_path, file_import_options )
+                
+            except Exception as e:
+                
+                set_error( file_seed, e )
+                
+            
+        
+        publish_status( 'calculating pre-import status' )
+        
+        hash_futures = [ ( file_seed, SubmitFileImportWork( GenerateFileImportHash, file_import_job.GetTempPath() ) ) for ( file_seed, file_import_job ) in file_seeds_to_file_import_jobs.items() ]
+        
+        info_futures = []
+        
+        for ( file_seed, future ) in hash_futures:
+            
+            file_import_job = file_seeds_to_file_import_jobs[ file_seed ]
+            
+            try:
+                
+                hash = GetFileImportWorkResult( future, GenerateFileImportHash, file_import_job.GetTempPath() )
+                
+                ( pre_import_status, hash, note ) = file_import_job.GenerateHashAndStatus( hash = hash )
+                
+                if file_import_job.IsNewToDB():
+                    
+                    info_generation_args = file_import_job.GetInfoGenerationArgs()
+                    
+                    info_futures.append( ( file_seed, info_generation_args, SubmitFileImportWork( GenerateFileImportInfo, *info_generation_args ) ) )
+                    
+                else:
+                    
+                    file_seed.SetStatus( pre_import_status, note = note )
+                    file_seed.SetHash( hash )
+                    
+                
+            except Exception as e:
+                
+                set_error( file_seed, e )
+                
+                del file_seeds_to_file_import_jobs[ file_seed ]
+                
+            
+        
+        publish_status( 'generating metadata' )
+        
+        file_seeds_to_write = []
+        
+        for ( file_seed, info_generation_args, future ) in info_futures:
+            
+            file_import_job = file_seeds_to_file_import_jobs[ file_seed ]
+            
+            try:
+                
+                file_import_job.GenerateInfo( GetFileImportWorkResult( future, GenerateFileImportInfo, *info_generation_args ) )
+                
+                skip_result = file_import_job.GetSkipResult()
+                
+                if skip_result is None:
+                    
+                    file_import_job.AddToClientFiles()
+                    
+                    file_seeds_to_write.append( file_seed )
+                    
+                else:
+                    
+                    ( status, note ) = skip_result
+                    
+                    file_seed.SetStatus( status, note = note )
+                    file_seed.SetHash( file_import_job.GetHash() )
+                    
+                
+            except Exception as e:
+                
+                set_error( file_seed, e )
+                
+                del file_seeds_to_file_import_jobs[ file_seed ]
+                
+            
+        
+        if len( file_seeds_to_write ) > 0:
+            
+            publish_status( 'updating database' )
+            
+            try:
+                
+                results = HG.client_controller.WriteSynchronous( 'import_files', [ file_seeds_to_file_import_jobs[ file_seed ] for file_seed in file_seeds_to_write ] )
+                
+            except Exception as e:
+                
+                # something in the batch went wrong, so let's find out which one
+                
+                results = []
+                
+                for file_seed in file_seeds_to_write:
+                    
+                    try:
+                        
+                        results.append( HG.client_controller.WriteSynchronous( 'import_file', file_seeds_to_file_import_jobs[ file_seed ] ) )
+                        
+                    except Exception as e:
+                        
+                        results.append( e )
+                        
+                    
+                
+            
+            for ( file_seed, result ) in zip( file_seeds_to_write, results ):
+                
+                if isinstance( result, Exception ):
+                    
+                    set_error( file_seed, result )
+                    
+                    del file_seeds_to_file_import_jobs[ file_seed ]
+                    
+                else:
+                    
+                    ( status, note ) = result
+                    
+                    file_seed.SetStatus( status, note = note )
+                    file_seed.SetHash( file_seeds_to_file_import_jobs[ file_seed ].GetHash() )
+                    
+                
+            
+        
+        for ( file_seed, file_import_job ) in file_seeds_to_file_import_jobs.items():
+            
+            try:
+                
+                file_import_job.PubsubContentUpdates()
+                
+                file_seed.WriteContentUpdates()
+                
+            except Exception as e:
+                
+                set_error( file_seed, e )
+                
+            
+        
+    finally:
+        
+        for ( os_file_handle, temp_path ) in file_seeds_to_temp_paths.values():
+            
+            HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+            
+        
+    
+    file_seed_cache.NotifyFileSeedsUpdated( file_seeds )
+    
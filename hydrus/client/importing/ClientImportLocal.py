@@ -21,6 +21,43 @@ from hydrus.client.importing import ClientImportFileSeeds
 from hydrus.client.importing import ClientImportOptions
 from hydrus.client.metadata import ClientTags
 
+# how many new paths an import folder check adds to its file seed cache at once
+CHECK_FOLDER_FILE_SEED_BATCH_SIZE = 256
+
+# how many files a local file import works on at once, enough to keep the file import process pool busy
+HDD_IMPORT_FILE_SEED_BATCH_SIZE = ClientImportFileSeeds.FILE_IMPORT_NUM_PROCESSES * 2
+
+# import folders are reloaded from the db for every check, so their directory trackers live here, keyed by path
+IMPORT_FOLDER_DIRECTORY_TRACKERS = {}
+IMPORT_FOLDER_DIRECTORY_TRACKERS_LOCK = threading.Lock()
+
+def GetImportFolderDirectoryTracker( path ):
+    
+    with IMPORT_FOLDER_DIRECTORY_TRACKERS_LOCK:
+        
+        if path not in IMPORT_FOLDER_DIRECTORY_TRACKERS:
+            
+            IMPORT_FOLDER_DIRECTORY_TRACKERS[ path ] = ClientFiles.DirectoryChangeTracker( path )
+            
+        
+        return IMPORT_FOLDER_DIRECTORY_TRACKERS[ path ]
+        
+    
+def PruneImportFolderDirectoryTrackers( paths_in_use ):
+    
+    # when an import folder is deleted or pointed somewhere else, its old tracker would otherwise sit here for the rest of the session
+    
+    with IMPORT_FOLDER_DIRECTORY_TRACKERS_LOCK:
+        
+        for path in list( IMPORT_FOLDER_DIRECTORY_TRACKERS.keys() ):
+            
+            if path not in paths_in_use:
+                
+                del IMPORT_FOLDER_DIRECTORY_TRACKERS[ path ]
+                
+            
+        
+    
 class HDDImport( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_HDD_IMPORT
@@ -126,17 +163,15 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
     
     def _WorkOnFiles( self, page_key ):
         
-        file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+        file_seeds = self._file_seed_cache.GetNextFileSeeds( CC.STATUS_UNKNOWN, HDD_IMPORT_FILE_SEED_BATCH_SIZE )
         
-        if file_seed is None:
+        if len( file_seeds ) == 0:
             
             return
             
         
         did_substantial_work = False
         
-        path = file_seed.file_seed_data
-        
         with self._lock:
             
             self._current_action = 'importing'
@@ -155,11 +190,27 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
                 
             
         
-        file_seed.ImportPath( self._file_seed_cache, self._file_import_options, status_hook = status_hook )
+        if len( file_seeds ) == 1:
+            
+            ( file_seed, ) = file_seeds
+            
+            file_seed.ImportPath( self._file_seed_cache, self._file_import_options, status_hook = status_hook )
+            
+        else:
+            
+            ClientImportFileSeeds.ImportFileSeedPaths( self._file_seed_cache, file_seeds, self._file_import_options, status_hook = status_hook )
+            
         
         did_substantial_work = True
         
-        if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
+        for file_seed in file_seeds:
+            
+            if file_seed.status not in CC.SUCCESSFUL_IMPORT_STATES:
+                
+                continue
+                
+            
+            path = file_seed.file_seed_data
             
             if file_seed.ShouldPresent( self._file_import_options ):
                 
@@ -526,11 +577,13 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
     
     def _CheckFolder( self, job_key ):
         
-        all_paths = ClientFiles.GetAllFilePaths( [ self._path ] )
+        directory_tracker = GetImportFolderDirectoryTracker( self._path )
+        
+        all_paths = directory_tracker.GetAllFilePaths()
         
-        all_paths = HydrusPaths.FilterFreePaths( all_paths )
+        # filter in memory first, so we only test the new paths for being free and only sort those
         
-        file_seeds = []
+        new_paths = []
         
         for path in all_paths:
             
@@ -548,13 +601,31 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             
             if not self._file_seed_cache.HasFileSeed( file_seed ):
                 
-                file_seeds.append( file_seed )
+                new_paths.append( path )
                 
             
-            job_key.SetVariable( 'popup_text_1', 'checking: found ' + HydrusData.ToHumanInt( len( file_seeds ) ) + ' new files' )
-            
         
-        self._file_seed_cache.AddFileSeeds( file_seeds )
+        new_paths = HydrusPaths.FilterFreePaths( new_paths )
+        
+        HydrusData.HumanTextSort( new_paths )
+        
+        num_found = 0
+        
+        for chunk_of_paths in HydrusData.SplitListIntoChunks( new_paths, CHECK_FOLDER_FILE_SEED_BATCH_SIZE ):
+            
+            if job_key.IsCancelled():
+                
+                break
+                
+            
+            file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, path ) for path in chunk_of_paths ]
+            
+            self._file_seed_cache.AddFileSeeds( file_seeds )
+            
+            num_found += len( file_seeds )
+            
+            job_key.SetVariable( 'popup_text_1', 'checking: found ' + HydrusData.ToHumanInt( num_found ) + ' new files' )
+            
         
         self._last_checked = HydrusData.GetNow()
         self._check_now = False
@@ -898,6 +969,11 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         return self._file_seed_cache
         
     
+    def GetPath( self ):
+        
+        return self._path
+        
+    
     def Paused( self ):
         
         return self._paused
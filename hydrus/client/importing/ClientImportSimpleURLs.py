@@ -837,6 +837,10 @@ class URLsImport( HydrusSerialisable.SerialisableBase ):
             
             time.sleep( 3 )
             
+        finally:
+            
+            self._file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+            
         
         if did_substantial_work:
             
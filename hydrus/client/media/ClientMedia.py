@@ -1,4 +1,5 @@
 import collections
+import itertools
 import random
 import typing
 
@@ -744,6 +745,202 @@ class MediaCollect( HydrusSerialisable.SerialisableBase ):
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_MEDIA_COLLECT ] = MediaCollect
 
+class MediaTagCountAggregator( object ):
+    
+    def __init__( self, tag_service_key, tag_display_type ):
+        
+        self._tag_service_key = tag_service_key
+        self._tag_display_type = tag_display_type
+        
+        # we remember exactly what we counted for each media so we can subtract it later even if its tags have since changed
+        self._medias_to_counted_tags = {}
+        
+        self._current_tags_to_count = collections.Counter()
+        self._deleted_tags_to_count = collections.Counter()
+        self._pending_tags_to_count = collections.Counter()
+        self._petitioned_tags_to_count = collections.Counter()
+        
+        self._counters = ( self._current_tags_to_count, self._deleted_tags_to_count, self._pending_tags_to_count, self._petitioned_tags_to_count )
+        
+    
+    def _AddMedias( self, medias ):
+        
+        changed_tags = set()
+        
+        for media in medias:
+            
+            if media in self._medias_to_counted_tags:
+                
+                continue
+                
+            
+            counted_tags = self._GetCountedTags( media )
+            
+            self._medias_to_counted_tags[ media ] = counted_tags
+            
+            for ( counter, tags ) in zip( self._counters, counted_tags ):
+                
+                if len( tags ) > 0:
+                    
+                    counter.update( tags )
+                    
+                    changed_tags.update( tags )
+                    
+                
+            
+        
+        return changed_tags
+        
+    
+    def _GetCountedTags( self, media ):
+        
+        if media.IsCollection():
+            
+            tags_managers = media.GetSingletonsTagsManagers()
+            
+        else:
+            
+            tags_managers = ( media.GetTagsManager(), )
+            
+        
+        all_statuses_to_tags = [ tags_manager.GetStatusesToTags( self._tag_service_key, self._tag_display_type ) for tags_manager in tags_managers ]
+        
+        return tuple( ( tuple( itertools.chain.from_iterable( ( statuses_to_tags[ status ] for statuses_to_tags in all_statuses_to_tags ) ) ) for status in ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_DELETED, HC.CONTENT_STATUS_PENDING, HC.CONTENT_STATUS_PETITIONED ) ) )
+        
+    
+    def _RemoveMedias( self, medias ):
+        
+        changed_tags = set()
+        
+        for media in medias:
+            
+            counted_tags = self._medias_to_counted_tags.pop( media, None )
+            
+            if counted_tags is None:
+                
+                continue
+                
+            
+            for ( counter, tags ) in zip( self._counters, counted_tags ):
+                
+                for tag in tags:
+                    
+                    count = counter[ tag ] - 1
+                    
+                    if count > 0:
+                        
+                        counter[ tag ] = count
+                        
+                    else:
+                        
+                        del counter[ tag ]
+                        
+                    
+                
+                changed_tags.update( tags )
+                
+            
+        
+        return changed_tags
+        
+    
+    def _Reset( self, medias ):
+        
+        changed_tags = set()
+        
+        for counter in self._counters:
+            
+            changed_tags.update( counter.keys() )
+            
+            counter.clear()
+            
+        
+        self._medias_to_counted_tags = {}
+        
+        changed_tags.update( self._AddMedias( medias ) )
+        
+        return changed_tags
+        
+    
+    def AddMedias( self, medias ):
+        
+        return self._AddMedias( medias )
+        
+    
+    def GetCounts( self ):
+        
+        # these are live and get updated in place, so don't edit them
+        
+        return self._counters
+        
+    
+    def GetMedias( self ):
+        
+        return set( self._medias_to_counted_tags.keys() )
+        
+    
+    def GetNumMedias( self ):
+        
+        return len( self._medias_to_counted_tags )
+        
+    
+    def RecountAll( self ):
+        
+        return self._Reset( list( self._medias_to_counted_tags.keys() ) )
+        
+    
+    def RecountMedias( self, medias ):
+        
+        medias = [ media for media in medias if media in self._medias_to_counted_tags ]
+        
+        changed_tags = self._RemoveMedias( medias )
+        
+        changed_tags.update( self._AddMedias( medias ) )
+        
+        return changed_tags
+        
+    
+    def RemoveMedias( self, medias ):
+        
+        return self._RemoveMedias( medias )
+        
+    
+    def ResetMedias( self, medias ):
+        
+        return self._Reset( medias )
+        
+    
+    def SetMedias( self, medias ):
+        
+        if not isinstance( medias, set ):
+            
+            medias = set( medias )
+            
+        
+        removees = [ media for media in self._medias_to_counted_tags if media not in medias ]
+        adds = [ media for media in medias if media not in self._medias_to_counted_tags ]
+        
+        # if we are dropping to a much smaller selection (e.g. 5000 -> 1), it is cheaper to just count the new lot from scratch
+        
+        if len( removees ) + len( adds ) > len( medias ):
+            
+            return self._Reset( medias )
+            
+        
+        changed_tags = self._RemoveMedias( removees )
+        
+        changed_tags.update( self._AddMedias( adds ) )
+        
+        return changed_tags
+        
+    
+    def SetTagServiceKey( self, tag_service_key ):
+        
+        self._tag_service_key = tag_service_key
+        
+        return self.RecountAll()
+        
+    
 class MediaList( object ):
     
     def __init__( self, file_service_key, media_results ):
@@ -783,6 +980,8 @@ class MediaList( object ):
         self._singleton_media = set( self._sorted_media )
         self._collected_media = set()
         
+        self._tag_count_aggregators = []
+        
         self._RecalcHashes()
         
     
@@ -966,6 +1165,8 @@ class MediaList( object ):
         
         affected_singleton_media = self._GetMedia( hashes, discriminator = 'singletons' )
         
+        shrunk_collected_media = self._GetMedia( hashes, discriminator = 'collections' )
+        
         for media in self._collected_media:
             
             media._RemoveMediaByHashes( hashes )
@@ -975,6 +1176,11 @@ class MediaList( object ):
         
         self._RemoveMediaDirectly( affected_singleton_media, affected_collected_media )
         
+        for aggregator in self._tag_count_aggregators:
+            
+            aggregator.RecountMedias( shrunk_collected_media )
+            
+        
     
     def _RemoveMediaDirectly( self, singleton_media, collected_media ):
         
@@ -993,6 +1199,11 @@ class MediaList( object ):
         
         self._sorted_media.remove_items( singleton_media.union( collected_media ) )
         
+        for aggregator in self._tag_count_aggregators:
+            
+            aggregator.RemoveMedias( singleton_media.union( collected_media ) )
+            
+        
         self._RecalcHashes()
         
     
@@ -1024,6 +1235,16 @@ class MediaList( object ):
         return new_media
         
     
+    def AddTagCountAggregator( self, aggregator: MediaTagCountAggregator ):
+        
+        # the aggregator's counts will now follow tag changes and removals in this list
+        
+        if aggregator not in self._tag_count_aggregators:
+            
+            self._tag_count_aggregators.append( aggregator )
+            
+        
+    
     def Collect( self, media_collect = None ):
         
         if media_collect == None:
@@ -1555,6 +1776,32 @@ class MediaList( object ):
             m.ProcessContentUpdates( service_keys_to_content_updates )
             
         
+        if len( self._tag_count_aggregators ) > 0:
+            
+            mappings_hashes = set()
+            
+            for content_updates in service_keys_to_content_updates.values():
+                
+                for content_update in content_updates:
+                    
+                    if content_update.GetDataType() == HC.CONTENT_TYPE_MAPPINGS:
+                        
+                        mappings_hashes.update( content_update.GetHashes() )
+                        
+                    
+                
+            
+            if len( mappings_hashes ) > 0:
+                
+                affected_media = self._GetMedia( mappings_hashes )
+                
+                for aggregator in self._tag_count_aggregators:
+                    
+                    aggregator.RecountMedias( affected_media )
+                    
+                
+            
+        
         for ( service_key, content_updates ) in service_keys_to_content_updates.items():
             
             for content_update in content_updates:
@@ -1610,6 +1857,14 @@ class MediaList( object ):
                     self.ResetService( service_key )
                     
                 
+                if action in ( HC.SERVICE_UPDATE_DELETE_PENDING, HC.SERVICE_UPDATE_RESET ):
+                    
+                    for aggregator in self._tag_count_aggregators:
+                        
+                        aggregator.RecountAll()
+                        
+                    
+                
             
         
     
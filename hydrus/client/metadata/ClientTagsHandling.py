@@ -1,5 +1,10 @@
+import array
+import bisect
 import collections
 import random
+import re
+import string
+import sys
 import threading
 import time
 import typing
@@ -14,6 +19,9 @@ from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientServices
 from hydrus.client.metadata import ClientTags
 
+ASCII_UPPERCASE_TO_LOWERCASE = str.maketrans( string.ascii_uppercase, string.ascii_lowercase )
+FTS4_SIMPLE_TOKEN_RE = re.compile( '[0-9A-Za-z\u0080-\U0010ffff]+' )
+
 class TagAutocompleteOptions( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_TAG_AUTOCOMPLETE_OPTIONS
@@ -803,6 +811,214 @@ class TagDisplayManager( HydrusSerialisable.SerialisableBase ):
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_TAG_DISPLAY_MANAGER ] = TagDisplayManager
 
+def GetFTS4SimpleTokens( text: str ) -> typing.List[ str ]:
+    
+    # the same tokens sqlite's 'simple' fts4 tokenizer makes: runs of ascii alphanumerics and anything >= 128, with ascii case folded
+    
+    return FTS4_SIMPLE_TOKEN_RE.findall( text.translate( ASCII_UPPERCASE_TO_LOWERCASE ) )
+    
+def GetLookupDictMemoryUsage( lookup: dict ):
+    
+    return sys.getsizeof( lookup ) + sum( ( sys.getsizeof( key ) + sys.getsizeof( value ) for ( key, value ) in lookup.items() ) )
+    
+def RemoveFromArrayLookup( lookup: typing.Dict[ int, array.array ], keys_to_removees: typing.Dict[ int, typing.Set[ int ] ] ):
+    
+    # we rebuild each array once, rather than doing a remove per item, since popular ancestors can have a lot of kids
+    
+    for ( key, removees ) in keys_to_removees.items():
+        
+        if key not in lookup:
+            
+            continue
+            
+        
+        new_array = array.array( 'q', ( value for value in lookup[ key ] if value not in removees ) )
+        
+        if len( new_array ) == 0:
+            
+            del lookup[ key ]
+            
+        else:
+            
+            lookup[ key ] = new_array
+            
+        
+    
+class TagParentsLookupCache( object ):
+    
+    # an in-memory copy of a child_tag_id -> ancestor_tag_id parents lookup table, held both ways round
+    # the db updates this as it writes the table, so it never has to be reloaded unless the whole table is rewritten
+    
+    def __init__( self, pairs: typing.Iterable[ typing.Tuple[ int, int ] ] = () ):
+        
+        self._descendants_to_ancestors = {}
+        self._ancestors_to_descendants = {}
+        
+        self._num_pairs = 0
+        
+        self.AddPairs( pairs )
+        
+    
+    def AddPairs( self, pairs: typing.Iterable[ typing.Tuple[ int, int ] ] ):
+        
+        for ( child_tag_id, ancestor_tag_id ) in pairs:
+            
+            if child_tag_id in self._descendants_to_ancestors:
+                
+                ancestors = self._descendants_to_ancestors[ child_tag_id ]
+                
+                if ancestor_tag_id in ancestors:
+                    
+                    continue
+                    
+                
+                ancestors.append( ancestor_tag_id )
+                
+            else:
+                
+                self._descendants_to_ancestors[ child_tag_id ] = array.array( 'q', ( ancestor_tag_id, ) )
+                
+            
+            if ancestor_tag_id in self._ancestors_to_descendants:
+                
+                self._ancestors_to_descendants[ ancestor_tag_id ].append( child_tag_id )
+                
+            else:
+                
+                self._ancestors_to_descendants[ ancestor_tag_id ] = array.array( 'q', ( child_tag_id, ) )
+                
+            
+            self._num_pairs += 1
+            
+        
+    
+    def DeletePairs( self, pairs: typing.Iterable[ typing.Tuple[ int, int ] ] ):
+        
+        children_to_removees = collections.defaultdict( set )
+        ancestors_to_removees = collections.defaultdict( set )
+        
+        for ( child_tag_id, ancestor_tag_id ) in set( pairs ):
+            
+            if child_tag_id in self._descendants_to_ancestors and ancestor_tag_id in self._descendants_to_ancestors[ child_tag_id ]:
+                
+                children_to_removees[ child_tag_id ].add( ancestor_tag_id )
+                ancestors_to_removees[ ancestor_tag_id ].add( child_tag_id )
+                
+                self._num_pairs -= 1
+                
+            
+        
+        RemoveFromArrayLookup( self._descendants_to_ancestors, children_to_removees )
+        RemoveFromArrayLookup( self._ancestors_to_descendants, ancestors_to_removees )
+        
+    
+    def DeleteTagIds( self, tag_ids: typing.Collection[ int ] ):
+        
+        # same as 'DELETE WHERE child_tag_id = ? OR ancestor_tag_id = ?'
+        
+        pairs = set()
+        
+        for tag_id in tag_ids:
+            
+            if tag_id in self._descendants_to_ancestors:
+                
+                pairs.update( ( ( tag_id, ancestor_tag_id ) for ancestor_tag_id in self._descendants_to_ancestors[ tag_id ] ) )
+                
+            
+            if tag_id in self._ancestors_to_descendants:
+                
+                pairs.update( ( ( child_tag_id, tag_id ) for child_tag_id in self._ancestors_to_descendants[ tag_id ] ) )
+                
+            
+        
+        self.DeletePairs( pairs )
+        
+    
+    def FilterChained( self, tag_ids: typing.Collection[ int ] ) -> typing.Set[ int ]:
+        
+        return { tag_id for tag_id in tag_ids if tag_id in self._descendants_to_ancestors or tag_id in self._ancestors_to_descendants }
+        
+    
+    def GetAncestors( self, tag_id: int ) -> typing.Set[ int ]:
+        
+        return set( self._descendants_to_ancestors.get( tag_id, () ) )
+        
+    
+    def GetChainMembers( self, tag_id: int ) -> typing.Set[ int ]:
+        
+        chain_tag_ids = set( self._ancestors_to_descendants.get( tag_id, () ) )
+        
+        chain_tag_ids.update( self._descendants_to_ancestors.get( tag_id, () ) )
+        
+        if len( chain_tag_ids ) == 0:
+            
+            chain_tag_ids = { tag_id }
+            
+        
+        return chain_tag_ids
+        
+    
+    def GetChainsMembers( self, tag_ids: typing.Collection[ int ] ) -> typing.Set[ int ]:
+        
+        chain_tag_ids = set( tag_ids )
+        we_have_looked_up = set()
+        next_search_tag_ids = set( tag_ids )
+        
+        while len( next_search_tag_ids ) > 0:
+            
+            round_of_tag_ids = set()
+            
+            for tag_id in next_search_tag_ids:
+                
+                round_of_tag_ids.update( self._ancestors_to_descendants.get( tag_id, () ) )
+                round_of_tag_ids.update( self._descendants_to_ancestors.get( tag_id, () ) )
+                
+            
+            chain_tag_ids.update( round_of_tag_ids )
+            
+            we_have_looked_up.update( next_search_tag_ids )
+            
+            next_search_tag_ids = round_of_tag_ids.difference( we_have_looked_up )
+            
+        
+        return chain_tag_ids
+        
+    
+    def GetDescendants( self, tag_id: int ) -> typing.Set[ int ]:
+        
+        return set( self._ancestors_to_descendants.get( tag_id, () ) )
+        
+    
+    def GetMemoryUsage( self ) -> int:
+        
+        return GetLookupDictMemoryUsage( self._descendants_to_ancestors ) + GetLookupDictMemoryUsage( self._ancestors_to_descendants )
+        
+    
+    def GetNumPairs( self ) -> int:
+        
+        return self._num_pairs
+        
+    
+    def GetTagsToAncestors( self, tag_ids: typing.Collection[ int ] ) -> typing.Dict[ int, typing.Set[ int ] ]:
+        
+        return { tag_id : self.GetAncestors( tag_id ) for tag_id in tag_ids }
+        
+    
+    def GetTagsToDescendants( self, tag_ids: typing.Collection[ int ] ) -> typing.Dict[ int, typing.Set[ int ] ]:
+        
+        return { tag_id : self.GetDescendants( tag_id ) for tag_id in tag_ids }
+        
+    
+    def IsChained( self, tag_id: int ) -> bool:
+        
+        if True in ( ancestor_tag_id != tag_id for ancestor_tag_id in self._descendants_to_ancestors.get( tag_id, () ) ):
+            
+            return True
+            
+        
+        return True in ( child_tag_id != tag_id for child_tag_id in self._ancestors_to_descendants.get( tag_id, () ) )
+        
+    
 class TagParentsStructure( object ):
     
     def __init__( self ):
@@ -973,3 +1189,334 @@ class TagSiblingsStructure( object ):
         return self._bad_tags_to_ideal_tags
         
     
+class TagSiblingsLookupCache( object ):
+    
+    # an in-memory copy of a bad_tag_id -> ideal_tag_id siblings lookup table, with the chains held the other way round
+    # the db updates this as it writes the table, so it never has to be reloaded unless the whole table is rewritten
+    
+    def __init__( self, pairs: typing.Iterable[ typing.Tuple[ int, int ] ] = () ):
+        
+        self._bad_tag_ids_to_ideal_tag_ids = {}
+        self._ideal_tag_ids_to_bad_tag_ids = {}
+        
+        self.AddPairs( pairs )
+        
+    
+    def AddPairs( self, pairs: typing.Iterable[ typing.Tuple[ int, int ] ] ):
+        
+        for ( bad_tag_id, ideal_tag_id ) in pairs:
+            
+            # bad_tag_id is the primary key, so this is INSERT OR IGNORE
+            
+            if bad_tag_id in self._bad_tag_ids_to_ideal_tag_ids:
+                
+                continue
+                
+            
+            self._bad_tag_ids_to_ideal_tag_ids[ bad_tag_id ] = ideal_tag_id
+            
+            if ideal_tag_id in self._ideal_tag_ids_to_bad_tag_ids:
+                
+                self._ideal_tag_ids_to_bad_tag_ids[ ideal_tag_id ].append( bad_tag_id )
+                
+            else:
+                
+                self._ideal_tag_ids_to_bad_tag_ids[ ideal_tag_id ] = array.array( 'q', ( bad_tag_id, ) )
+                
+            
+        
+    
+    def DeletePairs( self, pairs: typing.Iterable[ typing.Tuple[ int, int ] ] ):
+        
+        ideals_to_removees = collections.defaultdict( set )
+        
+        for ( bad_tag_id, ideal_tag_id ) in pairs:
+            
+            if self._bad_tag_ids_to_ideal_tag_ids.get( bad_tag_id, None ) == ideal_tag_id:
+                
+                del self._bad_tag_ids_to_ideal_tag_ids[ bad_tag_id ]
+                
+                ideals_to_removees[ ideal_tag_id ].add( bad_tag_id )
+                
+            
+        
+        RemoveFromArrayLookup( self._ideal_tag_ids_to_bad_tag_ids, ideals_to_removees )
+        
+    
+    def DeleteTagIds( self, tag_ids: typing.Collection[ int ] ):
+        
+        # same as 'DELETE WHERE bad_tag_id = ? OR ideal_tag_id = ?'
+        
+        pairs = set()
+        
+        for tag_id in tag_ids:
+            
+            if tag_id in self._bad_tag_ids_to_ideal_tag_ids:
+                
+                pairs.add( ( tag_id, self._bad_tag_ids_to_ideal_tag_ids[ tag_id ] ) )
+                
+            
+            if tag_id in self._ideal_tag_ids_to_bad_tag_ids:
+                
+                pairs.update( ( ( bad_tag_id, tag_id ) for bad_tag_id in self._ideal_tag_ids_to_bad_tag_ids[ tag_id ] ) )
+                
+            
+        
+        self.DeletePairs( pairs )
+        
+    
+    def FilterChained( self, tag_ids: typing.Collection[ int ] ) -> typing.Set[ int ]:
+        
+        return { tag_id for tag_id in tag_ids if tag_id in self._bad_tag_ids_to_ideal_tag_ids or tag_id in self._ideal_tag_ids_to_bad_tag_ids }
+        
+    
+    def GetBadTagIdsToIdealTagIds( self ) -> typing.Dict[ int, int ]:
+        
+        return dict( self._bad_tag_ids_to_ideal_tag_ids )
+        
+    
+    def GetChainMembersFromIdeal( self, ideal_tag_id: int ) -> typing.Set[ int ]:
+        
+        chain_tag_ids = set( self._ideal_tag_ids_to_bad_tag_ids.get( ideal_tag_id, () ) )
+        
+        chain_tag_ids.add( ideal_tag_id )
+        
+        return chain_tag_ids
+        
+    
+    def GetChainsMembersFromIdeals( self, ideal_tag_ids: typing.Collection[ int ] ) -> typing.Set[ int ]:
+        
+        chain_tag_ids = set( ideal_tag_ids )
+        
+        for ideal_tag_id in ideal_tag_ids:
+            
+            chain_tag_ids.update( self._ideal_tag_ids_to_bad_tag_ids.get( ideal_tag_id, () ) )
+            
+        
+        return chain_tag_ids
+        
+    
+    def GetIdeal( self, tag_id: int ) -> int:
+        
+        return self._bad_tag_ids_to_ideal_tag_ids.get( tag_id, tag_id )
+        
+    
+    def GetIdeals( self, tag_ids: typing.Collection[ int ] ) -> typing.Set[ int ]:
+        
+        return { self._bad_tag_ids_to_ideal_tag_ids.get( tag_id, tag_id ) for tag_id in tag_ids }
+        
+    
+    def GetIdealsToChains( self, ideal_tag_ids: typing.Collection[ int ] ) -> typing.Dict[ int, typing.Set[ int ] ]:
+        
+        return { ideal_tag_id : self.GetChainMembersFromIdeal( ideal_tag_id ) for ideal_tag_id in ideal_tag_ids }
+        
+    
+    def GetMemoryUsage( self ) -> int:
+        
+        return GetLookupDictMemoryUsage( self._bad_tag_ids_to_ideal_tag_ids ) + GetLookupDictMemoryUsage( self._ideal_tag_ids_to_bad_tag_ids )
+        
+    
+    def GetNumPairs( self ) -> int:
+        
+        return len( self._bad_tag_ids_to_ideal_tag_ids )
+        
+    
+    def GetTagsToIdeals( self, tag_ids: typing.Collection[ int ] ) -> typing.Dict[ int, int ]:
+        
+        return { tag_id : self._bad_tag_ids_to_ideal_tag_ids.get( tag_id, tag_id ) for tag_id in tag_ids }
+        
+    
+    def IsChained( self, tag_id: int ) -> bool:
+        
+        if self._bad_tag_ids_to_ideal_tag_ids.get( tag_id, tag_id ) != tag_id:
+            
+            return True
+            
+        
+        return True in ( bad_tag_id != tag_id for bad_tag_id in self._ideal_tag_ids_to_bad_tag_ids.get( tag_id, () ) )
+        
+    
+class SubtagPrefixIndex( object ):
+    
+    # an in-memory stand-in for a subtags fts4 table, for the simple 'samus ar*' searches that autocomplete does on every keystroke
+    # we hold the word-start suffixes of every searchable subtag in one sorted list, so a prefix search is two bisects and a slice
+    # new rows and deletes go into small sets, and we fold them back into the main list every now and then
+    
+    MAX_KEY_TOKENS = 8
+    
+    def __init__( self, subtag_ids_and_searchable_subtags: typing.Iterable[ typing.Tuple[ int, str ] ] = () ):
+        
+        self._keys = []
+        self._subtag_ids = array.array( 'q' )
+        
+        self._overflow_rows = set()
+        self._sorted_overflow_rows = []
+        self._overflow_is_sorted = True
+        
+        self._deleted_subtag_ids = set()
+        
+        rows = [ row for ( subtag_id, searchable_subtag ) in subtag_ids_and_searchable_subtags for row in self._GenerateRows( subtag_id, searchable_subtag ) ]
+        
+        self._SetRows( rows )
+        
+    
+    def _Compact( self ):
+        
+        rows = [ row for row in zip( self._keys, self._subtag_ids ) if row[1] not in self._deleted_subtag_ids ]
+        
+        rows.extend( self._overflow_rows )
+        
+        self._SetRows( rows )
+        
+    
+    def _GenerateRows( self, subtag_id: int, searchable_subtag: str ):
+        
+        tokens = GetFTS4SimpleTokens( searchable_subtag )
+        
+        return [ ( ' '.join( tokens[ i : i + self.MAX_KEY_TOKENS ] ), subtag_id ) for i in range( len( tokens ) ) ]
+        
+    
+    def _HasRow( self, key: str, subtag_id: int ):
+        
+        if ( key, subtag_id ) in self._overflow_rows:
+            
+            return True
+            
+        
+        index = bisect.bisect_left( self._keys, key )
+        
+        while index < len( self._keys ) and self._keys[ index ] == key:
+            
+            if self._subtag_ids[ index ] == subtag_id:
+                
+                return True
+                
+            
+            index += 1
+            
+        
+        return False
+        
+    
+    def _SetRows( self, rows ):
+        
+        rows.sort()
+        
+        self._keys = [ key for ( key, subtag_id ) in rows ]
+        self._subtag_ids = array.array( 'q', ( subtag_id for ( key, subtag_id ) in rows ) )
+        
+        self._overflow_rows = set()
+        self._sorted_overflow_rows = []
+        self._overflow_is_sorted = True
+        
+        self._deleted_subtag_ids = set()
+        
+    
+    def AddSubtags( self, subtag_ids_and_searchable_subtags: typing.Iterable[ typing.Tuple[ int, str ] ] ):
+        
+        for ( subtag_id, searchable_subtag ) in subtag_ids_and_searchable_subtags:
+            
+            rows = self._GenerateRows( subtag_id, searchable_subtag )
+            
+            if len( rows ) == 0:
+                
+                continue
+                
+            
+            # docid is the primary key, so this is INSERT OR IGNORE. if it was deleted, its old rows just come back to life
+            
+            self._deleted_subtag_ids.discard( subtag_id )
+            
+            if self._HasRow( rows[0][0], subtag_id ):
+                
+                continue
+                
+            
+            self._overflow_rows.update( rows )
+            
+            self._overflow_is_sorted = False
+            
+        
+        if len( self._overflow_rows ) > max( 1024, len( self._keys ) // 16 ):
+            
+            self._Compact()
+            
+        
+    
+    def DeleteSubtagIds( self, subtag_ids: typing.Collection[ int ] ):
+        
+        subtag_ids = set( subtag_ids )
+        
+        if True in ( row[1] in subtag_ids for row in self._overflow_rows ):
+            
+            self._overflow_rows = { row for row in self._overflow_rows if row[1] not in subtag_ids }
+            
+            self._overflow_is_sorted = False
+            
+        
+        self._deleted_subtag_ids.update( subtag_ids )
+        
+        if len( self._deleted_subtag_ids ) > max( 1024, len( self._keys ) // 16 ):
+            
+            self._Compact()
+            
+        
+    
+    def GetMemoryUsage( self ) -> int:
+        
+        memory_usage = sys.getsizeof( self._keys ) + sum( ( sys.getsizeof( key ) for key in self._keys ) ) + sys.getsizeof( self._subtag_ids )
+        memory_usage += sys.getsizeof( self._overflow_rows ) + sys.getsizeof( self._sorted_overflow_rows ) + sys.getsizeof( self._deleted_subtag_ids )
+        
+        return memory_usage
+        
+    
+    def GetSubtagIdsFromWildcard( self, subtag_wildcard: str ) -> typing.Optional[ typing.Set[ int ] ]:
+        
+        # this returns None if the wildcard is not a simple prefix search, in which case go to the fts4 table as normal
+        
+        if subtag_wildcard.count( '*' ) != 1 or not subtag_wildcard.endswith( '*' ) or len( subtag_wildcard ) < 2:
+            
+            return None
+            
+        
+        # fts4 only does prefix matching on a token, so 'samus *' and friends have different rules
+        
+        if len( GetFTS4SimpleTokens( subtag_wildcard[-2] ) ) == 0:
+            
+            return None
+            
+        
+        tokens = GetFTS4SimpleTokens( subtag_wildcard[:-1] )
+        
+        if len( tokens ) > self.MAX_KEY_TOKENS or ord( tokens[-1][-1] ) == sys.maxunicode:
+            
+            return None
+            
+        
+        prefix = ' '.join( tokens )
+        prefix_upper_bound = prefix[:-1] + chr( ord( prefix[-1] ) + 1 )
+        
+        lo = bisect.bisect_left( self._keys, prefix )
+        hi = bisect.bisect_left( self._keys, prefix_upper_bound, lo = lo )
+        
+        subtag_ids = set( self._subtag_ids[ lo : hi ] )
+        
+        if not self._overflow_is_sorted:
+            
+            self._sorted_overflow_rows = sorted( self._overflow_rows )
+            
+            self._overflow_is_sorted = True
+            
+        
+        # ( prefix, ) sorts before every ( prefix..., subtag_id ) row
+        
+        lo = bisect.bisect_left( self._sorted_overflow_rows, ( prefix, ) )
+        hi = bisect.bisect_left( self._sorted_overflow_rows, ( prefix_upper_bound, ), lo = lo )
+        
+        subtag_ids.update( ( subtag_id for ( key, subtag_id ) in self._sorted_overflow_rows[ lo : hi ] ) )
+        
+        subtag_ids.difference_update( self._deleted_subtag_ids )
+        
+        return subtag_ids
+        
+    
@@ -1,4 +1,5 @@
 import collections
+import heapq
 import http.cookiejar
 import os
 import re
@@ -265,6 +266,20 @@ def ConvertURLIntoDomain( url ):
     
     return domain
     
+def ConvertURLIntoMatchableParts( url ):
+    
+    # parse a url once into the bits URLClass matching looks at, so we can test it against many url classes
+    
+    p = ParseURL( url )
+    
+    url_path = p.path.lstrip( '/' )
+    
+    url_path_components = url_path.split( '/' )
+    
+    ( url_parameters, param_order ) = ConvertQueryTextToDict( p.query )
+    
+    return ( p.netloc, url_path_components, url_parameters )
+    
 def ConvertURLIntoSecondLevelDomain( url ):
     
     domain = ConvertURLIntoDomain( url )
@@ -436,6 +451,9 @@ def UnicodeNormaliseURL( url: str ):
     
     return url
     
+# how many recent urls we remember the url class and normalised url of
+URL_CACHE_SIZE = 10000
+
 VALID_DENIED = 0
 VALID_APPROVED = 1
 VALID_UNKNOWN = 2
@@ -471,6 +489,10 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         self._url_class_keys_to_parser_keys = HydrusSerialisable.SerialisableBytesDictionary()
         
         self._second_level_domains_to_url_classes = collections.defaultdict( list )
+        self._second_level_domains_to_url_class_indices = {}
+        
+        self._urls_to_url_classes = collections.OrderedDict()
+        self._urls_to_normalised_urls = collections.OrderedDict()
         
         self._second_level_domains_to_network_infrastructure_errors = collections.defaultdict( list )
         
@@ -654,28 +676,73 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
     
     def _GetURLClass( self, url ):
         
+        if url in self._urls_to_url_classes:
+            
+            self._urls_to_url_classes.move_to_end( url )
+            
+            return self._urls_to_url_classes[ url ]
+            
+        
         domain = ConvertURLIntoSecondLevelDomain( url )
         
-        if domain in self._second_level_domains_to_url_classes:
+        url_class = None
+        
+        if domain in self._second_level_domains_to_url_class_indices:
             
-            url_classes = self._second_level_domains_to_url_classes[ domain ]
+            ( netloc, url_path_components, url_parameters ) = ConvertURLIntoMatchableParts( url )
             
-            for url_class in url_classes:
-                
-                try:
-                    
-                    url_class.Test( url )
-                    
-                    return url_class
-                    
-                except HydrusExceptions.URLClassException:
-                    
-                    continue
-                    
-                
+            url_class = self._second_level_domains_to_url_class_indices[ domain ].GetURLClass( netloc, url_path_components, url_parameters )
             
         
-        return None
+        self._urls_to_url_classes[ url ] = url_class
+        
+        if len( self._urls_to_url_classes ) > URL_CACHE_SIZE:
+            
+            self._urls_to_url_classes.popitem( last = False )
+            
+        
+        return url_class
+        
+    
+    def _NormaliseURL( self, url ):
+        
+        if url in self._urls_to_normalised_urls:
+            
+            self._urls_to_normalised_urls.move_to_end( url )
+            
+            return self._urls_to_normalised_urls[ url ]
+            
+        
+        url_class = self._GetURLClass( url )
+        
+        if url_class is None:
+            
+            p = ParseURL( url )
+            
+            scheme = p.scheme
+            netloc = p.netloc
+            path = p.path
+            params = p.params
+            query = AlphabetiseQueryText( p.query )
+            fragment = ''
+            
+            r = urllib.parse.ParseResult( scheme, netloc, path, params, query, fragment )
+            
+            normalised_url = r.geturl()
+            
+        else:
+            
+            normalised_url = url_class.Normalise( url )
+            
+        
+        self._urls_to_normalised_urls[ url ] = normalised_url
+        
+        if len( self._urls_to_normalised_urls ) > URL_CACHE_SIZE:
+            
+            self._urls_to_normalised_urls.popitem( last = False )
+            
+        
+        return normalised_url
         
     
     def _GetURLToFetchAndParser( self, url ):
@@ -753,6 +820,11 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
             NetworkDomainManager.STATICSortURLClassesDescendingComplexity( url_classes )
             
         
+        self._second_level_domains_to_url_class_indices = { domain : URLClassIndex( url_classes ) for ( domain, url_classes ) in self._second_level_domains_to_url_classes.items() }
+        
+        self._urls_to_url_classes = collections.OrderedDict()
+        self._urls_to_normalised_urls = collections.OrderedDict()
+        
         self._gug_keys_to_gugs = { gug.GetGUGKey() : gug for gug in self._gugs }
         self._gug_names_to_gugs = { gug.GetName() : gug for gug in self._gugs }
         
@@ -1670,6 +1742,30 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         return ( url_type, match_name, can_parse )
         
     
+    def GetURLsToURLClasses( self, urls ):
+        
+        # bulk version for importers. urls with no url class map to None, and anything that is not a valid url is left out
+        
+        urls_to_url_classes = {}
+        
+        with self._lock:
+            
+            for url in urls:
+                
+                try:
+                    
+                    urls_to_url_classes[ url ] = self._GetURLClass( url )
+                    
+                except HydrusExceptions.URLClassException:
+                    
+                    continue
+                    
+                
+            
+        
+        return urls_to_url_classes
+        
+    
     def GetURLToFetchAndParser( self, url ):
         
         with self._lock:
@@ -1743,30 +1839,32 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            url_class = self._GetURLClass( url )
+            return self._NormaliseURL( url )
             
-            if url_class is None:
-                
-                p = ParseURL( url )
-                
-                scheme = p.scheme
-                netloc = p.netloc
-                path = p.path
-                params = p.params
-                query = AlphabetiseQueryText( p.query )
-                fragment = ''
-                
-                r = urllib.parse.ParseResult( scheme, netloc, path, params, query, fragment )
-                
-                normalised_url = r.geturl()
-                
-            else:
+        
+    
+    def NormaliseURLs( self, urls ):
+        
+        # bulk version for importers. anything that is not a valid url is left out
+        
+        urls_to_normalised_urls = {}
+        
+        with self._lock:
+            
+            for url in urls:
                 
-                normalised_url = url_class.Normalise( url )
+                try:
+                    
+                    urls_to_normalised_urls[ url ] = self._NormaliseURL( url )
+                    
+                except HydrusExceptions.URLClassException:
+                    
+                    continue
+                    
                 
             
-            return normalised_url
-            
+        
+        return urls_to_normalised_urls
         
     
     def OverwriteDefaultGUGs( self, gug_names ):
@@ -3276,6 +3374,35 @@ class URLClass( HydrusSerialisable.SerialisableBaseNamed ):
         return self._should_be_associated_with_files or self.UsesAPIURL()
         
     
+    def FilterMatchingURLs( self, urls ):
+        
+        matching_urls = set()
+        
+        for url in urls:
+            
+            if url in matching_urls:
+                
+                continue
+                
+            
+            try:
+                
+                ( netloc, url_path_components, url_parameters ) = ConvertURLIntoMatchableParts( url )
+                
+            except HydrusExceptions.URLClassException:
+                
+                continue
+                
+            
+            if self.MatchesParsedURL( netloc, url_path_components, url_parameters ):
+                
+                matching_urls.add( url )
+                
+            
+        
+        return matching_urls
+        
+    
     def GetAPIURL( self, url = None ):
         
         if url is None:
@@ -3313,6 +3440,32 @@ class URLClass( HydrusSerialisable.SerialisableBaseNamed ):
         return self._header_overrides
         
     
+    def GetIndexPathComponent( self ):
+        
+        # if our first path component is a required fixed string, url class indices can file us under it
+        
+        if len( self._path_components ) == 0:
+            
+            return None
+            
+        
+        ( string_match, default ) = self._path_components[0]
+        
+        if default is not None:
+            
+            return None
+            
+        
+        ( match_type, match_value, min_chars, max_chars, example_string ) = string_match.ToTuple()
+        
+        if match_type != ClientParsing.STRING_MATCH_FIXED:
+            
+            return None
+            
+        
+        return match_value
+        
+    
     def GetNextGalleryPage( self, url ):
         
         url = self.Normalise( url )
@@ -3437,6 +3590,11 @@ class URLClass( HydrusSerialisable.SerialisableBaseNamed ):
         return referral_url
         
     
+    def GetRequiredParameterKeys( self ):
+        
+        return { key for ( key, ( string_match, default ) ) in self._parameters.items() if default is None }
+        
+    
     def GetSafeSummary( self ):
         
         return 'URL Class "' + self._name + '" - ' + ConvertURLIntoDomain( self.GetExampleURL() )
@@ -3504,6 +3662,65 @@ class URLClass( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def MatchesParsedURL( self, netloc, url_path_components, url_parameters ):
+        
+        # same as Test, but on a url that has already been broken up by ConvertURLIntoMatchableParts, and with no exceptions
+        
+        if self._match_subdomains:
+            
+            if netloc != self._netloc and not netloc.endswith( '.' + self._netloc ):
+                
+                return False
+                
+            
+        else:
+            
+            if not DomainEqualsAnotherForgivingWWW( netloc, self._netloc ):
+                
+                return False
+                
+            
+        
+        num_url_path_components = len( url_path_components )
+        
+        for ( index, ( string_match, default ) ) in enumerate( self._path_components ):
+            
+            if num_url_path_components > index:
+                
+                if not string_match.Matches( url_path_components[ index ] ):
+                    
+                    return False
+                    
+                
+            elif default is None:
+                
+                return False
+                
+            
+        
+        for ( key, ( string_match, default ) ) in self._parameters.items():
+            
+            if key not in url_parameters:
+                
+                if default is None:
+                    
+                    return False
+                    
+                else:
+                    
+                    continue
+                    
+                
+            
+            if not string_match.Matches( url_parameters[ key ] ):
+                
+                return False
+                
+            
+        
+        return True
+        
+    
     def MatchesSubdomains( self ):
         
         return self._match_subdomains
@@ -3679,3 +3896,65 @@ class URLClass( HydrusSerialisable.SerialisableBaseNamed ):
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_URL_CLASS ] = URLClass
+
+class URLClassIndex( object ):
+    
+    # a domain's url classes, in matching priority order, filed by their fixed first path component and required parameters
+    # this lets us skip the many url classes that cannot possibly match a url without running any string matches
+    
+    def __init__( self, url_classes ):
+        
+        self._url_classes = list( url_classes )
+        
+        self._first_path_components_to_indices = collections.defaultdict( list )
+        self._wildcard_indices = []
+        self._required_parameter_keys = []
+        
+        for ( index, url_class ) in enumerate( self._url_classes ):
+            
+            first_path_component = url_class.GetIndexPathComponent()
+            
+            if first_path_component is None:
+                
+                self._wildcard_indices.append( index )
+                
+            else:
+                
+                self._first_path_components_to_indices[ first_path_component ].append( index )
+                
+            
+            self._required_parameter_keys.append( frozenset( url_class.GetRequiredParameterKeys() ) )
+            
+        
+    
+    def GetURLClass( self, netloc, url_path_components, url_parameters ):
+        
+        first_path_component = url_path_components[0]
+        
+        if first_path_component in self._first_path_components_to_indices:
+            
+            indices = heapq.merge( self._first_path_components_to_indices[ first_path_component ], self._wildcard_indices )
+            
+        else:
+            
+            indices = self._wildcard_indices
+            
+        
+        for index in indices:
+            
+            if not self._required_parameter_keys[ index ].issubset( url_parameters ):
+                
+                continue
+                
+            
+            url_class = self._url_classes[ index ]
+            
+            if url_class.MatchesParsedURL( netloc, url_path_components, url_parameters ):
+                
+                return url_class
+                
+            
+        
+        return None
+        
+    
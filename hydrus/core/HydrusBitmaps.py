@@ -0,0 +1,496 @@
+import numpy
+import typing
+
+# a roaring-style compressed set of non-negative integers, for big hash_id sets
+# ids are split by their high bits into 65536-wide chunks. each chunk is stored as either:
+# - a sorted uint16 array of the low bits, when sparse
+# - an 8KB packed bitmap, when dense
+# a python set of three million hash_ids is ~150MB of int objects. as a bitmap, it is a few MB at most
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+
+BITMAP_NUM_BYTES = CHUNK_SIZE // 8
+
+# past this, an array container is bigger than a bitmap container
+ARRAY_CONTAINER_MAX_SIZE = 4096
+
+POPCOUNT_TABLE = numpy.array( [ bin( i ).count( '1' ) for i in range( 256 ) ], dtype = numpy.uint16 )
+
+def _ArrayToBitmap( lows: numpy.ndarray ) -> numpy.ndarray:
+    
+    bits = numpy.zeros( CHUNK_SIZE, dtype = numpy.bool_ )
+    
+    bits[ lows ] = True
+    
+    return numpy.packbits( bits )
+    
+def _BitmapCardinality( bitmap: numpy.ndarray ) -> int:
+    
+    return int( POPCOUNT_TABLE[ bitmap ].sum() )
+    
+def _BitmapContains( bitmap: numpy.ndarray, lows: numpy.ndarray ) -> numpy.ndarray:
+    
+    lows = lows.astype( numpy.int64 )
+    
+    return ( bitmap[ lows >> 3 ] & ( 128 >> ( lows & 7 ) ) ) != 0
+    
+def _BitmapToArray( bitmap: numpy.ndarray ) -> numpy.ndarray:
+    
+    return numpy.flatnonzero( numpy.unpackbits( bitmap ) ).astype( numpy.uint16 )
+    
+def _IsBitmap( container: numpy.ndarray ) -> bool:
+    
+    return container.dtype == numpy.uint8
+    
+def _Normalise( container: numpy.ndarray ):
+    
+    # returns the smallest representation, or None if the container is empty
+    
+    if _IsBitmap( container ):
+        
+        cardinality = _BitmapCardinality( container )
+        
+        if cardinality == 0:
+            
+            return None
+            
+        elif cardinality <= ARRAY_CONTAINER_MAX_SIZE:
+            
+            return _BitmapToArray( container )
+            
+        
+    else:
+        
+        if len( container ) == 0:
+            
+            return None
+            
+        elif len( container ) > ARRAY_CONTAINER_MAX_SIZE:
+            
+            return _ArrayToBitmap( container )
+            
+        
+    
+    return container
+    
+def _ContainerAnd( a: numpy.ndarray, b: numpy.ndarray ):
+    
+    if _IsBitmap( a ) and _IsBitmap( b ):
+        
+        return _Normalise( numpy.bitwise_and( a, b ) )
+        
+    elif _IsBitmap( a ):
+        
+        return _Normalise( b[ _BitmapContains( a, b ) ] )
+        
+    elif _IsBitmap( b ):
+        
+        return _Normalise( a[ _BitmapContains( b, a ) ] )
+        
+    else:
+        
+        return _Normalise( numpy.intersect1d( a, b, assume_unique = True ) )
+        
+    
+def _ContainerAndNot( a: numpy.ndarray, b: numpy.ndarray ):
+    
+    if _IsBitmap( a ):
+        
+        if not _IsBitmap( b ):
+            
+            b = _ArrayToBitmap( b )
+            
+        
+        return _Normalise( numpy.bitwise_and( a, numpy.invert( b ) ) )
+        
+    elif _IsBitmap( b ):
+        
+        return _Normalise( a[ numpy.logical_not( _BitmapContains( b, a ) ) ] )
+        
+    else:
+        
+        return _Normalise( numpy.setdiff1d( a, b, assume_unique = True ) )
+        
+    
+def _ContainerCardinality( container: numpy.ndarray ) -> int:
+    
+    if _IsBitmap( container ):
+        
+        return _BitmapCardinality( container )
+        
+    else:
+        
+        return len( container )
+        
+    
+def _ContainerOr( a: numpy.ndarray, b: numpy.ndarray ):
+    
+    if _IsBitmap( a ) or _IsBitmap( b ):
+        
+        if not _IsBitmap( a ):
+            
+            a = _ArrayToBitmap( a )
+            
+        
+        if not _IsBitmap( b ):
+            
+            b = _ArrayToBitmap( b )
+            
+        
+        return numpy.bitwise_or( a, b )
+        
+    else:
+        
+        return _Normalise( numpy.union1d( a, b ) )
+        
+    
+def _ContainerToArray( container: numpy.ndarray ) -> numpy.ndarray:
+    
+    if _IsBitmap( container ):
+        
+        return _BitmapToArray( container )
+        
+    else:
+        
+        return container
+        
+    
+class IntegerBitmap( object ):
+    
+    def __init__( self, integers = None ):
+        
+        self._containers = {}
+        self._cardinality = 0
+        
+        if integers is not None:
+            
+            self._containers = IntegerBitmap._GenerateContainers( integers )
+            self._cardinality = None
+            
+        
+    
+    def __and__( self, other ):
+        
+        return self.intersection( other )
+        
+    
+    def __bool__( self ):
+        
+        return len( self._containers ) > 0
+        
+    
+    def __contains__( self, i ):
+        
+        if not isinstance( i, ( int, numpy.integer ) ) or i < 0:
+            
+            return False
+            
+        
+        i = int( i )
+        
+        container = self._containers.get( i >> CHUNK_BITS, None )
+        
+        if container is None:
+            
+            return False
+            
+        
+        low = i & CHUNK_MASK
+        
+        if _IsBitmap( container ):
+            
+            return bool( container[ low >> 3 ] & ( 128 >> ( low & 7 ) ) )
+            
+        else:
+            
+            index = numpy.searchsorted( container, low )
+            
+            return index < len( container ) and container[ index ] == low
+            
+        
+    
+    def __eq__( self, other ):
+        
+        if isinstance( other, ( IntegerBitmap, set, frozenset ) ):
+            
+            other = IntegerBitmap._Coerce( other )
+            
+            if len( self ) != len( other ) or self._containers.keys() != other._containers.keys():
+                
+                return False
+                
+            
+            for ( key, container ) in self._containers.items():
+                
+                other_container = other._containers[ key ]
+                
+                if _IsBitmap( container ) != _IsBitmap( other_container ) or not numpy.array_equal( container, other_container ):
+                    
+                    return False
+                    
+                
+            
+            return True
+            
+        
+        return NotImplemented
+        
+    
+    def __iand__( self, other ):
+        
+        self.intersection_update( other )
+        
+        return self
+        
+    
+    def __ior__( self, other ):
+        
+        self.update( other )
+        
+        return self
+        
+    
+    def __isub__( self, other ):
+        
+        self.difference_update( other )
+        
+        return self
+        
+    
+    def __iter__( self ):
+        
+        for key in sorted( self._containers.keys() ):
+            
+            offset = key << CHUNK_BITS
+            
+            yield from ( _ContainerToArray( self._containers[ key ] ).astype( numpy.int64 ) + offset ).tolist()
+            
+        
+    
+    def __len__( self ):
+        
+        if self._cardinality is None:
+            
+            self._cardinality = sum( ( _ContainerCardinality( container ) for container in self._containers.values() ) )
+            
+        
+        return self._cardinality
+        
+    
+    def __or__( self, other ):
+        
+        return self.union( other )
+        
+    
+    def __repr__( self ):
+        
+        return 'IntegerBitmap: {} integers in {} chunks'.format( len( self ), len( self._containers ) )
+        
+    
+    def __sub__( self, other ):
+        
+        return self.difference( other )
+        
+    
+    __hash__ = None
+    
+    @staticmethod
+    def _Coerce( integers ) -> 'IntegerBitmap':
+        
+        if isinstance( integers, IntegerBitmap ):
+            
+            return integers
+            
+        
+        return IntegerBitmap( integers )
+        
+    
+    @staticmethod
+    def _GenerateContainers( integers ) -> dict:
+        
+        if isinstance( integers, IntegerBitmap ):
+            
+            return { key : container.copy() for ( key, container ) in integers._containers.items() }
+            
+        
+        if isinstance( integers, numpy.ndarray ):
+            
+            integers_array = integers.astype( numpy.int64 )
+            
+        elif isinstance( integers, ( set, frozenset, list, tuple ) ):
+            
+            integers_array = numpy.fromiter( integers, dtype = numpy.int64, count = len( integers ) )
+            
+        else:
+            
+            integers_array = numpy.fromiter( integers, dtype = numpy.int64 )
+            
+        
+        if len( integers_array ) == 0:
+            
+            return {}
+            
+        
+        if integers_array.min() < 0:
+            
+            raise ValueError( 'IntegerBitmap can only hold non-negative integers!' )
+            
+        
+        integers_array = numpy.unique( integers_array )
+        
+        keys = integers_array >> CHUNK_BITS
+        
+        split_indices = numpy.flatnonzero( numpy.diff( keys ) ) + 1
+        
+        containers = {}
+        
+        for chunk in numpy.split( integers_array, split_indices ):
+            
+            key = int( chunk[0] >> CHUNK_BITS )
+            
+            lows = ( chunk & CHUNK_MASK ).astype( numpy.uint16 )
+            
+            if len( lows ) > ARRAY_CONTAINER_MAX_SIZE:
+                
+                containers[ key ] = _ArrayToBitmap( lows )
+                
+            else:
+                
+                containers[ key ] = lows
+                
+            
+        
+        return containers
+        
+    
+    def add( self, i: int ):
+        
+        self.update( ( i, ) )
+        
+    
+    def copy( self ) -> 'IntegerBitmap':
+        
+        return IntegerBitmap( self )
+        
+    
+    def difference( self, other ) -> 'IntegerBitmap':
+        
+        result = self.copy()
+        
+        result.difference_update( other )
+        
+        return result
+        
+    
+    def difference_update( self, other ):
+        
+        other = IntegerBitmap._Coerce( other )
+        
+        for key in list( self._containers.keys() ):
+            
+            if key in other._containers:
+                
+                container = _ContainerAndNot( self._containers[ key ], other._containers[ key ] )
+                
+                if container is None:
+                    
+                    del self._containers[ key ]
+                    
+                else:
+                    
+                    self._containers[ key ] = container
+                    
+                
+            
+        
+        self._cardinality = None
+        
+    
+    def discard( self, i: int ):
+        
+        if i in self:
+            
+            self.difference_update( ( i, ) )
+            
+        
+    
+    def intersection( self, other ) -> 'IntegerBitmap':
+        
+        result = self.copy()
+        
+        result.intersection_update( other )
+        
+        return result
+        
+    
+    def intersection_update( self, other ):
+        
+        other = IntegerBitmap._Coerce( other )
+        
+        for key in list( self._containers.keys() ):
+            
+            container = None
+            
+            if key in other._containers:
+                
+                container = _ContainerAnd( self._containers[ key ], other._containers[ key ] )
+                
+            
+            if container is None:
+                
+                del self._containers[ key ]
+                
+            else:
+                
+                self._containers[ key ] = container
+                
+            
+        
+        self._cardinality = None
+        
+    
+    def isdisjoint( self, other ) -> bool:
+        
+        return len( self.intersection( other ) ) == 0
+        
+    
+    def union( self, other ) -> 'IntegerBitmap':
+        
+        result = self.copy()
+        
+        result.update( other )
+        
+        return result
+        
+    
+    def update( self, other ):
+        
+        other = IntegerBitmap._Coerce( other )
+        
+        for ( key, other_container ) in other._containers.items():
+            
+            if key in self._containers:
+                
+                self._containers[ key ] = _ContainerOr( self._containers[ key ], other_container )
+                
+            else:
+                
+                self._containers[ key ] = other_container.copy()
+                
+            
+        
+        self._cardinality = None
+        
+    
+    def GetMemoryFootprint( self ) -> int:
+        
+        return sum( ( container.nbytes for container in self._containers.values() ) )
+        
+    
+    def ToList( self ) -> typing.List[ int ]:
+        
+        return list( self )
+
+
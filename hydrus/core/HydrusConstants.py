@@ -509,6 +509,7 @@ GENERAL_VIDEO = 42
 GENERAL_APPLICATION = 43
 GENERAL_ANIMATION = 44
 APPLICATION_CLIP = 45
+APPLICATION_MSGPACK = 46
 APPLICATION_OCTET_STREAM = 100
 APPLICATION_UNKNOWN = 101
 
@@ -581,6 +582,7 @@ mime_enum_lookup[ 'application/x-shockwave-flash' ] = APPLICATION_FLASH
 mime_enum_lookup[ 'application/x-photoshop' ] = APPLICATION_PSD
 mime_enum_lookup[ 'image/vnd.adobe.photoshop' ] = APPLICATION_PSD
 mime_enum_lookup[ 'application/clip' ] = APPLICATION_CLIP
+mime_enum_lookup[ 'application/x-msgpack' ] = APPLICATION_MSGPACK
 mime_enum_lookup[ 'application/octet-stream' ] = APPLICATION_OCTET_STREAM
 mime_enum_lookup[ 'application/x-yaml' ] = APPLICATION_YAML
 mime_enum_lookup[ 'PDF document' ] = APPLICATION_PDF
@@ -633,6 +635,7 @@ mime_string_lookup[ APPLICATION_JSON ] = 'json'
 mime_string_lookup[ APPLICATION_PDF ] = 'pdf'
 mime_string_lookup[ APPLICATION_PSD ] = 'photoshop psd'
 mime_string_lookup[ APPLICATION_CLIP ] = 'clip'
+mime_string_lookup[ APPLICATION_MSGPACK ] = 'msgpack'
 mime_string_lookup[ APPLICATION_ZIP ] = 'zip'
 mime_string_lookup[ APPLICATION_RAR ] = 'rar'
 mime_string_lookup[ APPLICATION_7Z ] = '7z'
@@ -683,6 +686,7 @@ mime_mimetype_string_lookup[ APPLICATION_JSON ] = 'application/json'
 mime_mimetype_string_lookup[ APPLICATION_PDF ] = 'application/pdf'
 mime_mimetype_string_lookup[ APPLICATION_PSD ] = 'application/x-photoshop'
 mime_mimetype_string_lookup[ APPLICATION_CLIP ] = 'application/clip'
+mime_mimetype_string_lookup[ APPLICATION_MSGPACK ] = 'application/x-msgpack'
 mime_mimetype_string_lookup[ APPLICATION_ZIP ] = 'application/zip'
 mime_mimetype_string_lookup[ APPLICATION_RAR ] = 'application/vnd.rar'
 mime_mimetype_string_lookup[ APPLICATION_7Z ] = 'application/x-7z-compressed'
@@ -733,6 +737,7 @@ mime_ext_lookup[ APPLICATION_JSON ] = '.json'
 mime_ext_lookup[ APPLICATION_PDF ] = '.pdf'
 mime_ext_lookup[ APPLICATION_PSD ] = '.psd'
 mime_ext_lookup[ APPLICATION_CLIP ] = '.clip'
+mime_ext_lookup[ APPLICATION_MSGPACK ] = '.msgpack'
 mime_ext_lookup[ APPLICATION_ZIP ] = '.zip'
 mime_ext_lookup[ APPLICATION_RAR ] = '.rar'
 mime_ext_lookup[ APPLICATION_7Z ] = '.7z'
@@ -3,9 +3,12 @@ import distutils.version
 import os
 import queue
 import sqlite3
+import threading
 import traceback
 import time
+import urllib.request
 
+from hydrus.core import HydrusBitmaps
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusEncryption
@@ -13,6 +16,31 @@ from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusPaths
 
+# read pool threads put their own read-only cursor and temp table name cache here
+# the db object and its modules check it first, so a pure read can run on a reader thread without knowing about it
+READ_POOL_THREAD_LOCAL = threading.local()
+
+# how many pages an online backup copies before it reports progress and checks for cancel
+ONLINE_BACKUP_PAGES_PER_STEP = 4096
+# an online backup holds one snapshot, so the WALs cannot checkpoint past it. if they grow more than this, the writer waits at its next commit until the copy is done
+ONLINE_BACKUP_MAX_WAL_GROWTH = 256 * 1048576
+
+def CallIfReadIsCurrent( func ):
+    
+    # a read pool job works from a snapshot, and a write may come in before it finishes, in which case the job is thrown away and redone on the writer
+    # so anything a read does to shared in-memory state (like adding to a cache) goes through here, and only happens if the job's result is kept
+    
+    deferred_callables = getattr( READ_POOL_THREAD_LOCAL, 'deferred_callables', None )
+    
+    if deferred_callables is None:
+        
+        func()
+        
+    else:
+        
+        deferred_callables.append( func )
+        
+    
 def CheckCanVacuum( db_path, stop_time = None ):
     
     db = sqlite3.connect( db_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
@@ -49,6 +77,30 @@ def CheckCanVacuumCursor( db_path, c, stop_time = None ):
     
     HydrusPaths.CheckHasSpaceForDBTransaction( db_dir, vacuum_estimate )
     
+def ConvertBackupProgressToPrettyString( label, num_done, num_to_do, num_bytes_done, time_started ):
+    
+    text = label + ': ' + HydrusData.ConvertValueRangeToPrettyString( num_done, num_to_do )
+    
+    time_running = max( HydrusData.GetNowFloat() - time_started, 0.001 )
+    
+    if num_bytes_done > 0:
+        
+        text += ' at ' + HydrusData.ToHumanBytes( int( num_bytes_done / time_running ) ) + '/s'
+        
+    
+    if 0 < num_done < num_to_do:
+        
+        time_left = int( time_running * ( num_to_do - num_done ) / num_done )
+        
+        text += ', about ' + HydrusData.TimeDeltaToPrettyTimeDelta( time_left ) + ' left'
+        
+    
+    return text
+    
+def GetReadPoolCursor():
+    
+    return getattr( READ_POOL_THREAD_LOCAL, 'c', None )
+    
 def GetRowCount( c: sqlite3.Cursor ):
     
     row_count = c.rowcount
@@ -156,12 +208,19 @@ def VacuumDB( db_path ):
     
 class DBCursorTransactionWrapper( object ):
     
-    def __init__( self, c: sqlite3.Cursor, transaction_commit_period: int ):
+    def __init__( self, c: sqlite3.Cursor, transaction_commit_period: int, commit_lock = None ):
         
         self._c = c
         
         self._transaction_commit_period = transaction_commit_period
         
+        if commit_lock is None:
+            
+            commit_lock = threading.Lock()
+            
+        
+        self._commit_lock = commit_lock
+        
         self._transaction_start_time = 0
         self._in_transaction = False
         self._transaction_contains_writes = False
@@ -187,7 +246,10 @@ class DBCursorTransactionWrapper( object ):
         
         if self._in_transaction:
             
-            self._c.execute( 'COMMIT;' )
+            with self._commit_lock:
+                
+                self._c.execute( 'COMMIT;' )
+                
             
             self._in_transaction = False
             self._transaction_contains_writes = False
@@ -225,6 +287,11 @@ class DBCursorTransactionWrapper( object ):
             
         
     
+    def HasUncommittedWrites( self ):
+        
+        return self._in_transaction and self._transaction_contains_writes
+        
+    
     def InTransaction( self ):
         
         return self._in_transaction
@@ -267,6 +334,7 @@ class HydrusDB( object ):
     TRANSACTION_COMMIT_PERIOD = 30
     
     READ_WRITE_ACTIONS = []
+    READ_POOL_ACTIONS = []
     UPDATE_WAIT = 2
     
     def __init__( self, controller, db_dir, db_name ):
@@ -316,12 +384,29 @@ class HydrusDB( object ):
         self._jobs = queue.Queue()
         self._pubsubs = []
         
+        self._read_pool_size = 0
+        
+        # held around every writer commit, so an online backup can start its snapshot of all the files between two commits
+        self._commit_lock = threading.Lock()
+        
+        if HG.db_journal_mode == 'WAL':
+            
+            self._read_pool_size = max( 0, HG.db_read_pool_size )
+            
+        
+        self._read_pool_jobs = queue.Queue()
+        self._read_pool_lock = threading.Lock()
+        self._read_pool_enabled = True
+        self._read_pool_num_running = 0
+        self._num_outstanding_write_jobs = 0
+        self._write_generation = 0
+        
         self._currently_doing_job = False
         self._current_status = ''
         self._current_job_name = ''
         
         self._db = None
-        self._c = None
+        self._writer_c = None
         
         self._cursor_transaction_wrapper = None
         
@@ -410,6 +495,30 @@ class HydrusDB( object ):
                 
             
         
+        for i in range( self._read_pool_size ):
+            
+            self._controller.CallToThreadLongRunning( self.ReadPoolLoop )
+            
+        
+    
+    @property
+    def _c( self ) -> sqlite3.Cursor:
+        
+        read_pool_c = GetReadPoolCursor()
+        
+        if read_pool_c is not None:
+            
+            return read_pool_c
+            
+        
+        return self._writer_c
+        
+    
+    @_c.setter
+    def _c( self, c: sqlite3.Cursor ):
+        
+        self._writer_c = c
+        
     
     def _AnalyzeTempTable( self, temp_table_name ):
         
@@ -438,6 +547,46 @@ class HydrusDB( object ):
         self._c.execute( 'ATTACH ? AS durable_temp;', ( db_path, ) )
         
     
+    def _BackupDBFileOnline( self, db, name, dest_path, progress ):
+        
+        HydrusPaths.DeletePath( dest_path )
+        
+        dest_db = sqlite3.connect( dest_path, isolation_level = None )
+        
+        try:
+            
+            db.backup( dest_db, pages = ONLINE_BACKUP_PAGES_PER_STEP, progress = progress, name = name )
+            
+        finally:
+            
+            dest_db.close()
+            
+        
+    
+    def _CanUseReadPool( self, action ):
+        
+        # the pool connections only see committed data, so we only use them when the writer has nothing they cannot see
+        
+        if not self._read_pool_enabled or self._read_pool_num_running == 0 or action not in self.READ_POOL_ACTIONS or self._pause_and_disconnect:
+            
+            return False
+            
+        
+        if self._num_outstanding_write_jobs > 0:
+            
+            return False
+            
+        
+        cursor_transaction_wrapper = self._cursor_transaction_wrapper
+        
+        if cursor_transaction_wrapper is None or cursor_transaction_wrapper.HasUncommittedWrites():
+            
+            return False
+            
+        
+        return True
+        
+    
     def _CleanAfterJobWork( self ):
         
         self._pubsubs = []
@@ -457,7 +606,6 @@ class HydrusDB( object ):
             self._c.close()
             self._db.close()
             
-            del self._c
             del self._db
             
             self._db = None
@@ -469,6 +617,21 @@ class HydrusDB( object ):
             
         
     
+    def _CloseReadPoolCursor( self ):
+        
+        c = GetReadPoolCursor()
+        
+        if c is not None:
+            
+            c.close()
+            READ_POOL_THREAD_LOCAL.db.close()
+            
+            READ_POOL_THREAD_LOCAL.db = None
+            READ_POOL_THREAD_LOCAL.c = None
+            READ_POOL_THREAD_LOCAL.temp_integer_table_name_cache = None
+            
+        
+    
     def _CreateDB( self ):
         
         raise NotImplementedError()
@@ -614,7 +777,7 @@ class HydrusDB( object ):
             
             self._c = self._db.cursor()
             
-            self._cursor_transaction_wrapper = DBCursorTransactionWrapper( self._c, self.TRANSACTION_COMMIT_PERIOD )
+            self._cursor_transaction_wrapper = DBCursorTransactionWrapper( self._c, self.TRANSACTION_COMMIT_PERIOD, commit_lock = self._commit_lock )
             
             self._LoadModules()
             
@@ -685,6 +848,33 @@ class HydrusDB( object ):
         pass
         
     
+    def _InitReadPoolCursor( self ):
+        
+        # a read-only connection that sees the same schema as the writer, minus durable_temp, which is the writer's scratch space
+        
+        db = self._OpenReadOnlyConnection()
+        
+        c = db.cursor()
+        
+        if HG.no_db_temp_files:
+            
+            c.execute( 'PRAGMA temp_store = 2;' )
+            
+        
+        c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        cache_size = HG.db_cache_size * 1024
+        
+        for db_name in self._db_filenames.keys():
+            
+            c.execute( 'PRAGMA {}.cache_size = -{};'.format( db_name, cache_size ) )
+            
+        
+        READ_POOL_THREAD_LOCAL.db = db
+        READ_POOL_THREAD_LOCAL.c = c
+        READ_POOL_THREAD_LOCAL.temp_integer_table_name_cache = TemporaryIntegerTableNameCache( register_instance = False )
+        
+    
     def _LoadModules( self ):
         
         pass
@@ -695,6 +885,28 @@ class HydrusDB( object ):
         raise NotImplementedError()
         
     
+    def _OpenReadOnlyConnection( self ):
+        
+        def uri( filename ):
+            
+            return 'file:{}?mode=ro'.format( urllib.request.pathname2url( os.path.abspath( os.path.join( self._db_dir, filename ) ) ) )
+            
+        
+        db = sqlite3.connect( uri( self._db_filenames[ 'main' ] ), isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES, uri = True )
+        
+        for ( name, filename ) in self._db_filenames.items():
+            
+            if name == 'main':
+                
+                continue
+                
+            
+            db.execute( 'ATTACH ? AS ' + name + ';', ( uri( filename ), ) )
+            
+        
+        return db
+        
+    
     def _ProcessJob( self, job ):
         
         job_type = job.GetType()
@@ -753,6 +965,10 @@ class HydrusDB( object ):
                 
                 self._cursor_transaction_wrapper.Rollback()
                 
+                # any temp integer tables this job made are gone now, so the names have to be made again
+                
+                TemporaryIntegerTableNameCache.instance().Clear()
+                
             except Exception as rollback_e:
                 
                 HydrusData.Print( 'When the transaction failed, attempting to rollback the database failed. Please restart the client as soon as is convenient.' )
@@ -774,6 +990,70 @@ class HydrusDB( object ):
             
         
     
+    def _ProcessReadPoolJob( self, job, write_generation ):
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        c = GetReadPoolCursor()
+        
+        READ_POOL_THREAD_LOCAL.deferred_callables = []
+        
+        try:
+            
+            c.execute( 'BEGIN DEFERRED;' ) # one snapshot for the whole job
+            
+            try:
+                
+                result = self._Read( action, *args, **kwargs )
+                
+            finally:
+                
+                c.execute( 'COMMIT;' )
+                
+            
+            with self._read_pool_lock:
+                
+                if self._write_generation != write_generation:
+                    
+                    # a write came in while we were reading, so our snapshot may be out of date by the time the caller sees it
+                    # the writer will redo this after that write, just as if the pool were off
+                    
+                    self._jobs.put( job )
+                    
+                    return
+                    
+                
+                for func in READ_POOL_THREAD_LOCAL.deferred_callables:
+                    
+                    func()
+                    
+                
+            
+            job.PutResult( result )
+            
+        except sqlite3.OperationalError as e:
+            
+            if 'readonly' in str( e ):
+                
+                # this read wanted to write something, like a new definition, so it has to go to the writer
+                
+                self._jobs.put( job )
+                
+            else:
+                
+                self._ManageDBError( job, e )
+                
+            
+        except Exception as e:
+            
+            self._ManageDBError( job, e )
+            
+        finally:
+            
+            READ_POOL_THREAD_LOCAL.deferred_callables = None
+            
+        
+    
     def _Read( self, action, *args, **kwargs ):
         
         raise NotImplementedError()
@@ -882,6 +1162,152 @@ class HydrusDB( object ):
         pass
         
     
+    def BackupDBFilesOnline( self, dest_dir, text_update_hook = None, is_cancelled_hook = None, snapshot_callable = None ):
+        
+        # this does not run on the db thread. it copies the db files with sqlite's backup api from a separate read-only connection, so the db can keep working
+        # a hydrus transaction spans all the attached files, so they are all copied from one read transaction, started between two writer commits. a restore then has mappings and their count caches from the same moment
+        # that snapshot stops the WALs checkpointing past it, so if they grow too much while we copy, the writer is held at its next commit until we are done
+        # if given, snapshot_callable is called with a cursor in the same read transaction once the copy is done, and its result returned
+        
+        if HG.db_journal_mode != 'WAL':
+            
+            raise Exception( 'Online backup needs the database to be in WAL journal mode!' )
+            
+        
+        HydrusPaths.MakeSureDirectoryExists( dest_dir )
+        
+        db = self._OpenReadOnlyConnection()
+        
+        try:
+            
+            c = db.cursor()
+            
+            names_to_num_pages = {}
+            names_to_page_sizes = {}
+            
+            c.execute( 'BEGIN DEFERRED;' )
+            
+            commit_lock_held = False
+            
+            try:
+                
+                with self._commit_lock:
+                    
+                    # reading each file's header starts its part of our read transaction, and no commit can land between them
+                    
+                    for name in self._db_filenames.keys():
+                        
+                        ( names_to_num_pages[ name ], ) = c.execute( 'PRAGMA {}.page_count;'.format( name ) ).fetchone()
+                        ( names_to_page_sizes[ name ], ) = c.execute( 'PRAGMA {}.page_size;'.format( name ) ).fetchone()
+                        
+                    
+                
+                wal_paths = [ os.path.join( self._db_dir, filename + '-wal' ) for filename in self._db_filenames.values() ]
+                
+                def get_wal_size():
+                    
+                    return sum( ( os.path.getsize( wal_path ) for wal_path in wal_paths if os.path.exists( wal_path ) ) )
+                    
+                
+                initial_wal_size = get_wal_size()
+                
+                total_num_pages = sum( names_to_num_pages.values() )
+                num_pages_done_previously = 0
+                num_bytes_done_previously = 0
+                
+                time_started = HydrusData.GetNowFloat()
+                
+                dest_paths_to_temp_dest_paths = {}
+                
+                try:
+                    
+                    for ( name, filename ) in self._db_filenames.items():
+                        
+                        page_size = names_to_page_sizes[ name ]
+                        
+                        def progress( status, remaining, total ):
+                            
+                            nonlocal commit_lock_held
+                            
+                            if is_cancelled_hook is not None and is_cancelled_hook():
+                                
+                                raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                                
+                            
+                            if not commit_lock_held and get_wal_size() - initial_wal_size > ONLINE_BACKUP_MAX_WAL_GROWTH:
+                                
+                                self._commit_lock.acquire()
+                                
+                                commit_lock_held = True
+                                
+                            
+                            if text_update_hook is not None:
+                                
+                                num_pages_done = num_pages_done_previously + total - remaining
+                                num_bytes_done = num_bytes_done_previously + ( total - remaining ) * page_size
+                                
+                                text_update_hook( ConvertBackupProgressToPrettyString( 'copying ' + filename, num_pages_done, total_num_pages, num_bytes_done, time_started ) )
+                                
+                            
+                        
+                        dest_path = os.path.join( dest_dir, filename )
+                        
+                        # we copy to temp files first so a cancel or error leaves the previous backup intact
+                        temp_dest_path = dest_path + '.backup_temp'
+                        
+                        dest_paths_to_temp_dest_paths[ dest_path ] = temp_dest_path
+                        
+                        self._BackupDBFileOnline( db, name, temp_dest_path, progress )
+                        
+                        num_pages_done_previously += names_to_num_pages[ name ]
+                        num_bytes_done_previously += names_to_num_pages[ name ] * page_size
+                        
+                    
+                    result = None
+                    
+                    if snapshot_callable is not None:
+                        
+                        result = snapshot_callable( c )
+                        
+                    
+                except:
+                    
+                    for temp_dest_path in dest_paths_to_temp_dest_paths.values():
+                        
+                        HydrusPaths.DeletePath( temp_dest_path )
+                        
+                    
+                    raise
+                    
+                
+            finally:
+                
+                c.execute( 'COMMIT;' )
+                
+                if commit_lock_held:
+                    
+                    self._commit_lock.release()
+                    
+                
+            
+            for ( dest_path, temp_dest_path ) in dest_paths_to_temp_dest_paths.items():
+                
+                for stale_journal_path in ( dest_path + '-wal', dest_path + '-shm' ):
+                    
+                    HydrusPaths.DeletePath( stale_journal_path )
+                    
+                
+                os.replace( temp_dest_path, dest_path )
+                
+            
+            return result
+            
+        finally:
+            
+            db.close()
+            
+        
+    
     def CurrentlyDoingJob( self ):
         
         return self._currently_doing_job
@@ -944,12 +1370,12 @@ class HydrusDB( object ):
     
     def LoopIsFinished( self ):
         
-        return self._loop_finished
+        return self._loop_finished and self._read_pool_num_running == 0
         
     
     def JobsQueueEmpty( self ):
         
-        return self._jobs.empty()
+        return self._jobs.empty() and self._read_pool_jobs.empty()
         
     
     def MainLoop( self ):
@@ -1004,6 +1430,14 @@ class HydrusDB( object ):
                         self._ProcessJob( job )
                         
                     
+                    if job.GetType() in ( 'read_write', 'write' ):
+                        
+                        with self._read_pool_lock:
+                            
+                            self._num_outstanding_write_jobs -= 1
+                            
+                        
+                    
                     error_count = 0
                     
                 except:
@@ -1031,6 +1465,12 @@ class HydrusDB( object ):
                     
                     self._cursor_transaction_wrapper.CommitAndBegin()
                     
+                elif self._read_pool_num_running > 0 and self._cursor_transaction_wrapper.HasUncommittedWrites():
+                    
+                    # we are idle, so let the read pool see the latest writes
+                    
+                    self._cursor_transaction_wrapper.CommitAndBegin()
+                    
                 
             
             if self._pause_and_disconnect:
@@ -1085,16 +1525,118 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        with self._read_pool_lock:
+            
+            if job_type == 'read' and self._CanUseReadPool( action ):
+                
+                self._read_pool_jobs.put( ( job, self._write_generation ) )
+                
+            else:
+                
+                if job_type == 'read_write':
+                    
+                    self._num_outstanding_write_jobs += 1
+                    self._write_generation += 1
+                    
+                
+                self._jobs.put( job )
+                
+            
         
         return job.GetResult()
         
     
+    def ReadPoolIsEnabled( self ):
+        
+        with self._read_pool_lock:
+            
+            return self._read_pool_enabled
+            
+        
+    
+    def ReadPoolIsRunning( self ):
+        
+        return self._read_pool_num_running > 0
+        
+    
+    def ReadPoolLoop( self ):
+        
+        try:
+            
+            self._InitReadPoolCursor()
+            
+        except:
+            
+            HydrusData.Print( 'A db read pool connection could not initialise, so it will not run. Error follows:' )
+            HydrusData.PrintException( traceback.format_exc() )
+            
+            return
+            
+        
+        with self._read_pool_lock:
+            
+            self._read_pool_num_running += 1
+            
+        
+        try:
+            
+            while not ( ( self._local_shutdown or HG.model_shutdown ) and self._read_pool_jobs.empty() ):
+                
+                try:
+                    
+                    ( job, write_generation ) = self._read_pool_jobs.get( timeout = 1 )
+                    
+                    self._ProcessReadPoolJob( job, write_generation )
+                    
+                except queue.Empty:
+                    
+                    pass
+                    
+                
+                if self._pause_and_disconnect:
+                    
+                    self._CloseReadPoolCursor()
+                    
+                    while self._pause_and_disconnect:
+                        
+                        if self._local_shutdown or HG.model_shutdown:
+                            
+                            break
+                            
+                        
+                        time.sleep( 1 )
+                        
+                    
+                    self._InitReadPoolCursor()
+                    
+                
+            
+        finally:
+            
+            self._CloseReadPoolCursor()
+            
+            with self._read_pool_lock:
+                
+                self._read_pool_num_running -= 1
+                
+            
+        
+    
     def ReadyToServeRequests( self ):
         
         return self._ready_to_serve_requests
         
     
+    def SetReadPoolEnabled( self, value ):
+        
+        # for benchmarking. reads already in the pool finish there
+        
+        with self._read_pool_lock:
+            
+            self._read_pool_enabled = value
+            
+        
+    
     def Shutdown( self ):
         
         self._local_shutdown = True
@@ -1111,7 +1653,13 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        with self._read_pool_lock:
+            
+            self._num_outstanding_write_jobs += 1
+            self._write_generation += 1
+            
+            self._jobs.put( job )
+            
         
         if synchronous: return job.GetResult()
         
@@ -1120,9 +1668,12 @@ class TemporaryIntegerTableNameCache( object ):
     
     my_instance = None
     
-    def __init__( self ):
+    def __init__( self, register_instance = True ):
         
-        TemporaryIntegerTableNameCache.my_instance = self
+        if register_instance:
+            
+            TemporaryIntegerTableNameCache.my_instance = self
+            
         
         self._column_names_to_table_names = collections.defaultdict( collections.deque )
         self._column_names_counter = collections.Counter()
@@ -1131,6 +1682,14 @@ class TemporaryIntegerTableNameCache( object ):
     @staticmethod
     def instance() -> 'TemporaryIntegerTableNameCache':
         
+        # read pool connections each have their own mem db, so they get their own names
+        read_pool_instance = getattr( READ_POOL_THREAD_LOCAL, 'temp_integer_table_name_cache', None )
+        
+        if read_pool_instance is not None:
+            
+            return read_pool_instance
+            
+        
         if TemporaryIntegerTableNameCache.my_instance is None:
             
             raise Exception( 'TemporaryIntegerTableNameCache is not yet initialised!' )
@@ -1180,7 +1739,7 @@ class TemporaryIntegerTable( object ):
     
     def __init__( self, cursor, integer_iterable, column_name ):
         
-        if not isinstance( integer_iterable, set ):
+        if not isinstance( integer_iterable, ( set, HydrusBitmaps.IntegerBitmap ) ):
             
             integer_iterable = set( integer_iterable )
             
@@ -1196,7 +1755,7 @@ class TemporaryIntegerTable( object ):
         
         if not self._initialised:
             
-            self._cursor.execute( 'CREATE TABLE {} ( {} INTEGER PRIMARY KEY );'.format( self._table_name, self._column_name ) )
+            self._cursor.execute( 'CREATE TABLE IF NOT EXISTS {} ( {} INTEGER PRIMARY KEY );'.format( self._table_name, self._column_name ) )
             
         
         self._cursor.executemany( 'INSERT INTO {} ( {} ) VALUES ( ? );'.format( self._table_name, self._column_name ), ( ( i, ) for i in self._integer_iterable ) )
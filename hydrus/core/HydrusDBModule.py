@@ -1,6 +1,8 @@
 import sqlite3
 import typing
 
+from hydrus.core import HydrusDB
+
 class HydrusDBModule( object ):
     
     def __init__( self, name, cursor: sqlite3.Cursor ):
@@ -9,6 +11,25 @@ class HydrusDBModule( object ):
         self._c = cursor
         
     
+    @property
+    def _c( self ) -> sqlite3.Cursor:
+        
+        read_pool_c = HydrusDB.GetReadPoolCursor()
+        
+        if read_pool_c is not None:
+            
+            return read_pool_c
+            
+        
+        return self._writer_c
+        
+    
+    @_c.setter
+    def _c( self, c: sqlite3.Cursor ):
+        
+        self._writer_c = c
+        
+    
     def _CreateIndex( self, table_name, columns, unique = False ):
         
         if '.' in table_name:
@@ -17,6 +17,9 @@ boot_debug = False
 
 db_cache_size = 200
 
+# extra read-only connections, WAL only. 0 means every read goes through the single db thread
+db_read_pool_size = 0
+
 # if this is set to 1, transactions are not immediately synced to the journal so multiple can be undone following a power-loss
 # if set to 2, all transactions are synced, so once a new one starts you know the last one is on disk
 # corruption cannot occur either way, but since we have multiple ATTACH dbs with diff journals, let's not mess around when power-cut during heavy file import or w/e
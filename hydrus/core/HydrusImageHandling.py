@@ -103,6 +103,39 @@ except:
     
     OPENCV_OK = False
     
+def ConvertCVNumPyImageToRGB( numpy_image ):
+    
+    if numpy_image.dtype == 'uint16':
+        
+        numpy_image //= 256
+        
+        numpy_image = numpy.array( numpy_image, dtype = 'uint8' )
+        
+    
+    shape = numpy_image.shape
+    
+    if len( shape ) == 2:
+        
+        # monochrome image
+        
+        convert = cv2.COLOR_GRAY2RGB
+        
+    else:
+        
+        ( im_y, im_x, depth ) = shape
+        
+        if depth == 4:
+            
+            convert = cv2.COLOR_BGRA2RGBA
+            
+        else:
+            
+            convert = cv2.COLOR_BGR2RGB
+            
+        
+    
+    return cv2.cvtColor( numpy_image, convert )
+    
 def ConvertToPNGIfBMP( path ):
     
     with open( path, 'rb' ) as f:
@@ -204,36 +237,49 @@ def GenerateNumPyImage( path, mime, force_pil = False ):
             
         else:
             
-            if numpy_image.dtype == 'uint16':
-                
-                numpy_image //= 256
-                
-                numpy_image = numpy.array( numpy_image, dtype = 'uint8' )
-                
+            numpy_image = ConvertCVNumPyImageToRGB( numpy_image )
             
-            shape = numpy_image.shape
+        
+    
+    return numpy_image
+    
+def GenerateNumPyImageFromBytes( image_bytes, mime, force_pil = False ):
+    
+    # for images we already have in memory, like thumbnails out of a packed store
+    
+    if not OPENCV_OK:
+        
+        force_pil = True
+        
+    
+    if mime in PIL_ONLY_MIMETYPES or force_pil:
+        
+        pil_image = GeneratePILImage( io.BytesIO( image_bytes ) )
+        
+        numpy_image = GenerateNumPyImageFromPILImage( pil_image )
+        
+    else:
+        
+        if mime == HC.IMAGE_JPEG:
             
-            if len( shape ) == 2:
-                
-                # monochrome image
-                
-                convert = cv2.COLOR_GRAY2RGB
-                
-            else:
-                
-                ( im_y, im_x, depth ) = shape
-                
-                if depth == 4:
-                    
-                    convert = cv2.COLOR_BGRA2RGBA
-                    
-                else:
-                    
-                    convert = cv2.COLOR_BGR2RGB
-                    
-                
+            flags = CV_IMREAD_FLAGS_SUPPORTS_EXIF_REORIENTATION
+            
+        else:
+            
+            flags = CV_IMREAD_FLAGS_SUPPORTS_ALPHA
+            
+        
+        numpy_image = cv2.imdecode( numpy.frombuffer( image_bytes, dtype = 'uint8' ), flags )
+        
+        if numpy_image is None:
+            
+            pil_image = GeneratePILImage( io.BytesIO( image_bytes ) )
+            
+            numpy_image = GenerateNumPyImageFromPILImage( pil_image )
+            
+        else:
             
-            numpy_image = cv2.cvtColor( numpy_image, convert )
+            numpy_image = ConvertCVNumPyImageToRGB( numpy_image )
             
         
     
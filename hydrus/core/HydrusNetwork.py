@@ -1,7 +1,25 @@
 import collections
+import hashlib
+import itertools
+import numpy
+import struct
 import threading
 import typing
 import urllib
+import zlib
+
+ZSTD_OK = False
+
+try:
+    
+    import zstandard
+    
+    ZSTD_OK = True
+    
+except:
+    
+    pass
+    
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
@@ -10,7 +28,7 @@ from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusNetworking
 from hydrus.core import HydrusSerialisable
 
-INT_PARAMS = { 'expires', 'num', 'since', 'content_type', 'action', 'status' }
+INT_PARAMS = { 'expires', 'num', 'since', 'content_type', 'action', 'status', 'update_format' }
 BYTE_PARAMS = { 'access_key', 'account_type_key', 'subject_account_key', 'hash', 'registration_key', 'subject_hash', 'update_hash' }
 STRING_PARAMS = { 'subject_tag' }
 JSON_PARAMS = set()
@@ -321,6 +339,478 @@ def ParseHydrusNetworkGETArgs( requests_args ):
     
     return args
     
+# compact binary update format
+# json is fine for most things, but a big tag repository is gigabytes of integer lists and hex hashes, so updates get an alternative packed encoding
+# the server keeps the json update as the canonical file, whose hash is what the metadata lists, and transcodes on request
+# the binary bytes carry that canonical hash and a checksum of themselves, so the client can verify and store them under the same hash
+
+UPDATE_FORMAT_JSON = 0
+UPDATE_FORMAT_BINARY = 1
+UPDATE_FORMAT_BINARY_ZSTD = 2
+
+BINARY_UPDATE_MAGIC = b'HYUB'
+BINARY_UPDATE_VERSION = 1
+
+BINARY_UPDATE_COMPRESSION_NONE = 0
+BINARY_UPDATE_COMPRESSION_ZLIB = 1
+BINARY_UPDATE_COMPRESSION_ZSTD = 2
+
+BINARY_UPDATE_HEADER_STRUCT = struct.Struct( '<4sBB32s32s' )
+
+INT_ARRAY_DTYPES = [ numpy.int8, numpy.int16, numpy.int32, numpy.int64 ]
+
+def _PackBlob( blob ):
+    
+    return struct.pack( '<Q', len( blob ) ) + blob
+    
+def _PackIntArray( values ):
+    
+    # delta encoded, and packed at the smallest width that fits, so runs of ascending ids become tiny numbers that compress well
+    
+    array = numpy.array( values, dtype = numpy.int64 )
+    
+    deltas = numpy.diff( array, prepend = 0 ) if len( array ) > 0 else array
+    
+    dtype_index = 3
+    
+    if len( deltas ) > 0:
+        
+        ( min_delta, max_delta ) = ( int( deltas.min() ), int( deltas.max() ) )
+        
+        for ( i, dtype ) in enumerate( INT_ARRAY_DTYPES ):
+            
+            dtype_info = numpy.iinfo( dtype )
+            
+            if dtype_info.min <= min_delta and max_delta <= dtype_info.max:
+                
+                dtype_index = i
+                
+                break
+                
+            
+        
+    
+    dtype = numpy.dtype( INT_ARRAY_DTYPES[ dtype_index ] ).newbyteorder( '<' )
+    
+    # byte-shuffled, so all the mostly-zero high bytes sit together for the compressor
+    packed_deltas = deltas.astype( dtype ).view( numpy.uint8 ).reshape( -1, dtype.itemsize ).T.tobytes()
+    
+    return struct.pack( '<BQ', dtype_index, len( deltas ) ) + packed_deltas
+    
+def _PackNullableIntArray( values ):
+    
+    nulls = [ value is None for value in values ]
+    
+    if True in nulls:
+        
+        return struct.pack( '<B', 1 ) + _PackBlob( numpy.packbits( numpy.array( nulls, dtype = numpy.bool_ ) ).tobytes() ) + _PackIntArray( [ 0 if value is None else value for value in values ] )
+        
+    else:
+        
+        return struct.pack( '<B', 0 ) + _PackIntArray( values )
+        
+    
+def _PackStrings( strings ):
+    
+    # one blob and the offsets into it, which delta encoding turns into the string lengths
+    
+    offsets = numpy.cumsum( [ len( s ) for s in strings ], dtype = numpy.int64 )
+    
+    return _PackIntArray( offsets ) + _PackBlob( ''.join( strings ).encode( 'utf-8' ) )
+    
+def _UnpackBlob( body, position ):
+    
+    ( length, ) = struct.unpack_from( '<Q', body, position )
+    
+    position += 8
+    
+    return ( body[ position : position + length ], position + length )
+    
+def _UnpackIntArray( body, position ):
+    
+    ( dtype_index, count ) = struct.unpack_from( '<BQ', body, position )
+    
+    position += 9
+    
+    dtype = numpy.dtype( INT_ARRAY_DTYPES[ dtype_index ] ).newbyteorder( '<' )
+    
+    shuffled_bytes = numpy.frombuffer( body, dtype = numpy.uint8, count = count * dtype.itemsize, offset = position )
+    
+    deltas = shuffled_bytes.reshape( dtype.itemsize, count ).T.copy().view( dtype ).reshape( count )
+    
+    position += count * dtype.itemsize
+    
+    return ( numpy.cumsum( deltas, dtype = numpy.int64 ), position )
+    
+def _UnpackNullableIntArray( body, position ):
+    
+    ( has_nulls, ) = struct.unpack_from( '<B', body, position )
+    
+    position += 1
+    
+    if has_nulls:
+        
+        ( packed_nulls, position ) = _UnpackBlob( body, position )
+        
+        ( array, position ) = _UnpackIntArray( body, position )
+        
+        nulls = numpy.unpackbits( numpy.frombuffer( packed_nulls, dtype = numpy.uint8 ), count = len( array ) ).astype( numpy.bool_ ).tolist()
+        
+        values = [ None if null else value for ( null, value ) in zip( nulls, array.tolist() ) ]
+        
+    else:
+        
+        ( array, position ) = _UnpackIntArray( body, position )
+        
+        values = array.tolist()
+        
+    
+    return ( values, position )
+    
+def _UnpackStrings( body, position ):
+    
+    ( offsets, position ) = _UnpackIntArray( body, position )
+    
+    ( blob, position ) = _UnpackBlob( body, position )
+    
+    text = str( blob, 'utf-8' )
+    
+    offsets = offsets.tolist()
+    
+    strings = [ text[ start : end ] for ( start, end ) in zip( [ 0 ] + offsets[:-1], offsets ) ]
+    
+    return ( strings, position )
+    
+def _DumpContentUpdateToBinaryBody( content_update ):
+    
+    sections = []
+    
+    for ( content_type, action, rows ) in content_update.IterateContent():
+        
+        section = [ struct.pack( '<BB', content_type, action ) ]
+        
+        if content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_ADD:
+            
+            columns = list( zip( *rows ) ) if len( rows ) > 0 else [ [] ] * 9
+            
+            if len( columns ) != 9:
+                
+                raise HydrusExceptions.SerialisationException( 'Unexpected file row in content update!' )
+                
+            
+            section.extend( ( _PackNullableIntArray( column ) for column in columns ) )
+            
+        elif content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_DELETE:
+            
+            section.append( _PackIntArray( rows ) )
+            
+        elif content_type == HC.CONTENT_TYPE_MAPPINGS:
+            
+            tag_ids = [ tag_id for ( tag_id, hash_ids ) in rows ]
+            offsets = numpy.cumsum( [ len( hash_ids ) for ( tag_id, hash_ids ) in rows ], dtype = numpy.int64 )
+            all_hash_ids = list( itertools.chain.from_iterable( ( hash_ids for ( tag_id, hash_ids ) in rows ) ) )
+            
+            section.append( _PackIntArray( tag_ids ) )
+            section.append( _PackIntArray( offsets ) )
+            section.append( _PackIntArray( all_hash_ids ) )
+            
+        elif content_type in ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_TYPE_TAG_SIBLINGS ):
+            
+            section.append( _PackIntArray( [ a for ( a, b ) in rows ] ) )
+            section.append( _PackIntArray( [ b for ( a, b ) in rows ] ) )
+            
+        else:
+            
+            raise HydrusExceptions.SerialisationException( 'Do not know how to pack content type {} into a binary update!'.format( content_type ) )
+            
+        
+        sections.append( b''.join( section ) )
+        
+    
+    return struct.pack( '<I', len( sections ) ) + b''.join( sections )
+    
+def _DumpDefinitionsUpdateToBinaryBody( definitions_update ):
+    
+    sections = []
+    
+    hash_ids_to_hashes = definitions_update.GetHashIdsToHashes()
+    
+    if len( hash_ids_to_hashes ) > 0:
+        
+        hash_lengths = { len( hash ) for hash in hash_ids_to_hashes.values() }
+        
+        if len( hash_lengths ) != 1:
+            
+            raise HydrusExceptions.SerialisationException( 'Definitions update had hashes of different lengths!' )
+            
+        
+        ( hash_length, ) = hash_lengths
+        
+        section = [ struct.pack( '<BB', HC.DEFINITIONS_TYPE_HASHES, hash_length ) ]
+        
+        section.append( _PackIntArray( list( hash_ids_to_hashes.keys() ) ) )
+        section.append( _PackBlob( b''.join( hash_ids_to_hashes.values() ) ) )
+        
+        sections.append( b''.join( section ) )
+        
+    
+    tag_ids_to_tags = definitions_update.GetTagIdsToTags()
+    
+    if len( tag_ids_to_tags ) > 0:
+        
+        section = [ struct.pack( '<BB', HC.DEFINITIONS_TYPE_TAGS, 0 ) ]
+        
+        section.append( _PackIntArray( list( tag_ids_to_tags.keys() ) ) )
+        section.append( _PackStrings( list( tag_ids_to_tags.values() ) ) )
+        
+        sections.append( b''.join( section ) )
+        
+    
+    return struct.pack( '<I', len( sections ) ) + b''.join( sections )
+    
+def _LoadContentUpdateFromBinaryBody( body, position ):
+    
+    content_update = ContentUpdate()
+    
+    ( num_sections, ) = struct.unpack_from( '<I', body, position )
+    
+    position += 4
+    
+    for i in range( num_sections ):
+        
+        ( content_type, action ) = struct.unpack_from( '<BB', body, position )
+        
+        position += 2
+        
+        if content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_ADD:
+            
+            columns = []
+            
+            for j in range( 9 ):
+                
+                ( column, position ) = _UnpackNullableIntArray( body, position )
+                
+                columns.append( column )
+                
+            
+            rows = list( zip( *columns ) )
+            
+        elif content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_DELETE:
+            
+            ( array, position ) = _UnpackIntArray( body, position )
+            
+            rows = array.tolist()
+            
+        elif content_type == HC.CONTENT_TYPE_MAPPINGS:
+            
+            ( tag_ids, position ) = _UnpackIntArray( body, position )
+            ( offsets, position ) = _UnpackIntArray( body, position )
+            ( all_hash_ids, position ) = _UnpackIntArray( body, position )
+            
+            all_hash_ids = all_hash_ids.tolist()
+            offsets = offsets.tolist()
+            
+            rows = [ ( tag_id, all_hash_ids[ start : end ] ) for ( tag_id, start, end ) in zip( tag_ids.tolist(), [ 0 ] + offsets[:-1], offsets ) ]
+            
+        elif content_type in ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_TYPE_TAG_SIBLINGS ):
+            
+            ( a_array, position ) = _UnpackIntArray( body, position )
+            ( b_array, position ) = _UnpackIntArray( body, position )
+            
+            rows = list( zip( a_array.tolist(), b_array.tolist() ) )
+            
+        else:
+            
+            raise HydrusExceptions.SerialisationException( 'Did not understand content type {} in a binary update!'.format( content_type ) )
+            
+        
+        content_update.AddRows( content_type, action, rows )
+        
+    
+    return content_update
+    
+def _LoadDefinitionsUpdateFromBinaryBody( body, position ):
+    
+    definitions_update = DefinitionsUpdate()
+    
+    ( num_sections, ) = struct.unpack_from( '<I', body, position )
+    
+    position += 4
+    
+    for i in range( num_sections ):
+        
+        ( definitions_type, hash_length ) = struct.unpack_from( '<BB', body, position )
+        
+        position += 2
+        
+        ( ids, position ) = _UnpackIntArray( body, position )
+        
+        ids = ids.tolist()
+        
+        if definitions_type == HC.DEFINITIONS_TYPE_HASHES:
+            
+            ( blob, position ) = _UnpackBlob( body, position )
+            
+            definitions = [ blob[ i : i + hash_length ] for i in range( 0, len( blob ), hash_length ) ]
+            
+        elif definitions_type == HC.DEFINITIONS_TYPE_TAGS:
+            
+            ( definitions, position ) = _UnpackStrings( body, position )
+            
+        else:
+            
+            raise HydrusExceptions.SerialisationException( 'Did not understand definitions type {} in a binary update!'.format( definitions_type ) )
+            
+        
+        definitions_update.AddRows( definitions_type, zip( ids, definitions ) )
+        
+    
+    return definitions_update
+    
+def ConvertBinaryUpdateNetworkBytesForStorage( network_bytes ):
+    
+    # zstd is only for the trip over the network. what we store has to load on a client that does not have zstandard, so it is recompressed with zlib
+    
+    if not network_bytes.startswith( BINARY_UPDATE_MAGIC ) or len( network_bytes ) < BINARY_UPDATE_HEADER_STRUCT.size:
+        
+        return network_bytes
+        
+    
+    ( magic, version, compression, reference_hash, checksum ) = BINARY_UPDATE_HEADER_STRUCT.unpack_from( network_bytes, 0 )
+    
+    if compression != BINARY_UPDATE_COMPRESSION_ZSTD:
+        
+        return network_bytes
+        
+    
+    if not ZSTD_OK:
+        
+        raise HydrusExceptions.SerialisationException( 'That binary update is zstd compressed, but zstandard is not available!' )
+        
+    
+    body = zstandard.ZstdDecompressor().decompress( network_bytes[ BINARY_UPDATE_HEADER_STRUCT.size : ] )
+    
+    compressed_body = zlib.compress( body, 6 )
+    
+    checksum = hashlib.sha256( compressed_body ).digest()
+    
+    return BINARY_UPDATE_HEADER_STRUCT.pack( magic, version, BINARY_UPDATE_COMPRESSION_ZLIB, reference_hash, checksum ) + compressed_body
+    
+def CreateUpdateFromBinaryNetworkBytes( network_bytes ):
+    
+    ( magic, version, compression, reference_hash, checksum ) = BINARY_UPDATE_HEADER_STRUCT.unpack_from( network_bytes, 0 )
+    
+    if magic != BINARY_UPDATE_MAGIC:
+        
+        raise HydrusExceptions.SerialisationException( 'That was not a binary update!' )
+        
+    
+    if version > BINARY_UPDATE_VERSION:
+        
+        raise HydrusExceptions.SerialisationException( 'That binary update was from a newer version of hydrus and cannot be read! Please update your client!' )
+        
+    
+    compressed_body = network_bytes[ BINARY_UPDATE_HEADER_STRUCT.size : ]
+    
+    if compression == BINARY_UPDATE_COMPRESSION_NONE:
+        
+        body = compressed_body
+        
+    elif compression == BINARY_UPDATE_COMPRESSION_ZLIB:
+        
+        body = zlib.decompress( compressed_body )
+        
+    elif compression == BINARY_UPDATE_COMPRESSION_ZSTD:
+        
+        if not ZSTD_OK:
+            
+            raise HydrusExceptions.SerialisationException( 'That binary update is zstd compressed, but zstandard is not available! Updates are now stored with zlib, so please install zstandard again, or delete this update file and let the client redownload it.' )
+            
+        
+        body = zstandard.ZstdDecompressor().decompress( compressed_body )
+        
+    else:
+        
+        raise HydrusExceptions.SerialisationException( 'Did not understand the compression of that binary update!' )
+        
+    
+    ( serialisable_type, ) = struct.unpack_from( '<H', body, 0 )
+    
+    if serialisable_type == HydrusSerialisable.SERIALISABLE_TYPE_DEFINITIONS_UPDATE:
+        
+        return _LoadDefinitionsUpdateFromBinaryBody( body, 2 )
+        
+    elif serialisable_type == HydrusSerialisable.SERIALISABLE_TYPE_CONTENT_UPDATE:
+        
+        return _LoadContentUpdateFromBinaryBody( body, 2 )
+        
+    else:
+        
+        raise HydrusExceptions.SerialisationException( 'Did not understand the type of that binary update!' )
+        
+    
+def DumpUpdateToBinaryNetworkBytes( update, reference_hash, update_format = UPDATE_FORMAT_BINARY ):
+    
+    if isinstance( update, DefinitionsUpdate ):
+        
+        body = _DumpDefinitionsUpdateToBinaryBody( update )
+        
+    elif isinstance( update, ContentUpdate ):
+        
+        body = _DumpContentUpdateToBinaryBody( update )
+        
+    else:
+        
+        raise HydrusExceptions.SerialisationException( 'Only repository updates can be dumped to binary!' )
+        
+    
+    body = struct.pack( '<H', update.SERIALISABLE_TYPE ) + body
+    
+    if update_format == UPDATE_FORMAT_BINARY_ZSTD and ZSTD_OK:
+        
+        compression = BINARY_UPDATE_COMPRESSION_ZSTD
+        
+        compressed_body = zstandard.ZstdCompressor( level = 12 ).compress( body )
+        
+    else:
+        
+        compression = BINARY_UPDATE_COMPRESSION_ZLIB
+        
+        # level 9 is many times slower for about 1% here
+        compressed_body = zlib.compress( body, 6 )
+        
+    
+    checksum = hashlib.sha256( compressed_body ).digest()
+    
+    return BINARY_UPDATE_HEADER_STRUCT.pack( BINARY_UPDATE_MAGIC, BINARY_UPDATE_VERSION, compression, reference_hash, checksum ) + compressed_body
+    
+def GetUpdateHashFromNetworkBytes( network_bytes ):
+    
+    # a json update is identified by its own hash, a binary one by the canonical hash it carries, as long as it is intact
+    
+    if network_bytes.startswith( BINARY_UPDATE_MAGIC ) and len( network_bytes ) >= BINARY_UPDATE_HEADER_STRUCT.size:
+        
+        ( magic, version, compression, reference_hash, checksum ) = BINARY_UPDATE_HEADER_STRUCT.unpack_from( network_bytes, 0 )
+        
+        if hashlib.sha256( network_bytes[ BINARY_UPDATE_HEADER_STRUCT.size : ] ).digest() == checksum:
+            
+            return reference_hash
+            
+        
+    
+    return hashlib.sha256( network_bytes ).digest()
+    
+def GetUpdateHashFromPath( path ):
+    
+    with open( path, 'rb' ) as f:
+        
+        network_bytes = f.read()
+        
+    
+    return GetUpdateHashFromNetworkBytes( network_bytes )
+    
+HydrusSerialisable.NETWORK_BYTES_MAGICS_TO_LOADERS[ BINARY_UPDATE_MAGIC ] = CreateUpdateFromBinaryNetworkBytes
+
 class Account( object ):
     
     def __init__( self, account_key, account_type, created, expires, banned_info = None, bandwidth_tracker = None ):
@@ -1387,6 +1877,21 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         self._content_data[ content_type ][ action ].append( data )
         
     
+    def AddRows( self, content_type, action, rows ):
+        
+        if content_type not in self._content_data:
+            
+            self._content_data[ content_type ] = {}
+            
+        
+        if action not in self._content_data[ content_type ]:
+            
+            self._content_data[ content_type ][ action ] = []
+            
+        
+        self._content_data[ content_type ][ action ].extend( rows )
+        
+    
     def GetDeletedFiles( self ):
         
         return self._GetContent( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE )
@@ -1453,6 +1958,17 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         return num
         
     
+    def IterateContent( self ):
+        
+        for ( content_type, actions_to_datas ) in self._content_data.items():
+            
+            for ( action, data ) in actions_to_datas.items():
+                
+                yield ( content_type, action, data )
+                
+            
+        
+    
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_CONTENT_UPDATE ] = ContentUpdate
 
 class Credentials( HydrusSerialisable.SerialisableBase ):
@@ -1700,6 +2216,18 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def AddRows( self, definitions_type, keys_and_values ):
+        
+        if definitions_type == HC.DEFINITIONS_TYPE_HASHES:
+            
+            self._hash_ids_to_hashes.update( keys_and_values )
+            
+        elif definitions_type == HC.DEFINITIONS_TYPE_TAGS:
+            
+            self._tag_ids_to_tags.update( keys_and_values )
+            
+        
+    
     def GetHashIdsToHashes( self ):
         
         return self._hash_ids_to_hashes
@@ -2606,3 +3134,12 @@ class UpdateBuilder( object ):
         return self._updates
         
     
+    def PopUpdates( self ):
+        
+        updates = self._updates
+        
+        self._updates = []
+        
+        return updates
+        
+    
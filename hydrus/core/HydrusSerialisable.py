@@ -124,8 +124,19 @@ SERIALISABLE_TYPE_TAG_SORT = 101
 
 SERIALISABLE_TYPES_TO_OBJECT_TYPES = {}
 
+# some objects have a non-json network format too, recognised by its leading bytes
+NETWORK_BYTES_MAGICS_TO_LOADERS = {}
+
 def CreateFromNetworkBytes( network_string, raise_error_on_future_version = False ):
     
+    for ( magic, loader ) in NETWORK_BYTES_MAGICS_TO_LOADERS.items():
+        
+        if network_string.startswith( magic ):
+            
+            return loader( network_string )
+            
+        
+    
     try:
         
         obj_bytes = zlib.decompress( network_string )
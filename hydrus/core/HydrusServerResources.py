@@ -274,6 +274,59 @@ def ParseFileArguments( path, decompression_bombs_ok = False ):
     
 hydrus_favicon = FileResource( os.path.join( HC.STATIC_DIR, 'hydrus.ico' ), defaultType = 'image/x-icon' )
 
+class BodyChunksProducer( object ):
+    
+    # writes a response body a chunk at a time, as the transport asks for it. with no Content-Length, this goes out as chunked transfer encoding
+    
+    def __init__( self, request, body_chunks, finished_callback ):
+        
+        self._request = request
+        self._body_chunks = iter( body_chunks )
+        self._finished_callback = finished_callback
+        
+        self._num_bytes = 0
+        
+    
+    def resumeProducing( self ):
+        
+        if self._request is None:
+            
+            return
+            
+        
+        try:
+            
+            chunk = next( self._body_chunks )
+            
+        except StopIteration:
+            
+            request = self._request
+            
+            self._request = None
+            
+            request.unregisterProducer()
+            request.finish()
+            
+            self._finished_callback( request, self._num_bytes )
+            
+            return
+            
+        
+        self._num_bytes += len( chunk )
+        
+        self._request.write( chunk )
+        
+    
+    def start( self ):
+        
+        self._request.registerProducer( self, False )
+        
+    
+    def stopProducing( self ):
+        
+        self._request = None
+        
+    
 class HydrusDomain( object ):
     
     def __init__( self, local_only ):
@@ -575,6 +628,24 @@ class HydrusResource( Resource ):
             
             request.write( body_bytes )
             
+        elif response_context.HasBodyChunks():
+            
+            mime = response_context.GetMime()
+            
+            content_type = HC.mime_mimetype_string_lookup[ mime ]
+            
+            request.setHeader( 'Content-Type', content_type )
+            request.setHeader( 'Content-Disposition', 'inline' )
+            
+            producer = BodyChunksProducer( request, response_context.GetBodyChunks(), self._reportDataUsed )
+            
+            producer.start()
+            
+            # the producer reports data used when it is done
+            content_length = 0
+            
+            do_finish = False
+            
         else:
             
             content_length = 0
@@ -1066,7 +1137,7 @@ class HydrusResourceWelcome( HydrusResource ):
     
 class ResponseContext( object ):
     
-    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None ):
+    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None, body_chunks = None ):
         
         if body is None:
             
@@ -1098,6 +1169,7 @@ class ResponseContext( object ):
         self._status_code = status_code
         self._mime = mime
         self._body_bytes = body_bytes
+        self._body_chunks = body_chunks
         self._path = path
         self._cookies = cookies
         
@@ -1107,6 +1179,11 @@ class ResponseContext( object ):
         return self._body_bytes
         
     
+    def GetBodyChunks( self ):
+        
+        return self._body_chunks
+        
+    
     def GetCookies( self ): return self._cookies
     
     def GetMime( self ): return self._mime
@@ -1117,5 +1194,7 @@ class ResponseContext( object ):
     
     def HasBody( self ): return self._body_bytes is not None
     
+    def HasBodyChunks( self ): return self._body_chunks is not None
+    
     def HasPath( self ): return self._path is not None
     
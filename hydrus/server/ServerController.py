@@ -16,6 +16,7 @@ from hydrus.core import HydrusSessions
 from hydrus.core import HydrusThreading
 
 from hydrus.server import ServerDB
+from hydrus.server import ServerFiles
 from hydrus.server import ServerServer
 
 
@@ -202,6 +203,8 @@ class Controller( HydrusController.HydrusController ):
         
         self.WriteSynchronous( 'delete_orphans' )
         
+        ServerFiles.DeleteOrphanBinaryUpdateFiles()
+        
     
     def Exit( self ):
         
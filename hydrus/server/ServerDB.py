@@ -1,5 +1,7 @@
 import collections
 import hashlib
+import itertools
+import json
 import os
 import random
 import sqlite3
@@ -19,6 +21,50 @@ from hydrus.core import HydrusTags
 
 from hydrus.server import ServerFiles
 
+UPDATE_GENERATION_PAGE_SIZE = 50000
+
+UPDATE_MAX_DEFINITIONS_ROWS = 50000
+UPDATE_MAX_CONTENT_ROWS = 250000
+UPDATE_MAX_CONTENT_CHUNK = 25000
+
+# how often, in seconds, we commit the update files written so far while generating
+UPDATE_GENERATION_CHECKPOINT_PERIOD = 60
+
+def GenerateUpdateGenerationOptions():
+    
+    # progress from an interrupted update generation can only be resumed if the updates would be split the same way
+    
+    return json.dumps( [ UPDATE_MAX_DEFINITIONS_ROWS, UPDATE_MAX_CONTENT_ROWS, UPDATE_MAX_CONTENT_CHUNK ] )
+    
+def GenerateKeysetPredicate( key_column_names, key ):
+    
+    # ( a, b ) > ( x, y ) without needing sqlite row values
+    
+    clauses = []
+    args = []
+    
+    for i in range( len( key_column_names ) ):
+        
+        equalities = [ '{} = ?'.format( column_name ) for column_name in key_column_names[ : i ] ]
+        
+        clauses.append( ' AND '.join( equalities + [ '{} > ?'.format( key_column_names[ i ] ) ] ) )
+        
+        args.extend( key[ : i + 1 ] )
+        
+    
+    predicate = ' OR '.join( ( '( {} )'.format( clause ) for clause in clauses ) )
+    
+    if len( key_column_names ) > 1:
+        
+        # sqlite will not use an index for the OR on its own, so give it a range on the first column too
+        
+        predicate = '{} >= ? AND ( {} )'.format( key_column_names[0], predicate )
+        
+        args.insert( 0, key[0] )
+        
+    
+    return ( predicate, args )
+    
 def GenerateRepositoryMasterMapTableNames( service_id ):
     
     suffix = str( service_id )
@@ -349,6 +395,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.execute( 'CREATE TABLE sessions ( session_key BLOB_BYTES, service_id INTEGER, account_id INTEGER, expires INTEGER );' )
         
+        self._c.execute( 'CREATE TABLE update_generation_progress ( service_id INTEGER, begin INTEGER, end INTEGER, generation_options TEXT, update_index INTEGER, update_hash BLOB_BYTES, num_definition_rows INTEGER, num_content_rows INTEGER, stage INTEGER, resume_key TEXT, PRIMARY KEY ( service_id, begin, end, generation_options, update_index ) );' )
+        
         self._c.execute( 'CREATE TABLE version ( version INTEGER, year INTEGER, month INTEGER );' )
         
         # master
@@ -1229,6 +1277,32 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RepairDB( self ):
+        
+        HydrusDB.HydrusDB._RepairDB( self )
+        
+        result = self._c.execute( 'SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?;', ( 'table', 'update_generation_progress' ) ).fetchone()
+        
+        if result is not None:
+            
+            column_names = { row[1] for row in self._c.execute( 'PRAGMA table_info( update_generation_progress );' ) }
+            
+            if 'generation_options' not in column_names:
+                
+                # an early version of this table did not know which window or update sizes its progress was for. it is only resume data, so we start again
+                
+                self._c.execute( 'DROP TABLE update_generation_progress;' )
+                
+                result = None
+                
+            
+        
+        if result is None:
+            
+            self._c.execute( 'CREATE TABLE update_generation_progress ( service_id INTEGER, begin INTEGER, end INTEGER, generation_options TEXT, update_index INTEGER, update_hash BLOB_BYTES, num_definition_rows INTEGER, num_content_rows INTEGER, stage INTEGER, resume_key TEXT, PRIMARY KEY ( service_id, begin, end, generation_options, update_index ) );' )
+            
+        
+    
     def _RepositoryAddFile( self, service_id, account_id, file_dict, overwrite_deleted, timestamp ):
         
         master_hash_id = self._AddFile( file_dict )
@@ -1482,41 +1556,76 @@ class DB( HydrusDB.HydrusDB ):
         
         HydrusData.Print( 'Creating update for ' + repr( name ) + ' from ' + HydrusData.ConvertTimestampToPrettyTime( begin, in_utc = True ) + ' to ' + HydrusData.ConvertTimestampToPrettyTime( end, in_utc = True ) )
         
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
+        # if a previous attempt at this update was interrupted, we pick up after the last update file it wrote
+        
+        generation_options = GenerateUpdateGenerationOptions()
         
-        update_hashes = []
+        # anything else is from a different window or was split differently, and cannot be carried on
         
-        total_definition_rows = 0
-        total_content_rows = 0
+        self._c.execute( 'DELETE FROM update_generation_progress WHERE service_id = ? AND NOT ( begin = ? AND end = ? AND generation_options = ? );', ( service_id, begin, end, generation_options ) )
         
-        if len( updates ) > 0:
+        progress_rows = self._c.execute( 'SELECT update_index, update_hash, num_definition_rows, num_content_rows, stage, resume_key FROM update_generation_progress WHERE service_id = ? AND begin = ? AND end = ? AND generation_options = ? ORDER BY update_index ASC;', ( service_id, begin, end, generation_options ) ).fetchall()
+        
+        if len( progress_rows ) > 0:
             
-            for update in updates:
-                
-                num_rows = update.GetNumRows()
+            ( update_index, update_hash, num_definition_rows, num_content_rows, stage, resume_key ) = progress_rows[-1]
+            
+            resume_position = ( stage, tuple( json.loads( resume_key ) ) )
+            
+            HydrusData.Print( 'Resuming an interrupted update generation after ' + HydrusData.ToHumanInt( len( progress_rows ) ) + ' update files.' )
+            
+        else:
+            
+            resume_position = None
+            
+        
+        def record_finished_updates():
+            
+            for ( update_index, update_hash, num_definition_rows, num_content_rows, ( stage, key ) ) in update_file_writer.GetFinishedUpdates():
                 
-                if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
-                    
-                    total_definition_rows += num_rows
-                    
-                elif isinstance( update, HydrusNetwork.ContentUpdate ):
-                    
-                    total_content_rows += num_rows
-                    
+                self._c.execute( 'INSERT INTO update_generation_progress ( service_id, begin, end, generation_options, update_index, update_hash, num_definition_rows, num_content_rows, stage, resume_key ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ? );', ( service_id, begin, end, generation_options, update_index, sqlite3.Binary( update_hash ), num_definition_rows, num_content_rows, stage, json.dumps( key ) ) )
                 
-                update_bytes = update.DumpToNetworkBytes()
+            
+        
+        update_file_writer = ServerFiles.UpdateFileWriter( self._controller, first_update_index = len( progress_rows ) )
+        
+        next_commit = HydrusData.GetNowPrecise() + UPDATE_GENERATION_CHECKPOINT_PERIOD
+        
+        try:
+            
+            for ( update, position ) in self._RepositoryIterateUpdates( service_id, begin, end, resume_position = resume_position ):
                 
-                update_hash = hashlib.sha256( update_bytes ).digest()
+                update_file_writer.AddUpdate( update, position )
                 
-                dest_path = ServerFiles.GetExpectedFilePath( update_hash )
+                record_finished_updates()
                 
-                with open( dest_path, 'wb' ) as f:
+                if HydrusData.TimeHasPassedPrecise( next_commit ):
                     
-                    f.write( update_bytes )
+                    # checkpoint, so a crash from here on does not lose what we have written so far
+                    
+                    self._cursor_transaction_wrapper.CommitAndBegin()
+                    
+                    next_commit = HydrusData.GetNowPrecise() + UPDATE_GENERATION_CHECKPOINT_PERIOD
                     
                 
-                update_hashes.append( update_hash )
-                
+            
+            update_file_writer.Finish()
+            
+            record_finished_updates()
+            
+        finally:
+            
+            update_file_writer.Shutdown()
+            
+        
+        progress_rows = self._c.execute( 'SELECT update_index, update_hash, num_definition_rows, num_content_rows FROM update_generation_progress WHERE service_id = ? AND begin = ? AND end = ? AND generation_options = ? ORDER BY update_index ASC;', ( service_id, begin, end, generation_options ) ).fetchall()
+        
+        update_hashes = [ update_hash for ( update_index, update_hash, num_definition_rows, num_content_rows ) in progress_rows ]
+        
+        total_definition_rows = sum( ( num_definition_rows for ( update_index, update_hash, num_definition_rows, num_content_rows ) in progress_rows ) )
+        total_content_rows = sum( ( num_content_rows for ( update_index, update_hash, num_definition_rows, num_content_rows ) in progress_rows ) )
+        
+        if len( update_hashes ) > 0:
             
             ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
             
@@ -1525,7 +1634,9 @@ class DB( HydrusDB.HydrusDB ):
             self._c.executemany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
             
         
-        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( updates ) ) + ' update files.' )
+        self._c.execute( 'DELETE FROM update_generation_progress WHERE service_id = ? AND begin = ? AND end = ? AND generation_options = ?;', ( service_id, begin, end, generation_options ) )
+        
+        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( update_hashes ) ) + ' update files.' )
         
         return update_hashes
         
@@ -1661,6 +1772,8 @@ class DB( HydrusDB.HydrusDB ):
             self._c.execute( 'DROP TABLE ' + table_name + ';' )
             
         
+        self._c.execute( 'DELETE FROM update_generation_progress WHERE service_id = ?;', ( service_id, ) )
+        
     
     def _RepositoryGenerateImmediateUpdate( self, service_key, account, begin, end ):
         
@@ -1673,125 +1786,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGenerateUpdates( self, service_id, begin, end ):
         
-        MAX_DEFINITIONS_ROWS = 50000
-        MAX_CONTENT_ROWS = 250000
-        
-        MAX_CONTENT_CHUNK = 25000
-        
-        updates = []
-        
-        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS )
-        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS )
-        
-        ( service_hash_ids_table_name, service_tag_ids_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
-        
-        for ( service_hash_id, hash ) in self._c.execute( 'SELECT service_hash_id, hash FROM ' + service_hash_ids_table_name + ' NATURAL JOIN hashes WHERE hash_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
-            
-            row = ( HC.DEFINITIONS_TYPE_HASHES, service_hash_id, hash )
-            
-            definitions_update_builder.AddRow( row )
-            
-        
-        for ( service_tag_id, tag ) in self._c.execute( 'SELECT service_tag_id, tag FROM ' + service_tag_ids_table_name + ' NATURAL JOIN tags WHERE tag_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
-            
-            row = ( HC.DEFINITIONS_TYPE_TAGS, service_tag_id, tag )
-            
-            definitions_update_builder.AddRow( row )
-            
-        
-        definitions_update_builder.Finish()
-        
-        updates.extend( definitions_update_builder.GetUpdates() )
-        
-        #
-        
-        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
-        
-        table_join = self._RepositoryGetFilesInfoFilesTableJoin( service_id, HC.CONTENT_STATUS_CURRENT )
-        
-        for ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words ) in self._c.execute( 'SELECT service_hash_id, size, mime, file_timestamp, width, height, duration, num_frames, num_words FROM ' + table_join + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
-            
-            file_row = ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words )
-            
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, file_row ) )
-            
-        
-        service_hash_ids = [ service_hash_id for ( service_hash_id, ) in self._c.execute( 'SELECT service_hash_id FROM ' + deleted_files_table_name + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ) ]
-        
-        for service_hash_id in service_hash_ids:
-            
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, service_hash_id ) )
-            
-        
-        #
-        
-        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
-        
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + current_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
-        
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
-            
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
-                
-                row_weight = len( block_of_service_hash_ids )
-                
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
-                
-            
-        
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + deleted_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
-        
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
-            
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
-                
-                row_weight = len( block_of_service_hash_ids )
-                
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
-                
-            
-        
-        #
-        
-        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
-        
-        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + current_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
-            
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, pair ) )
-            
-        
-        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + deleted_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
-            
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_DELETE, pair ) )
-            
-        
-        #
-        
-        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
-        
-        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + current_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
-            
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, pair ) )
-            
-        
-        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + deleted_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
-            
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, pair ) )
-            
-        
-        #
-        
-        content_update_builder.Finish()
-        
-        updates.extend( content_update_builder.GetUpdates() )
+        updates = [ update for ( update, position ) in self._RepositoryIterateUpdates( service_id, begin, end ) ]
         
         return updates
         
@@ -2056,7 +2051,7 @@ class DB( HydrusDB.HydrusDB ):
         
         return HydrusNetwork.Petition( action, petitioner_account, reason, contents )
         
-        
+    
     
     def _RepositoryGetMasterHashIds( self, service_id, service_hash_ids ):
         
@@ -2506,6 +2501,189 @@ class DB( HydrusDB.HydrusDB ):
         return ( True, mime )
         
     
+    def _RepositoryIterateUpdateStagePages( self, table_join, key_column_names, column_names, begin, end, resume_key = None ):
+        
+        # we page straight off the source table in ( timestamp, primary key ) order, which the timestamp index gives us for free, so we never copy the window anywhere and can start from any key
+        # yields lists of ( key, row )
+        
+        timestamp_column_name = key_column_names[0]
+        
+        num_key_columns = len( key_column_names )
+        
+        key = resume_key
+        
+        while True:
+            
+            if key is None:
+                
+                ( predicate, predicate_args ) = ( '1 = 1', [] )
+                
+            else:
+                
+                ( predicate, predicate_args ) = GenerateKeysetPredicate( key_column_names, key )
+                
+            
+            query = 'SELECT {} FROM {} WHERE {} BETWEEN ? AND ? AND {} ORDER BY {} LIMIT ?;'.format( ', '.join( key_column_names + column_names ), table_join, timestamp_column_name, predicate, ', '.join( key_column_names ) )
+            
+            rows = self._c.execute( query, [ begin, end ] + predicate_args + [ UPDATE_GENERATION_PAGE_SIZE ] ).fetchall()
+            
+            if len( rows ) == 0:
+                
+                break
+                
+            
+            yield [ ( row[ : num_key_columns ], row[ num_key_columns : ] ) for row in rows ]
+            
+            key = rows[-1][ : num_key_columns ]
+            
+        
+    
+    def _RepositoryIterateUpdates( self, service_id, begin, end, resume_position = None ):
+        
+        # yields ( update, position ) as each update fills up
+        # position is ( stage, key ) of the last row in that update, which is enough to carry on from that point if we are interrupted
+        
+        ( service_hash_ids_table_name, service_tag_ids_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
+        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
+        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
+        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
+        
+        files_table_join = self._RepositoryGetFilesInfoFilesTableJoin( service_id, HC.CONTENT_STATUS_CURRENT )
+        
+        def convert_definitions( definitions_type ):
+            
+            def converter( rows ):
+                
+                for ( key, ( definition_id, definition ) ) in rows:
+                    
+                    yield ( key, ( definitions_type, definition_id, definition ), 1 )
+                    
+                
+            
+            return converter
+            
+        
+        def convert_files_add( rows ):
+            
+            for ( key, file_row ) in rows:
+                
+                yield ( key, ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, file_row ), 1 )
+                
+            
+        
+        def convert_files_delete( rows ):
+            
+            for ( key, ( service_hash_id, ) ) in rows:
+                
+                yield ( key, ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, service_hash_id ), 1 )
+                
+            
+        
+        def convert_mappings( content_update_action ):
+            
+            def converter( rows ):
+                
+                # rows come in timestamp order, but a petition or upload of many files for one tag all gets the same timestamp, so they are still next to each other
+                
+                for ( ( timestamp, service_tag_id ), group ) in itertools.groupby( rows, key = lambda key_and_row: ( key_and_row[0][0], key_and_row[1][0] ) ):
+                    
+                    for block in HydrusData.SplitListIntoChunks( list( group ), UPDATE_MAX_CONTENT_CHUNK ):
+                        
+                        block_of_service_hash_ids = [ service_hash_id for ( key, ( service_tag_id, service_hash_id ) ) in block ]
+                        
+                        row_weight = len( block_of_service_hash_ids )
+                        
+                        ( last_key, last_row ) = block[-1]
+                        
+                        yield ( last_key, ( HC.CONTENT_TYPE_MAPPINGS, content_update_action, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
+                        
+                    
+                
+            
+            return converter
+            
+        
+        def convert_pairs( content_type, content_update_action ):
+            
+            def converter( rows ):
+                
+                for ( key, pair ) in rows:
+                    
+                    yield ( key, ( content_type, content_update_action, pair ), 1 )
+                    
+                
+            
+            return converter
+            
+        
+        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, UPDATE_MAX_DEFINITIONS_ROWS )
+        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, UPDATE_MAX_CONTENT_ROWS )
+        
+        # ( builder, table join, key column names, column names, converter )
+        # the key is the timestamp and then the primary key, so it is unique and follows the timestamp index
+        # the order here is the stage order, so do not shuffle it about or interrupted generation will resume in the wrong place
+        
+        stages = []
+        
+        stages.append( ( definitions_update_builder, service_hash_ids_table_name + ' NATURAL JOIN hashes', [ 'hash_id_timestamp', 'service_hash_id' ], [ 'service_hash_id', 'hash' ], convert_definitions( HC.DEFINITIONS_TYPE_HASHES ) ) )
+        stages.append( ( definitions_update_builder, service_tag_ids_table_name + ' NATURAL JOIN tags', [ 'tag_id_timestamp', 'service_tag_id' ], [ 'service_tag_id', 'tag' ], convert_definitions( HC.DEFINITIONS_TYPE_TAGS ) ) )
+        stages.append( ( content_update_builder, files_table_join, [ 'file_timestamp', 'service_hash_id' ], [ 'service_hash_id', 'size', 'mime', 'file_timestamp', 'width', 'height', 'duration', 'num_frames', 'num_words' ], convert_files_add ) )
+        stages.append( ( content_update_builder, deleted_files_table_name, [ 'file_timestamp', 'service_hash_id' ], [ 'service_hash_id' ], convert_files_delete ) )
+        stages.append( ( content_update_builder, current_mappings_table_name, [ 'mapping_timestamp', 'service_tag_id', 'service_hash_id' ], [ 'service_tag_id', 'service_hash_id' ], convert_mappings( HC.CONTENT_UPDATE_ADD ) ) )
+        stages.append( ( content_update_builder, deleted_mappings_table_name, [ 'mapping_timestamp', 'service_tag_id', 'service_hash_id' ], [ 'service_tag_id', 'service_hash_id' ], convert_mappings( HC.CONTENT_UPDATE_DELETE ) ) )
+        stages.append( ( content_update_builder, current_tag_parents_table_name, [ 'parent_timestamp', 'child_service_tag_id', 'parent_service_tag_id' ], [ 'child_service_tag_id', 'parent_service_tag_id' ], convert_pairs( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD ) ) )
+        stages.append( ( content_update_builder, deleted_tag_parents_table_name, [ 'parent_timestamp', 'child_service_tag_id', 'parent_service_tag_id' ], [ 'child_service_tag_id', 'parent_service_tag_id' ], convert_pairs( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_DELETE ) ) )
+        stages.append( ( content_update_builder, current_tag_siblings_table_name, [ 'sibling_timestamp', 'bad_service_tag_id' ], [ 'bad_service_tag_id', 'good_service_tag_id' ], convert_pairs( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD ) ) )
+        stages.append( ( content_update_builder, deleted_tag_siblings_table_name, [ 'sibling_timestamp', 'bad_service_tag_id' ], [ 'bad_service_tag_id', 'good_service_tag_id' ], convert_pairs( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE ) ) )
+        
+        if resume_position is None:
+            
+            ( resume_stage, resume_key ) = ( 0, None )
+            
+        else:
+            
+            ( resume_stage, resume_key ) = resume_position
+            
+        
+        position = resume_position
+        
+        for ( stage, ( update_builder, table_join, key_column_names, column_names, converter ) ) in enumerate( stages ):
+            
+            if stage >= resume_stage:
+                
+                stage_resume_key = resume_key if stage == resume_stage else None
+                
+                for rows in self._RepositoryIterateUpdateStagePages( table_join, key_column_names, column_names, begin, end, resume_key = stage_resume_key ):
+                    
+                    for ( key, row, row_weight ) in converter( rows ):
+                        
+                        update_builder.AddRow( row, row_weight )
+                        
+                        position = ( stage, tuple( key ) )
+                        
+                        for update in update_builder.PopUpdates():
+                            
+                            yield ( update, position )
+                            
+                        
+                    
+                
+            
+            last_stage_for_this_builder = stage + 1 == len( stages ) or stages[ stage + 1 ][0] is not update_builder
+            
+            if last_stage_for_this_builder:
+                
+                update_builder.Finish()
+                
+                for update in update_builder.PopUpdates():
+                    
+                    yield ( update, position )
+                    
+                
+            
+        
+    
     def _RepositoryPendTagParent( self, service_id, account_id, child_master_tag_id, parent_master_tag_id, reason_id ):
         
         ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
@@ -1,12 +1,89 @@
+import hashlib
 import os
+import queue
+import threading
 
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusNetwork
+from hydrus.core import HydrusPaths
+from hydrus.core import HydrusSerialisable
 
+BINARY_UPDATE_SUFFIXES = ( '.binary_update', '.binary_update_zstd' )
+
+def DeleteOrphanBinaryUpdateFiles():
+    
+    # binary updates are only a transcode cache of the json update, so they go when it does
+    # an interrupted transcode leaves a temp file, which goes once it is a day old
+    
+    for path in IterateAllPaths( 'binary_update' ):
+        
+        ( dir, filename ) = os.path.split( path )
+        
+        if filename.endswith( '.temp' ):
+            
+            if HydrusData.TimeHasPassed( os.path.getmtime( path ) + 86400 ):
+                
+                HydrusPaths.DeletePath( path )
+                
+            
+        elif not os.path.exists( os.path.join( dir, filename.split( '.' )[0] ) ):
+            
+            HydrusPaths.DeletePath( path )
+            
+        
+    
 def GetAllHashes( file_type ):
     
-    return { bytes.fromhex( os.path.split( path )[1] ) for path in IterateAllPaths( file_type ) }
+    return { bytes.fromhex( os.path.split( path )[1].split( '.' )[0] ) for path in IterateAllPaths( file_type ) }
+    
+def GetBinaryUpdateFilePath( update_hash, update_format ):
+    
+    # the json update is canonical, so the binary version is transcoded the first time someone asks for it and kept next to it
+    
+    if update_format == HydrusNetwork.UPDATE_FORMAT_BINARY_ZSTD and not HydrusNetwork.ZSTD_OK:
+        
+        update_format = HydrusNetwork.UPDATE_FORMAT_BINARY
+        
+    
+    path = GetExpectedBinaryUpdateFilePath( update_hash, update_format )
+    
+    if not os.path.exists( path ):
+        
+        with open( GetFilePath( update_hash ), 'rb' ) as f:
+            
+            update_network_bytes = f.read()
+            
+        
+        update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
+        
+        binary_network_bytes = HydrusNetwork.DumpUpdateToBinaryNetworkBytes( update, update_hash, update_format )
+        
+        temp_path = path + '.' + os.urandom( 8 ).hex() + '.temp'
+        
+        with open( temp_path, 'wb' ) as f:
+            
+            f.write( binary_network_bytes )
+            
+        
+        os.replace( temp_path, path )
+        
+    
+    return path
+    
+def GetExpectedBinaryUpdateFilePath( update_hash, update_format ):
+    
+    if update_format == HydrusNetwork.UPDATE_FORMAT_BINARY_ZSTD:
+        
+        suffix = '.binary_update_zstd'
+        
+    else:
+        
+        suffix = '.binary_update'
+        
+    
+    return GetExpectedFilePath( update_hash ) + suffix
     
 def GetExpectedFilePath( hash ):
     
@@ -66,7 +143,7 @@ def IterateAllPaths( file_type ):
         
         for filename in filenames:
             
-            if file_type == 'file' and filename.endswith( '.thumbnail' ):
+            if file_type == 'file' and '.' in filename:
                 
                 continue
                 
@@ -74,8 +151,179 @@ def IterateAllPaths( file_type ):
                 
                 continue
                 
+            elif file_type == 'binary_update' and not any( suffix in filename for suffix in BINARY_UPDATE_SUFFIXES ):
+                
+                continue
+                
             
             yield os.path.join( dir, filename )
             
         
     
+
+class UpdateFileWriter( object ):
+    
+    # serialising and compressing a big update takes a while, and zlib lets go of the GIL, so we do it on several threads while the db keeps generating
+    # results are given back strictly in update order, so the caller can checkpoint a contiguous run of finished updates
+    
+    def __init__( self, controller, num_workers = None, first_update_index = 0 ):
+        
+        if num_workers is None:
+            
+            num_workers = max( 1, min( 4, os.cpu_count() or 1 ) )
+            
+        
+        self._controller = controller
+        self._num_workers = num_workers
+        
+        # bounded so the db thread cannot get more than a few updates ahead of the writers
+        self._queue = queue.Queue( maxsize = num_workers * 2 )
+        
+        self._lock = threading.Lock()
+        
+        self._update_indices_to_results = {}
+        self._next_update_index_to_add = first_update_index
+        self._next_update_index_to_give = first_update_index
+        
+        self._error = None
+        
+        self._workers_started = False
+        self._shut_down = False
+        
+    
+    def _CheckError( self ):
+        
+        with self._lock:
+            
+            error = self._error
+            
+        
+        if error is not None:
+            
+            raise error
+            
+        
+    
+    def _WorkerLoop( self ):
+        
+        while True:
+            
+            job = self._queue.get()
+            
+            try:
+                
+                if job is None:
+                    
+                    return
+                    
+                
+                with self._lock:
+                    
+                    if self._error is not None:
+                        
+                        continue
+                        
+                    
+                
+                ( update_index, update, position ) = job
+                
+                num_rows = update.GetNumRows()
+                
+                if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+                    
+                    ( num_definition_rows, num_content_rows ) = ( num_rows, 0 )
+                    
+                else:
+                    
+                    ( num_definition_rows, num_content_rows ) = ( 0, num_rows )
+                    
+                
+                update_bytes = update.DumpToNetworkBytes()
+                
+                update_hash = hashlib.sha256( update_bytes ).digest()
+                
+                dest_path = GetExpectedFilePath( update_hash )
+                
+                with open( dest_path, 'wb' ) as f:
+                    
+                    f.write( update_bytes )
+                    
+                
+                with self._lock:
+                    
+                    self._update_indices_to_results[ update_index ] = ( update_index, update_hash, num_definition_rows, num_content_rows, position )
+                    
+                
+            except Exception as e:
+                
+                with self._lock:
+                    
+                    self._error = e
+                    
+                
+            finally:
+                
+                self._queue.task_done()
+                
+            
+        
+    
+    def AddUpdate( self, update, position ):
+        
+        self._CheckError()
+        
+        if not self._workers_started:
+            
+            for i in range( self._num_workers ):
+                
+                self._controller.CallToThread( self._WorkerLoop )
+                
+            
+            self._workers_started = True
+            
+        
+        self._queue.put( ( self._next_update_index_to_add, update, position ) )
+        
+        self._next_update_index_to_add += 1
+        
+    
+    def Finish( self ):
+        
+        if self._workers_started:
+            
+            self._queue.join()
+            
+        
+        self._CheckError()
+        
+    
+    def GetFinishedUpdates( self ):
+        
+        results = []
+        
+        with self._lock:
+            
+            while self._next_update_index_to_give in self._update_indices_to_results:
+                
+                results.append( self._update_indices_to_results.pop( self._next_update_index_to_give ) )
+                
+                self._next_update_index_to_give += 1
+                
+            
+        
+        return results
+        
+    
+    def Shutdown( self ):
+        
+        if self._workers_started and not self._shut_down:
+            
+            for i in range( self._num_workers ):
+                
+                self._queue.put( None )
+                
+            
+        
+        self._shut_down = True
+        
+    
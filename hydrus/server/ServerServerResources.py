@@ -753,6 +753,23 @@ class HydrusResourceRestrictedUpdate( HydrusResourceRestricted ):
         
         path = ServerFiles.GetFilePath( update_hash )
         
+        if 'update_format' in request.parsed_request_args:
+            
+            update_format = request.parsed_request_args[ 'update_format' ]
+            
+            if update_format in ( HydrusNetwork.UPDATE_FORMAT_BINARY, HydrusNetwork.UPDATE_FORMAT_BINARY_ZSTD ):
+                
+                try:
+                    
+                    path = ServerFiles.GetBinaryUpdateFilePath( update_hash, update_format )
+                    
+                except HydrusExceptions.SerialisationException:
+                    
+                    pass # something in there cannot be packed, so they get the json
+                    
+                
+            
+        
         response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
         
         return response_context
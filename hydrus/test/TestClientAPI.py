@@ -1643,6 +1643,77 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( d, expected_answer )
         
+        # paginated search
+        
+        path = '/get_files/search_files?tags={}&limit=4'.format( urllib.parse.quote( json.dumps( tags ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'file_ids' ], hash_ids[ : 4 ] )
+        self.assertEqual( d[ 'offset' ], 0 )
+        self.assertEqual( d[ 'num_files' ], len( hash_ids ) )
+        
+        cursor_hex = d[ 'cursor' ]
+        
+        # next page from the cursor, which should not hit the db again
+        
+        HG.test_controller.SetRead( 'file_query_ids', set() )
+        
+        path = '/get_files/search_files?cursor={}&offset=4&limit=4'.format( cursor_hex )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'file_ids' ], hash_ids[ 4 : ] )
+        self.assertEqual( d[ 'cursor' ], cursor_hex )
+        self.assertEqual( d[ 'offset' ], 4 )
+        self.assertEqual( d[ 'num_files' ], len( hash_ids ) )
+        
+        HG.test_controller.SetRead( 'file_query_ids', set( hash_ids ) )
+        
+        # bad cursor
+        
+        path = '/get_files/search_files?cursor={}&offset=4'.format( os.urandom( 32 ).hex() )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 404 )
+        
+        # metadata needs pagination
+        
+        path = '/get_files/search_files?tags={}&include_file_metadata=true'.format( urllib.parse.quote( json.dumps( tags ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 400 )
+        
         # some file search param parsing
         
         class PretendRequest( object ):
@@ -1996,6 +2067,96 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( d, expected_detailed_known_urls_metadata_result )
         
+        # metadata with selected fields
+        
+        parts_to_hash_ids_to_values = {}
+        
+        parts_to_hash_ids_to_values[ 'hashes' ] = file_ids_to_hashes
+        parts_to_hash_ids_to_values[ 'info' ] = { media_result.GetHashId() : media_result.GetFileInfoManager().ToTuple()[2:] for media_result in media_results }
+        parts_to_hash_ids_to_values[ 'urls' ] = { media_result.GetHashId() : set( urls ) for media_result in media_results }
+        
+        HG.test_controller.SetRead( 'media_result_parts', parts_to_hash_ids_to_values )
+        
+        fields = [ 'file_id', 'hash', 'size', 'mime', 'num_words', 'known_urls' ]
+        
+        expected_metadata = [ { field : row[ field ] for field in fields } for row in metadata ]
+        
+        path = '/get_files/file_metadata?file_ids={}&fields={}'.format( urllib.parse.quote( json.dumps( [ 1, 2, 3 ] ) ), urllib.parse.quote( json.dumps( fields ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d, { 'metadata' : expected_metadata } )
+        
+        # and columnar
+        
+        path = '/get_files/file_metadata?file_ids={}&fields={}&columnar=true'.format( urllib.parse.quote( json.dumps( [ 1, 2, 3 ] ) ), urllib.parse.quote( json.dumps( fields ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d, { 'metadata' : { field : [ row[ field ] for row in metadata ] for field in fields } } )
+        
+        # selected fields from hashes come back in the order they were asked for
+        
+        path = '/get_files/file_metadata?hashes={}&fields={}'.format( urllib.parse.quote( json.dumps( [ hash.hex() for hash in reversed( list( file_ids_to_hashes.values() ) ) ] ) ), urllib.parse.quote( json.dumps( fields ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d, { 'metadata' : list( reversed( expected_metadata ) ) } )
+        
+        # and a hash we do not know is not found
+        
+        path = '/get_files/file_metadata?hashes={}&fields={}'.format( urllib.parse.quote( json.dumps( [ hash.hex() for hash in file_ids_to_hashes.values() ] + [ HydrusData.GenerateKey().hex() ] ) ), urllib.parse.quote( json.dumps( fields ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 404 )
+        
+        # bad field
+        
+        path = '/get_files/file_metadata?file_ids={}&fields={}'.format( urllib.parse.quote( json.dumps( [ 1, 2, 3 ] ) ), urllib.parse.quote( json.dumps( [ 'hash', 'colour' ] ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 400 )
+        
         # files and thumbs
         
         hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
@@ -1,8 +1,17 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
+from mock import patch
+
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusNetwork
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientManagers
@@ -121,3 +130,291 @@ class TestManagers( unittest.TestCase ):
         self.assertEqual( ( 'undo archive 2 files', None ), undo_manager.GetUndoRedoStrings() )
         
     
+class TestRepositoryUpdatePrefetcher( unittest.TestCase ):
+    
+    class _FakeClientFilesManager( object ):
+        
+        def __init__( self, hashes_to_paths ):
+            
+            self._hashes_to_paths = hashes_to_paths
+            
+            self.paths_asked_for = []
+            
+        
+        def GetFilePath( self, hash, mime ):
+            
+            self.paths_asked_for.append( hash )
+            
+            if hash not in self._hashes_to_paths:
+                
+                raise HydrusExceptions.FileMissingException( 'missing!' )
+                
+            
+            return self._hashes_to_paths[ hash ]
+            
+        
+    
+    class _FakeController( object ):
+        
+        # jobs are queued up rather than run, so the test decides when and in what order they finish
+        
+        def __init__( self, client_files_manager ):
+            
+            self.client_files_manager = client_files_manager
+            
+            self._lock = threading.Lock()
+            
+            self._queued_calls = []
+            
+        
+        def CallToThread( self, callable, *args ):
+            
+            with self._lock:
+                
+                self._queued_calls.append( ( callable, args ) )
+                
+            
+        
+        def GetQueuedHashes( self ):
+            
+            with self._lock:
+                
+                return [ args[0] for ( callable, args ) in self._queued_calls ]
+                
+            
+        
+        def RunQueuedCalls( self, reverse = False ):
+            
+            with self._lock:
+                
+                queued_calls = self._queued_calls
+                
+                self._queued_calls = []
+                
+            
+            if reverse:
+                
+                queued_calls.reverse()
+                
+            
+            for ( callable, args ) in queued_calls:
+                
+                callable( *args )
+                
+            
+        
+        def WaitForQueuedCalls( self, num_calls ):
+            
+            for i in range( 100 ):
+                
+                if len( self.GetQueuedHashes() ) >= num_calls:
+                    
+                    return
+                    
+                
+                time.sleep( 0.05 )
+                
+            
+        
+    
+    @classmethod
+    def setUpClass( cls ):
+        
+        cls._temp_dir = tempfile.mkdtemp()
+        
+        cls._hashes_to_paths = {}
+        cls._update_hashes_and_mimes = []
+        
+        for i in range( 5 ):
+            
+            if i < 2:
+                
+                update = HydrusNetwork.DefinitionsUpdate()
+                
+                update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, i, 'series:test ' + str( i ) ) )
+                
+                mime = HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS
+                
+            else:
+                
+                update = HydrusNetwork.ContentUpdate()
+                
+                for j in range( i ):
+                    
+                    update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( j, [ 1, 2, 3 ] ) ) )
+                    
+                
+                mime = HC.APPLICATION_HYDRUS_UPDATE_CONTENT
+                
+            
+            update_hash = HydrusData.GenerateKey()
+            
+            path = os.path.join( cls._temp_dir, update_hash.hex() )
+            
+            with open( path, 'wb' ) as f:
+                
+                f.write( update.DumpToNetworkBytes() )
+                
+            
+            cls._hashes_to_paths[ update_hash ] = path
+            cls._update_hashes_and_mimes.append( ( update_hash, mime ) )
+            
+        
+    
+    @classmethod
+    def tearDownClass( cls ):
+        
+        shutil.rmtree( cls._temp_dir )
+        
+    
+    def _GetUpdateInThread( self, prefetcher, update_hash ):
+        
+        result = {}
+        
+        def do_it():
+            
+            try:
+                
+                result[ 'update' ] = prefetcher.GetUpdate( update_hash )
+                
+            except Exception as e:
+                
+                result[ 'error' ] = e
+                
+            
+        
+        thread = threading.Thread( target = do_it )
+        
+        thread.start()
+        
+        return ( thread, result )
+        
+    
+    def test_prefetch_order( self ):
+        
+        client_files_manager = self._FakeClientFilesManager( self._hashes_to_paths )
+        controller = self._FakeController( client_files_manager )
+        
+        update_hashes = [ update_hash for ( update_hash, mime ) in self._update_hashes_and_mimes ]
+        
+        prefetcher = ClientServices.RepositoryUpdatePrefetcher( controller, self._update_hashes_and_mimes, num_to_prefetch = 2 )
+        
+        # nothing is read until someone asks
+        
+        self.assertEqual( controller.GetQueuedHashes(), [] )
+        
+        # asking for the first update also queues the next two, and nothing further
+        
+        ( thread, result ) = self._GetUpdateInThread( prefetcher, update_hashes[0] )
+        
+        controller.WaitForQueuedCalls( 3 )
+        
+        self.assertEqual( controller.GetQueuedHashes(), update_hashes[ : 3 ] )
+        
+        # finishing out of order still gives the right update back
+        
+        controller.RunQueuedCalls( reverse = True )
+        
+        thread.join( 10 )
+        
+        self.assertNotIn( 'error', result )
+        self.assertIsInstance( result[ 'update' ], HydrusNetwork.DefinitionsUpdate )
+        self.assertEqual( result[ 'update' ].GetHashIdsToHashes(), {} )
+        self.assertEqual( set( client_files_manager.paths_asked_for ), set( update_hashes[ : 3 ] ) )
+        
+        # the window slides forward one update at a time
+        
+        update = prefetcher.GetUpdate( update_hashes[1] )
+        
+        self.assertIsInstance( update, HydrusNetwork.DefinitionsUpdate )
+        self.assertEqual( controller.GetQueuedHashes(), update_hashes[ 3 : 4 ] )
+        
+        update = prefetcher.GetUpdate( update_hashes[2] )
+        
+        self.assertIsInstance( update, HydrusNetwork.ContentUpdate )
+        self.assertEqual( update.GetNumRows(), 6 )
+        self.assertEqual( controller.GetQueuedHashes(), update_hashes[ 3 : 5 ] )
+        
+        controller.RunQueuedCalls()
+        
+        for ( i, update_hash ) in enumerate( update_hashes[ 3 : ], start = 3 ):
+            
+            update = prefetcher.GetUpdate( update_hash )
+            
+            self.assertIsInstance( update, HydrusNetwork.ContentUpdate )
+            self.assertEqual( update.GetNumRows(), i * 3 )
+            
+        
+        self.assertEqual( controller.GetQueuedHashes(), [] )
+        self.assertEqual( sorted( client_files_manager.paths_asked_for ), sorted( update_hashes ) )
+        
+        self.assertIn( 'waited', prefetcher.GetStageReport( HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) )
+        
+        # errors come out on the db side, for the update that had them
+        
+        missing_hash = HydrusData.GenerateKey()
+        
+        prefetcher = ClientServices.RepositoryUpdatePrefetcher( controller, [ ( missing_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) ] )
+        
+        ( thread, result ) = self._GetUpdateInThread( prefetcher, missing_hash )
+        
+        controller.WaitForQueuedCalls( 1 )
+        controller.RunQueuedCalls()
+        
+        thread.join( 10 )
+        
+        self.assertIsInstance( result[ 'error' ], HydrusExceptions.FileMissingException )
+        
+    
+    def test_cancel( self ):
+        
+        client_files_manager = self._FakeClientFilesManager( self._hashes_to_paths )
+        controller = self._FakeController( client_files_manager )
+        
+        update_hashes = [ update_hash for ( update_hash, mime ) in self._update_hashes_and_mimes ]
+        
+        prefetcher = ClientServices.RepositoryUpdatePrefetcher( controller, self._update_hashes_and_mimes, num_to_prefetch = 2 )
+        
+        ( thread, result ) = self._GetUpdateInThread( prefetcher, update_hashes[0] )
+        
+        controller.WaitForQueuedCalls( 3 )
+        
+        self.assertEqual( controller.GetQueuedHashes(), update_hashes[ : 3 ] )
+        
+        # shutting down while jobs are still queued means they never touch the disk
+        
+        prefetcher.Shutdown()
+        
+        controller.RunQueuedCalls()
+        
+        thread.join( 10 )
+        
+        self.assertFalse( thread.is_alive() )
+        self.assertEqual( client_files_manager.paths_asked_for, [] )
+        self.assertEqual( result, { 'update' : None } )
+        
+        # a db thread waiting on an update gives up when the program is closing
+        
+        prefetcher = ClientServices.RepositoryUpdatePrefetcher( controller, self._update_hashes_and_mimes, num_to_prefetch = 2 )
+        
+        # only the prefetcher sees the shutdown, so the test controller's own threads keep going
+        
+        with patch.object( ClientServices, 'HG' ) as fake_hg:
+            
+            fake_hg.model_shutdown = True
+            
+            with self.assertRaises( HydrusExceptions.ShutdownException ):
+                
+                prefetcher.GetUpdate( update_hashes[0] )
+                
+            
+        
+        self.assertEqual( client_files_manager.paths_asked_for, [] )
+        
+        prefetcher.Shutdown()
+        
+        controller.RunQueuedCalls()
+        
+        self.assertEqual( client_files_manager.paths_asked_for, [] )
+        
+    
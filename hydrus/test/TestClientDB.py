@@ -1,19 +1,33 @@
+import numpy
 import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
 import time
 import unittest
 
+from mock import patch
+
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDB
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusNetwork
 from hydrus.core import HydrusSerialisable
+from hydrus.core import HydrusVideoHandling
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDefaults
 from hydrus.client import ClientExporting
 from hydrus.client import ClientSearch
 from hydrus.client import ClientServices
+from hydrus.client import ClientThreading
 from hydrus.client.db import ClientDB
+from hydrus.client.db import ClientDBFilesMetadataBasic
+from hydrus.client.db import ClientDBSimilarFiles
+from hydrus.client.db import ClientDBTagCooccurrence
 from hydrus.client.gui import ClientGUIManagement
 from hydrus.client.gui import ClientGUIPages
 from hydrus.client.importing import ClientImportLocal
@@ -227,6 +241,213 @@ class TestClientDB( unittest.TestCase ):
         for p in result: self.assertEqual( p.GetCount( HC.CONTENT_STATUS_CURRENT ), 1 )
         
         self.assertEqual( set( result ), preds )
+            
+        # now the same through the in-memory subtag index, including a tag added after it was built
+        
+        HG.test_controller.new_options.SetBoolean( 'autocomplete_subtag_prefix_index', True )
+        
+        try:
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, tag_search_context, CC.COMBINED_FILE_SERVICE_KEY, search_text = 'series:c*' )
+            
+            self.assertEqual( set( result ), { ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'series:cars', min_current_count = 1 ) } )
+            
+            service_keys_to_content_updates = { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'cart', ( hash, ) ) ) ] }
+            
+            self._write( 'content_updates', service_keys_to_content_updates )
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, tag_search_context, CC.COMBINED_FILE_SERVICE_KEY, search_text = 'c*', add_namespaceless = False )
+            
+            preds = set()
+            
+            preds.add( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'car', min_current_count = 1 ) )
+            preds.add( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'cart', min_current_count = 1 ) )
+            preds.add( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'series:cars', min_current_count = 1 ) )
+            
+            for p in result: self.assertEqual( p.GetCount( HC.CONTENT_STATUS_CURRENT ), 1 )
+            
+            self.assertEqual( set( result ), preds )
+            
+            # my files shares its tables with all local files, so a tag added after its index is loaded has to turn up too
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, tag_search_context, CC.LOCAL_FILE_SERVICE_KEY, search_text = 'cart*' )
+            
+            self.assertEqual( set( result ), { ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'cart', min_current_count = 1 ) } )
+            
+            service_keys_to_content_updates = { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'cartwheel', ( hash, ) ) ) ] }
+            
+            self._write( 'content_updates', service_keys_to_content_updates )
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, tag_search_context, CC.LOCAL_FILE_SERVICE_KEY, search_text = 'cart*' )
+            
+            preds = set()
+            
+            preds.add( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'cart', min_current_count = 1 ) )
+            preds.add( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'cartwheel', min_current_count = 1 ) )
+            
+            self.assertEqual( set( result ), preds )
+            
+            service_keys_to_content_updates = { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'cartwheel', ( hash, ) ) ) ] }
+            
+            self._write( 'content_updates', service_keys_to_content_updates )
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, tag_search_context, CC.LOCAL_FILE_SERVICE_KEY, search_text = 'cart*' )
+            
+            self.assertEqual( set( result ), { ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'cart', min_current_count = 1 ) } )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'autocomplete_subtag_prefix_index', False )
+            
+        
+    
+    def test_backup_online( self ):
+        
+        backup_dir = tempfile.mkdtemp()
+        
+        client_files_dir = os.path.join( TestController.DB_DIR, 'client_files' )
+        
+        hash = HydrusData.GenerateKey()
+        
+        hash_encoded = hash.hex()
+        
+        source_file_path = os.path.join( client_files_dir, 'f' + hash_encoded[:2], hash_encoded + '.jpg' )
+        source_thumbnail_path = os.path.join( client_files_dir, 't' + hash_encoded[:2], hash_encoded + '.thumbnail' )
+        
+        backup_file_path = source_file_path.replace( client_files_dir, os.path.join( backup_dir, 'client_files' ) )
+        backup_thumbnail_path = source_thumbnail_path.replace( client_files_dir, os.path.join( backup_dir, 'client_files' ) )
+        
+        source_packed_thumbnails_dir = os.path.join( client_files_dir, 'packed_thumbnails' )
+        source_segment_path = os.path.join( source_packed_thumbnails_dir, 'segment_000000.dat' )
+        backup_segment_path = os.path.join( backup_dir, 'client_files', 'packed_thumbnails', 'segment_000000.dat' )
+        
+        try:
+            
+            TestClientDB._db.BackupOnline( backup_dir )
+            
+            for filename in TestClientDB._db._db_filenames.values():
+                
+                self.assertTrue( os.path.exists( os.path.join( backup_dir, filename ) ) )
+                self.assertFalse( os.path.exists( os.path.join( backup_dir, filename + '.backup_temp' ) ) )
+                
+            
+            db = sqlite3.connect( os.path.join( backup_dir, 'client.db' ) )
+            
+            ( num_services, ) = db.execute( 'SELECT COUNT( * ) FROM services;' ).fetchone()
+            
+            db.close()
+            
+            self.assertEqual( num_services, len( self._read( 'services' ) ) )
+            
+            self.assertTrue( os.path.exists( os.path.join( backup_dir, ClientDB.CLIENT_FILES_BACKUP_MANIFEST_FILENAME ) ) )
+            
+            # if the WALs grow too much, the writer is held at its commit for the rest of the copy, and let go after
+            
+            with patch.object( HydrusDB, 'ONLINE_BACKUP_MAX_WAL_GROWTH', -1 ):
+                
+                snapshot_num_services = TestClientDB._db.BackupDBFilesOnline( backup_dir, snapshot_callable = lambda c: c.execute( 'SELECT COUNT( * ) FROM services;' ).fetchone()[0] )
+                
+            
+            self.assertEqual( snapshot_num_services, num_services )
+            
+            self.assertTrue( TestClientDB._db._commit_lock.acquire( False ) )
+            
+            TestClientDB._db._commit_lock.release()
+            
+            self._write( 'force_commit' )
+            
+            # now the incremental file backup
+            
+            for ( path, content ) in ( ( source_file_path, b'file' ), ( source_thumbnail_path, b'thumbnail' ) ):
+                
+                os.makedirs( os.path.dirname( path ), exist_ok = True )
+                
+                with open( path, 'wb' ) as f:
+                    
+                    f.write( content )
+                    
+                
+            
+            job_key = ClientThreading.JobKey()
+            
+            TestClientDB._db._BackupClientFilesIncremental( backup_dir, { hash : HC.IMAGE_JPEG }, job_key )
+            
+            self.assertTrue( os.path.exists( backup_file_path ) )
+            self.assertTrue( os.path.exists( backup_thumbnail_path ) )
+            
+            # a regenerated thumbnail is copied again, even though its file is already backed up
+            
+            with open( source_thumbnail_path, 'wb' ) as f:
+                
+                f.write( b'regenerated thumbnail' )
+                
+            
+            os.utime( source_thumbnail_path, ( time.time() + 10, time.time() + 10 ) )
+            
+            TestClientDB._db._BackupClientFilesIncremental( backup_dir, { hash : HC.IMAGE_JPEG }, job_key )
+            
+            with open( backup_thumbnail_path, 'rb' ) as f:
+                
+                self.assertEqual( f.read(), b'regenerated thumbnail' )
+                
+            
+            TestClientDB._db._BackupClientFilesIncremental( backup_dir, {}, job_key )
+            
+            self.assertFalse( os.path.exists( backup_file_path ) )
+            self.assertFalse( os.path.exists( backup_thumbnail_path ) )
+            
+            # packed thumbnail segments are not in the manifest, but every run keeps them up to date
+            
+            os.makedirs( source_packed_thumbnails_dir )
+            
+            with open( source_segment_path, 'wb' ) as f:
+                
+                f.write( b'segment' )
+                
+            
+            TestClientDB._db._BackupClientFilesIncremental( backup_dir, {}, job_key )
+            
+            with open( backup_segment_path, 'rb' ) as f:
+                
+                self.assertEqual( f.read(), b'segment' )
+                
+            
+            with open( source_segment_path, 'ab' ) as f:
+                
+                f.write( b' appended' )
+                
+            
+            TestClientDB._db._BackupClientFilesIncremental( backup_dir, {}, job_key )
+            
+            with open( backup_segment_path, 'rb' ) as f:
+                
+                self.assertEqual( f.read(), b'segment appended' )
+                
+            
+            shutil.rmtree( source_packed_thumbnails_dir )
+            
+            TestClientDB._db._BackupClientFilesIncremental( backup_dir, {}, job_key )
+            
+            self.assertFalse( os.path.exists( backup_segment_path ) )
+            
+        finally:
+            
+            if os.path.exists( source_packed_thumbnails_dir ):
+                
+                shutil.rmtree( source_packed_thumbnails_dir )
+                
+            
+            
+            for path in ( source_file_path, source_thumbnail_path ):
+                
+                if os.path.exists( path ):
+                    
+                    os.remove( path )
+                    
+                
+            
+            shutil.rmtree( backup_dir )
+            
         
     
     def test_export_folders( self ):
@@ -981,6 +1202,138 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_import_file_seed_paths( self ):
+        
+        TestClientDB._clear_db()
+        
+        temp_dir = tempfile.mkdtemp()
+        
+        good_path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' )
+        bad_path = os.path.join( temp_dir, 'broken.jpg' )
+        dupe_path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_png.png' )
+        dupe_copy_path = os.path.join( temp_dir, 'muh_png_copy.png' )
+        
+        # the batch path talks to the controller, so point it at the real db for a bit
+        
+        HG.test_controller.Read = self._read
+        HG.test_controller.WriteSynchronous = self._write
+        
+        try:
+            
+            with open( bad_path, 'wb' ) as f:
+                
+                f.write( b'\xff\xd8\xff\xe0' + b'this is not really a jpeg' * 16 )
+                
+            
+            shutil.copy2( dupe_path, dupe_copy_path )
+            
+            file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, path ) for path in ( good_path, bad_path, dupe_path, dupe_copy_path ) ]
+            
+            file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+            
+            file_seed_cache.AddFileSeeds( file_seeds )
+            
+            ClientImportFileSeeds.ImportFileSeedPaths( file_seed_cache, file_seeds, ClientImportOptions.FileImportOptions() )
+            
+            ( good_file_seed, bad_file_seed, dupe_file_seed, dupe_copy_file_seed ) = file_seeds
+            
+            self.assertEqual( good_file_seed.status, CC.STATUS_SUCCESSFUL_AND_NEW )
+            self.assertEqual( good_file_seed.GetHash(), bytes.fromhex( '5d884d84813beeebd59a35e474fa3e4742d0f2b6679faa7609b245ddbbd05444' ) )
+            
+            self.assertEqual( bad_file_seed.status, CC.STATUS_VETOED )
+            self.assertIn( 'malformed', bad_file_seed.note )
+            
+            # both copies are new when the batch is checked, so the second finds out in the db job
+            
+            self.assertEqual( dupe_file_seed.status, CC.STATUS_SUCCESSFUL_AND_NEW )
+            self.assertEqual( dupe_copy_file_seed.status, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT )
+            self.assertEqual( dupe_copy_file_seed.GetHash(), dupe_file_seed.GetHash() )
+            
+            self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_SUCCESSFUL_AND_NEW ), 2 )
+            self.assertFalse( file_seed_cache.WorkToDo() )
+            
+            media_result = self._read( 'media_result', dupe_file_seed.GetHash() )
+            
+            self.assertEqual( media_result.GetResolution(), ( 191, 196 ) )
+            
+        finally:
+            
+            del HG.test_controller.Read
+            del HG.test_controller.WriteSynchronous
+            
+            ClientImportFileSeeds.ShutdownFileImportProcessPool()
+            
+            shutil.rmtree( temp_dir )
+            
+        
+    
+    def test_import_files_in_process_pool( self ):
+        
+        TestClientDB._clear_db()
+        
+        test_files = []
+        
+        test_files.append( ( 'muh_jpg.jpg', '5d884d84813beeebd59a35e474fa3e4742d0f2b6679faa7609b245ddbbd05444', HC.IMAGE_JPEG, 392, 498 ) )
+        test_files.append( ( 'muh_png.png', 'cdc67d3b377e6e1397ffa55edc5b50f6bdf4482c7a6102c6f27fa351429d6f49', HC.IMAGE_PNG, 191, 196 ) )
+        test_files.append( ( 'muh_gif.gif', '00dd9e9611ebc929bfc78fde99a0c92800bbb09b9d18e0946cea94c099b211c2', HC.IMAGE_GIF, 329, 302 ) )
+        
+        file_import_jobs = []
+        
+        try:
+            
+            for ( filename, hex_hash, mime, width, height ) in test_files:
+                
+                path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+                
+                file_import_job = ClientImportFileSeeds.FileImportJob( path )
+                
+                future = ClientImportFileSeeds.SubmitFileImportWork( ClientImportFileSeeds.GenerateFileImportHash, path )
+                
+                file_import_job.GenerateHashAndStatus( hash = future.result() )
+                
+                self.assertEqual( file_import_job.GetHash(), bytes.fromhex( hex_hash ) )
+                
+                info_generation_args = file_import_job.GetInfoGenerationArgs()
+                
+                future = ClientImportFileSeeds.SubmitFileImportWork( ClientImportFileSeeds.GenerateFileImportInfo, *info_generation_args )
+                
+                file_import_info = future.result()
+                
+                self.assertEqual( file_import_info, ClientImportFileSeeds.GenerateFileImportInfo( *info_generation_args ) )
+                
+                file_import_job.GenerateInfo( file_import_info )
+                
+                file_import_jobs.append( file_import_job )
+                
+            
+            # the workers are spawned, so they only know about the client's ffmpeg path if we send it
+            
+            with patch.object( HydrusVideoHandling, 'FFMPEG_PATH', os.path.join( HC.STATIC_DIR, 'testing', 'not_ffmpeg' ) ):
+                
+                future = ClientImportFileSeeds.SubmitFileImportWork( HydrusVideoHandling.GetFFMPEGVersion )
+                
+                self.assertEqual( future.result(), HydrusVideoHandling.GetFFMPEGVersion() )
+                self.assertIn( 'not_ffmpeg', future.result() )
+                
+            
+        finally:
+            
+            ClientImportFileSeeds.ShutdownFileImportProcessPool()
+            
+        
+        results = self._write( 'import_files', file_import_jobs )
+        
+        self.assertEqual( [ status for ( status, note ) in results ], [ CC.STATUS_SUCCESSFUL_AND_NEW ] * len( test_files ) )
+        
+        for ( ( filename, hex_hash, mime, width, height ), file_import_job ) in zip( test_files, file_import_jobs ):
+            
+            media_result = self._read( 'media_result', file_import_job.GetHash() )
+            
+            self.assertEqual( media_result.GetMime(), mime )
+            self.assertEqual( media_result.GetResolution(), ( width, height ) )
+            
+        
+    
     def test_import_folders( self ):
         
         import_folder_1 = ClientImportLocal.ImportFolder( 'imp 1', path = TestController.DB_DIR, mimes = HC.VIDEO, publish_files_to_popup_button = False )
@@ -1151,6 +1504,24 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( mr_has_audio, False )
         self.assertEqual( mr_num_words, None )
         
+        #
+        
+        parts_to_hash_ids_to_values = self._read( 'media_result_parts', ( 1, ), { 'info', 'locations', 'urls', 'tags' } )
+        
+        self.assertEqual( parts_to_hash_ids_to_values[ 'hashes' ], { 1 : hash } )
+        self.assertEqual( parts_to_hash_ids_to_values[ 'info' ], { 1 : ( 5270, HC.IMAGE_PNG, 200, 200, None, None, False, None ) } )
+        
+        ( inbox, current_service_keys ) = parts_to_hash_ids_to_values[ 'locations' ][ 1 ]
+        
+        self.assertEqual( inbox, True )
+        self.assertIn( CC.COMBINED_LOCAL_FILE_SERVICE_KEY, current_service_keys )
+        self.assertEqual( parts_to_hash_ids_to_values[ 'urls' ][ 1 ], set() )
+        self.assertEqual( parts_to_hash_ids_to_values[ 'tags' ][ 1 ].GetCurrent( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ), set() )
+        
+        parts_to_hash_ids_to_values = self._read( 'media_result_parts', ( 1, ), { 'hashes' } )
+        
+        self.assertEqual( set( parts_to_hash_ids_to_values.keys() ), { 'hashes' } )
+        
     
     def test_nums_pending( self ):
         
@@ -1214,6 +1585,311 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( result, [ pixiv_id, password ] )
         
     
+    def test_read_pool( self ):
+        
+        HG.db_read_pool_size = 2
+        
+        try:
+            
+            TestClientDB._clear_db()
+            
+        finally:
+            
+            HG.db_read_pool_size = 0
+            
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( os.path.join( HC.STATIC_DIR, 'archive.png' ) )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        other_hash = file_import_job.GetHash()
+        
+        content_updates = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'car', ( hash, ) ) ) ]
+        
+        self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : content_updates } )
+        
+        # the write is not committed yet, so this has to go to the writer
+        
+        self.assertFalse( TestClientDB._db._CanUseReadPool( 'file_query_ids' ) )
+        
+        tag_search_context = ClientSearch.TagSearchContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, tag_search_context = tag_search_context, predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'car' ) ] )
+        
+        writer_hash_ids = self._read( 'file_query_ids', search_context )
+        
+        self.assertEqual( len( writer_hash_ids ), 1 )
+        
+        # once the db is idle, it commits, and the pool can take over
+        
+        for i in range( 100 ):
+            
+            if TestClientDB._db._CanUseReadPool( 'file_query_ids' ):
+                
+                break
+                
+            
+            time.sleep( 0.1 )
+            
+        
+        self.assertTrue( TestClientDB._db._CanUseReadPool( 'file_query_ids' ) )
+        
+        # the pool cannot see the subtag prefix index, so autocomplete stays on the writer while it is on
+        
+        self.assertTrue( TestClientDB._db._CanUseReadPool( 'autocomplete_predicates' ) )
+        
+        HG.test_controller.new_options.SetBoolean( 'autocomplete_subtag_prefix_index', True )
+        
+        try:
+            
+            self.assertFalse( TestClientDB._db._CanUseReadPool( 'autocomplete_predicates' ) )
+            
+            predicates = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, tag_search_context, CC.COMBINED_FILE_SERVICE_KEY, search_text = 'ca*' )
+            
+            self.assertEqual( [ predicate.GetValue() for predicate in predicates ], [ 'car' ] )
+            self.assertIn( ( TestClientDB._db.modules_services.combined_file_service_id, TestClientDB._db.modules_services.GetServiceId( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ) ), TestClientDB._db._subtag_prefix_indices )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'autocomplete_subtag_prefix_index', False )
+            
+        
+        pool_hash_ids = self._read( 'file_query_ids', search_context )
+        
+        self.assertEqual( pool_hash_ids, writer_hash_ids )
+        
+        ( media_result, ) = self._read( 'media_results_from_ids', pool_hash_ids )
+        
+        self.assertEqual( media_result.GetHash(), hash )
+        self.assertIn( 'car', media_result.GetTagsManager().GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ) )
+        
+        # pool threads share the definition caches. keep one past its prune limit so reads are pruning it out from under each other
+        
+        ( hash_id, ) = pool_hash_ids
+        
+        ( other_hash_id, ) = self._read( 'hash_ids_to_hashes', hashes = ( other_hash, ) ).keys()
+        
+        hashes_cache = TestClientDB._db.modules_hashes_local_cache
+        
+        junk = { -i : b'' for i in range( 1, 100002 ) }
+        
+        errors = []
+        
+        def read_hashes( thread_index ):
+            
+            try:
+                
+                for i in range( 300 ):
+                    
+                    with hashes_cache._hash_ids_to_hashes_cache_lock:
+                        
+                        hashes_cache._hash_ids_to_hashes_cache.update( junk )
+                        
+                    
+                    if ( thread_index + i ) % 2 == 0:
+                        
+                        self.assertEqual( self._read( 'hash_ids_to_hashes', hash_ids = ( hash_id, ) ), { hash_id : hash } )
+                        
+                    else:
+                        
+                        self.assertEqual( self._read( 'hash_ids_to_hashes', hash_ids = ( other_hash_id, ) ), { other_hash_id : other_hash } )
+                        
+                    
+                
+            except Exception as e:
+                
+                errors.append( e )
+                
+            
+        
+        threads = [ threading.Thread( target = read_hashes, args = ( i, ) ) for i in range( 8 ) ]
+        
+        for thread in threads:
+            
+            thread.start()
+            
+        
+        for thread in threads:
+            
+            thread.join()
+            
+        
+        self.assertEqual( errors, [] )
+        
+        # a pool job that finds a write came in while it was working is redone on the writer
+        
+        job = TestClientDB._db._GenerateDBJob( 'read', True, 'media_results_from_ids', pool_hash_ids )
+        
+        TestClientDB._db._read_pool_jobs.put( ( job, TestClientDB._db._write_generation - 1 ) )
+        
+        ( media_result, ) = job.GetResult()
+        
+        self.assertEqual( media_result.GetHash(), hash )
+        
+        # a read the pool cannot do, since it wants to add a new definition, falls back to the writer
+        
+        new_hash = os.urandom( 32 )
+        
+        ( media_result, ) = self._read( 'media_results', ( new_hash, ) )
+        
+        self.assertEqual( media_result.GetHash(), new_hash )
+        
+        TestClientDB._clear_db()
+        
+    
+    def test_related_tags( self ):
+        
+        TestClientDB._clear_db()
+        
+        ( h1, h2, h3, h4, skip_hash ) = [ HydrusData.GenerateKey() for i in range( 5 ) ]
+        
+        def add_mappings( tags_and_hashes, action = HC.CONTENT_UPDATE_ADD ):
+            
+            content_updates = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, action, ( tag, hashes ) ) for ( tag, hashes ) in tags_and_hashes ]
+            
+            self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : content_updates } )
+            
+        
+        def get_related( search_tags ):
+            
+            predicates = self._read( 'related_tags', CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, skip_hash, search_tags, 100, 5.0 )
+            
+            return { predicate.GetValue() : predicate.GetCount( HC.CONTENT_STATUS_CURRENT ) for predicate in predicates }
+            
+        
+        add_mappings( [ ( 'a', ( h1, h2, h3 ) ), ( 'b', ( h1, h2, h4 ) ), ( 'c', ( h1, h4 ) ) ] )
+        
+        self._write( 'regenerate_tag_cooccurrence_index', tag_service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        # edits before the rebuild has counted anything are picked up by the rebuild
+        
+        add_mappings( [ ( 'd', ( h3, ) ) ] )
+        
+        self.assertIn( 'tag co-occurrence index work', self._read( 'maintenance_due', None ) )
+        
+        self._write( 'maintain_tag_cooccurrence_index' )
+        
+        self.assertNotIn( 'tag co-occurrence index work', self._read( 'maintenance_due', None ) )
+        
+        self.assertEqual( get_related( [ 'a' ] ), { 'b' : 2, 'c' : 1, 'd' : 1 } )
+        self.assertEqual( get_related( [ 'a', 'b' ] ), { 'c' : 3, 'd' : 1 } )
+        
+        # edits afterwards only mark their tags dirty, and are counted in the next maintenance
+        
+        add_mappings( [ ( 'c', ( h2, h3 ) ), ( 'e', ( h1, h2 ) ) ] )
+        
+        self.assertIn( 'tag co-occurrence index work', self._read( 'maintenance_due', None ) )
+        
+        self._write( 'maintain_tag_cooccurrence_index' )
+        
+        self.assertEqual( get_related( [ 'a' ] ), { 'b' : 2, 'c' : 3, 'd' : 1, 'e' : 2 } )
+        
+        add_mappings( [ ( 'c', ( h1, h3, skip_hash ) ) ], action = HC.CONTENT_UPDATE_DELETE )
+        
+        self._write( 'maintain_tag_cooccurrence_index' )
+        
+        self.assertEqual( get_related( [ 'a' ] ), { 'b' : 2, 'c' : 1, 'd' : 1, 'e' : 2 } )
+        self.assertEqual( get_related( [ 'c' ] ), { 'a' : 1, 'b' : 2, 'e' : 1 } )
+        
+        # the file we are suggesting for does not count towards its own suggestions
+        
+        add_mappings( [ ( 'c', ( skip_hash, ) ), ( 'f', ( skip_hash, ) ) ] )
+        
+        self._write( 'maintain_tag_cooccurrence_index' )
+        
+        self.assertEqual( get_related( [ 'c' ] ), { 'a' : 1, 'b' : 2, 'e' : 1 } )
+        
+        # each tag keeps only its top neighbours, and a tag on many files is counted from a sample of them
+        
+        with patch.object( ClientDBTagCooccurrence, 'NUM_NEIGHBOURS_TO_KEEP', 2 ):
+            
+            with patch.object( ClientDBTagCooccurrence, 'MAX_FILES_TO_COUNT', 2 ):
+                
+                self._write( 'regenerate_tag_cooccurrence_index', tag_service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+                self._write( 'maintain_tag_cooccurrence_index' )
+                
+                for tag in ( 'a', 'b', 'c', 'd', 'e', 'f' ):
+                    
+                    self.assertLessEqual( len( get_related( [ tag ] ) ), 2 )
+                    
+                
+                # 'b' is on three files, so only two were counted, but it still has a full list
+                
+                self.assertEqual( len( get_related( [ 'b' ] ) ), 2 )
+                
+            
+        
+        self._write( 'regenerate_tag_cooccurrence_index', tag_service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        self._write( 'maintain_tag_cooccurrence_index' )
+        
+        self.assertEqual( get_related( [ 'c' ] ), { 'a' : 1, 'b' : 2, 'e' : 1 } )
+        
+        #
+        
+        self._write( 'delete_tag_cooccurrence_index', tag_service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        self.assertEqual( get_related( [ 'c' ] ), { 'a' : 1, 'b' : 2, 'e' : 1 } )
+        
+    
+    def test_rollback_drops_file_caches( self ):
+        
+        TestClientDB._clear_db()
+        
+        # these mirror rows before the commit, so a job that fails and rolls back has to drop them
+        
+        local_file_service_id = TestClientDB._db.modules_services.local_file_service_id
+        
+        TestClientDB._db._service_ids_to_current_files_timestamp_caches[ local_file_service_id ] = ClientDBFilesMetadataBasic.IntegerColumnCache( ( 'timestamp', ), [] )
+        TestClientDB._db.modules_files_metadata_basic._files_info_column_cache = ClientDBFilesMetadataBasic.IntegerColumnCache( ClientDBFilesMetadataBasic.FILES_INFO_CACHE_COLUMN_NAMES, [] )
+        TestClientDB._db.modules_similar_files._phash_index = ClientDBSimilarFiles.PHashIndex( [], [] )
+        
+        good_file_import_job = ClientImportFileSeeds.FileImportJob( os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' ) )
+        
+        good_file_import_job.GenerateHashAndStatus()
+        good_file_import_job.GenerateInfo()
+        
+        # no file info, so this one falls over in the db after the good one is done
+        
+        bad_file_import_job = ClientImportFileSeeds.FileImportJob( os.path.join( HC.STATIC_DIR, 'testing', 'muh_png.png' ) )
+        
+        bad_file_import_job.GenerateHashAndStatus()
+        
+        with self.assertRaises( Exception ):
+            
+            self._write( 'import_files', [ good_file_import_job, bad_file_import_job ] )
+            
+        
+        self.assertEqual( TestClientDB._db._service_ids_to_current_files_timestamp_caches, {} )
+        self.assertIsNone( TestClientDB._db.modules_files_metadata_basic._files_info_column_cache )
+        self.assertIsNone( TestClientDB._db.modules_similar_files._phash_index )
+        
+        # this is what the batch importer falls back to
+        
+        ( status, note ) = self._write( 'import_file', good_file_import_job )
+        
+        self.assertEqual( status, CC.STATUS_SUCCESSFUL_AND_NEW )
+        
+        media_result = self._read( 'media_result', good_file_import_job.GetHash() )
+        
+        self.assertEqual( media_result.GetResolution(), ( 392, 498 ) )
+        
+    
     def test_services( self ):
         
         result = self._read( 'services', ( HC.LOCAL_FILE_DOMAIN, HC.LOCAL_FILE_TRASH_DOMAIN, HC.COMBINED_LOCAL_FILE, HC.LOCAL_TAG ) )
@@ -1298,3 +1974,64 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_sort_keys( self ):
+        
+        values = [ random.randint( -1, 20 ) for i in range( 500 ) ]
+        
+        sort_key = numpy.array( values, dtype = numpy.int64 )
+        
+        for reverse in ( False, True ):
+            
+            expected = sorted( range( len( values ) ), key = lambda i: values[ i ], reverse = reverse )
+            
+            self.assertEqual( ClientDB.ArgSortKeys( [ sort_key ], reverse ).tolist(), expected )
+            
+            for limit in ( 1, 7, 50, 499, 500, 1000 ):
+                
+                self.assertEqual( ClientDB.ArgSortKeys( [ sort_key ], reverse, limit = limit ).tolist()[ : limit ], expected[ : limit ] )
+                
+            
+        
+        #
+        
+        secondary_values = [ random.randint( 0, 3 ) for i in range( 500 ) ]
+        
+        secondary_sort_key = numpy.array( secondary_values, dtype = numpy.int64 )
+        
+        for reverse in ( False, True ):
+            
+            expected = sorted( range( len( values ) ), key = lambda i: ( values[ i ], secondary_values[ i ] ), reverse = reverse )
+            
+            self.assertEqual( ClientDB.ArgSortKeys( [ sort_key, secondary_sort_key ], reverse, limit = 10 ).tolist(), expected )
+            
+        
+        #
+        
+        columns = {}
+        
+        columns[ 'size' ] = numpy.array( [ 1000, 1000, -1, 5000 ], dtype = numpy.int64 )
+        columns[ 'width' ] = numpy.array( [ 100, -1, 640, 200 ], dtype = numpy.int64 )
+        columns[ 'height' ] = numpy.array( [ 50, -1, 0, 100 ], dtype = numpy.int64 )
+        columns[ 'duration' ] = numpy.array( [ -1, -1, 2000, 1000 ], dtype = numpy.int64 )
+        columns[ 'num_frames' ] = numpy.array( [ -1, -1, 40, 0 ], dtype = numpy.int64 )
+        
+        ( ratio, ) = ClientDB.GenerateColumnSortKeys( CC.SORT_FILES_BY_RATIO, columns )
+        
+        self.assertEqual( ratio.tolist(), [ 2.0, -1, -1, 2.0 ] )
+        
+        ( num_pixels, ) = ClientDB.GenerateColumnSortKeys( CC.SORT_FILES_BY_NUM_PIXELS, columns )
+        
+        self.assertEqual( num_pixels.tolist(), [ 5000, -1, -1, 20000 ] )
+        
+        ( framerate, ) = ClientDB.GenerateColumnSortKeys( CC.SORT_FILES_BY_FRAMERATE, columns )
+        
+        self.assertEqual( framerate.tolist(), [ -1, -1, 0.02, -1 ] )
+        
+        ( duration_bitrate, frame_bitrate ) = ClientDB.GenerateColumnSortKeys( CC.SORT_FILES_BY_APPROX_BITRATE, columns )
+        
+        self.assertEqual( duration_bitrate.tolist(), [ 0, 0, -1, 5.0 ] )
+        self.assertEqual( frame_bitrate.tolist(), [ 0.2, 0, -1, 0 ] )
+        
+        self.assertIsNone( ClientDB.GenerateColumnSortKeys( CC.SORT_FILES_BY_MEDIA_VIEWS, columns ) )
+        
+    
@@ -1,12 +1,16 @@
 import os
+import random
 import time
 import unittest
 
+from mock import patch
+
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusGlobals as HG
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientFiles
 from hydrus.client import ClientSearch
 from hydrus.client.db import ClientDB
 from hydrus.client.importing import ClientImportOptions
@@ -1039,3 +1043,129 @@ class TestClientDBDuplicates( unittest.TestCase ):
         self._test_dissolve()
         
     
+    def test_similar_files_search( self ):
+        
+        TestClientDBDuplicates._clear_db()
+        
+        base_phash = random.getrandbits( 64 )
+        
+        hashes_to_phashes = {}
+        
+        for i in range( 200 ):
+            
+            phash = base_phash
+            
+            for bit in random.sample( range( 64 ), random.randint( 0, 16 ) ):
+                
+                phash ^= 1 << bit
+                
+            
+            hashes_to_phashes[ HydrusData.GenerateKey() ] = phash.to_bytes( 8, 'big' )
+            
+        
+        ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = ( 65535, HC.IMAGE_JPEG, 640, 480, None, None, False, None )
+        
+        for ( hash, phash ) in hashes_to_phashes.items():
+            
+            fake_file_import_job = ClientImportFileSeeds.FileImportJob( 'fake path' )
+            
+            fake_file_import_job._hash = hash
+            fake_file_import_job._file_info = ( size, mime, width, height, duration, num_frames, has_audio, num_words )
+            fake_file_import_job._extra_hashes = ( b'abcd', b'abcd', b'abcd' )
+            fake_file_import_job._phashes = [ phash ]
+            fake_file_import_job._file_import_options = ClientImportOptions.FileImportOptions()
+            
+            self._write( 'import_file', fake_file_import_job )
+            
+        
+        def do_search( search_hash, max_hamming ):
+            
+            predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ( ( search_hash, ), max_hamming ) ) ]
+            
+            search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = predicates )
+            
+            hash_ids = self._read( 'file_query_ids', search_context )
+            
+            return set( self._read( 'hash_ids_to_hashes', hash_ids = hash_ids ).values() )
+            
+        
+        search_hashes = random.sample( list( hashes_to_phashes.keys() ), 10 )
+        
+        try:
+            
+            for max_hamming in ( 4, 8, 12 ):
+                
+                for search_hash in search_hashes:
+                    
+                    search_phash = hashes_to_phashes[ search_hash ]
+                    
+                    expected_hashes = { hash for ( hash, phash ) in hashes_to_phashes.items() if HydrusData.Get64BitHammingDistance( search_phash, phash ) <= max_hamming }
+                    
+                    HG.test_controller.new_options.SetBoolean( 'use_in_memory_similar_files_index', True )
+                    
+                    self.assertEqual( do_search( search_hash, max_hamming ), expected_hashes )
+                    
+                    HG.test_controller.new_options.SetBoolean( 'use_in_memory_similar_files_index', False )
+                    
+                    self.assertEqual( do_search( search_hash, max_hamming ), expected_hashes )
+                    
+                
+            
+            # the index exists now, so check it keeps up with phash edits
+            
+            HG.test_controller.new_options.SetBoolean( 'use_in_memory_similar_files_index', True )
+            
+            ( search_hash, moved_hash ) = search_hashes[:2]
+            
+            search_phash = hashes_to_phashes[ search_hash ]
+            
+            do_search( search_hash, 4 )
+            
+            near_phash = ( int.from_bytes( search_phash, 'big' ) ^ 1 ).to_bytes( 8, 'big' )
+            far_phash = ( int.from_bytes( search_phash, 'big' ) ^ ( 2 ** 64 - 1 ) ).to_bytes( 8, 'big' )
+            
+            self._write( 'file_maintenance_clear_jobs', [ ( moved_hash, ClientFiles.REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA, [ near_phash ] ) ] )
+            
+            self.assertIn( moved_hash, do_search( search_hash, 4 ) )
+            
+            self._write( 'file_maintenance_clear_jobs', [ ( moved_hash, ClientFiles.REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA, [ far_phash ] ) ] )
+            
+            self.assertNotIn( moved_hash, do_search( search_hash, 4 ) )
+            self.assertIn( moved_hash, do_search( moved_hash, 4 ) )
+            
+            hashes_to_phashes[ moved_hash ] = far_phash
+            
+            # and the batched potential duplicates search should find every pair
+            
+            all_phashes = list( hashes_to_phashes.values() )
+            
+            expected_num_pairs = len( [ 1 for i in range( len( all_phashes ) ) for j in range( i + 1, len( all_phashes ) ) if HydrusData.Get64BitHammingDistance( all_phashes[ i ], all_phashes[ j ] ) <= 4 ] )
+            
+            self._write( 'maintain_similar_files_search_for_potential_duplicates', 4 )
+            
+            size_pred = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_SIZE, ( '=', 65535, HydrusData.ConvertUnitToInt( 'B' ) ) )
+            
+            file_search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = [ size_pred ] )
+            
+            self.assertEqual( self._read( 'potential_duplicates_count', file_search_context, True ), expected_num_pairs )
+            
+            # a search that runs out of time still clears the batch cache
+            
+            with patch.object( TestClientDBDuplicates._db.modules_similar_files, 'ClearBatchSearchCache' ) as clear_batch_search_cache:
+                
+                ( still_work_to_do, num_done ) = self._write( 'maintain_similar_files_search_for_potential_duplicates', 8, work_time_float = 0 )
+                
+                self.assertTrue( still_work_to_do )
+                self.assertEqual( num_done, 0 )
+                
+                clear_batch_search_cache.assert_called_once_with()
+                
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'use_in_memory_similar_files_index', True )
+            
+        
+        TestClientDBDuplicates._clear_db()
+        
+    
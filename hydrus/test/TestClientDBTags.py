@@ -824,6 +824,67 @@ class TestClientDBTags( unittest.TestCase ):
             } ) )
         
     
+    def test_display_lookup_caches( self ):
+        
+        self._clear_db()
+        
+        content_updates_list = [ [] for i in range( 3 ) ]
+        
+        for pair in IRL_PARENT_PAIRS:
+            
+            content_updates_list[ random.randint( 0, 2 ) ].append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, pair ) )
+            
+        
+        for pair in IRL_SIBLING_PAIRS:
+            
+            content_updates_list[ random.randint( 0, 2 ) ].append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, pair ) )
+            
+        
+        test_tags = ( 'pharah', 'warcraft', 'overwatch', 'species:night elf', 'character:pharah' )
+        
+        # get the caches loaded first, so the rest of this is all incremental updates
+        
+        self._read( 'tag_siblings_and_parents_lookup', test_tags )
+        
+        for ( i, content_updates ) in enumerate( content_updates_list ):
+            
+            self._write( 'content_updates', { self._my_service_key : content_updates } )
+            
+            if i == 1:
+                
+                self._sync_display()
+                
+            
+        
+        deletee_content_updates = []
+        
+        deletee_content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, ( 'pharah', 'character:fareeha "pharah" amari' ) ) )
+        deletee_content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_DELETE, ( 'species:night elf', 'series:warcraft' ) ) )
+        
+        self._write( 'content_updates', { self._my_service_key : deletee_content_updates } )
+        
+        self._sync_display()
+        
+        incremental_result = self._read( 'tag_siblings_and_parents_lookup', test_tags )
+        
+        status = self._read( 'tag_display_maintenance_status', self._my_service_key )
+        
+        self.assertGreater( status[ 'lookup_cache_memory_usage' ], 0 )
+        
+        # now have the caches load fresh from the tables, which should give the same answers
+        
+        TestClientDBTags._db._tag_siblings_lookup_caches = {}
+        TestClientDBTags._db._tag_parents_lookup_caches = {}
+        
+        status = self._read( 'tag_display_maintenance_status', self._my_service_key )
+        
+        self.assertEqual( status[ 'lookup_cache_memory_usage' ], 0 )
+        
+        fresh_result = self._read( 'tag_siblings_and_parents_lookup', test_tags )
+        
+        self.assertEqual( incremental_result, fresh_result )
+        
+    
     def test_display_pending_to_current_bug_both_non_ideal( self ):
         
         # rescinding pending (when you set current on pending) two tags that imply the same thing at once can lead to ghost pending when you don't interleave processing
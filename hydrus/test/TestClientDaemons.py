@@ -8,6 +8,7 @@ from hydrus.core import HydrusPaths
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDaemons
+from hydrus.client import ClientFiles
 from hydrus.client.importing import ClientImportLocal
 
 with open( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), 'rb' ) as f:
@@ -16,6 +17,96 @@ with open( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), 'rb' ) as f:
     
 class TestDaemons( unittest.TestCase ):
     
+    def test_directory_change_tracker( self ):
+        
+        test_dir = HydrusPaths.GetTempDir()
+        
+        try:
+            
+            sub_dir = os.path.join( test_dir, 'sub' )
+            
+            HydrusPaths.MakeSureDirectoryExists( sub_dir )
+            
+            def touch( path ):
+                
+                with open( path, 'wb' ) as f: f.write( b'blarg' )
+                
+            
+            def age_dirs():
+                
+                # old mtimes, so the tracker trusts its listings
+                
+                for dir_path in ( test_dir, sub_dir ):
+                    
+                    os.utime( dir_path, ( 1000000, 1000000 ) )
+                    
+                
+            
+            touch( os.path.join( test_dir, '0' ) )
+            touch( os.path.join( sub_dir, '1' ) )
+            
+            age_dirs()
+            
+            tracker = ClientFiles.DirectoryChangeTracker( test_dir )
+            
+            self.assertEqual( set( tracker.GetAllFilePaths() ), { os.path.join( test_dir, '0' ), os.path.join( sub_dir, '1' ) } )
+            
+            # a new file that does not change the mtime is not seen, so the old listing was reused
+            
+            touch( os.path.join( sub_dir, '2' ) )
+            
+            age_dirs()
+            
+            self.assertEqual( set( tracker.GetAllFilePaths() ), { os.path.join( test_dir, '0' ), os.path.join( sub_dir, '1' ) } )
+            
+            # a normal change is seen
+            
+            touch( os.path.join( sub_dir, '3' ) )
+            
+            self.assertEqual( set( tracker.GetAllFilePaths() ), { os.path.join( test_dir, '0' ), os.path.join( sub_dir, '1' ), os.path.join( sub_dir, '2' ), os.path.join( sub_dir, '3' ) } )
+            
+            shutil.rmtree( sub_dir )
+            
+            self.assertEqual( set( tracker.GetAllFilePaths() ), { os.path.join( test_dir, '0' ) } )
+            
+        finally:
+            
+            shutil.rmtree( test_dir )
+            
+        
+    
+    def test_import_folder_directory_trackers( self ):
+        
+        test_dir = HydrusPaths.GetTempDir()
+        
+        path_1 = os.path.join( test_dir, '1' )
+        path_2 = os.path.join( test_dir, '2' )
+        
+        try:
+            
+            tracker_1 = ClientImportLocal.GetImportFolderDirectoryTracker( path_1 )
+            
+            self.assertIs( ClientImportLocal.GetImportFolderDirectoryTracker( path_1 ), tracker_1 )
+            
+            ClientImportLocal.GetImportFolderDirectoryTracker( path_2 )
+            
+            # an import folder was deleted or moved off path_2
+            
+            ClientImportLocal.PruneImportFolderDirectoryTrackers( { path_1 } )
+            
+            self.assertIn( path_1, ClientImportLocal.IMPORT_FOLDER_DIRECTORY_TRACKERS )
+            self.assertNotIn( path_2, ClientImportLocal.IMPORT_FOLDER_DIRECTORY_TRACKERS )
+            
+            ClientImportLocal.PruneImportFolderDirectoryTrackers( set() )
+            
+            self.assertEqual( ClientImportLocal.IMPORT_FOLDER_DIRECTORY_TRACKERS, {} )
+            
+        finally:
+            
+            shutil.rmtree( test_dir )
+            
+        
+    
     def test_import_folders_daemon( self ):
         
         test_dir = HydrusPaths.GetTempDir()
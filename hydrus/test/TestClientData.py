@@ -1,8 +1,511 @@
+import collections
+import os
+import random
+import shutil
+import tempfile
+import threading
 import unittest
 
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client.importing import ClientImportOptions
 from hydrus.client.importing import ClientImportFileSeeds
+
+from hydrus.core import HydrusGlobals as HG
+
+from hydrus.client import ClientCaches
+from hydrus.client import ClientThumbnailStore
+
+class TestDataCache( unittest.TestCase ):
+    
+    class _FakeData( object ):
+        
+        def __init__( self, memory_footprint ):
+            
+            self.memory_footprint = memory_footprint
+            
+        
+        def GetEstimatedMemoryFootprint( self ):
+            
+            return self.memory_footprint
+            
+        
+    
+    def test_lru( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 100, eviction_policy = ClientCaches.CACHE_EVICTION_LRU )
+        
+        for i in range( 11 ):
+            
+            data_cache.AddData( i, self._FakeData( 10 ) )
+            
+        
+        self.assertEqual( data_cache.GetStatistics()[ 'memory_footprint' ], 110 )
+        
+        data_cache.GetData( 0 )
+        
+        data_cache.AddData( 11, self._FakeData( 10 ) )
+        
+        self.assertTrue( data_cache.HasData( 0 ) )
+        self.assertFalse( data_cache.HasData( 1 ) )
+        self.assertEqual( data_cache.GetStatistics()[ 'memory_footprint' ], 110 )
+        
+        self.assertEqual( data_cache.GetIfHasData( 1 ), None )
+        
+        with self.assertRaises( Exception ):
+            
+            data_cache.GetData( 1 )
+            
+        
+        data_cache.DeleteData( 11 )
+        
+        statistics = data_cache.GetStatistics()
+        
+        self.assertEqual( statistics[ 'num_items' ], 10 )
+        self.assertEqual( statistics[ 'memory_footprint' ], 100 )
+        self.assertEqual( statistics[ 'num_hits' ], 1 )
+        self.assertEqual( statistics[ 'num_misses' ], 2 )
+        self.assertEqual( statistics[ 'num_evictions' ], 1 )
+        
+        # footprints are checked again on access
+        
+        data = data_cache.GetData( 0 )
+        
+        data.memory_footprint = 50
+        
+        data_cache.GetData( 0 )
+        
+        self.assertEqual( data_cache.GetStatistics()[ 'memory_footprint' ], 140 )
+        
+        data_cache.Clear()
+        
+        self.assertEqual( data_cache.GetStatistics()[ 'memory_footprint' ], 0 )
+        
+    
+    def test_2q( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 100, eviction_policy = ClientCaches.CACHE_EVICTION_2Q )
+        
+        hot_keys = [ 'hot {}'.format( i ) for i in range( 4 ) ]
+        
+        for key in hot_keys:
+            
+            data_cache.AddData( key, self._FakeData( 10 ) )
+            
+        
+        for i in range( 20 ):
+            
+            data_cache.AddData( 'first scan {}'.format( i ), self._FakeData( 10 ) )
+            
+        
+        # the hot keys were pushed out, but they are remembered, so coming back promotes them
+        
+        for key in hot_keys:
+            
+            self.assertFalse( data_cache.HasData( key ) )
+            
+            data_cache.AddData( key, self._FakeData( 10 ) )
+            
+        
+        # a long scan now churns through the 'in' queue and leaves them alone
+        
+        for i in range( 100 ):
+            
+            data_cache.AddData( 'second scan {}'.format( i ), self._FakeData( 10 ) )
+            
+        
+        for key in hot_keys:
+            
+            self.assertTrue( data_cache.HasData( key ) )
+            
+        
+        self.assertLessEqual( data_cache.GetStatistics()[ 'memory_footprint' ], 110 )
+        
+    
+class TestThumbnailCacheWaterfall( unittest.TestCase ):
+    
+    class _FakeController( object ):
+        
+        # the waterfall threads are never started, so the test drives the work itself
+        
+        def __init__( self ):
+            
+            self.options = HG.test_controller.options
+            self.new_options = HG.test_controller.new_options
+            
+            self.pubs = []
+            
+        
+        def CallToThreadLongRunning( self, callable, *args, **kwargs ):
+            
+            pass
+            
+        
+        def pub( self, topic, *args ):
+            
+            self.pubs.append( ( topic, args ) )
+            
+        
+        def sub( self, *args, **kwargs ):
+            
+            pass
+            
+        
+    
+    class _FakeMedia( object ):
+        
+        def __init__( self, hash, mime ):
+            
+            self._hash = hash
+            self._mime = mime
+            
+        
+        def GetDisplayMedia( self ):
+            
+            return self
+            
+        
+        def GetHash( self ):
+            
+            return self._hash
+            
+        
+        def GetMediaResult( self ):
+            
+            return self
+            
+        
+        def GetMime( self ):
+            
+            return self._mime
+            
+        
+    
+    class _RecordingThumbnailCache( ClientCaches.ThumbnailCache ):
+        
+        def __init__( self, controller ):
+            
+            self.rendered_medias = []
+            
+            self.rendering_event = threading.Event()
+            self.release_event = None
+            
+            ClientCaches.ThumbnailCache.__init__( self, controller )
+            
+        
+        def GetThumbnail( self, media ):
+            
+            self.rendered_medias.append( media )
+            
+            self.rendering_event.set()
+            
+            if self.release_event is not None:
+                
+                self.release_event.wait( 10 )
+                
+            
+        
+    
+    def _get_waterfalled_medias( self, controller ):
+        
+        page_keys_to_medias = collections.defaultdict( list )
+        
+        for ( topic, args ) in controller.pubs:
+            
+            if topic == 'waterfall_thumbnails':
+                
+                ( page_key, medias ) = args
+                
+                page_keys_to_medias[ page_key ].extend( medias )
+                
+            
+        
+        return page_keys_to_medias
+        
+    
+    def _work_until_empty( self, thumbnail_cache ):
+        
+        for i in range( 100 ):
+            
+            thumbnail_cache._DoWaterfallWork()
+            
+            if thumbnail_cache._waterfall_queue_empty_event.is_set():
+                
+                return
+                
+            
+        
+    
+    def test_order_and_cancel( self ):
+        
+        controller = self._FakeController()
+        
+        thumbnail_cache = self._RecordingThumbnailCache( controller )
+        
+        page_key = HydrusData.GenerateKey()
+        
+        videos = [ self._FakeMedia( HydrusData.GenerateKey(), HC.VIDEO_WEBM ) for i in range( 20 ) ]
+        images = [ self._FakeMedia( HydrusData.GenerateKey(), HC.IMAGE_JPEG ) for i in range( 20 ) ]
+        
+        medias = videos + images
+        
+        random.shuffle( medias )
+        
+        thumbnail_cache.Waterfall( page_key, medias )
+        
+        # a page closing or scrolling away cancels what it no longer needs
+        
+        cancelled_medias = videos[ : 10 ] + images[ : 10 ]
+        
+        thumbnail_cache.CancelWaterfall( page_key, cancelled_medias )
+        
+        self._work_until_empty( thumbnail_cache )
+        
+        # easy images before hard videos, and by hash within those
+        
+        expected_medias = sorted( images[ 10 : ], key = lambda media: media.GetHash() ) + sorted( videos[ 10 : ], key = lambda media: media.GetHash() )
+        
+        self.assertEqual( thumbnail_cache.rendered_medias, expected_medias )
+        
+        self.assertEqual( set( self._get_waterfalled_medias( controller )[ page_key ] ), set( expected_medias ) )
+        
+    
+    def test_in_flight_hashes( self ):
+        
+        controller = self._FakeController()
+        
+        thumbnail_cache = self._RecordingThumbnailCache( controller )
+        
+        thumbnail_cache.release_event = threading.Event()
+        
+        hash = HydrusData.GenerateKey()
+        
+        ( page_key_1, page_key_2, page_key_3 ) = [ HydrusData.GenerateKey() for i in range( 3 ) ]
+        
+        page_keys_to_medias = { page_key : self._FakeMedia( hash, HC.IMAGE_JPEG ) for page_key in ( page_key_1, page_key_2, page_key_3 ) }
+        
+        for ( page_key, media ) in page_keys_to_medias.items():
+            
+            thumbnail_cache.Waterfall( page_key, [ media ] )
+            
+        
+        # one thread starts on the file, and while it is busy, another picks up the same file for the other pages
+        
+        thread = threading.Thread( target = thumbnail_cache._DoWaterfallWork )
+        
+        thread.start()
+        
+        try:
+            
+            self.assertTrue( thumbnail_cache.rendering_event.wait( 10 ) )
+            
+            thumbnail_cache._DoWaterfallWork()
+            
+            self.assertEqual( len( thumbnail_cache.rendered_medias ), 1 )
+            
+            ( rendering_page_key, ) = [ page_key for ( page_key, media ) in page_keys_to_medias.items() if media is thumbnail_cache.rendered_medias[0] ]
+            
+            ( waiting_page_key, cancelled_page_key ) = [ page_key for page_key in page_keys_to_medias.keys() if page_key != rendering_page_key ]
+            
+            thumbnail_cache.CancelWaterfall( cancelled_page_key, [ page_keys_to_medias[ cancelled_page_key ] ] )
+            
+        finally:
+            
+            thumbnail_cache.release_event.set()
+            
+            thread.join()
+            
+        
+        # the file was only rendered once, and the waiting page got it too
+        
+        self.assertEqual( len( thumbnail_cache.rendered_medias ), 1 )
+        
+        waterfalled_medias = self._get_waterfalled_medias( controller )
+        
+        self.assertEqual( set( waterfalled_medias.keys() ), { rendering_page_key, waiting_page_key } )
+        self.assertEqual( waterfalled_medias[ waiting_page_key ], [ page_keys_to_medias[ waiting_page_key ] ] )
+        
+        self.assertEqual( thumbnail_cache._waterfall_in_flight_hashes_to_waiting_results, {} )
+        
+    
+class TestPackedThumbnailStore( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._dir = tempfile.mkdtemp()
+        
+    
+    def tearDown( self ):
+        
+        shutil.rmtree( self._dir )
+        
+    
+    def _GetStore( self ):
+        
+        return ClientThumbnailStore.PackedThumbnailStore( self._dir, segment_max_size = 64 * 1024 )
+        
+    
+    def test_store( self ):
+        
+        store = self._GetStore()
+        
+        hashes_to_thumbnails = { os.urandom( 32 ) : os.urandom( 1000 + i ) for i in range( 500 ) }
+        
+        for ( hash, thumbnail_bytes ) in hashes_to_thumbnails.items():
+            
+            store.AddThumbnail( hash, thumbnail_bytes )
+            
+        
+        for ( hash, thumbnail_bytes ) in hashes_to_thumbnails.items():
+            
+            self.assertEqual( bytes( store.GetThumbnail( hash ) ), thumbnail_bytes )
+            
+        
+        self.assertEqual( store.GetThumbnail( os.urandom( 32 ) ), None )
+        
+        ( num_thumbnails, num_segments, total_bytes, live_bytes ) = store.GetStatistics()
+        
+        self.assertEqual( num_thumbnails, 500 )
+        self.assertGreater( num_segments, 1 )
+        self.assertEqual( total_bytes, live_bytes )
+        
+        # replace and delete
+        
+        hashes = list( hashes_to_thumbnails.keys() )
+        
+        replaced_hash = hashes[0]
+        
+        hashes_to_thumbnails[ replaced_hash ] = b'new thumbnail'
+        
+        store.AddThumbnail( replaced_hash, b'new thumbnail' )
+        
+        deleted_hashes = hashes[ 1 : 301 ]
+        
+        store.DeleteThumbnails( deleted_hashes )
+        
+        for hash in deleted_hashes:
+            
+            del hashes_to_thumbnails[ hash ]
+            
+        
+        self.assertEqual( bytes( store.GetThumbnail( replaced_hash ) ), b'new thumbnail' )
+        self.assertFalse( store.HasThumbnail( deleted_hashes[0] ) )
+        self.assertEqual( set( store.GetHashes() ), set( hashes_to_thumbnails.keys() ) )
+        
+        # reopen from the saved index
+        
+        store.Close()
+        
+        store = self._GetStore()
+        
+        self.assertEqual( set( store.GetHashes() ), set( hashes_to_thumbnails.keys() ) )
+        
+        # compact
+        
+        ( num_thumbnails, num_segments, total_bytes, live_bytes ) = store.GetStatistics()
+        
+        num_bytes_reclaimed = store.Compact()
+        
+        self.assertGreater( num_bytes_reclaimed, 0 )
+        
+        ( num_thumbnails, num_segments, new_total_bytes, new_live_bytes ) = store.GetStatistics()
+        
+        self.assertEqual( new_live_bytes, live_bytes )
+        self.assertLess( new_total_bytes, total_bytes )
+        
+        for ( hash, thumbnail_bytes ) in hashes_to_thumbnails.items():
+            
+            self.assertEqual( bytes( store.GetThumbnail( hash ) ), thumbnail_bytes )
+            
+        
+        # appends since the last index save are recovered from the segment tails, and a torn write is dropped
+        
+        store.SaveIndex()
+        
+        another_hash = os.urandom( 32 )
+        
+        hashes_to_thumbnails[ another_hash ] = b'another thumbnail'
+        
+        store.AddThumbnail( another_hash, b'another thumbnail' )
+        
+        self.assertEqual( bytes( store.GetThumbnail( another_hash ) ), b'another thumbnail' )
+        
+        # no close here, as if we crashed
+        
+        last_segment_filename = sorted( filename for filename in os.listdir( self._dir ) if ClientThumbnailStore.SEGMENT_FILENAME_RE.match( filename ) is not None )[-1]
+        
+        with open( os.path.join( self._dir, last_segment_filename ), 'ab' ) as f:
+            
+            f.write( ClientThumbnailStore.RECORD_HEADER.pack( os.urandom( 32 ), 5000, 0 ) + b'torn' )
+            
+        
+        store = self._GetStore()
+        
+        self.assertEqual( set( store.GetHashes() ), set( hashes_to_thumbnails.keys() ) )
+        self.assertEqual( bytes( store.GetThumbnail( another_hash ) ), b'another thumbnail' )
+        
+        # rebuild from the segments alone
+        
+        store.RebuildIndex()
+        
+        self.assertEqual( set( store.GetHashes() ), set( hashes_to_thumbnails.keys() ) )
+        
+        for ( hash, thumbnail_bytes ) in hashes_to_thumbnails.items():
+            
+            self.assertEqual( bytes( store.GetThumbnail( hash ) ), thumbnail_bytes )
+            
+        
+        store.Close()
+
+
+    def test_compact_keeps_needed_deletion_markers( self ):
+        
+        store = ClientThumbnailStore.PackedThumbnailStore( self._dir, segment_max_size = 4096 )
+        
+        deleted_hash = os.urandom( 32 )
+        
+        store.AddThumbnail( deleted_hash, os.urandom( 100 ) )
+        
+        # the first segment stays mostly live, so it survives compaction with its old copy of the deleted thumbnail
+        
+        keeper_hashes = [ os.urandom( 32 ) for i in range( 3 ) ]
+        
+        for hash in keeper_hashes:
+            
+            store.AddThumbnail( hash, os.urandom( 1000 ) )
+            
+        
+        junk_hashes = [ os.urandom( 32 ) for i in range( 3 ) ]
+        
+        for hash in junk_hashes:
+            
+            store.AddThumbnail( hash, os.urandom( 1000 ) )
+            
+        
+        store.DeleteThumbnails( [ deleted_hash ] )
+        store.DeleteThumbnails( junk_hashes )
+        
+        store.AddThumbnail( os.urandom( 32 ), os.urandom( 1000 ) )
+        
+        self.assertGreater( store.Compact(), 0 )
+        
+        store.RebuildIndex()
+        
+        self.assertFalse( store.HasThumbnail( deleted_hash ) )
+        
+        for hash in junk_hashes:
+            
+            self.assertFalse( store.HasThumbnail( hash ) )
+            
+        
+        for hash in keeper_hashes:
+            
+            self.assertTrue( store.HasThumbnail( hash ) )
+            
+        
+        store.Close()
+        
+    
@@ -1,6 +1,11 @@
+import numpy
 import os
+import shutil
+import tempfile
 import unittest
 
+from PIL import Image as PILImage
+
 from hydrus.core import HydrusConstants as HC
 
 from hydrus.client import ClientConstants as CC
@@ -22,3 +27,60 @@ class TestImageHandling( unittest.TestCase ):
         
         self.assertEqual( phashes, set( [ b'\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
         
+    
+    def test_phash_batch( self ):
+        
+        paths_and_mimes = []
+        
+        paths_and_mimes.append( ( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), HC.IMAGE_PNG ) )
+        paths_and_mimes.append( ( os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' ), HC.IMAGE_JPEG ) )
+        paths_and_mimes.append( ( os.path.join( HC.STATIC_DIR, 'testing', 'muh_png.png' ), HC.IMAGE_PNG ) )
+        paths_and_mimes.append( ( os.path.join( HC.STATIC_DIR, 'testing', 'does_not_exist.png' ), HC.IMAGE_PNG ) )
+        
+        results = ClientImageHandling.GenerateShapePerceptualHashesBatch( paths_and_mimes )
+        
+        self.assertEqual( results[0], set( [ b'\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
+        
+        for ( ( path, mime ), result ) in list( zip( paths_and_mimes, results ) )[1:3]:
+            
+            self.assertEqual( result, ClientImageHandling.GenerateShapePerceptualHashes( path, mime ) )
+            
+        
+        self.assertIsInstance( results[3], Exception )
+        
+        self.assertEqual( ClientImageHandling.GenerateShapePerceptualHashesBatch( [] ), [] )
+        
+    
+    def test_phash_batch_large_jpeg( self ):
+        
+        # big enough that a reduced jpeg decode would kick in, which gives different phashes, so the batch has to decode in full like import does
+        
+        temp_dir = tempfile.mkdtemp()
+        
+        try:
+            
+            rng = numpy.random.default_rng( 0 )
+            
+            ( height, width ) = ( 1800, 2400 )
+            
+            ( ys, xs ) = numpy.mgrid[ 0 : height, 0 : width ]
+            
+            grey = ( 127 + 60 * numpy.sin( xs / 97.0 ) * numpy.cos( ys / 61.0 ) + rng.normal( 0, 40, ( height, width ) ) ).clip( 0, 255 ).astype( numpy.uint8 )
+            
+            path = os.path.join( temp_dir, 'large.jpg' )
+            
+            PILImage.fromarray( numpy.stack( [ grey, grey[ :, ::-1 ], grey[ ::-1, : ] ], axis = 2 ) ).save( path, quality = 90 )
+            
+            for force_pil in ( False, True ):
+                
+                ( result, ) = ClientImageHandling.GenerateShapePerceptualHashesBatch( [ ( path, HC.IMAGE_JPEG ) ], force_pil = force_pil )
+                
+                self.assertEqual( result, ClientImageHandling.GenerateShapePerceptualHashes( path, HC.IMAGE_JPEG, force_pil = force_pil ) )
+                
+            
+        finally:
+            
+            shutil.rmtree( temp_dir )
+            
+        
+    
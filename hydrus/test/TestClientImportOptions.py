@@ -426,6 +426,104 @@ def GetNotesMediaResult( hash, names_to_notes ):
     
     return media_result
     
+class TestFileSeedCache( unittest.TestCase ):
+    
+    def test_indexed_statuses( self ):
+        
+        file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+        
+        file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, 'https://wew.lad/{}'.format( i ) ) for i in range( 10 ) ]
+        
+        file_seed_cache.AddFileSeeds( file_seeds )
+        
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 10 )
+        self.assertIs( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[0] )
+        
+        for file_seed in file_seeds[:3]:
+            
+            file_seed.SetStatus( CC.STATUS_SUCCESSFUL_AND_NEW )
+            
+        
+        file_seeds[5].SetStatus( CC.STATUS_ERROR, note = 'test' )
+        
+        file_seed_cache.NotifyFileSeedsUpdated( file_seeds[:3] + [ file_seeds[5] ] )
+        
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 6 )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_SUCCESSFUL_AND_NEW ), 3 )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_ERROR ), 1 )
+        self.assertEqual( file_seed_cache.GetStatus().GetStatusesToCounts()[ CC.STATUS_SUCCESSFUL_AND_NEW ], 3 )
+        
+        self.assertIs( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[3] )
+        self.assertIs( file_seed_cache.GetNextFileSeed( CC.STATUS_ERROR ), file_seeds[5] )
+        self.assertEqual( file_seed_cache.GetFileSeeds( CC.STATUS_SUCCESSFUL_AND_NEW ), file_seeds[:3] )
+        
+        # moving things around
+        
+        file_seed_cache.DelayFileSeed( file_seeds[3] )
+        
+        self.assertIs( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[4] )
+        self.assertEqual( file_seed_cache.GetFileSeedIndex( file_seeds[3] ), 4 )
+        
+        file_seed_cache.AdvanceFileSeed( file_seeds[9] )
+        
+        self.assertEqual( file_seed_cache.GetFileSeedIndex( file_seeds[9] ), 8 )
+        self.assertEqual( file_seed_cache.GetFileSeeds( CC.STATUS_UNKNOWN ), [ file_seeds[ i ] for i in ( 4, 3, 6, 7, 9, 8 ) ] )
+        
+        file_seed_cache.RetryFailed()
+        
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_ERROR ), 0 )
+        self.assertIs( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[4] )
+        
+        file_seed_cache.RemoveFileSeeds( ( file_seeds[4], file_seeds[3] ) )
+        
+        self.assertIs( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[5] )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 5 )
+        self.assertEqual( file_seed_cache.GetFileSeedCount(), 8 )
+        
+        file_seed_cache.RemoveFileSeedsByStatus( ( CC.STATUS_SUCCESSFUL_AND_NEW, ) )
+        
+        self.assertEqual( file_seed_cache.GetFileSeedCount(), 5 )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_SUCCESSFUL_AND_NEW ), 0 )
+        self.assertIs( file_seed_cache.GetNextFileSeed( CC.STATUS_SUCCESSFUL_AND_NEW ), None )
+        
+    
+    def test_status_change_without_notify( self ):
+        
+        # plenty of importers set a status and never call NotifyFileSeedsUpdated, so the seed has to tell the cache itself
+        
+        file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+        
+        file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, 'https://wew.lad/{}'.format( i ) ) for i in range( 3 ) ]
+        
+        file_seed_cache.AddFileSeeds( file_seeds )
+        
+        self.assertTrue( file_seed_cache.WorkToDo() )
+        
+        for file_seed in file_seeds:
+            
+            file_seed.SetStatus( CC.STATUS_ERROR, note = 'test' )
+            
+        
+        self.assertFalse( file_seed_cache.WorkToDo() )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 0 )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_ERROR ), 3 )
+        self.assertIs( file_seed_cache.GetNextFileSeed( CC.STATUS_ERROR ), file_seeds[0] )
+        
+        file_seed_cache.RetryFailed()
+        
+        self.assertTrue( file_seed_cache.WorkToDo() )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 3 )
+        
+        # a seed that has been removed does not count any more
+        
+        file_seed_cache.RemoveFileSeeds( ( file_seeds[0], ) )
+        
+        file_seeds[0].SetStatus( CC.STATUS_SUCCESSFUL_AND_NEW )
+        
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_SUCCESSFUL_AND_NEW ), 0 )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 2 )
+        
+    
 class TestNoteImportOptions( unittest.TestCase ):
     
     def test_basics( self ):
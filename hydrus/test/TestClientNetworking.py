@@ -373,6 +373,96 @@ class TestNetworkingDomain( unittest.TestCase ):
         self.assertEqual( url_class.Normalise( example_url ), example_url )
         
     
+    def test_url_class_index( self ):
+        
+        def make_url_class( name, url_type, path_components, parameters, example_url ):
+            
+            url_class = ClientNetworkingDomain.URLClass( name, url_type = url_type, netloc = 'testbooru.cx', path_components = path_components, parameters = parameters, example_url = example_url )
+            
+            return url_class
+            
+        
+        post_path_components = []
+        
+        post_path_components.append( ( ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_FIXED, match_value = 'post', example_string = 'post' ), None ) )
+        post_path_components.append( ( ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_FLEXIBLE, match_value = ClientParsing.NUMERIC, example_string = '123456' ), None ) )
+        
+        post_url_class = make_url_class( 'post', HC.URL_TYPE_POST, post_path_components, {}, 'https://testbooru.cx/post/123456' )
+        
+        gallery_path_components = []
+        
+        gallery_path_components.append( ( ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_FIXED, match_value = 'gallery', example_string = 'gallery' ), None ) )
+        
+        gallery_parameters = {}
+        
+        gallery_parameters[ 'tags' ] = ( ClientParsing.StringMatch( example_string = 'samus_aran' ), None )
+        
+        gallery_url_class = make_url_class( 'gallery', HC.URL_TYPE_GALLERY, gallery_path_components, gallery_parameters, 'https://testbooru.cx/gallery?tags=samus_aran' )
+        
+        file_path_components = []
+        
+        file_path_components.append( ( ClientParsing.StringMatch( example_string = 'abcdef.jpg' ), None ) )
+        
+        file_url_class = make_url_class( 'file', HC.URL_TYPE_FILE, file_path_components, {}, 'https://testbooru.cx/abcdef.jpg' )
+        
+        self.assertEqual( post_url_class.GetIndexPathComponent(), 'post' )
+        self.assertEqual( gallery_url_class.GetRequiredParameterKeys(), { 'tags' } )
+        self.assertEqual( file_url_class.GetIndexPathComponent(), None )
+        
+        #
+        
+        url_classes = [ post_url_class, gallery_url_class, file_url_class ]
+        
+        ClientNetworkingDomain.NetworkDomainManager.STATICSortURLClassesDescendingComplexity( url_classes )
+        
+        url_class_index = ClientNetworkingDomain.URLClassIndex( url_classes )
+        
+        tests = []
+        
+        tests.append( ( 'https://testbooru.cx/post/123456', post_url_class ) )
+        tests.append( ( 'https://testbooru.cx/gallery?tags=samus_aran', gallery_url_class ) )
+        tests.append( ( 'https://testbooru.cx/abcdef.jpg', file_url_class ) )
+        tests.append( ( 'https://testbooru.cx/post', file_url_class ) )
+        tests.append( ( 'https://testbooru.cx/gallery', file_url_class ) )
+        tests.append( ( 'https://testbooru.cx/post/abcdef', file_url_class ) )
+        tests.append( ( 'https://wew.lad/post/123456', None ) )
+        
+        for ( url, expected_url_class ) in tests:
+            
+            ( netloc, url_path_components, url_parameters ) = ClientNetworkingDomain.ConvertURLIntoMatchableParts( url )
+            
+            self.assertIs( url_class_index.GetURLClass( netloc, url_path_components, url_parameters ), expected_url_class )
+            
+            self.assertEqual( post_url_class.MatchesParsedURL( netloc, url_path_components, url_parameters ), post_url_class.Matches( url ) )
+            
+        
+        urls = [ 'https://testbooru.cx/post/123456', 'https://testbooru.cx/post/123456', 'https://testbooru.cx/post/abcdef', 'file:///C:/Users/Tall%20Man/Downloads/maxresdefault.jpg' ]
+        
+        self.assertEqual( post_url_class.FilterMatchingURLs( urls ), { 'https://testbooru.cx/post/123456' } )
+        
+        #
+        
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        
+        domain_manager.SetURLClasses( [ post_url_class, gallery_url_class, file_url_class ] )
+        
+        bad_url = 'file:///C:/Users/Tall%20Man/Downloads/maxresdefault.jpg'
+        
+        urls_to_url_classes = domain_manager.GetURLsToURLClasses( [ 'https://testbooru.cx/post/123456', 'https://testbooru.cx/gallery?tags=samus_aran', 'https://wew.lad/post/123456', bad_url ] )
+        
+        self.assertEqual( urls_to_url_classes, { 'https://testbooru.cx/post/123456' : post_url_class, 'https://testbooru.cx/gallery?tags=samus_aran' : gallery_url_class, 'https://wew.lad/post/123456' : None } )
+        
+        urls_to_normalised_urls = domain_manager.NormaliseURLs( [ 'http://testbooru.cx/post/123456?blah=1', 'https://wew.lad/post/123456?b=2&a=1', bad_url ] )
+        
+        self.assertEqual( urls_to_normalised_urls, { 'http://testbooru.cx/post/123456?blah=1' : 'https://testbooru.cx/post/123456', 'https://wew.lad/post/123456?b=2&a=1' : 'https://wew.lad/post/123456?a=1&b=2' } )
+        
+        # the cache gets wiped when the url classes change
+        
+        domain_manager.SetURLClasses( [ gallery_url_class, file_url_class ] )
+        
+        self.assertIs( domain_manager.GetURLClass( 'https://testbooru.cx/post/123456' ), file_url_class )
+        
+    
 class TestNetworkingEngine( unittest.TestCase ):
     
     def test_engine_shutdown_app( self ):
@@ -4,9 +4,229 @@ import unittest
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusGlobals as HG
 
+from hydrus.client import ClientDefaults
 from hydrus.client import ClientParsing
 
+PARITY_TEST_HTML = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<title>test gallery page</title>
+<meta property="og:image" content="https://example.com/images/full/abcdef.jpg">
+<link rel="canonical" href="https://example.com/post/show/123456">
+</head>
+<body>
+<div id="content" class="main  content">
+<section id="tag-list">
+<ul class="tags">
+<li class="tag-type-artist"><a class="search-tag" href="/posts?tags=artist_name">artist name</a> <span class="count">12</span></li>
+<li class="tag-type-character"><a class="search-tag" href="/posts?tags=char\'s_name">char's "name"</a></li>
+<li class="tag-type-general"><a class="search-tag" href="/posts?tags=blue_sky">blue sky</a></li>
+<li class="tag-type-general"><a class="search-tag" href="/posts?tags=cloud">  <!-- comment --> cloud</a></li>
+</ul>
+</section>
+<div class="thumbs">
+<div class="thumb"><a href="/post/show/1"><img src="/thumbs/1.jpg" alt="one"></a></div>
+<div class="thumb selected"><a href="/post/show/2"><img src="/thumbs/2.jpg" alt="two"></a></div>
+<div class="thumb"><div class="thumb"><a href="/post/show/3"><img src="/thumbs/3.jpg" alt="three"></a></div></div>
+</div>
+<div class="featured thumb selected extra"><a href="/post/show/4"><img src="/thumbs/4.jpg" alt="four"></a></div>
+<table><tr><td><a href="/next?page=2" rel="next">next</a></td></tr></table>
+<p>source: <a href="https://source.example.com/work/99" data-source-id="99">source</a>
+<script>var thing = "<a href='not a link'>";</script>
+</div>
+</body>
+</html>'''
+
+class TestParseFormulaHTML( unittest.TestCase ):
+    
+    def _get_all_formulae( self, page_parsers ):
+        
+        formulae = []
+        
+        def add_formula( formula ):
+            
+            if isinstance( formula, ClientParsing.ParseFormulaCompound ):
+                
+                for sub_formula in formula.GetFormulae():
+                    
+                    add_formula( sub_formula )
+                    
+                
+            else:
+                
+                formulae.append( formula )
+                
+            
+        
+        def add_page_parser( page_parser ):
+            
+            ( sub_page_parsers, content_parsers ) = page_parser.GetContentParsers()
+            
+            for ( formula, sub_page_parser ) in sub_page_parsers:
+                
+                add_formula( formula )
+                
+                add_page_parser( sub_page_parser )
+                
+            
+            for content_parser in content_parsers:
+                
+                ( name, content_type, formula, additional_info ) = content_parser.ToTuple()
+                
+                add_formula( formula )
+                
+            
+        
+        for page_parser in page_parsers:
+            
+            add_page_parser( page_parser )
+            
+        
+        return formulae
+        
+    
+    def _get_all_html_formulae( self, page_parsers ):
+        
+        return [ formula for formula in self._get_all_formulae( page_parsers ) if isinstance( formula, ClientParsing.ParseFormulaHTML ) ]
+        
+    
+    def _parse( self, formula, html, use_lxml ):
+        
+        HG.test_controller.new_options.SetBoolean( 'parse_html_with_lxml_fast_path', use_lxml )
+        
+        try:
+            
+            return formula.Parse( {}, html )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'parse_html_with_lxml_fast_path', False )
+            
+        
+    
+    def _parse_page( self, page_parser, html, use_lxml ):
+        
+        HG.test_controller.new_options.SetBoolean( 'parse_html_with_lxml_fast_path', use_lxml )
+        
+        try:
+            
+            return page_parser.Parse( {}, html )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'parse_html_with_lxml_fast_path', False )
+            
+        
+    
+    def test_lxml_parity( self ):
+        
+        DESCENDING = ClientParsing.HTML_RULE_TYPE_DESCENDING
+        ASCENDING = ClientParsing.HTML_RULE_TYPE_ASCENDING
+        
+        def rule( tag_name, tag_attributes = None, tag_index = None, rule_type = DESCENDING, tag_depth = None, string_match = None ):
+            
+            return ClientParsing.ParseRuleHTML( rule_type = rule_type, tag_name = tag_name, tag_attributes = tag_attributes, tag_index = tag_index, tag_depth = tag_depth, should_test_tag_string = string_match is not None, tag_string_string_match = string_match )
+            
+        
+        formulae = []
+        
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'meta', { 'property' : 'og:image' } ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'content' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'li', { 'class' : 'tag-type-general' } ), rule( 'a', { 'class' : 'search-tag' } ) ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'li', { 'class' : 'tag-type-character' } ), rule( 'a' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'li', { 'class' : 'tag-type-character' } ), rule( 'a' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'div', { 'class' : 'thumb' } ), rule( 'a' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'div', { 'class' : 'selected' } ), rule( 'img' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'src' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'div', { 'id' : 'content' } ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'class' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'div', { 'class' : 'thumbs' } ), rule( 'a', tag_index = 1 ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'div', { 'class' : 'thumbs' } ), rule( 'a', tag_index = -1 ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'div', { 'class' : 'thumbs' } ), rule( 'a', tag_index = 10 ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'img' ), rule( 'div', rule_type = ASCENDING, tag_depth = 2 ), rule( 'a' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'span' ), rule( None, rule_type = ASCENDING, tag_depth = 1 ), rule( 'a' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'a', string_match = ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_FIXED, match_value = 'next', example_string = 'next' ) ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'a', { 'data-source-id' : '99' } ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'script' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'title' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'html' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'lang' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( None, tag_index = 0 ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'lang' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( None, tag_index = 0 ), rule( None, tag_index = 0 ), rule( None, tag_index = 0 ) ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'html' ), rule( None, rule_type = ASCENDING, tag_depth = 1 ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'lang' ) )
+        
+        for formula in formulae:
+            
+            self.assertTrue( formula._CanUseLXMLFastPath(), formula.ToPrettyMultilineString() )
+            
+        
+        # these need the soup
+        
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'table' ), rule( 'tbody' ), rule( 'a' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'a', { 'rel' : 'next' } ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'title' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_HTML ) )
+        
+        formulae.append( ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'link', { 'rel' : 'canonical' } ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ) )
+        
+        # bs4 matches 'thumb selected' against the whole class string, not as a subsequence of it
+        
+        multi_class_formula = ClientParsing.ParseFormulaHTML( tag_rules = [ rule( 'div', { 'class' : 'thumb selected' } ), rule( 'img' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'src' )
+        
+        formulae.append( multi_class_formula )
+        
+        for formula in formulae[-5:]:
+            
+            self.assertFalse( formula._CanUseLXMLFastPath() )
+            
+        
+        formulae.extend( self._get_all_html_formulae( ClientDefaults.GetDefaultParsers() ) )
+        
+        for formula in formulae:
+            
+            self.assertEqual( self._parse( formula, PARITY_TEST_HTML, True ), self._parse( formula, PARITY_TEST_HTML, False ), formula.ToPrettyMultilineString() )
+            
+        
+        self.assertEqual( self._parse( formulae[0], PARITY_TEST_HTML, True ), [ 'https://example.com/images/full/abcdef.jpg' ] )
+        self.assertEqual( self._parse( formulae[4], PARITY_TEST_HTML, True ), [ '/post/show/1', '/post/show/2', '/post/show/3', '/post/show/3', '/post/show/4' ] )
+        self.assertEqual( self._parse( formulae[5], PARITY_TEST_HTML, True ), [ '/thumbs/2.jpg', '/thumbs/4.jpg' ] )
+        self.assertEqual( self._parse( formulae[6], PARITY_TEST_HTML, True ), [ 'main content' ] )
+        self.assertEqual( self._parse( formulae[16], PARITY_TEST_HTML, True ), [ 'en' ] )
+        self.assertEqual( self._parse( formulae[17], PARITY_TEST_HTML, True ), [ 'en' ] )
+        self.assertEqual( self._parse( formulae[18], PARITY_TEST_HTML, True ), [ 'test gallery page' ] )
+        self.assertEqual( self._parse( formulae[19], PARITY_TEST_HTML, True ), [] )
+        self.assertEqual( self._parse( multi_class_formula, PARITY_TEST_HTML, True ), [ '/thumbs/2.jpg' ] )
+        
+    
+    def test_lxml_parity_on_example_pages( self ):
+        
+        num_example_pages = 0
+        
+        for page_parser in ClientDefaults.GetDefaultParsers():
+            
+            formulae = self._get_all_formulae( [ page_parser ] )
+            
+            if len( formulae ) == 0 or False in ( isinstance( formula, ClientParsing.ParseFormulaHTML ) for formula in formulae ):
+                
+                continue
+                
+            
+            html = ClientParsing.GenerateExampleHTMLForPageParser( page_parser )
+            
+            num_example_pages += 1
+            
+            results = [ self._parse( formula, html, False ) for formula in formulae ]
+            
+            self.assertTrue( True in ( len( result ) > 0 for result in results ), page_parser.GetName() )
+            
+            for ( formula, result ) in zip( formulae, results ):
+                
+                self.assertEqual( self._parse( formula, html, True ), result, page_parser.GetName() + ': ' + formula.ToPrettyMultilineString() )
+                
+            
+            self.assertEqual( self._parse_page( page_parser, html, True ), self._parse_page( page_parser, html, False ), page_parser.GetName() )
+            
+        
+        self.assertGreater( num_example_pages, 0 )
+        
+    
 class TestStringConverter( unittest.TestCase ):
     
     def test_basics( self ):
@@ -529,3 +749,55 @@ class TestStringProcessor( unittest.TestCase ):
         self.assertEqual( processor.ProcessStrings( [ '1,a,2,3', 'test', '123' ] ), expected_result )
         
     
+    def test_compiled_pipeline( self ):
+        
+        processor = ClientParsing.StringProcessor()
+        
+        string_match = ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_REGEX, match_value = '^[a-z]+$' )
+        
+        conversions = [ ( ClientParsing.STRING_CONVERSION_REGEX_SUB, ( '[aeiou]', '' ) ), ( ClientParsing.STRING_CONVERSION_PREPEND_TEXT, '_' ) ]
+        
+        processor.SetProcessingSteps( [ ClientParsing.StringSplitter( separator = ' ' ), string_match, ClientParsing.StringConverter( conversions = conversions ), ClientParsing.StringSlicer( index_start = 0, index_end = 2 ) ] )
+        
+        texts = [ 'hello world', b'bytes', 'some 123 test words' ]
+        
+        self.assertEqual( processor.ProcessStrings( texts ), [ '_hll', '_wrld' ] )
+        self.assertEqual( processor.ProcessStrings( texts, no_slicing = True ), [ '_hll', '_wrld', '_sm', '_tst', '_wrds' ] )
+        self.assertEqual( processor.ProcessStrings( texts, max_steps_allowed = 2 ), [ 'hello', 'world', 'some', 'test', 'words' ] )
+        
+        # the compiled steps have to notice changes
+        
+        string_match.SetMinChars( 5 )
+        
+        self.assertEqual( processor.ProcessStrings( texts, no_slicing = True ), [ '_hll', '_wrld', '_wrds' ] )
+        
+        processor.SetProcessingSteps( [ ClientParsing.StringSplitter( separator = ' ', max_splits = 1 ) ] )
+        
+        self.assertEqual( processor.ProcessStrings( texts ), [ 'hello', 'world', 'some', '123 test words' ] )
+        
+        # bad steps drop their strings rather than raising
+        
+        bad_regex_match = ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_REGEX, match_value = '(' )
+        bad_regex_conversions = [ ( ClientParsing.STRING_CONVERSION_REGEX_SUB, ( '(', '' ) ) ]
+        
+        self.assertFalse( bad_regex_match.Matches( 'test' ) )
+        
+        with self.assertRaises( HydrusExceptions.StringMatchException ):
+            
+            bad_regex_match.Test( 'test' )
+            
+        
+        with self.assertRaises( HydrusExceptions.StringConvertException ):
+            
+            ClientParsing.StringConverter( conversions = bad_regex_conversions ).Convert( 'test' )
+            
+        
+        processor.SetProcessingSteps( [ ClientParsing.StringConverter( conversions = bad_regex_conversions ) ] )
+        
+        self.assertEqual( processor.ProcessStrings( texts ), [] )
+        
+        processor.SetProcessingSteps( [ bad_regex_match ] )
+        
+        self.assertEqual( processor.ProcessStrings( texts ), [] )
+        
+    
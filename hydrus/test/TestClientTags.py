@@ -1,4 +1,6 @@
 import collections
+import random
+import sqlite3
 import unittest
 
 from hydrus.core import HydrusConstants as HC
@@ -8,7 +10,9 @@ from hydrus.core import HydrusGlobals as HG
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientManagers
 from hydrus.client import ClientSearch
+from hydrus.client.media import ClientMedia
 from hydrus.client.media import ClientMediaManagers
+from hydrus.client.media import ClientMediaResult
 from hydrus.client.metadata import ClientTags
 from hydrus.client.metadata import ClientTagsHandling
 
@@ -414,6 +418,194 @@ class TestTagsManager( unittest.TestCase ):
         self.assertEqual( self._other_tags_manager.GetPetitioned( self._reset_service_key, ClientTags.TAG_DISPLAY_STORAGE ), set() )
         
     
+class TestMediaTagCountAggregator( unittest.TestCase ):
+    
+    def _GetMediaList( self, service_key, hashes_to_current_tags ):
+        
+        media_results = []
+        
+        for ( i, ( hash, current_tags ) ) in enumerate( hashes_to_current_tags.items() ):
+            
+            file_info_manager = ClientMediaManagers.FileInfoManager( i + 1, hash, size = 100, mime = HC.IMAGE_PNG, width = 20, height = 20 )
+            
+            service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+            
+            service_keys_to_statuses_to_tags[ service_key ][ HC.CONTENT_STATUS_CURRENT ] = set( current_tags )
+            
+            tags_manager = ClientMediaManagers.TagsManager( service_keys_to_statuses_to_tags, collections.defaultdict( HydrusData.default_dict_set ) )
+            
+            locations_manager = ClientMediaManagers.LocationsManager( set(), set(), set(), set() )
+            ratings_manager = ClientMediaManagers.RatingsManager( {} )
+            notes_manager = ClientMediaManagers.NotesManager( {} )
+            file_viewing_stats_manager = ClientMediaManagers.FileViewingStatsManager( 0, 0, 0, 0 )
+            
+            media_results.append( ClientMediaResult.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager ) )
+            
+        
+        return ClientMedia.MediaList( CC.LOCAL_FILE_SERVICE_KEY, media_results )
+        
+    
+    def test_aggregator( self ):
+        
+        service_key = HydrusData.GenerateKey()
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 4 ) ]
+        
+        hashes_to_current_tags = {
+            hashes[0] : { 'blue eyes', 'blonde hair' },
+            hashes[1] : { 'blue eyes' },
+            hashes[2] : { 'red eyes', 'blonde hair' },
+            hashes[3] : set()
+        }
+        
+        media_list = self._GetMediaList( service_key, hashes_to_current_tags )
+        
+        medias = { media.GetHash() : media for media in media_list.GetSortedMedia() }
+        
+        aggregator = ClientMedia.MediaTagCountAggregator( service_key, ClientTags.TAG_DISPLAY_STORAGE )
+        
+        media_list.AddTagCountAggregator( aggregator )
+        
+        def check_against_fresh_count():
+            
+            fresh_counts = ClientMedia.GetMediasTagCount( aggregator.GetMedias(), service_key, ClientTags.TAG_DISPLAY_STORAGE )
+            
+            for ( counter, fresh_counter ) in zip( aggregator.GetCounts(), fresh_counts ):
+                
+                self.assertEqual( dict( counter ), { tag : count for ( tag, count ) in fresh_counter.items() if count > 0 } )
+                
+            
+        
+        ( current_tags_to_count, deleted_tags_to_count, pending_tags_to_count, petitioned_tags_to_count ) = aggregator.GetCounts()
+        
+        #
+        
+        tags_changed = aggregator.SetMedias( [ medias[ hashes[0] ], medias[ hashes[1] ] ] )
+        
+        self.assertEqual( tags_changed, { 'blue eyes', 'blonde hair' } )
+        self.assertEqual( dict( current_tags_to_count ), { 'blue eyes' : 2, 'blonde hair' : 1 } )
+        
+        tags_changed = aggregator.SetMedias( [ medias[ hashes[1] ], medias[ hashes[2] ] ] )
+        
+        self.assertEqual( tags_changed, { 'blue eyes', 'blonde hair', 'red eyes' } )
+        self.assertEqual( dict( current_tags_to_count ), { 'blue eyes' : 1, 'blonde hair' : 1, 'red eyes' : 1 } )
+        
+        check_against_fresh_count()
+        
+        tags_changed = aggregator.AddMedias( [ medias[ hashes[2] ], medias[ hashes[3] ] ] )
+        
+        self.assertEqual( tags_changed, set() )
+        self.assertEqual( aggregator.GetNumMedias(), 3 )
+        
+        #
+        
+        content_updates = []
+        
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND, ( 'red eyes', { hashes[1], hashes[3] } ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'blonde hair', { hashes[0], hashes[2] } ) ) )
+        
+        for content_update in content_updates:
+            
+            for hash in content_update.GetHashes():
+                
+                medias[ hash ].GetTagsManager().ProcessContentUpdate( service_key, content_update )
+                
+            
+        
+        # the media list keeps the aggregator in sync
+        
+        media_list.ProcessContentUpdates( { service_key : content_updates } )
+        
+        self.assertEqual( dict( current_tags_to_count ), { 'blue eyes' : 1, 'red eyes' : 1 } )
+        self.assertEqual( dict( deleted_tags_to_count ), { 'blonde hair' : 1 } )
+        self.assertEqual( dict( pending_tags_to_count ), { 'red eyes' : 2 } )
+        
+        check_against_fresh_count()
+        
+        # removal takes away what we originally counted
+        
+        aggregator.RemoveMedias( [ medias[ hashes[1] ] ] )
+        
+        self.assertEqual( dict( current_tags_to_count ), { 'red eyes' : 1 } )
+        self.assertEqual( dict( pending_tags_to_count ), { 'red eyes' : 1 } )
+        
+        check_against_fresh_count()
+        
+        # shrinking a lot means a fresh count
+        
+        tags_changed = aggregator.SetMedias( [ medias[ hashes[0] ] ] )
+        
+        self.assertEqual( tags_changed, { 'red eyes', 'blonde hair', 'blue eyes' } )
+        self.assertEqual( dict( current_tags_to_count ), { 'blue eyes' : 1 } )
+        self.assertEqual( dict( deleted_tags_to_count ), { 'blonde hair' : 1 } )
+        self.assertEqual( dict( pending_tags_to_count ), {} )
+        
+        check_against_fresh_count()
+        
+    
+class TestSubtagPrefixIndex( unittest.TestCase ):
+    
+    def test_fts4_parity( self ):
+        
+        # the index stands in for an fts4 prefix MATCH, so it has to give exactly the same answers
+        
+        r = random.Random( 5 )
+        
+        words = [ 'samus', 'aran', 'sam', 'samurai', 'blue', 'eyes', 'nier', 'automata', 'caf\u00e9', '\u7adc', 'x1', '2b', 'a', 'B' ]
+        separators = [ ' ', '-', '_', '.', '(', ')', '!', '\'', '/' ]
+        
+        subtag_ids_to_subtags = {}
+        
+        for subtag_id in range( 1, 2001 ):
+            
+            num_words = r.randint( 1, 10 )
+            
+            subtag_ids_to_subtags[ subtag_id ] = ''.join( r.choice( words ) + ( r.choice( separators ) if i < num_words - 1 else '' ) for i in range( num_words ) )
+            
+        
+        db = sqlite3.connect( ':memory:' )
+        
+        db.execute( 'CREATE VIRTUAL TABLE subtags_fts4 USING fts4( subtag );' )
+        
+        pairs = list( subtag_ids_to_subtags.items() )
+        
+        db.executemany( 'INSERT INTO subtags_fts4 ( docid, subtag ) VALUES ( ?, ? );', pairs )
+        
+        subtag_prefix_index = ClientTagsHandling.SubtagPrefixIndex( pairs[ : 1500 ] )
+        
+        subtag_prefix_index.AddSubtags( pairs[ 1500 : ] )
+        
+        deletee_subtag_ids = r.sample( list( subtag_ids_to_subtags.keys() ), 300 )
+        
+        subtag_prefix_index.DeleteSubtagIds( deletee_subtag_ids )
+        
+        db.executemany( 'DELETE FROM subtags_fts4 WHERE docid = ?;', ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
+        
+        readd_pairs = [ ( subtag_id, subtag_ids_to_subtags[ subtag_id ] ) for subtag_id in deletee_subtag_ids[ : 50 ] ]
+        
+        subtag_prefix_index.AddSubtags( readd_pairs )
+        
+        db.executemany( 'INSERT INTO subtags_fts4 ( docid, subtag ) VALUES ( ?, ? );', readd_pairs )
+        
+        wildcards = [ 's*', 'sam*', 'samus a*', 'samus-ar*', 'aran s*', 'blue eyes b*', 'caf*', '\u7adc*', 'x*', '2*', 'nier automata a*', 'a b*', 'SAM*' ]
+        
+        for wildcard in wildcards:
+            
+            result = subtag_prefix_index.GetSubtagIdsFromWildcard( wildcard )
+            
+            expected = { subtag_id for ( subtag_id, ) in db.execute( 'SELECT docid FROM subtags_fts4 WHERE subtag MATCH ?;', ( '"{}"'.format( wildcard ), ) ) }
+            
+            self.assertEqual( result, expected, wildcard )
+            
+        
+        # these are for the tables to handle
+        
+        for wildcard in [ 'sam', '*us', 's*s*', 'samus *', 'a a a a a a a a a*' ]:
+            
+            self.assertIsNone( subtag_prefix_index.GetSubtagIdsFromWildcard( wildcard ), wildcard )
+            
+        
+    
 class TestTagDisplayManager( unittest.TestCase ):
     
     def test_tag_filtering( self ):
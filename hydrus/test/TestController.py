@@ -536,6 +536,11 @@ class Controller( object ):
         }
         
     
+    def GetDBDir( self ):
+        
+        return self.db_dir
+        
+    
     def GetFilesDir( self ):
         
         return self._server_files_dir
@@ -1,5 +1,7 @@
+import random
 import unittest
 
+from hydrus.core import HydrusBitmaps
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusGlobals as HG
@@ -25,3 +27,58 @@ class TestHydrusData( unittest.TestCase ):
         self.assertEqual( HydrusData.ConvertIntToPrettyOrdinalString( 1011 ), '1,011th' )
         
     
+class TestHydrusBitmaps( unittest.TestCase ):
+    
+    def test_bitmap( self ):
+        
+        sparse = { random.randint( 0, 5000000 ) for i in range( 2000 ) }
+        dense = set( range( 65536 * 3 + 17, 65536 * 4 + 20000 ) )
+        mixed = set( random.sample( sorted( dense ), 5000 ) ).union( sparse )
+        
+        for ( a, b ) in [ ( sparse, dense ), ( dense, mixed ), ( mixed, sparse ), ( set(), dense ) ]:
+            
+            bitmap_a = HydrusBitmaps.IntegerBitmap( a )
+            bitmap_b = HydrusBitmaps.IntegerBitmap( b )
+            
+            self.assertEqual( len( bitmap_a ), len( a ) )
+            self.assertEqual( list( bitmap_a ), sorted( a ) )
+            self.assertEqual( bitmap_a, a )
+            
+            self.assertEqual( set( bitmap_a & bitmap_b ), a.intersection( b ) )
+            self.assertEqual( set( bitmap_a | bitmap_b ), a.union( b ) )
+            self.assertEqual( set( bitmap_a - bitmap_b ), a.difference( b ) )
+            
+            self.assertEqual( len( bitmap_a & bitmap_b ), len( a.intersection( b ) ) )
+            self.assertEqual( len( bitmap_a | bitmap_b ), len( a.union( b ) ) )
+            
+            # plain iterables work as the other side too
+            
+            c = bitmap_a.copy()
+            
+            c.intersection_update( iter( b ) )
+            
+            self.assertEqual( c, a.intersection( b ) )
+            
+            c = bitmap_a.copy()
+            
+            c.difference_update( list( b ) )
+            
+            self.assertEqual( c, a.difference( b ) )
+            
+        
+        bitmap = HydrusBitmaps.IntegerBitmap( dense )
+        
+        self.assertIn( 65536 * 3 + 17, bitmap )
+        self.assertNotIn( 65536 * 3 + 16, bitmap )
+        
+        bitmap.discard( 65536 * 3 + 17 )
+        bitmap.add( 5 )
+        
+        self.assertNotIn( 65536 * 3 + 17, bitmap )
+        self.assertIn( 5, bitmap )
+        self.assertEqual( len( bitmap ), len( dense ) )
+        
+        # a dense chunk is an 8KB bitmap, not 85,000 python ints
+        
+        self.assertLess( bitmap.GetMemoryFootprint(), 20000 )
+        
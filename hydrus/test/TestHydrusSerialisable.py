@@ -1,7 +1,9 @@
+import hashlib
 import unittest
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusNetwork
 from hydrus.core import HydrusSerialisable
 
 from hydrus.client import ClientApplicationCommand as CAC
@@ -151,6 +153,79 @@ class TestSerialisables( unittest.TestCase ):
             
         
     
+    def test_SERIALISABLE_TYPE_CONTENT_UPDATE_BINARY( self ):
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( 5, 1024, HC.IMAGE_JPEG, 1600000000, 640, 480, None, None, None ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( 3, 2048, HC.VIDEO_WEBM, 1600000001, 1280, 720, 5000, 150, None ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, 8 ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 1, [ 2, 3, 70000, 5 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 300, [ 1 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 2, [ 2 ** 40 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( 4, 5 ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, ( 7, 6 ) ) )
+        
+        network_bytes = content_update.DumpToNetworkBytes()
+        
+        update_hash = hashlib.sha256( network_bytes ).digest()
+        
+        binary_network_bytes = HydrusNetwork.DumpUpdateToBinaryNetworkBytes( content_update, update_hash )
+        
+        self.assertTrue( binary_network_bytes.startswith( HydrusNetwork.BINARY_UPDATE_MAGIC ) )
+        
+        dupe_content_update = HydrusSerialisable.CreateFromNetworkBytes( binary_network_bytes )
+        
+        self.assertIsInstance( dupe_content_update, HydrusNetwork.ContentUpdate )
+        self.assertEqual( dupe_content_update.DumpToString(), content_update.DumpToString() )
+        self.assertEqual( dupe_content_update.GetNumRows(), content_update.GetNumRows() )
+        
+        self.assertEqual( HydrusNetwork.GetUpdateHashFromNetworkBytes( network_bytes ), update_hash )
+        self.assertEqual( HydrusNetwork.GetUpdateHashFromNetworkBytes( binary_network_bytes ), update_hash )
+        self.assertNotEqual( HydrusNetwork.GetUpdateHashFromNetworkBytes( binary_network_bytes[:-1] ), update_hash )
+        
+        # zstd is only for transport, so the client stores it as zlib under the same hash
+        
+        self.assertEqual( HydrusNetwork.ConvertBinaryUpdateNetworkBytesForStorage( binary_network_bytes ), binary_network_bytes )
+        self.assertEqual( HydrusNetwork.ConvertBinaryUpdateNetworkBytesForStorage( network_bytes ), network_bytes )
+        
+        if HydrusNetwork.ZSTD_OK:
+            
+            zstd_network_bytes = HydrusNetwork.DumpUpdateToBinaryNetworkBytes( content_update, update_hash, update_format = HydrusNetwork.UPDATE_FORMAT_BINARY_ZSTD )
+            
+            stored_network_bytes = HydrusNetwork.ConvertBinaryUpdateNetworkBytesForStorage( zstd_network_bytes )
+            
+            ( magic, version, compression, reference_hash, checksum ) = HydrusNetwork.BINARY_UPDATE_HEADER_STRUCT.unpack_from( stored_network_bytes, 0 )
+            
+            self.assertEqual( compression, HydrusNetwork.BINARY_UPDATE_COMPRESSION_ZLIB )
+            self.assertEqual( HydrusNetwork.GetUpdateHashFromNetworkBytes( stored_network_bytes ), update_hash )
+            self.assertEqual( HydrusSerialisable.CreateFromNetworkBytes( stored_network_bytes ).DumpToString(), content_update.DumpToString() )
+            
+        
+    
+    def test_SERIALISABLE_TYPE_DEFINITIONS_UPDATE_BINARY( self ):
+        
+        definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        for i in range( 1, 50 ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, i * 3, HydrusData.GenerateKey() ) )
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, i * 2, 'series:test tag \u00e9 {}'.format( i ) ) )
+            
+        
+        update_hash = hashlib.sha256( definitions_update.DumpToNetworkBytes() ).digest()
+        
+        binary_network_bytes = HydrusNetwork.DumpUpdateToBinaryNetworkBytes( definitions_update, update_hash )
+        
+        dupe_definitions_update = HydrusSerialisable.CreateFromNetworkBytes( binary_network_bytes )
+        
+        self.assertIsInstance( dupe_definitions_update, HydrusNetwork.DefinitionsUpdate )
+        self.assertEqual( dupe_definitions_update.GetHashIdsToHashes(), definitions_update.GetHashIdsToHashes() )
+        self.assertEqual( dupe_definitions_update.GetTagIdsToTags(), definitions_update.GetTagIdsToTags() )
+        
+        self.assertEqual( HydrusNetwork.GetUpdateHashFromNetworkBytes( binary_network_bytes ), update_hash )
+        
+    
     def test_SERIALISABLE_TYPE_DUPLICATE_ACTION_OPTIONS( self ):
         
         def test( obj, dupe_obj ):
@@ -646,6 +646,70 @@ class TestServer( unittest.TestCase ):
         self._test_local_booru( host, port )
         
     
+    def test_binary_update_orphans( self ):
+        
+        for prefix in HydrusData.IterateHexPrefixes():
+            
+            HydrusPaths.MakeSureDirectoryExists( os.path.join( HG.server_controller.GetFilesDir(), prefix ) )
+            
+        
+        update_hash = HydrusData.GenerateKey()
+        orphan_update_hash = HydrusData.GenerateKey()
+        
+        update_path = ServerFiles.GetExpectedFilePath( update_hash )
+        
+        binary_update_path = ServerFiles.GetExpectedBinaryUpdateFilePath( update_hash, HydrusNetwork.UPDATE_FORMAT_BINARY )
+        orphan_binary_update_path = ServerFiles.GetExpectedBinaryUpdateFilePath( orphan_update_hash, HydrusNetwork.UPDATE_FORMAT_BINARY_ZSTD )
+        old_temp_path = binary_update_path + '.0123456789abcdef.temp'
+        new_temp_path = binary_update_path + '.fedcba9876543210.temp'
+        
+        paths = ( update_path, binary_update_path, orphan_binary_update_path, old_temp_path, new_temp_path )
+        
+        try:
+            
+            for path in paths:
+                
+                with open( path, 'wb' ) as f:
+                    
+                    f.write( b'update' )
+                    
+                
+            
+            two_days_ago = HydrusData.GetNow() - 86400 * 2
+            
+            os.utime( old_temp_path, ( two_days_ago, two_days_ago ) )
+            
+            self.assertEqual( ServerFiles.GetAllHashes( 'binary_update' ), { update_hash, orphan_update_hash } )
+            self.assertNotIn( orphan_update_hash, ServerFiles.GetAllHashes( 'file' ) )
+            
+            ServerFiles.DeleteOrphanBinaryUpdateFiles()
+            
+            self.assertTrue( os.path.exists( update_path ) )
+            self.assertTrue( os.path.exists( binary_update_path ) )
+            self.assertTrue( os.path.exists( new_temp_path ) )
+            self.assertFalse( os.path.exists( orphan_binary_update_path ) )
+            self.assertFalse( os.path.exists( old_temp_path ) )
+            
+            # and when the json update goes, its transcode goes with it
+            
+            os.remove( update_path )
+            
+            ServerFiles.DeleteOrphanBinaryUpdateFiles()
+            
+            self.assertFalse( os.path.exists( binary_update_path ) )
+            
+        finally:
+            
+            for path in paths:
+                
+                if os.path.exists( path ):
+                    
+                    os.remove( path )
+                    
+                
+            
+        
+    
     '''
 class TestAMP( unittest.TestCase ):
     
@@ -1,15 +1,45 @@
+import hashlib
+import os
 import time
 import unittest
 
+from mock import patch
+
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusNetwork
+from hydrus.core import HydrusPaths
+from hydrus.core import HydrusSerialisable
 
 from hydrus.server import ServerDB
+from hydrus.server import ServerFiles
 
 from hydrus.test import TestController
 
+class InterruptingUpdateFileWriter( ServerFiles.UpdateFileWriter ):
+    
+    # waits for each update to be written before taking the next, so we know exactly what has been checkpointed when it falls over
+    # this is patched over ServerFiles.UpdateFileWriter, hence super() for the real one
+    
+    num_updates_to_allow = None
+    num_updates_added = 0
+    
+    def AddUpdate( self, update, position ):
+        
+        if InterruptingUpdateFileWriter.num_updates_added == InterruptingUpdateFileWriter.num_updates_to_allow:
+            
+            raise Exception( 'Simulated interruption!' )
+            
+        
+        super().AddUpdate( update, position )
+        
+        InterruptingUpdateFileWriter.num_updates_added += 1
+        
+        self.Finish()
+        
+    
 class TestServerDB( unittest.TestCase ):
     
     def _read( self, action, *args, **kwargs ): return TestServerDB._db.Read( action, *args, **kwargs )
@@ -133,6 +163,126 @@ class TestServerDB( unittest.TestCase ):
         self._admin_account_key = result
         
     
+    def _test_repository_update_generation( self ):
+        
+        for prefix in HydrusData.IterateHexPrefixes():
+            
+            HydrusPaths.MakeSureDirectoryExists( os.path.join( HG.server_controller.GetFilesDir(), prefix ) )
+            
+        
+        admin_account_key = self._read( 'account_key_from_access_key', HC.SERVER_ADMIN_KEY, self._admin_access_key )
+        
+        admin_account = self._read( 'account', HC.SERVER_ADMIN_KEY, admin_account_key )
+        
+        tag_service_key = HydrusData.GenerateKey()
+        
+        services = self._read( 'services' )
+        
+        services.append( HydrusNetwork.GenerateService( tag_service_key, HC.TAG_REPOSITORY, 'update generation test', 45872 ) )
+        
+        service_keys_to_access_keys = self._write( 'services', admin_account, services )
+        
+        account_key = self._read( 'account_key_from_access_key', tag_service_key, service_keys_to_access_keys[ tag_service_key ] )
+        
+        account = self._read( 'account', tag_service_key, account_key )
+        
+        hash = HydrusData.GenerateKey()
+        tags = [ 'tag {}'.format( i ) for i in range( 6 ) ]
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        
+        for tag in tags:
+            
+            client_to_server_update.AddContent( HC.CONTENT_UPDATE_PEND, HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag, ( hash, ) ) ) )
+            
+        
+        timestamp = HydrusData.GetNow()
+        
+        self._write( 'update', tag_service_key, account, client_to_server_update, timestamp )
+        
+        # tiny updates, so the 7 definitions and 6 mappings make three of each, with a checkpoint after every one
+        
+        with patch.object( ServerDB, 'UPDATE_MAX_DEFINITIONS_ROWS', 2 ), patch.object( ServerDB, 'UPDATE_MAX_CONTENT_ROWS', 1 ), patch.object( ServerDB, 'UPDATE_GENERATION_CHECKPOINT_PERIOD', 0 ), patch.object( ServerFiles, 'UpdateFileWriter', InterruptingUpdateFileWriter ):
+            
+            InterruptingUpdateFileWriter.num_updates_to_allow = 4
+            InterruptingUpdateFileWriter.num_updates_added = 0
+            
+            with self.assertRaises( Exception ):
+                
+                self._write( 'create_update', tag_service_key, timestamp - 10, timestamp + 10 )
+                
+            
+            self.assertEqual( InterruptingUpdateFileWriter.num_updates_added, 4 )
+            
+            # the next attempt carries on after the last checkpointed update
+            
+            InterruptingUpdateFileWriter.num_updates_to_allow = None
+            InterruptingUpdateFileWriter.num_updates_added = 0
+            
+            resumed_update_hashes = self._write( 'create_update', tag_service_key, timestamp - 10, timestamp + 10 )
+            
+            self.assertEqual( InterruptingUpdateFileWriter.num_updates_added, 2 )
+            
+            # and gives the same updates as a clean run
+            
+            InterruptingUpdateFileWriter.num_updates_added = 0
+            
+            clean_update_hashes = self._write( 'create_update', tag_service_key, timestamp - 10, timestamp + 10 )
+            
+            self.assertEqual( InterruptingUpdateFileWriter.num_updates_added, 6 )
+            
+            # progress for a different window is not carried on
+            
+            InterruptingUpdateFileWriter.num_updates_to_allow = 4
+            InterruptingUpdateFileWriter.num_updates_added = 0
+            
+            with self.assertRaises( Exception ):
+                
+                self._write( 'create_update', tag_service_key, timestamp - 10, timestamp + 10 )
+                
+            
+            InterruptingUpdateFileWriter.num_updates_to_allow = None
+            InterruptingUpdateFileWriter.num_updates_added = 0
+            
+            wider_update_hashes = self._write( 'create_update', tag_service_key, timestamp - 10, timestamp + 11 )
+            
+            self.assertEqual( InterruptingUpdateFileWriter.num_updates_added, 6 )
+            self.assertEqual( wider_update_hashes, clean_update_hashes )
+            
+        
+        self.assertEqual( resumed_update_hashes, clean_update_hashes )
+        
+        updates = []
+        
+        for update_hash in resumed_update_hashes:
+            
+            with open( ServerFiles.GetFilePath( update_hash ), 'rb' ) as f:
+                
+                updates.append( HydrusSerialisable.CreateFromNetworkBytes( f.read() ) )
+                
+            
+        
+        definitions_updates = [ update for update in updates if isinstance( update, HydrusNetwork.DefinitionsUpdate ) ]
+        content_updates = [ update for update in updates if isinstance( update, HydrusNetwork.ContentUpdate ) ]
+        
+        self.assertEqual( [ type( update ) for update in updates ], [ HydrusNetwork.DefinitionsUpdate ] * 3 + [ HydrusNetwork.ContentUpdate ] * 3 )
+        self.assertEqual( [ update.GetNumRows() for update in definitions_updates ], [ 3, 3, 1 ] )
+        self.assertEqual( [ update.GetNumRows() for update in content_updates ], [ 2, 2, 2 ] )
+        
+        service_tag_ids_to_tags = {}
+        
+        for update in definitions_updates:
+            
+            service_tag_ids_to_tags.update( update.GetTagIdsToTags() )
+            
+        
+        self.assertEqual( set( service_tag_ids_to_tags.values() ), set( tags ) )
+        
+        mapped_tags = [ service_tag_ids_to_tags[ service_tag_id ] for update in content_updates for ( service_tag_id, service_hash_ids ) in update.GetNewMappings() ]
+        
+        self.assertEqual( sorted( mapped_tags ), tags )
+        
+    
     def _test_service_creation( self ):
         
         self._tag_service_key = HydrusData.GenerateKey()
@@ -173,6 +323,8 @@ class TestServerDB( unittest.TestCase ):
         
         self._test_init_server_admin()
         
+        self._test_repository_update_generation()
+        
         # broke since service rewrite
         #self._test_service_creation()
         
@@ -180,4 +332,77 @@ class TestServerDB( unittest.TestCase ):
         
         #self._test_content_creation()
         
-
+    
+    def test_update_file_writer( self ):
+        
+        for prefix in HydrusData.IterateHexPrefixes():
+            
+            HydrusPaths.MakeSureDirectoryExists( os.path.join( HG.server_controller.GetFilesDir(), prefix ) )
+            
+        
+        updates = []
+        
+        for i in range( 20 ):
+            
+            update = HydrusNetwork.ContentUpdate()
+            
+            update.AddRows( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, [ ( i, list( range( i * 100 ) ) ) ] )
+            
+            updates.append( update )
+            
+        
+        # the workers finish in whatever order, but results only come back as a contiguous run from the first index
+        
+        update_file_writer = ServerFiles.UpdateFileWriter( HG.test_controller, num_workers = 4, first_update_index = 5 )
+        
+        try:
+            
+            for ( i, update ) in enumerate( updates ):
+                
+                update_file_writer.AddUpdate( update, ( 0, ( i, ) ) )
+                
+            
+            update_file_writer.Finish()
+            
+            results = update_file_writer.GetFinishedUpdates()
+            
+        finally:
+            
+            update_file_writer.Shutdown()
+            
+        
+        self.assertEqual( [ update_index for ( update_index, update_hash, num_definition_rows, num_content_rows, position ) in results ], list( range( 5, 25 ) ) )
+        self.assertEqual( [ position for ( update_index, update_hash, num_definition_rows, num_content_rows, position ) in results ], [ ( 0, ( i, ) ) for i in range( 20 ) ] )
+        self.assertEqual( [ num_content_rows for ( update_index, update_hash, num_definition_rows, num_content_rows, position ) in results ], [ i * 100 for i in range( 20 ) ] )
+        
+        for ( ( update_index, update_hash, num_definition_rows, num_content_rows, position ), update ) in zip( results, updates ):
+            
+            self.assertEqual( update_hash, hashlib.sha256( update.DumpToNetworkBytes() ).digest() )
+            
+            with open( ServerFiles.GetFilePath( update_hash ), 'rb' ) as f:
+                
+                self.assertEqual( HydrusSerialisable.CreateFromNetworkBytes( f.read() ).GetNumRows(), num_content_rows )
+                
+            
+        
+        self.assertEqual( update_file_writer.GetFinishedUpdates(), [] )
+        
+        # an error on a worker comes back to the caller
+        
+        update_file_writer = ServerFiles.UpdateFileWriter( HG.test_controller, num_workers = 2 )
+        
+        try:
+            
+            update_file_writer.AddUpdate( 'not an update', ( 0, ( 0, ) ) )
+            
+            with self.assertRaises( AttributeError ):
+                
+                update_file_writer.Finish()
+                
+            
+        finally:
+            
+            update_file_writer.Shutdown()
+            
+        
+    